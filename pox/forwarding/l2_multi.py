@@ -27,12 +27,18 @@ Works with openflow.spanning_tree
 from pox.core import core
 import pox.openflow.libopenflow_01 as of
 from pox.lib.revent import *
-from collections import defaultdict
+from collections import defaultdict, deque
 from pox.openflow.discovery import Discovery
 from pox.lib.util import dpidToStr
+import itertools
+import time
 
 log = core.getLogger()
 
+# Timeouts for the flows we install
+FLOW_IDLE_TIMEOUT = 10
+FLOW_HARD_TIMEOUT = 30
+
 # Adjacency map.  [sw1][sw2] -> port from sw1 to sw2
 adjacency = defaultdict(lambda:defaultdict(lambda:None))
 
@@ -42,65 +48,129 @@ switches = {}
 # ethaddr -> (switch, port)
 mac_map = {}
 
-# [sw1][sw2] -> (distance, intermediate)
-path_map = defaultdict(lambda:defaultdict(lambda:(None,None)))
+# Shortest paths from each switch, computed when first needed and kept
+# until a link change affects them.  [src] -> (distances, previous hops),
+# where distances is {sw:hops from src} and previous hops is
+# {sw:switch before sw on the path from src} for every switch src reaches.
+path_map = {}
 
+# Paths we've installed flows for, each with its own flow cookie.
+# [cookie] -> (match, path)
+installed_paths = {}
 
-def _calc_paths ():
-  """
-  Essentially Floyd-Warshall algorithm
-  """
-  sws = switches.values()
-  path_map.clear()
-  for k in sws:
-    for j,port in adjacency[k].iteritems():
-      if port is None: continue
-      path_map[k][j] = (1,None)
-    path_map[k][k] = (0,None) # distance, intermediate
+# [(switch, port)] -> cookies of the installed paths which send out of it
+path_index = defaultdict(set)
 
-  """
-  for i in sws:
-    for j in sws:
-      a = path_map[i][j][0]
-      #a = adjacency[i][j]
-      if a is None: a = "*"
-      print a,
-    print
-  """
+# (expiration, cookie) in the order paths were installed, so we can forget
+# them once their flows have certainly timed out
+_path_expirations = deque()
+
+_next_cookie = itertools.count(1)
 
-  for k in sws:
-    for i in sws:
-      for j in sws:
-        if path_map[i][k][0] is not None:
-          if path_map[k][j][0] is not None:
-            # i -> k -> j exists
-            ikj_dist = path_map[i][k][0]+path_map[k][j][0]
-            if path_map[i][j][0] is None or ikj_dist < path_map[i][j][0]:
-              # i -> k -> j is better than existing
-              path_map[i][j] = (ikj_dist, k)
 
+def _calc_paths (src):
   """
-  print "--------------------"
-  for i in sws:
-    for j in sws:
-      print path_map[i][j][0],
-    print
+  Breadth-first search for the shortest paths from src
   """
+  dist = {src:0}
+  prev = {src:None}
+  frontier = [src]
+  d = 0
+  while frontier:
+    d += 1
+    next_frontier = []
+    for sw in frontier:
+      for nbr,port in adjacency[sw].iteritems():
+        if port is None or nbr in dist: continue
+        dist[nbr] = d
+        prev[nbr] = sw
+        next_frontier.append(nbr)
+    frontier = next_frontier
+  path_map[src] = (dist, prev)
+  return dist, prev
+
+
+def _invalidate_paths (sw1, sw2, connected):
+  """
+  Forgets the paths which change now that sw1 and sw2 are (or are no
+  longer) connected
+  """
+  for src,(dist,prev) in path_map.items():
+    if connected:
+      # The new link only shortens something if it joins switches more
+      # than a hop apart (or joins something new)
+      d1 = dist.get(sw1)
+      d2 = dist.get(sw2)
+      if d1 is None and d2 is None: continue
+      if d1 is not None and d2 is not None and abs(d1 - d2) <= 1: continue
+    else:
+      # Only paths through the link break
+      if prev.get(sw2) is not sw1 and prev.get(sw1) is not sw2: continue
+    del path_map[src]
 
 
 def _get_raw_path (src, dst):
-  if len(path_map) == 0: _calc_paths()
+  """
+  Returns the switches between src and dst, or None if there's no path
+  """
   if src is dst:
     # We're here!
     return []
-  if path_map[src][dst][0] is None:
+  tree = path_map.get(src)
+  if tree is None: tree = _calc_paths(src)
+  prev = tree[1]
+  if dst not in prev:
     return None
-  intermediate = path_map[src][dst][1]
-  if intermediate is None:
-    # Directly connected
-    return []
-  return _get_raw_path(src, intermediate) + [intermediate] + \
-         _get_raw_path(intermediate, dst)
+  path = []
+  sw = prev[dst]
+  while sw is not src:
+    path.append(sw)
+    sw = prev[sw]
+  path.reverse()
+  return path
+
+
+def _record_path (path, match):
+  """
+  Remembers an installed path and returns the cookie for its flows
+  """
+  now = time.time()
+  while _path_expirations and _path_expirations[0][0] <= now:
+    _forget_path(_path_expirations.popleft()[1])
+  cookie = next(_next_cookie)
+  installed_paths[cookie] = (match, path)
+  for hop in path:
+    path_index[hop].add(cookie)
+  _path_expirations.append((now + FLOW_HARD_TIMEOUT, cookie))
+  return cookie
+
+
+def _forget_path (cookie):
+  entry = installed_paths.pop(cookie, None)
+  if entry is None: return
+  for hop in entry[1]:
+    cookies = path_index.get(hop)
+    if cookies is None: continue
+    cookies.discard(cookie)
+    if not cookies: del path_index[hop]
+
+
+def _remove_paths (cookies):
+  """
+  Deletes the flows for the given installed paths from their switches
+  """
+  msgs = defaultdict(list) # switch -> flow_mods
+  for cookie in cookies:
+    entry = installed_paths.get(cookie)
+    if entry is None: continue
+    match, path = entry
+    for sw,port in path:
+      msgs[sw].append(of.ofp_flow_mod(match=match, cookie=cookie,
+                                      command=of.OFPFC_DELETE_STRICT))
+    _forget_path(cookie)
+  for sw,m in msgs.iteritems():
+    if sw.connection is not None:
+      sw.connection.send_batch(m)
 
 
 def _check_path (p):
@@ -150,20 +220,22 @@ class Switch (EventMixin):
   def __repr__ (self):
     return dpidToStr(self.dpid)
 
-  def _install (self, switch, port, match, buf = -1):
+  def _install (self, switch, port, match, buf = -1, cookie = 0):
     msg = of.ofp_flow_mod()
     msg.match = match
-    msg.idle_timeout = 10
-    msg.hard_timeout = 30
+    msg.cookie = cookie
+    msg.idle_timeout = FLOW_IDLE_TIMEOUT
+    msg.hard_timeout = FLOW_HARD_TIMEOUT
     msg.actions.append(of.ofp_action_output(port = port))
     msg.buffer_id = buf
     switch.connection.send(msg)
 
   def _install_path (self, p, match, buffer_id = -1):
+    cookie = _record_path(p, match)
     for sw,port in p[1:]:
-      self._install(sw, port, match)
+      self._install(sw, port, match, cookie = cookie)
 
-    self._install(p[0][0], p[0][1], match, buffer_id)
+    self._install(p[0][0], p[0][1], match, buffer_id, cookie)
 
     core.l2_multi.raiseEvent(PathInstalled(p))
 
@@ -310,7 +382,10 @@ class l2_multi (EventMixin):
     PathInstalled,
   ])
 
-  def __init__ (self):
+  def __init__ (self, reoptimize = False):
+    # If True, a new link causes flows on paths which it makes shorter to
+    # be removed right away rather than just left to time out
+    self.reoptimize = reoptimize
     self.listenTo(core.openflow, priority=0)
     self.listenTo(core.openflow_discovery)
 
@@ -321,17 +396,13 @@ class l2_multi (EventMixin):
     l = event.link
     sw1 = switches[l.dpid1]
     sw2 = switches[l.dpid2]
+    was_connected = adjacency[sw1][sw2] is not None
 
-    # Invalidate all flows and path info.
-    # For link adds, this makes sure that if a new link leads to an
-    # improved path, we use it.
-    # For link removals, this makes sure that we don't use a
-    # path that may have been broken.
-    #NOTE: This could be radically improved! (e.g., not *ALL* paths break)
-    clear = of.ofp_flow_mod(match=of.ofp_match(),command=of.OFPFC_DELETE)
-    for sw in switches.itervalues():
-      sw.connection.send(clear)
-    path_map.clear()
+    # Remove the flows for paths which use either end of the link.  For
+    # link removals, those paths are broken.  For link adds, they're
+    # paths to hosts we thought were on those ports.
+    _remove_paths(path_index.get((sw1, l.port1), set()) |
+                  path_index.get((sw2, l.port2), set()))
 
     if event.removed:
       # This link no longer okay
@@ -339,14 +410,13 @@ class l2_multi (EventMixin):
       if sw1 in adjacency[sw2]: del adjacency[sw2][sw1]
 
       # But maybe there's another way to connect these...
-      for ll in core.openflow_discovery.adjacency:
-        if ll.dpid1 == l.dpid1 and ll.dpid2 == l.dpid2:
-          if flip(ll) in core.openflow_discovery.adjacency:
-            # Yup, link goes both ways
-            adjacency[sw1][sw2] = ll.port1
-            adjacency[sw2][sw1] = ll.port2
-            # Fixed -- new link chosen to connect these
-            break
+      links = core.openflow_discovery.linksBetween(l.dpid1, l.dpid2,
+                                                   bidirectional=True)
+      if links:
+        # Yup, link goes both ways -- new link chosen to connect these
+        ll = min(links)
+        adjacency[sw1][sw2] = ll.port1
+        adjacency[sw2][sw1] = ll.port2
     else:
       # If we already consider these nodes connected, we can
       # ignore this link up.
@@ -375,6 +445,19 @@ class l2_multi (EventMixin):
       for mac in bad_macs:
         del mac_map[mac]
 
+    connected = adjacency[sw1][sw2] is not None
+    if connected != was_connected:
+      _invalidate_paths(sw1, sw2, connected)
+      if connected and self.reoptimize:
+        # Remove flows for paths which are now longer than they need be
+        # (they'll be replaced when their traffic comes back to us)
+        longer = []
+        for cookie,(match,path) in installed_paths.iteritems():
+          raw = _get_raw_path(path[0][0], path[-1][0])
+          if raw is not None and len(raw) + 2 < len(path):
+            longer.append(cookie)
+        _remove_paths(longer)
+
   def _handle_ConnectionUp (self, event):
     sw = switches.get(event.dpid)
     if sw is None:
@@ -386,10 +469,15 @@ class l2_multi (EventMixin):
       sw.connect(event.connection)
 
 
-def launch ():
+def launch (reoptimize = False):
+  """
+  --reoptimize removes flows as soon as a new link gives them a shorter
+  path, rather than letting them time out first.
+  """
   if 'openflow_discovery' not in core.components:
     import pox.openflow.discovery as discovery
     core.registerNew(discovery.Discovery)
-    
-  core.registerNew(l2_multi)
+
+  from pox.lib.util import str_to_bool
+  core.registerNew(l2_multi, str_to_bool(reoptimize))
 
@@ -21,6 +21,7 @@ Classes for addresses of various types.
 
 import struct
 import socket
+import binascii
 
 # Slightly tested attempt at Python 3 friendliness
 import sys
@@ -72,68 +73,59 @@ def _load_oui_names ():
 _load_oui_names()
 
 
+# Addresses are immutable, so the same object can be handed out every time
+# a particular address is created from the same thing (e.g., the same raw
+# bytes from a packet header).  These map what addresses were recently
+# created from to the address objects.
+_CACHE_SIZE = 4096
+_eth_cache = {}
+_ip_cache = {}
+_network_cache = {}
+_cacheable = frozenset((bytes, int, long))
+
+def _cache_put (cache, key, value):
+  if len(cache) >= _CACHE_SIZE:
+    cache.clear()
+  cache[key] = value
+
+_eth_struct = struct.Struct("!HI")
+_ip_struct = struct.Struct("!I")
+
+
 class EthAddr (object):
   """
   An Ethernet (MAC) address type.
   """
-  def __init__ (self, addr):
+  __slots__ = ('_value',) # Always a 6 character string
+
+  def __new__ (cls, addr):
     """
     Understands Ethernet address is various forms.  Hex strings, raw byte
     strings, long integers, etc.
     """
-    # Always stores as a 6 character string
-    if isinstance(addr, int) or isinstance(addr, long):
-      addr = long(addr)
-      # Store the long as an array of 6 bytes
-      # Struct puts the least significant byte at [0] though!
-      # And Murphy puts the least significant byte at [-1]
-      # So we pack ourselves one byte at a time
-      val = []
-      for _ in range(6):
-        # This may not be machine-independent...
-        val.insert(0, struct.pack("B", (addr & 0xFF)))
-        addr >>= 8
-      self._value = ''.join(val)
-    elif isinstance(addr, bytes) or isinstance(addr, unicode):
-      if len(addr) == 17 or len(addr) == 12 or addr.count(':') == 5:
-        # hex
-        if len(addr) == 17:
-          if addr[2::3] != ':::::' and addr[2::3] != '-----':
-            raise RuntimeError("Bad format for ethernet address")
-          # TODOC: I have no clue what this is doing
-          addr = ''.join((addr[x*3:x*3+2] for x in xrange(0,6)))
-        elif len(addr) == 12:
-          pass
-        else:
-          addr = ''.join(["%02x" % (int(x,16),) for x in addr.split(":")])
-        # TODOC: I have no clue what this is doing
-        addr = b''.join((chr(int(addr[x*2:x*2+2], 16)) for x in range(0,6)))
-      elif len(addr) == 6:
-        # raw
-        pass
-      else:
-        raise RuntimeError("Expected ethernet address string to be 6 raw bytes or some hex")
-      self._value = addr
-    elif isinstance(addr, EthAddr):
-      self._value = addr.toRaw()
-    elif type(addr) == list or (hasattr(addr, '__len__') and len(addr) == 6 and hasattr(addr, '__iter__')):
-      self._value = b''.join( (chr(x) for x in addr) )
-    elif addr is None:
-      self._value = b'\x00' * 6
-    else:
-      raise RuntimeError("Expected ethernet address to be a string of 6 raw bytes or some hex")
-
-  def isGlobal (self):
-    """
-    Returns True if this is a globally unique (OUI enforced) address.
-    """
-    return not self.isLocal()
-
-  def isLocal (self):
-    """
-    Returns True if this is a locally-administered (non-global) address.
-    """
-    return True if (ord(self._value[0]) & 2) else False
+    t = type(addr)
+    if t is cls:
+      return addr
+    cacheable = t in _cacheable and cls is EthAddr
+    if cacheable:
+      self = _eth_cache.get(addr)
+      if self is not None:
+        return self
+
+    self = object.__new__(cls)
+    object.__setattr__(self, '_value', _eth_value(addr))
+    if cacheable:
+      _cache_put(_eth_cache, addr, self)
+    return self
+
+  def __reduce__ (self):
+    return (EthAddr, (self._value,))
+
+  def __copy__ (self):
+    return self
+
+  def __deepcopy__ (self, memo):
+    return self
 
   def isBridgeFiltered (self):
     """
@@ -141,20 +133,8 @@ class EthAddr (object):
     01-80-C2-00-00-00 to 01-80-C2-00-00-0F. MAC frames that have a destination MAC address
     within this range are not relayed by MAC bridges conforming to IEEE 802.1D
     """
-    return  ((ord(self._value[0]) == 0x01)
-    	and (ord(self._value[1]) == 0x80)
-    	and (ord(self._value[2]) == 0xC2)
-    	and (ord(self._value[3]) == 0x00)
-    	and (ord(self._value[4]) == 0x00)
-    	and (ord(self._value[5]) <= 0x0F))
-
-  @property
-  def is_local (self):
-    return self.isLocal()
-
-  @property
-  def is_global (self):
-    return self.isGlobal()
+    return (self._value[:5] == '\x01\x80\xc2\x00\x00'
+            and ord(self._value[5]) <= 0x0F)
 
   def isGlobal (self):
     """
@@ -196,17 +176,8 @@ class EthAddr (object):
     '''
     Returns the address as an (unsigned) integer
     '''
-    value = 0
-    # Struct puts the least significant (bit|byte) leftmost, 
-    # but Murphy puts least significant (bit|byte) rightmost
-    # So we unpack ourselves, one byte at a time
-    # most-significant byte is leftmost (self._value[0])
-    for i in range(len(self._value)):
-      byte_shift = 5-i
-      byte = self._value[i]
-      byte_value = struct.unpack("B", byte)[0]
-      value += (byte_value << (8*byte_shift))
-    return value
+    hi, lo = _eth_struct.unpack(self._value)
+    return (hi << 32) | lo
 
   def toTuple (self):
     """
@@ -222,7 +193,8 @@ class EthAddr (object):
     If resolveNames is True, it may return company names based on
     the OUI. (Currently unimplemented)
     """
-    return separator.join(('%02x' % (ord(x),) for x in self._value))
+    h = binascii.hexlify(self._value)
+    return separator.join((h[0:2], h[2:4], h[4:6], h[6:8], h[8:10], h[10:12]))
 
   def __str__ (self):
     return self.toStr()
@@ -235,16 +207,18 @@ class EthAddr (object):
         pass
       else:
         other = EthAddr(other)._value
-      if self._value == other:
-        return 0
-      if self._value < other:
-        return -1
-      if self._value > other:
-        return -1
-      raise RuntimeError("Objects can not be compared?")
+      return cmp(self._value, other)
     except:
       return -other.__cmp__(self)
 
+  def __eq__ (self, other):
+    if type(other) is EthAddr:
+      return self._value == other._value
+    return self.__cmp__(other) == 0
+
+  def __ne__ (self, other):
+    return not self.__eq__(other)
+
   def __hash__ (self):
     return self._value.__hash__()
 
@@ -255,37 +229,98 @@ class EthAddr (object):
     return 6
 
   def __setattr__ (self, a, v):
-    if hasattr(self, '_value'):
-      raise TypeError("This object is immutable")
-    object.__setattr__(self, a, v)
+    raise TypeError("This object is immutable")
+
+
+def _eth_value (addr):
+  """
+  Returns the raw 6 bytes of an Ethernet address in any of the forms
+  EthAddr understands
+  """
+  if isinstance(addr, int) or isinstance(addr, long):
+    return _eth_struct.pack((addr >> 32) & 0xffff, addr & 0xffFFffFF)
+  elif isinstance(addr, bytes) or isinstance(addr, unicode):
+    if len(addr) == 17 or len(addr) == 12 or addr.count(':') == 5:
+      # hex
+      if len(addr) == 17:
+        if addr[2::3] != ':::::' and addr[2::3] != '-----':
+          raise RuntimeError("Bad format for ethernet address")
+        # Drop the separators
+        addr = ''.join((addr[x*3:x*3+2] for x in xrange(0,6)))
+      elif len(addr) == 12:
+        pass
+      else:
+        addr = ''.join(["%02x" % (int(x,16),) for x in addr.split(":")])
+      try:
+        return binascii.unhexlify(str(addr))
+      except TypeError:
+        # Maybe something int() is more forgiving about, like spaces
+        return b''.join((chr(int(addr[x*2:x*2+2], 16)) for x in range(0,6)))
+    elif len(addr) == 6:
+      # raw
+      return str(addr)
+    else:
+      raise RuntimeError("Expected ethernet address string to be 6 raw bytes or some hex")
+  elif isinstance(addr, EthAddr):
+    return addr._value
+  elif type(addr) == list or (hasattr(addr, '__len__') and len(addr) == 6 and hasattr(addr, '__iter__')):
+    return b''.join( (chr(x) for x in addr) )
+  elif addr is None:
+    return b'\x00' * 6
+  else:
+    raise RuntimeError("Expected ethernet address to be a string of 6 raw bytes or some hex")
 
 
 class IPAddr (object):
   """
   Represents an IPv4 address.
   """
-  def __init__ (self, addr, networkOrder = False):
+  __slots__ = ('_value',) # Always an unsigned host-order int
+
+  def __new__ (cls, addr, networkOrder = False):
     """ Can be initialized with several formats.
         If addr is an int/long, then it is assumed to be in host byte order
         unless networkOrder = True
-        Stored in network byte order as a signed int
     """
+    t = type(addr)
+    if t is cls:
+      return addr
+    cacheable = t in _cacheable and cls is IPAddr and not networkOrder
+    if cacheable:
+      self = _ip_cache.get(addr)
+      if self is not None:
+        return self
 
-    # Always stores as a signed network-order int
     if isinstance(addr, str) or isinstance(addr, bytes):
       if len(addr) != 4:
         # dotted quad
-        self._value = struct.unpack('i', socket.inet_aton(addr))[0]
+        value = _ip_struct.unpack(socket.inet_aton(addr))[0]
       else:
-        self._value = struct.unpack('i', addr)[0]
+        value = _ip_struct.unpack(addr)[0]
     elif isinstance(addr, IPAddr):
-      self._value = addr._value
+      value = addr._value
     elif isinstance(addr, int) or isinstance(addr, long):
-      addr = addr & 0xffFFffFF # unsigned long
-      self._value = struct.unpack("!i", struct.pack(('!' if networkOrder else '') + "I", addr))[0]
+      value = addr & 0xffFFffFF # unsigned long
+      if networkOrder:
+        value = socket.ntohl(value)
     else:
       raise RuntimeError("Unexpected IP address format")
 
+    self = object.__new__(cls)
+    object.__setattr__(self, '_value', value)
+    if cacheable:
+      _cache_put(_ip_cache, addr, self)
+    return self
+
+  def __reduce__ (self):
+    return (IPAddr, (self._value,))
+
+  def __copy__ (self):
+    return self
+
+  def __deepcopy__ (self, memo):
+    return self
+
   def toSignedN (self):
     """ A shortcut """
     return self.toSigned(networkOrder = True)
@@ -296,29 +331,29 @@ class IPAddr (object):
 
   def toSigned (self, networkOrder = False):
     """ Return the address as a signed int """
-    if networkOrder:
-      return self._value
-    v = socket.htonl(self._value & 0xffFFffFF)
-    return struct.unpack("i", struct.pack("I", v))[0]
+    v = self.toUnsigned(networkOrder)
+    if v & 0x80000000:
+      return v - 0x100000000
+    return v
 
   def toRaw (self):
     """
     Returns the address as a four-character byte string.
     """
-    return struct.pack("i", self._value)
+    return _ip_struct.pack(self._value)
 
   def toUnsigned (self, networkOrder = False):
     """
     Returns the address as an integer in either network or host (the
     default) byte order.
     """
-    if not networkOrder:
-      return socket.htonl(self._value & 0xffFFffFF)
-    return self._value & 0xffFFffFF
+    if networkOrder:
+      return socket.htonl(self._value)
+    return self._value
 
   def toStr (self):
     """ Return dotted quad representation """
-    return socket.inet_ntoa(self.toRaw())
+    return socket.inet_ntoa(_ip_struct.pack(self._value))
 
   def inNetwork (self, network, netmask = None):
     """
@@ -328,16 +363,13 @@ class IPAddr (object):
     or it can be a tuple of (address,wild-bits) like that returned by
     parseCIDR().
     """
-    if type(network) is not tuple:
-      if netmask is not None:
-        network += "/" + str(netmask)
-      n,b = parseCIDR(network)
-    else:
-      n,b = network
-      if type(n) is not IPAddr:
-        n = IPAddr(n)
-
-    return (self.toUnsigned() & ~((1 << b)-1)) == n.toUnsigned()
+    key = (network, netmask)
+    try:
+      n,m = _network_cache[key]
+    except (KeyError, TypeError):
+      n,m = _parse_network(network, netmask)
+      _cache_put(_network_cache, key, (n,m))
+    return (self._value & m) == n
 
   def __str__ (self):
     return self.toStr()
@@ -351,6 +383,14 @@ class IPAddr (object):
     except:
       return -other.__cmp__(self)
 
+  def __eq__ (self, other):
+    if type(other) is IPAddr:
+      return self._value == other._value
+    return self.__cmp__(other) == 0
+
+  def __ne__ (self, other):
+    return not self.__eq__(other)
+
   def __hash__ (self):
     return self._value.__hash__()
 
@@ -361,11 +401,24 @@ class IPAddr (object):
     return 4
 
   def __setattr__ (self, a, v):
-    if hasattr(self, '_value'):
-      raise TypeError("This object is immutable")
-    object.__setattr__(self, a, v)
+    raise TypeError("This object is immutable")
 
 
+def _parse_network (network, netmask = None):
+  """
+  Turns the arguments to IPAddr.inNetwork() into a (network, mask) pair of
+  unsigned ints
+  """
+  if type(network) is not tuple:
+    if netmask is not None:
+      network += "/" + str(netmask)
+    n,b = parseCIDR(network)
+  else:
+    n,b = network
+    if type(n) is not IPAddr:
+      n = IPAddr(n)
+  return (n._value, ~((1 << b)-1) & 0xffFFffFF)
+
 
 def parseCIDR (addr, infer=True):
   """
@@ -447,7 +500,6 @@ if __name__ == '__main__':
   for v in [('255.0.0.1',True), (0xff000001, True), (0x010000ff, False)]:
     print "== " + str(v) + " ======================="
     a = IPAddr(v[0],v[1])
-    print a._value,-16777215
     #print hex(a._value),'ff000001'
     print str(a),'255.0.0.1'
     print hex(a.toUnsigned()),'010000ff'
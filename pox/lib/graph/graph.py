@@ -18,8 +18,10 @@
 
 #import networkx as nx
 import pox.lib.graph.minigraph as nx
+from pox.lib.addresses import EthAddr, IPAddr
 from collections import defaultdict
 from copy import copy
+import numbers
 
 LINK = 'link'
 
@@ -400,10 +402,106 @@ class Member (BinaryOp):
     return getattr(l, r)
 
 
+_missing = object()
+_unhashable = object()
+
+def _kind (value):
+  """
+  Values of the same kind which compare equal also hash the same
+
+  That isn't true across kinds; e.g., an IPAddr is equal to the string
+  form of the address, but doesn't hash like it.
+  """
+  if isinstance(value, numbers.Number): return numbers.Number
+  return type(value)
+
+# Kinds which other values can be turned into with the constructor, the
+# same way their comparisons do
+_CONVERTIBLE = (EthAddr, IPAddr)
+
+class _FieldIndex (object):
+  """
+  Index of nodes by the value of one of their attributes
+  """
+  def __init__ (self, field):
+    self.field = field
+    self.values = {} # value -> set of nodes
+    self.unhashable = set() # Nodes whose value can't be put in values
+    self.kinds = {} # _kind() -> number of values of it in values
+    self._keys = {} # node -> key it's indexed under
+
+  def add (self, node):
+    v = getattr(node, self.field, _missing)
+    if v is not _missing:
+      try:
+        s = self.values.get(v)
+      except TypeError:
+        v = _unhashable
+        self.unhashable.add(node)
+      else:
+        if s is None:
+          s = self.values[v] = set()
+          k = _kind(v)
+          self.kinds[k] = self.kinds.get(k, 0) + 1
+        s.add(node)
+    self._keys[node] = v
+
+  def remove (self, node):
+    v = self._keys.pop(node, _missing)
+    if v is _missing: return
+    if v is _unhashable:
+      self.unhashable.discard(node)
+      return
+    s = self.values[v]
+    s.discard(node)
+    if not s:
+      del self.values[v]
+      k = _kind(v)
+      self.kinds[k] -= 1
+      if not self.kinds[k]: del self.kinds[k]
+
+  def find (self, value):
+    """
+    Returns the nodes which might have the given value (which must be
+    hashable), or None if the index can't tell
+
+    Values are only looked up among values of the same kind, so when there
+    are others, the index can't be used (unless the value can be converted
+    to the one kind there is).
+    """
+    kinds = self.kinds
+    k = _kind(value)
+    if k not in kinds or len(kinds) > 1:
+      if len(kinds) > 1: return None
+      if kinds:
+        k = next(iter(kinds))
+        if k not in _CONVERTIBLE: return None
+        try:
+          value = k(value)
+        except Exception:
+          return None
+    s = self.values.get(value)
+    if self.unhashable:
+      return self.unhashable if s is None else s | self.unhashable
+    return s if s is not None else ()
+
+_PLAN_CACHE_SIZE = 256
+
 class Graph (object):
+  """
+  Nodes are kept indexed by type, and optionally by the values of fields
+  named with add_index().  find(), get(), has() and the link versions of
+  them use the indexes to narrow down which nodes they need to test when
+  the query has (possibly And/Or-ed) parts like type=..., is_a=...,
+  field=value, Equal(F("field"), value), IsType() or IsInstance().
+  Everything else about the query is still tested on each node left.
+  """
   def __init__ (self):
     self._g = nx.MultiGraph()
     self.node_port = {}
+    self._by_type = {} # type -> set of nodes
+    self._indexes = {} # field name -> _FieldIndex
+    self._plans = {} # See _plan()
 
   def __contains__ (self, n):
     return n in self._g
@@ -411,9 +509,43 @@ class Graph (object):
   def add (self, node):
     self._g.add_node(node)
     self.node_port[node] = {}
+    s = self._by_type.get(type(node))
+    if s is None:
+      s = self._by_type[type(node)] = set()
+    s.add(node)
+    for index in self._indexes.itervalues():
+      index.add(node)
 
   def remove (self, node):
     self._g.remove_node(node)
+    s = self._by_type.get(type(node))
+    if s is not None:
+      s.discard(node)
+      if not s: del self._by_type[type(node)]
+    for index in self._indexes.itervalues():
+      index.remove(node)
+
+  def add_index (self, field):
+    """
+    Index nodes by the value of the given field
+
+    Fields are only looked at when a node is added, so if an indexed
+    field of a node changes, call reindex() on the node.
+    """
+    if field in self._indexes: return
+    index = _FieldIndex(field)
+    for n in self._g.nodes():
+      index.add(n)
+    self._indexes[field] = index
+    self._plans.clear()
+
+  def reindex (self, node):
+    """
+    Updates the indexes for a node whose fields have changed
+    """
+    for index in self._indexes.itervalues():
+      index.remove(node)
+      index.add(node)
 
   def neighbors (self, n):
     return self._g.neighbors(n)
@@ -492,12 +624,36 @@ class Graph (object):
 
   def find_links (self, query1=None, query2=()):
     # No idea if new link query stuff works.
+    return list(self._find_links(query1, query2))
+
+  def _find_links (self, query1, query2):
+    """
+    Generates the links find_links() finds
+    """
     if query2 is None: query2 = query1
     if query1 == (): query1 = None
     if query2 == (): query2 = None
-    o = set()
-    for n1,n2,k,d in self._g.edges(data=True, keys=True):
+
+    # Every matching link has an end which matches query1 and one which
+    # matches query2, so we only need to look at the links of whichever of
+    # those has fewer candidates
+    nodes = None
+    for q in (query1, query2):
+      if q is None: continue
+      c = self._candidates((q,), {})
+      if c is not None and (nodes is None or len(c) < len(nodes)):
+        nodes = c
+    if nodes is None:
+      edges = self._g.edges(data=True, keys=True)
+    else:
+      edges = [e for n in nodes
+               for e in self._g.edges([n], data=True, keys=True)]
+
+    seen = set()
+    for n1,n2,k,d in edges:
       l = d[LINK]
+      if l in seen: continue
+      seen.add(l)
       ok = False
       if query1 is None or self._test_node(l[0][0], args=(query1,), link=l):
         if query2 is None or self._test_node(l[1][0], args=(query2,), link=l):
@@ -508,8 +664,7 @@ class Graph (object):
             ok = True
             l = l.flip()
       if ok:
-        o.add(l)
-    return list(o)
+        yield l
 
   def ports_for_node (self, node):
     """
@@ -560,7 +715,10 @@ class Graph (object):
       one = kw['one']
       del kw['one']
     assert len(kw) == 0
-    r = self.find_links(query1, query2)
+    r = []
+    for l in self._find_links(query1, query2):
+      r.append(l)
+      if len(r) == (2 if one else 1): break
     if len(r) > 1 and one:
       raise RuntimeError("More than one match")
     elif len(r) == 0:
@@ -570,8 +728,9 @@ class Graph (object):
     return r[0]
 
   def has_link (self, query1=None, query2=()):
-    # Really bad implementation.  We can easily scape early.
-    return len(self.find_links(query1, query2)) > 0
+    for l in self._find_links(query1, query2):
+      return True
+    return False
 
   def _test_node (self, n, args=(), kw={}, link=None):
     #TODO: Should use a special value for unspecified n2
@@ -592,13 +751,134 @@ class Graph (object):
     return True
 
   def find (self, *args, **kw):
-    r = []
-    def test (n):
-      return self._test_node(n, args, kw)
-    for n in self._g.nodes():
-      if test(n):
-        r.append(n)
-    return r
+    return list(self._find(args, kw))
+
+  def _find (self, args, kw):
+    """
+    Generates the nodes find() finds
+    """
+    nodes = self._candidates(args, kw)
+    if nodes is None: nodes = self._g.nodes()
+    for n in nodes:
+      if self._test_node(n, args, kw):
+        yield n
+
+  def _candidates (self, args, kw):
+    """
+    Returns the nodes which the indexes say might match a query, or None
+    if they can't narrow it down
+    """
+    plan = self._plan(args, kw)
+    if plan is None: return None
+    return plan()
+
+  def _plan (self, args, kw):
+    """
+    Returns the plan for a query: a function which returns its candidates
+    (or None if the indexes can't tell at the time), or None
+
+    Plans are cached, so an application which keeps its query objects
+    around and uses them again only gets them planned once.
+    """
+    try:
+      key = (tuple(id(a) for a in args), tuple(sorted(kw.iteritems())))
+      entry = self._plans.get(key)
+    except TypeError:
+      # Something unhashable in kw
+      return self._compile_query(args, kw)
+    if entry is not None:
+      return entry[1]
+    plan = self._compile_query(args, kw)
+    if len(self._plans) >= _PLAN_CACHE_SIZE:
+      self._plans.clear()
+    # Keeping args means their ids can't be reused for other queries
+    self._plans[key] = (args, plan)
+    return plan
+
+  def _compile_query (self, args, kw):
+    plans = [self._compile(a) for a in args]
+    for k,v in kw.iteritems():
+      if k == "is_a":
+        plans.append(self._plan_type(v, True))
+      elif k == "type":
+        plans.append(self._plan_type(v, False))
+      else:
+        plans.append(self._plan_field(k, v))
+    return self._plan_and(plans)
+
+  def _compile (self, op):
+    t = type(op)
+    if t is And:
+      return self._plan_and([self._compile(op._left),
+                             self._compile(op._right)])
+    if t is Or:
+      l = self._compile(op._left)
+      r = self._compile(op._right)
+      if l is None or r is None: return None
+      def plan ():
+        a = l()
+        if a is None: return None
+        b = r()
+        if b is None: return None
+        return set(a).union(b)
+      return plan
+    if t is Equal:
+      for f, v in ((op._left, op._right), (op._right, op._left)):
+        if type(v) is not Literal: continue
+        if type(f) is not Field: continue
+        if type(f._left) is not Self or type(f._right) is not Literal:
+          continue
+        name = f._right._v
+        if isinstance(name, str) and not name.endswith("()"):
+          return self._plan_field(name, v._v)
+      return None
+    if t is IsType or t is IsInstance:
+      if type(op._left) is Self and type(op._right) is Literal:
+        return self._plan_type(op._right._v, t is IsInstance)
+    return None
+
+  def _plan_and (self, plans):
+    plans = [p for p in plans if p is not None]
+    if not plans: return None
+    if len(plans) == 1: return plans[0]
+    def plan ():
+      sets = [s for s in (p() for p in plans) if s is not None]
+      if not sets: return None
+      sets.sort(key=len)
+      r = set(sets[0])
+      for s in sets[1:]:
+        if not r: break
+        r.intersection_update(s)
+      return r
+    return plan
+
+  def _plan_field (self, name, value):
+    index = self._indexes.get(name)
+    if index is None: return None
+    try:
+      hash(value)
+    except TypeError:
+      return None
+    return lambda: index.find(value)
+
+  def _plan_type (self, t, subtypes):
+    by_type = self._by_type
+    if subtypes:
+      if not isinstance(t, (type, tuple)): return None
+      def plan ():
+        r = set()
+        for nt, nodes in by_type.iteritems():
+          if issubclass(nt, t): r.update(nodes)
+        return r
+      return plan
+    if isinstance(t, str):
+      def plan ():
+        r = set()
+        for nt, nodes in by_type.iteritems():
+          if nt.__name__ == t: r.update(nodes)
+        return r
+      return plan
+    return lambda: by_type.get(t, ())
 
   def get_one (self, *args, **kw):
     kw['one'] = True
@@ -621,7 +901,10 @@ class Graph (object):
     if 'one' in kw:
       del kw['one']
       one = True
-    r = self.find(*args,**kw)
+    r = []
+    for n in self._find(args, kw):
+      r.append(n)
+      if len(r) == (2 if one else 1): break
     if len(r) > 1 and one:
       raise RuntimeError("More than one match")
     elif len(r) == 0:
@@ -631,8 +914,9 @@ class Graph (object):
     return r[0]
 
   def has (self, *args, **kw):
-    # Really bad implementation.  We can easily scape early.
-    return len(self.find(*args,**kw)) > 0
+    for n in self._find(args, kw):
+      return True
+    return False
 
   def __len__ (self):
     return len(self._g)
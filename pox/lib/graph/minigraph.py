@@ -43,15 +43,18 @@ class MultiGraph (object):
       if a>b: return (b,a)
       return (a,b)
 
-    if nbunch is not None:
+    if nbunch is None:
+      items = self._edges.iteritems()
+    else:
+      # Only look at the given nodes' edges rather than all of them
       nbunch = set(nbunch)
+      items = ((n, self._edges[n]) for n in nbunch if n in self._edges)
 
     edges = {}
 
-    for e1,otherEnd in self._edges.iteritems():
+    for e1,otherEnd in items:
       for e2,rest in otherEnd.iteritems():
         if nbunch is not None:
-          if e1 not in nbunch: continue
           if len(nbunch) > 1 and e2 not in nbunch: continue
 
         e = fix(e1,e2)
@@ -57,8 +57,13 @@ class ethernet(packet_base):
 
   type_parsers = {}
 
-  def __init__(self, raw=None, prev=None, **kw):
+  def __init__(self, raw=None, prev=None, lazy=False, **kw):
+    """
+    If lazy is set, the layers inside the ethernet header (VLAN, IP, etc.)
+    are only parsed as they're used.
+    """
     packet_base.__init__(self)
+    self.lazy = lazy
 
     if len(ethernet.type_parsers) == 0:
       from vlan import vlan
@@ -105,7 +110,7 @@ class ethernet(packet_base):
 
     #TODO: support SNAP/LLC frames
     if self.type in ethernet.type_parsers:
-      self.next = ethernet.type_parsers[self.type](raw[ethernet.MIN_LEN:], self)
+      self.parse_next(ethernet.type_parsers[self.type], raw, ethernet.MIN_LEN)
     else:
       self.next = raw[ethernet.MIN_LEN:]
 
@@ -149,19 +149,16 @@ class ipv4(packet_base):
         if length > dlen:
             length = dlen # Clamp to what we've got
         if self.protocol == ipv4.UDP_PROTOCOL:
-            self.next = udp(raw=raw[self.hl*4:length], prev=self)
+            self.parse_next(udp, raw, self.hl*4, length, keep_raw=True)
         elif self.protocol == ipv4.TCP_PROTOCOL:
-            self.next = tcp(raw=raw[self.hl*4:length], prev=self)
+            self.parse_next(tcp, raw, self.hl*4, length, keep_raw=True)
         elif self.protocol == ipv4.ICMP_PROTOCOL:
-            self.next = icmp(raw=raw[self.hl*4:length], prev=self)
+            self.parse_next(icmp, raw, self.hl*4, length, keep_raw=True)
         elif dlen < self.iplen:
             self.msg('(ip parse) warning IP packet data shorter than IP len: %u < %u' % (dlen, self.iplen))
         else:
             self.next =  raw[self.hl*4:length]
 
-        if isinstance(self.next, packet_base) and not self.next.parsed:
-            self.next = raw[self.hl*4:length]
-
     def checksum(self):
         data = struct.pack('!BBHHHBBHII', (self.v << 4) + self.hl, self.tos,
                                  self.iplen, self.id,
@@ -24,6 +24,20 @@ lg = logging.getLogger('packet')
 
 from pox.lib.util import initHelper
 
+class _unparsed (object):
+    """
+    Stands in for the next layer of a lazily parsed packet until something
+    looks at it.  (See packet_base.parse_next().)
+    """
+    __slots__ = ('parser', 'raw', 'start', 'end', 'keep_raw')
+
+    def __init__ (self, parser, raw, start, end, keep_raw):
+        self.parser = parser
+        self.raw = raw
+        self.start = start
+        self.end = end
+        self.keep_raw = keep_raw
+
 class packet_base (object):
     """
     TODO: This description is somewhat outdated and should be fixed.
@@ -69,6 +83,46 @@ class packet_base (object):
         self.prev = None
         self.parsed = False
         self.raw = None
+        self.lazy = False
+
+    def _get_next (self):
+        n = self._next
+        if type(n) is _unparsed:
+            raw = n.raw[n.start:n.end]
+            p = n.parser(raw=raw, prev=self)
+            if n.keep_raw and not p.parsed:
+                p = raw
+            self._next = n = p
+        return n
+
+    def _set_next (self, next):
+        self._next = next
+
+    next = property(_get_next, _set_next, doc="""
+        The next layer (or the rest of the packet's bytes, or None).
+
+        For lazily parsed packets, the next layer is parsed the first time
+        this is read.
+        """)
+
+    def parse_next (self, parser, raw, start, end = None, keep_raw = False):
+        """
+        Sets next to parser(raw=raw[start:end], prev=self).
+
+        If keep_raw is set and the parser fails, next is set to the raw
+        bytes instead.  If this packet (or the one it's inside of) is being
+        parsed lazily, this is put off until next is first read, so layers
+        nobody looks at never get parsed (or even copied out of raw).
+        """
+        if self.lazy or getattr(self.prev, 'lazy', False):
+            self.lazy = True
+            self._next = _unparsed(parser, raw, start, end, keep_raw)
+            return
+        raw = raw[start:end]
+        p = parser(raw=raw, prev=self)
+        if keep_raw and not p.parsed:
+            p = raw
+        self._next = p
 
     def _init (self, kw):
         if 'payload' in kw:
@@ -27,6 +27,14 @@ import array
 import struct
 from socket import ntohs
 
+try:
+    import numpy as _numpy
+except ImportError:
+    _numpy = None
+
+# Below this, NumPy's per-call overhead makes it slower than sum()
+_NUMPY_MIN_LEN = 1024
+
 _ethtype_to_str = {}
 _ipproto_to_str = {}
 
@@ -49,29 +57,57 @@ _ipproto_to_str[47] = 'GRE'
 _ipproto_to_str[89] = 'OSPF'
 
 def checksum (data, start = 0, skip_word = None):
+    """
+    Calculates the Internet checksum of data (RFC 1071)
 
-    if len(data) % 2 != 0:
-        arr = array.array('H', data[:-1])
-    else:
-        arr = array.array('H', data)
+    start is an initial (native byte order) sum, and skip_word is the index
+    of a 16 bit word to leave out (e.g., the checksum field itself).  The
+    words are summed with sum() over an array (or with NumPy if it's
+    available and the data is large) rather than one at a time in Python.
+    """
+    if isinstance(data, bytearray):
+        data = bytes(data)
+    if len(data) & 1:
+        start += struct.unpack('H', data[-1:] + '\0')[0]
+        data = buffer(data, 0, len(data) - 1)
 
-    if skip_word is not None:
-        for i in range(0, len(arr)):
-            if i == skip_word:
-                continue
-            start +=  arr[i]
+    if _numpy is not None and len(data) >= _NUMPY_MIN_LEN:
+        arr = _numpy.frombuffer(data, dtype=_numpy.uint16)
+        start += int(arr.sum(dtype=_numpy.uint64))
     else:
-        for i in range(0, len(arr)):
-            start +=  arr[i]
+        arr = array.array('H')
+        arr.fromstring(data)
+        start += sum(arr)
 
-    if len(data) % 2 != 0:
-        start += struct.unpack('H', data[-1]+'\0')[0]
+    if skip_word is not None and skip_word < len(arr):
+        start -= int(arr[skip_word])
 
-    start  = (start >> 16) + (start & 0xffff)
-    start += (start >> 16)
+    while start >> 16:
+        start = (start >> 16) + (start & 0xffff)
 
     return ntohs(~start & 0xffff)
 
+def checksum_update (csum, old, new):
+    """
+    Incrementally updates a checksum for a change in the data it covers
+
+    csum is the old checksum (as it appears in a header, e.g., ipv4.csum),
+    and old and new are the old and new contents (as packed bytes) of the
+    changed part, which must start on a 16 bit boundary.  Uses equation 3
+    from RFC 1624, so it doesn't need the rest of the data.
+    """
+    if len(old) != len(new):
+        raise ValueError("Old and new data must be the same length")
+    if len(old) & 1:
+        old += '\0'
+        new += '\0'
+    fmt = '!%iH' % (len(old) // 2,)
+    s = (~csum & 0xffff) + sum(struct.unpack(fmt, new))
+    s += sum(~w & 0xffff for w in struct.unpack(fmt, old))
+    while s >> 16:
+        s = (s >> 16) + (s & 0xffff)
+    return ~s & 0xffff
+
 def ethtype_to_str(t):
     if t < 0x0600:
         return "llc/%04x" % (t,)
@@ -85,3 +121,77 @@ def ipproto_to_str(t):
         return _ipproto_to_str[t]
     else:
         return "%x" % t
+
+_eth_struct = struct.Struct('!6s6sH')
+_ipv4_struct = struct.Struct('!BBHHHBBHII')
+_ports_struct = struct.Struct('!HH')
+_arp_struct = struct.Struct('!HHBBH6sI6sI')
+
+def flow_key(raw):
+    """
+    Reads the L2-L4 fields OpenFlow matches on straight out of an ethernet
+    frame, in one pass and without building any packet objects.
+
+    Returns (dl_src, dl_dst, dl_vlan, dl_vlan_pcp, dl_type, nw_tos,
+    nw_proto, nw_src, nw_dst, tp_src, tp_dst), or None if raw is too short
+    for an ethernet header.  Ethernet addresses are raw bytes and IP
+    addresses are unsigned ints.  Fields the frame doesn't have are None.
+    The fields are those ofp_match.from_packet() would set, except that for
+    802.1Q frames dl_type is the encapsulated type.
+    """
+    end = len(raw)
+    if end < 14:
+        return None
+    (dl_dst, dl_src, dl_type) = _eth_struct.unpack_from(raw)
+    dl_vlan = dl_vlan_pcp = None
+    nw_tos = nw_proto = nw_src = nw_dst = tp_src = tp_dst = None
+    offset = 14
+
+    if dl_type == 0x8100:
+        if end < 18:
+            return (dl_src, dl_dst, None, None, dl_type,
+                    None, None, None, None, None, None)
+        (tci, dl_type) = _ports_struct.unpack_from(raw, 14)
+        dl_vlan = tci & 0x0fff
+        dl_vlan_pcp = tci >> 13
+        offset = 18
+
+    if dl_type == 0x0800:
+        if end - offset >= 20:
+            (vhl, tos, iplen, _, _, _, proto, _, src, dst) = \
+                _ipv4_struct.unpack_from(raw, offset)
+            hl = (vhl & 0x0f) * 4
+            if (vhl >> 4 == 4 and hl >= 20 and iplen >= 20 and hl < iplen
+                    and hl <= end - offset):
+                nw_tos = tos
+                nw_proto = proto
+                nw_src = src
+                nw_dst = dst
+                # Same clamping and length checks as ipv4/tcp/udp/icmp
+                l4 = offset + hl
+                l4_end = min(offset + iplen, end)
+                l4_len = l4_end - l4
+                if proto == 6:
+                    if l4_len >= 20:
+                        off = (ord(raw[l4 + 12]) >> 4) * 4
+                        if 20 <= off <= l4_len:
+                            (tp_src, tp_dst) = _ports_struct.unpack_from(raw, l4)
+                elif proto == 17:
+                    if l4_len >= 8:
+                        (tp_src, tp_dst) = _ports_struct.unpack_from(raw, l4)
+                elif proto == 1:
+                    if l4_len >= 4:
+                        tp_src = ord(raw[l4])
+                        tp_dst = ord(raw[l4 + 1])
+    elif dl_type == 0x0806 or dl_type == 0x8035:
+        if end - offset >= 28:
+            (_, _, _, protolen, opcode, _, src, _, dst) = \
+                _arp_struct.unpack_from(raw, offset)
+            if opcode <= 255:
+                nw_proto = opcode
+                if protolen == 4:
+                    nw_src = src
+                    nw_dst = dst
+
+    return (dl_src, dl_dst, dl_vlan, dl_vlan_pcp, dl_type,
+            nw_tos, nw_proto, nw_src, nw_dst, tp_src, tp_dst)
@@ -93,10 +93,10 @@ class udp(packet_base):
 
         if (self.dstport == dhcp.SERVER_PORT
                     or self.dstport == dhcp.CLIENT_PORT):
-            self.next = dhcp(raw=raw[udp.MIN_LEN:],prev=self)
+            self.parse_next(dhcp, raw, udp.MIN_LEN)
         elif (self.dstport == dns.SERVER_PORT
                     or self.srcport == dns.SERVER_PORT):
-            self.next = dns(raw=raw[udp.MIN_LEN:],prev=self)
+            self.parse_next(dns, raw, udp.MIN_LEN)
         elif dlen < self.len:
             self.msg('(udp parse) warning UDP packet data shorter than UDP len: %u < %u' % (dlen, self.len))
             return
@@ -89,8 +89,8 @@ class vlan(packet_base):
         assert self.eth_type != 0x8100
 
         if self.eth_type in ethernet.type_parsers:
-            self.next = ethernet.type_parsers[self.eth_type]\
-             (raw=raw[vlan.MIN_LEN:],prev=self)
+            self.parse_next(ethernet.type_parsers[self.eth_type], raw,
+                            vlan.MIN_LEN)
 
     def hdr(self, payload):
         pcpid  = self.pcp << 13
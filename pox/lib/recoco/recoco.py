@@ -26,12 +26,33 @@ import select
 import traceback
 import os
 import socket
+import errno
+import heapq
+import itertools
 import pox.lib.util
-import random
-from pox.lib.epoll_select import EpollSelect
 
 CYCLE_MAXIMUM = 2
 
+# Task priority classes.  The scheduler always runs a ready task from the
+# highest class which has one; tasks within a class take turns.
+PRIORITY_LOW = 0
+PRIORITY_NORMAL = 1
+PRIORITY_HIGH = 2
+
+# How many slices higher classes can run in a row while a lower class is
+# waiting before the lower class gets one anyway (so it can't starve).
+STARVATION_LIMIT = 32
+
+# epoll events SelectHub treats as readable, writable and exceptional (they
+# include errors and hangups, as select() would)
+_EPOLL_READ = getattr(select, 'EPOLLIN', 0) | getattr(select, 'EPOLLPRI', 0)
+_EPOLL_ERROR = getattr(select, 'EPOLLERR', 0) | getattr(select, 'EPOLLHUP', 0)
+_EPOLL_READABLE = _EPOLL_READ | _EPOLL_ERROR
+_EPOLL_WRITABLE = getattr(select, 'EPOLLOUT', 0) | _EPOLL_ERROR
+
+_noInterest = (frozenset(), frozenset(), frozenset())
+_noLists = ([], [], [])
+
 # A ReturnFunction can return this to skip a scheduled slice at the last
 # moment.
 ABORT = object()
@@ -47,7 +68,13 @@ def generateTaskID ():
 class BaseTask  (object):
   id = None
   #running = False
-  priority = 1
+  priority = PRIORITY_NORMAL
+
+  # Accounting: how many slices this task has run and for how long in total
+  slices = 0
+  run_time = 0.0
+
+  _queued = False # True while in a scheduler's ready queue
 
   @classmethod
   def new (cls, *args, **kw):
@@ -71,6 +98,8 @@ class BaseTask  (object):
     """
     Schedules this task.
 
+    priority is one of the PRIORITY_* classes (anything higher or lower
+    than those counts as the highest or lowest one).
     See Scheduler.schedule() and Scheduler.fast_schedule() for the meaning
     of the 'fast' argument.
     """
@@ -134,8 +163,11 @@ class Task (BaseTask):
 class Scheduler (object):
   """ Scheduler for Tasks """
   def __init__ (self, isDefaultScheduler = None, startInThread = True,
-                daemon = False, useEpoll=False):
-    self._ready = deque()
+                daemon = False, useEpoll=None):
+    # Ready queues, highest priority class first
+    self._queues = (deque(), deque(), deque())
+    self._streak = 0 # Slices run while a lower class was waiting
+    self._lowTurn = False # Whether low gets the next starvation slot
     self._hasQuit = False
     self._selectHub = SelectHub(self, useEpoll=useEpoll)
     self._thread = None
@@ -164,12 +196,15 @@ class Scheduler (object):
     a co-op-thread-safe manner.
     """
 
-    with self._lock:
-      if self._callLaterTask is None:
-        self._callLaterTask = CallLaterTask()
-        self._callLaterTask.start()
+    t = self._callLaterTask
+    if t is None:
+      with self._lock:
+        if self._callLaterTask is None:
+          self._callLaterTask = CallLaterTask(self)
+          self._callLaterTask.start(self, fast=True)
+        t = self._callLaterTask
 
-    self._callLaterTask.callLater(func, *args, **kw)
+    t.callLater(func, *args, **kw)
 
   def runThreaded (self, daemon = False):
     self._thread = Thread(target = self.run)
@@ -192,9 +227,7 @@ class Scheduler (object):
     if threading.current_thread() is self._thread:
       # We're know we're good.
       #TODO: Refactor the following with ScheduleTask
-      if task in self._ready:
-        # It might make sense to keep a flag on the task, since checking
-        # if it's in the ready list is not very efficient.
+      if task._queued:
         # Not sure if it makes sense to print out a message here or not.
         import logging
         logging.getLogger("recoco").info("Task %s scheduled multiple " +
@@ -228,23 +261,58 @@ class Scheduler (object):
     """
 
     # Sanity check.  Won't catch all cases.
-    assert task not in self._ready
-
+    assert not task._queued
+
+    self._enqueue(task, first)
+    if not self._event.is_set(): # Setting it takes a lock
+      self._event.set()
+
+  def _enqueue (self, task, first = False):
+    task._queued = True
+    p = task.priority
+    if p >= PRIORITY_HIGH: q = self._queues[0]
+    elif p >= PRIORITY_NORMAL: q = self._queues[1]
+    else: q = self._queues[2]
     if first:
-      self._ready.appendleft(task)
+      q.appendleft(task)
     else:
-      self._ready.append(task)
+      q.append(task)
 
-    self._event.set()
+  def _pop (self):
+    """
+    Removes and returns the next task to run, or None if none are ready
+    """
+    high, normal, low = self._queues
+    if high: q, lower = high, normal or low
+    elif normal: q, lower = normal, low
+    elif low: q, lower = low, None
+    else: return None
+    if lower:
+      # A lower class is waiting
+      self._streak += 1
+      if self._streak > STARVATION_LIMIT:
+        self._streak = 0
+        if lower is normal and low:
+          # Both lower classes are waiting, so they take turns
+          if self._lowTurn: lower = low
+          self._lowTurn = not self._lowTurn
+        q = lower
+    else:
+      self._streak = 0
+    t = q.popleft()
+    t._queued = False
+    return t
 
   def quit (self):
     self._hasQuit = True
+    self._event.set()
 
   def run (self):
     try:
       while self._hasQuit == False:
-        if len(self._ready) == 0:
-          self._event.wait(CYCLE_MAXIMUM) # Wait for a while
+        if not any(self._queues):
+          # (With a timeout, Event.wait() polls)
+          self._event.wait()
           self._event.clear()
           if self._hasQuit: break
         r = self.cycle()
@@ -255,26 +323,14 @@ class Scheduler (object):
       self._allDone = True
 
   def cycle (self):
-    #if len(self._ready) == 0: return False
-
-    # Patented hilarious priority system
-    #TODO: Replace it with something better
-    t = None
-    try:
-      while True:
-        t = self._ready.popleft()
-        if t >= 1: break
-        if random.random() >= t.priority: break
-        if len(self._ready) == 1: break
-        self._ready.append(t)
-    except IndexError:
-      return False
-
-    #print(len(self._ready), "tasks")
+    t = self._pop()
+    if t is None: return False
 
+    start = time.time()
     try:
       rv = t.execute()
     except StopIteration:
+      self._selectHub.retire(t)
       return True
     except:
       try:
@@ -282,7 +338,11 @@ class Scheduler (object):
         traceback.print_exc()
       except:
         pass
+      self._selectHub.retire(t)
       return True
+    finally:
+      t.slices += 1
+      t.run_time += time.time() - start
 
     if isinstance(rv, BlockingOperation):
       try:
@@ -291,6 +351,7 @@ class Scheduler (object):
         print("Task", t, "caused exception during a blocking operation and " +
               "was de-scheduled")
         traceback.print_exc()
+        self._selectHub.retire(t)
     elif rv is False:
       # Just unschedule/sleep
       #print "Unschedule", t, rv
@@ -299,7 +360,7 @@ class Scheduler (object):
       # Sleep time
       if rv == 0:
         #print "sleep 0"
-        self._ready.append(t)
+        self._enqueue(t)
       else:
         self._selectHub.registerTimer(t, rv)
     elif rv == None:
@@ -490,15 +551,44 @@ class SelectHub (object):
   """
   This class is a single select() loop that handles all Select() requests for
   a scheduler as well as timed wakes (i.e., Sleep()).
+
+  With epoll (the default where it's available), the file descriptors tasks
+  wait on stay registered between Select()s, and registrations only change
+  when a task's interest in them does -- so a wakeup costs time in
+  proportion to the active descriptors rather than all of them.
   """
-  def __init__ (self, scheduler, useEpoll=False):
-    # We store tuples of (elapse-time, task)
+  def __init__ (self, scheduler, useEpoll=None):
+    # We store tuples of (elapse-time, sequence, task)
     self._sleepers = [] # Sleeping items stored as a heap
-    self._incoming = Queue() # Threadsafe queue for new items
+    self._sequence = itertools.count()
+    self._incoming = deque() # Threadsafe queue for new items
+    self._retiring = deque() # Threadsafe queue of tasks which have ended
+
+    # The rest is only touched by our thread.
+    # Waiting tasks -> their entry in _sleepers (or None if no timeout)
+    self._waiting = {}
+    # Task -> (rset, wset, xset) of the objects registered for it
+    self._interest = {}
+    # Task -> copies of the lists it last passed, while they still match its
+    # interest (for epoll, where the interest outlives the wait)
+    self._lists = {}
+    # Task -> objects in its interest we've stopped watching until it waits
+    # again (so they don't keep firing while it's busy)
+    self._suspended = {}
+    # Registered object -> task, for each kind of interest
+    self._readers = {}
+    self._writers = {}
+    self._errors = {}
+    # For epoll: registered object -> (fd, mask), and fd -> object
+    self._fds = {}
+    self._objs = {}
+    # Objects epoll can't watch (e.g., regular files); always ready
+    self._unpollable = set()
 
     self._scheduler = scheduler
     self._pinger = pox.lib.util.makePinger()
-    self.epoll = EpollSelect() if useEpoll else None
+    if useEpoll is None: useEpoll = hasattr(select, 'epoll')
+    self.epoll = select.epoll() if useEpoll else None
 
     self._ready = False
 
@@ -510,106 +600,299 @@ class SelectHub (object):
     #while self._ready == False:
 
   def _threadProc (self):
-    tasks = {}
-    timeouts = []
-    rets = {}
+    pinger = self._pinger
+    epoll = self.epoll
+    waiting = self._waiting
+    readers = self._readers
+    writers = self._writers
+    errors = self._errors
+    sleepers = self._sleepers
+    if epoll:
+      epoll.register(pinger.fileno(), _EPOLL_READ)
+      self._objs[pinger.fileno()] = pinger
 
     while self._scheduler._hasQuit == False:
-      #print("SelectHub cycle")
+      rets = {}
+      if self._unpollable:
+        self._pollUnpollable(rets)
+
+      timeout = CYCLE_MAXIMUM
+      while sleepers and waiting.get(sleepers[0][2]) is not sleepers[0]:
+        heapq.heappop(sleepers) # Stale (the task has been woken already)
+      if sleepers:
+        timeout = min(timeout, max(0, sleepers[0][0] - time.time()))
+      if rets: timeout = 0
+
+      pinged = False
+      try:
+        if epoll:
+          events = epoll.poll(timeout)
+        else:
+          ro, wo, xo = select.select(readers.keys() + [pinger],
+                                     writers.keys(), errors.keys(), timeout)
+      except (IOError, OSError, select.error) as e:
+        if e.args[0] == errno.EINTR: continue
+        raise
+
+      if epoll:
+        objs = self._objs
+        for fd,ev in events:
+          obj = objs.get(fd)
+          if obj is pinger:
+            pinged = True
+            continue
+          stale = False
+          if ev & _EPOLL_READABLE:
+            t = readers.get(obj)
+            if t in waiting:
+              rets.setdefault(t, ([],[],[]))[0].append(obj)
+            elif t is not None:
+              stale = True
+          if ev & _EPOLL_WRITABLE:
+            t = writers.get(obj)
+            if t in waiting:
+              rets.setdefault(t, ([],[],[]))[1].append(obj)
+            elif t is not None:
+              stale = True
+          if ev & _EPOLL_ERROR:
+            t = errors.get(obj)
+            if t in waiting:
+              rets.setdefault(t, ([],[],[]))[2].append(obj)
+            elif t is not None:
+              stale = True
+          if stale:
+            # Still registered for a task which has since been woken
+            self._suspend(obj)
+      else:
+        for o in ro:
+          if o is pinger:
+            pinged = True
+          else:
+            rets.setdefault(readers[o], ([],[],[]))[0].append(o)
+        for o in wo:
+          rets.setdefault(writers[o], ([],[],[]))[1].append(o)
+        for o in xo:
+          rets.setdefault(errors[o], ([],[],[]))[2].append(o)
+
+      if pinged:
+        pinger.pongAll()
+        incoming = self._incoming
+        while incoming:
+          self._add(*incoming.popleft())
+        retiring = self._retiring
+        while retiring:
+          self._retire(retiring.popleft())
+
+      # Dispatch timers / release timeouts
+      now = time.time()
+      while sleepers and sleepers[0][0] <= now:
+        entry = heapq.heappop(sleepers)
+        task = entry[2]
+        if waiting.get(task) is entry and task not in rets:
+          rets[task] = ([],[],[])
+
+      for t,v in rets.iteritems():
+        self._wake(t, v)
 
-      if len(timeouts) == 0:
-        timeout = None
+    if epoll:
+      epoll.close()
+
+  def _add (self, task, rlist, wlist, xlist, timeout):
+    """
+    Starts a task waiting (in our thread)
+    """
+    assert task not in self._waiting
+    entry = None
+    if timeout is not None:
+      entry = (timeout, next(self._sequence), task)
+      heapq.heappush(self._sleepers, entry)
+      if len(self._sleepers) > 2 * len(self._waiting) + 64:
+        # Lots of stale entries from tasks woken before their timeouts
+        self._sleepers[:] = [e for e in self._sleepers
+                             if self._waiting.get(e[2]) is e]
+        heapq.heapify(self._sleepers)
+    self._waiting[task] = entry
+
+    suspended = None
+    if self.epoll:
+      suspended = self._suspended.pop(task, None)
+      lists = (list(rlist) if rlist else [], list(wlist) if wlist else [],
+               list(xlist) if xlist else [])
+      if self._lists.get(task, _noLists) == lists:
+        # Same as last time, which is the usual case
+        if suspended:
+          for obj in suspended:
+            self._update(obj)
+        return
+      if lists[0] or lists[1] or lists[2]:
+        self._lists[task] = lists
       else:
-        timeout = self._sleepers[0][0] - time.time()
-        if timeout < 0: timeout = 0
+        del self._lists[task]
+
+    new = (set(rlist) if rlist else set(), set(wlist) if wlist else set(),
+           set(xlist) if xlist else set())
+    old = self._interest.get(task, _noInterest)
+    if new[0] or new[1] or new[2]:
+      self._interest[task] = new
+    elif old is _noInterest:
+      return # Just a timer (so nothing can be suspended either)
+    else:
+      del self._interest[task]
+
+    changed = set()
+    for i,owners in enumerate((self._readers, self._writers, self._errors)):
+      n = new[i]
+      o = old[i]
+      if n == o: continue
+      for obj in o - n:
+        if owners.get(obj) is task: del owners[obj]
+      for obj in n - o:
+        prev = owners.get(obj)
+        if prev is not None and prev is not task:
+          # Take it from a task which isn't waiting on it anymore
+          self._interest[prev][i].discard(obj)
+          self._lists.pop(prev, None)
+        owners[obj] = task
+      changed |= n ^ o
+    if self.epoll:
+      if suspended: changed |= suspended
+      for obj in changed:
+        self._update(obj)
+
+  def _wake (self, task, returnVal):
+    del self._waiting[task]
+    if not self.epoll:
+      # select() has no state to keep, so forget the task's interest now
+      r,w,x = self._interest.pop(task, _noInterest)
+      for objs,owners in ((r,self._readers), (w,self._writers),
+                          (x,self._errors)):
+        for obj in objs:
+          if owners.get(obj) is task: del owners[obj]
+    self._return(task, returnVal)
+
+  def retire (self, task):
+    """
+    Forgets about a task which has ended (called by the scheduler)
 
-      #NOTE: Everything you select on eventually boils down to file descriptors,
-      #      which are unique, obviously.  It might be possible to leverage this
-      #      to reduce hashing cost (i.e. by picking a really good hashing
-      #      function), though this is complicated by wrappers, etc...
-      rl = {}
-      wl = {}
-      xl = {}
+    With epoll, a task's interest outlives its waits, so it has to be
+    dropped explicitly or the task and what it waited on are kept forever.
+    """
+    # Only the hub's thread changes _interest, and never for a task which
+    # is running, so this is safe to check from here
+    if task not in self._interest: return
+    self._retiring.append(task)
+    self._cycle()
 
-      timeout = None
-      timeoutTask = None
+  def _retire (self, task):
+    if task in self._waiting: return # Somehow waiting again
+    self._lists.pop(task, None)
+    suspended = self._suspended.pop(task, ())
+    r,w,x = self._interest.pop(task, _noInterest)
+    changed = set()
+    for objs,owners in ((r,self._readers), (w,self._writers),
+                        (x,self._errors)):
+      for obj in objs:
+        if owners.get(obj) is task:
+          del owners[obj]
+          changed.add(obj)
+    if self.epoll:
+      for obj in changed | set(suspended):
+        self._update(obj)
+
+  def _suspend (self, obj):
+    """
+    Stops watching obj for tasks which aren't waiting anymore
 
-      now = time.time()
+    It's still in their interest, and is watched again as soon as they
+    wait again.
+    """
+    for owners in (self._readers, self._writers, self._errors):
+      t = owners.get(obj)
+      if t is not None and t not in self._waiting:
+        self._suspended.setdefault(t, set()).add(obj)
+    self._update(obj)
 
-      expired = None
+  def _update (self, obj):
+    """
+    Brings obj's epoll registration in line with who's interested in it
+    """
+    mask = 0
+    wanted = False
+    for owners,bits in ((self._readers, _EPOLL_READ),
+                        (self._writers, select.EPOLLOUT),
+                        (self._errors, 0)):
+      t = owners.get(obj)
+      if t is not None and obj not in self._suspended.get(t, ()):
+        mask |= bits
+        wanted = True
+    cur = self._fds.get(obj)
+    if cur is None:
+      if not wanted or obj in self._unpollable: return
+      try:
+        fd = obj if isinstance(obj, (int, long)) else obj.fileno()
+        other = self._objs.get(fd)
+        if other is not None:
+          # fd was closed and reused, or obj is another wrapper for it
+          self._forget(other)
+        try:
+          self.epoll.register(fd, mask)
+        except IOError as e:
+          if e.errno != errno.EEXIST: raise
+          self.epoll.modify(fd, mask)
+      except (IOError, OSError, socket.error):
+        # epoll can't watch it (e.g., it's a regular file or it's closed),
+        # so do what select() would and say it's ready
+        self._unpollable.add(obj)
+        return
+      self._fds[obj] = (fd, mask)
+      self._objs[fd] = obj
+    elif not wanted:
+      self._unregister(obj)
+    elif mask != cur[1]:
+      try:
+        self.epoll.modify(cur[0], mask)
+      except (IOError, OSError):
+        # Closed behind our back
+        self._unregister(obj)
+        self._unpollable.add(obj)
+        return
+      self._fds[obj] = (cur[0], mask)
+
+  def _unregister (self, obj):
+    cur = self._fds.pop(obj, None)
+    if cur is None: return
+    del self._objs[cur[0]]
+    try:
+      self.epoll.unregister(cur[0])
+    except (IOError, OSError):
+      pass # Already closed
 
-      for t,trl,twl,txl,tto in tasks.itervalues():
-        if tto != None:
-          if tto <= now:
-            # Already expired
-            if expired is None: expired = []
-            expired.append(t)
-            if tto-now > 0.1: print("preexpired",tto,now,tto-now)
-            continue
-          tt = tto - now
-          if tt < timeout or timeout is None:
-            timeout = tt
-            timeoutTask = t
-
-        if trl:
-          for i in trl: rl[i] = t
-        if twl:
-          for i in twl: wl[i] = t
-        if txl:
-          for i in txl: xl[i] = t
-
-      if expired:
-        for t in expired:
-          del tasks[t]
-          self._return(t, ([],[],[]))
-
-      if timeout is None: timeout = CYCLE_MAXIMUM
-      if self.epoll:
-        ro, wo, xo = self.epoll.select( rl.keys() + [self._pinger],
-                                  wl.keys(),
-                                  xl.keys(), timeout )
-      else:
-        ro, wo, xo = select.select( rl.keys() + [self._pinger],
-                                  wl.keys(),
-                                  xl.keys(), timeout )
-
-      if len(ro) == 0 and len(wo) == 0 and len(xo) == 0 and timeoutTask != None:
-        # IO is idle - dispatch timers / release timeouts
-        del tasks[timeoutTask]
-        self._return(timeoutTask, ([],[],[]))
-      else:
-        # We have IO events
-        if self._pinger in ro:
-          self._pinger.pongAll()
-          while not self._incoming.empty():
-            stuff = self._incoming.get(True)
-            task = stuff[0]
-            assert task not in tasks
-            tasks[task] = stuff
-            self._incoming.task_done()
-          if len(ro) == 1 and len(wo) == 0 and len(xo) == 0:
-            # Just recycle
-            continue
-          ro.remove(self._pinger)
-
-        # At least one thread is going to be resumed
-        for i in ro:
-          task = rl[i]
-          if task not in rets: rets[task] = ([],[],[])
-          rets[task][0].append(i)
-        for i in wo:
-          task = wl[i]
-          if task not in rets: rets[task] = ([],[],[])
-          rets[task][1].append(i)
-        for i in xo:
-          task = xl[i]
-          if task not in rets: rets[task] = ([],[],[])
-          rets[task][2].append(i)
-
-        for t,v in rets.iteritems():
-          del tasks[t]
-          self._return(t, v)
-        rets.clear()
+  def _forget (self, obj):
+    """
+    Removes obj's epoll registration and any interest in it
+    """
+    self._unregister(obj)
+    self._unpollable.discard(obj)
+    for i,owners in enumerate((self._readers, self._writers, self._errors)):
+      t = owners.pop(obj, None)
+      if t is not None and t in self._interest:
+        self._interest[t][i].discard(obj)
+        self._lists.pop(t, None)
+
+  def _pollUnpollable (self, rets):
+    """
+    Reports objects epoll can't watch as ready for whoever's waiting on them
+    """
+    for obj in list(self._unpollable):
+      found = False
+      for i,owners in enumerate((self._readers, self._writers, self._errors)):
+        t = owners.get(obj)
+        if t is None: continue
+        found = True
+        if t in self._waiting:
+          rets.setdefault(t, ([],[],[]))[i].append(obj)
+      if not found:
+        self._unpollable.discard(obj)
 
   def registerSelect (self, task, rlist = None, wlist = None, xlist = None,
                       timeout = None, timeIsAbsolute = False):
@@ -617,7 +900,7 @@ class SelectHub (object):
       if timeout != None:
         timeout += time.time()
 
-    self._incoming.put((task, rlist, wlist, xlist, timeout))
+    self._incoming.append((task, rlist, wlist, xlist, timeout))
     self._cycle()
 
   def _cycle (self):
@@ -659,9 +942,7 @@ class ScheduleTask (BaseTask):
 
   def run (self):
     #TODO: Refactor the following, since it is copy/pasted from schedule().
-    if self._task in self._scheduler._ready:
-      # It might make sense to keep a flag on the task, since checking
-      # if it's in the ready list is not very efficient.
+    if self._task._queued:
       # Not sure if it makes sense to print out a message here or not.
       import logging
       logging.getLogger("recoco").info("Task %s scheduled multiple " +
@@ -755,31 +1036,41 @@ class Timer (Task):
 
 
 class CallLaterTask (BaseTask):
-  def __init__ (self):
+  """
+  Runs the functions passed to Scheduler.callLater()
+
+  Calls may come from any thread.  They're queued without locking, and
+  only the first one since the task last ran has to wake it up, so a busy
+  producer mostly just appends to a deque.
+  """
+  def __init__ (self, scheduler = None):
     BaseTask.__init__(self)
-    self._pinger = pox.lib.util.makePinger()
-    from collections import deque
+    if scheduler is None: scheduler = defaultScheduler
+    self._scheduler = scheduler
     self._calls = deque()
+    # Held from when the task is woken until it starts making the calls
+    self._wake = threading.Lock()
+    self._wake.acquire() # We're about to be started
 
   def callLater (self, func, *args, **kw):
     assert callable(func)
     self._calls.append((func,args,kw))
-    self._pinger.ping()
+    if self._wake.acquire(False):
+      self._scheduler.fast_schedule(self)
 
   def run (self):
+    calls = self._calls
     while True:
-      yield Select([self._pinger], None, None)
-      self._pinger.pongAll()
-      try:
-        while True:
-          e = self._calls.popleft()
-          try:
-            e[0](*e[1], **e[2])
-          except:
-            import logging
-            logging.getLogger("recoco").exception("Exception calling %s", e[0])
-      except:
-        pass
+      self._wake.release()
+      # Just the ones we have now; any more get their own wakeup
+      for _ in xrange(len(calls)):
+        e = calls.popleft()
+        try:
+          e[0](*e[1], **e[2])
+        except:
+          import logging
+          logging.getLogger("recoco").exception("Exception calling %s", e[0])
+      yield False # Sleep until woken
 
 
 class BlockingTask (BaseTask):
@@ -157,6 +157,8 @@ class Event (object):
   def _invoke (self, handler, *args, **kw):
     return handler(self, *args, **kw)
 
+_defaultInvoke = Event._invoke.im_func
+
 def handleEventException (source, event, args, kw, exc_info):
   """
   Called when an exception is raised by an event handler when the event
@@ -220,6 +222,15 @@ class EventMixin (object):
       setattr(self, "_eventMixin_events", True)
     if not hasattr(self, "_eventMixin_handlers"):
       setattr(self, "_eventMixin_handlers", {})
+    if not hasattr(self, "_eventMixin_dispatch"):
+      # Event type -> compiled handlers (see _eventMixin_compile())
+      setattr(self, "_eventMixin_dispatch", {})
+    if not hasattr(self, "_eventMixin_eids"):
+      # EID -> (event type, handler entry) for every live listener.  Entries
+      # in _eventMixin_handlers whose EIDs aren't in here are tombstones.
+      setattr(self, "_eventMixin_eids", {})
+      # Event type -> number of tombstones in its handler list
+      setattr(self, "_eventMixin_dead", {})
 
   def raiseEventNoErrors (self, event, *args, **kw):
     """
@@ -245,22 +256,27 @@ class EventMixin (object):
     Returns the event object, unless it was never created (because there were
     no listeners) in which case returns None.
     """
-    self._eventMixin_init()
+    try:
+      dispatch = self._eventMixin_dispatch
+    except AttributeError:
+      self._eventMixin_init()
+      dispatch = self._eventMixin_dispatch
 
-    classCall = False
     if isinstance(event, Event):
       eventType = event.__class__
-      classCall = True
       if event.source is None: event.source = self
+      compiled = dispatch.get(eventType)
+      if compiled is None:
+        compiled = self._eventMixin_compile(eventType)
     elif issubclass(event, Event):
+      eventType = event
+      compiled = dispatch.get(eventType)
+      if compiled is None:
+        compiled = self._eventMixin_compile(eventType)
       # Check for early-out
-      if event not in self._eventMixin_handlers:
-        return None
-      if len(self._eventMixin_handlers[event]) == 0:
+      if not compiled[0]:
         return None
 
-      classCall = True
-      eventType = event
       event = eventType(*args, **kw)
       args = ()
       kw = {}
@@ -272,32 +288,65 @@ class EventMixin (object):
       raise RuntimeError("Event " + str(eventType) +
                          " not defined on object of type " + str(type(self)))
 
-    # Create a copy so that it can be modified freely during event processing.
-    # It might make sense to change this.
-    handlers = self._eventMixin_handlers.get(eventType, [])
-    for (priority, handler, once, eid) in handlers:
-      if classCall:
-        rv = event._invoke(handler, *args, **kw)
-      else:
-        rv = handler(event, *args, **kw)
-      if once: self.removeListener(eid)
-      if rv is None: continue
-      if rv is False:
-        self.removeListener(eid)
-      if rv is True:
-        break
-      if type(rv) == tuple:
-        if len(rv) >= 2 and rv[1] == True:
-          self.removeListener(eid)
-        if len(rv) >= 1 and rv[0]:
-          break
-        if len(rv) == 0:
-          break
-      #if classCall and hasattr(event, "halt") and event.halt:
-      if classCall and event.halt:
-        break
+    # The compiled handler tuple is a snapshot, so handlers can be added and
+    # removed freely during event processing.
+    entries, plain = compiled
+    if plain and not args and not kw:
+      # Event._invoke() would just call the handler with the event
+      for handler, once, eid in entries:
+        rv = handler(event)
+        if once: self._eventMixin_removeEID(eid)
+        if rv is None: continue
+        if self._eventMixin_handleReturn(rv, (eventType, eid)): break
+        if event.halt: break
+    else:
+      invoke = event._invoke
+      for handler, once, eid in entries:
+        rv = invoke(handler, *args, **kw)
+        if once: self._eventMixin_removeEID(eid)
+        if rv is None: continue
+        if self._eventMixin_handleReturn(rv, (eventType, eid)): break
+        if event.halt: break
     return event
 
+  def _eventMixin_handleReturn (self, rv, eid):
+    """
+    Acts on the (non-None) value returned by an event handler.
+
+    Returns True if the event shouldn't be passed to any more handlers.
+    """
+    if rv is False:
+      self.removeListener(eid)
+    elif rv is True:
+      return True
+    elif type(rv) == tuple:
+      if len(rv) >= 2 and rv[1] == True:
+        self.removeListener(eid)
+      if len(rv) >= 1 and rv[0]:
+        return True
+      if len(rv) == 0:
+        return True
+    return False
+
+  def _eventMixin_compile (self, eventType):
+    """
+    Builds (and caches) what raiseEvent() needs to dispatch eventType.
+
+    This is a tuple of (handler, once, eid) tuples in the order they should
+    be called, and whether the event type uses the default _invoke().
+    The cache entry is thrown out whenever listeners are added or removed.
+    """
+    handlers = self._eventMixin_handlers.get(eventType, ())
+    eids = self._eventMixin_eids
+    entries = tuple((handler, once, eid)
+                    for (priority, handler, once, eid) in handlers
+                    if eid in eids)
+    invoke = getattr(eventType, "_invoke", None)
+    plain = getattr(invoke, "im_func", None) is _defaultInvoke
+    compiled = (entries, plain)
+    self._eventMixin_dispatch[eventType] = compiled
+    return compiled
+
   def removeListeners (self, listeners):
     altered = False
     for l in listeners:
@@ -308,61 +357,59 @@ class EventMixin (object):
     """
     Returns the number of listeners.
     """
-    return sum((len(x) for x in self._eventMixin_handlers.itervalues()))
+    return len(self._eventMixin_eids)
 
   def removeListener (self, handlerOrEID, eventType=None):
     """
     handlerOrEID : either a reference to a handler object, an event ID (EID) 
                   identifying the event type, or (eventType, EID) pair
     eventType : the type of event to remove the listener(s) for
-    """
-    #TODO: This method could use an elegant refactoring.
 
-    #print "Remove listener", handlerOrEID
+    Removing by EID (or type/EID pair) takes constant (amortized) time.
+    Removing by handler has to look through all the listeners.
+    """
     self._eventMixin_init()
     handler = handlerOrEID
 
-    altered = False
     if type(handler) == tuple:
       # It's a type/eid pair
       if eventType == None: eventType = handler[0]
-      handlers = self._eventMixin_handlers[eventType]
-      l = len(handlers)
-      self._eventMixin_handlers[eventType] = [x for x in handlers
-                                              if x[3] != handler[1]]
-      altered = altered or l != len(self._eventMixin_handlers[eventType])
+      return self._eventMixin_removeEID(handler[1], eventType)
     elif type(handler) == int:
       # It's an EID
-      if eventType == None:
-        for event in self._eventMixin_handlers:
-          handlers = self._eventMixin_handlers[event]
-          l = len(handlers)
-          self._eventMixin_handlers[event] = [x for x in handlers
-                                              if x[3] != handler]
-          altered = altered or l != len(self._eventMixin_handlers[event])
-      else:
-        l = len(handlers)
-        handlers = self._eventMixin_handlers[eventType]
-        self._eventMixin_handlers[eventType] = [x for x in handlers
-                                                if x[3] != handler]
-        altered = altered or l != len(self._eventMixin_handlers[event])
-    else:
-      if eventType == None:
-        for event in self._eventMixin_handlers:
-          handlers = self._eventMixin_handlers[event]
-          l = len(handlers)
-          self._eventMixin_handlers[event] = [x for x in handlers
-                                              if x[1] != handler]
-          altered = altered or l != len(self._eventMixin_handlers[event])
-      else:
-        handlers = self._eventMixin_handlers[eventType]
-        l = len(handlers)
-        self._eventMixin_handlers[eventType] = [x for x in handlers
-                                                if x[1] != handler]
-        altered = altered or l != len(self._eventMixin_handlers[eventType])
+      return self._eventMixin_removeEID(handler, eventType)
 
+    altered = False
+    for eid,(t,entry) in self._eventMixin_eids.items():
+      if entry[1] == handler and (eventType == None or t == eventType):
+        self._eventMixin_removeEID(eid, t)
+        altered = True
     return altered
 
+  def _eventMixin_removeEID (self, eid, eventType = None):
+    """
+    Removes the listener with the given EID
+
+    The entry is just forgotten in _eventMixin_eids, which leaves a
+    tombstone in the handler list for its event type.  Lists are compacted
+    once they're more than half tombstones, so this is O(1) amortized.
+    """
+    listener = self._eventMixin_eids.get(eid)
+    if listener is None: return False
+    t = listener[0]
+    if eventType != None and t != eventType: return False
+    del self._eventMixin_eids[eid]
+    self._eventMixin_dispatch.pop(t, None)
+
+    handlers = self._eventMixin_handlers[t]
+    dead = self._eventMixin_dead.get(t, 0) + 1
+    if dead * 2 > len(handlers):
+      eids = self._eventMixin_eids
+      self._eventMixin_handlers[t] = [x for x in handlers if x[3] in eids]
+      dead = 0
+    self._eventMixin_dead[t] = dead
+    return True
+
   def addListenerByName (self, *args, **kw):
     """
     Add a listener by name. An eventType argument must be present, which is
@@ -428,9 +475,11 @@ class EventMixin (object):
     entry = (priority, handler, once, eid)
 
     handlers.append(entry)
+    self._eventMixin_eids[eid] = (eventType, entry)
     if priority is not None:
       # If priority is specified, sort the event handlers
       handlers.sort(reverse = True, key = operator.itemgetter(0))
+    self._eventMixin_dispatch.pop(eventType, None)
 
     return (eventType,eid)
 
@@ -461,6 +510,9 @@ class EventMixin (object):
     Remove all handlers from this object
     """
     self._eventMixin_handlers = {}
+    self._eventMixin_dispatch = {}
+    self._eventMixin_eids = {}
+    self._eventMixin_dead = {}
 
 
 def autoBindEvents (sink, source, prefix='', weak=False, priority=None):
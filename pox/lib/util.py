@@ -214,20 +214,84 @@ def initHelper (obj, kw):
       + "unexpected keyword argument '" + k + "'")
     setattr(obj, k, v)
 
-def makePinger ():
+_eventfd = None # libc's eventfd(), False if we don't have it
+
+def _makeEventFD ():
+  """
+  Returns a new nonblocking eventfd, or None if the system lacks them
+  """
+  global _eventfd
+  if _eventfd is None:
+    _eventfd = False
+    if sys.platform.startswith("linux"):
+      try:
+        import ctypes
+        _eventfd = ctypes.CDLL(None, use_errno=True).eventfd
+      except Exception:
+        pass
+  if not _eventfd: return None
+  fd = _eventfd(0, 0o4000 | 0o2000000) # EFD_NONBLOCK | EFD_CLOEXEC
+  if fd < 0: return None
+  return fd
+
+def makePinger (eventfd = None):
   """
   A pinger is basically a thing to let you wake a select().
   On Unix systems, this makes a pipe pair.  But on Windows, select() only
   works with sockets, so it makes a pair of connected sockets.
+  On Linux, it uses a single eventfd instead of a pipe unless eventfd is
+  False (or the system doesn't have them).
+
+  Pings are coalesced: once one is pending, further ping()s do nothing
+  until it's ponged, so a busy producer doesn't do a syscall every time.
+  This means that, as usual, you should set whatever state the pinged
+  side is going to look at before you ping(), and the pinged side should
+  pong (which clears the pending ping) before it looks at it.  Ponging
+  reads before clearing, so a ping() which comes in the middle of it is
+  either read or makes a new one, never lost.
   """
 
+  class EventFDPinger (object):
+    _one = struct.pack("Q", 1)
+
+    def __init__ (self, fd):
+      self._fd = fd
+      self._pending = False
+
+    def ping (self):
+      if self._pending: return
+      self._pending = True
+      if os is None: return
+      os.write(self._fd, self._one)
+
+    def fileno (self):
+      return self._fd
+
+    def pongAll (self):
+      try:
+        os.read(self._fd, 8)
+      except OSError:
+        pass # Not actually pinged (EAGAIN)
+      self._pending = False
+
+    pong = pongAll
+
+    def __del__ (self):
+      try:
+        os.close(self._fd)
+      except:
+        pass
+
   class PipePinger (object):
     def __init__ (self, pair):
       self._w = pair[1]
       self._r = pair[0]
+      self._pending = False
       assert os is not None
 
     def ping (self):
+      if self._pending: return
+      self._pending = True
       if os is None: return #TODO: Is there a better fix for this?
       os.write(self._w, ' ')
 
@@ -237,9 +301,11 @@ def makePinger ():
     def pongAll (self):
       #TODO: make this actually read all
       os.read(self._r, 1024)
+      self._pending = False
 
     def pong (self):
       os.read(self._r, 1)
+      self._pending = False
 
     def __del__ (self):
       try:
@@ -255,16 +321,26 @@ def makePinger ():
     def __init__ (self, pair):
       self._w = pair[1]
       self._r = pair[0]
+      self._pending = False
     def ping (self):
+      if self._pending: return
+      self._pending = True
       self._w.send(' ')
     def pong (self):
       self._r.recv(1)
+      self._pending = False
     def pongAll (self):
       #TODO: make this actually read all
       self._r.recv(1024)
+      self._pending = False
     def fileno (self):
       return self._r.fileno()
 
+  if eventfd is not False:
+    fd = _makeEventFD()
+    if fd is not None:
+      return EventFDPinger(fd)
+
   #return PipePinger((os.pipe()[0],os.pipe()[1]))  # To test failure case
 
   if os.name == "posix":
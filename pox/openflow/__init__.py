@@ -144,7 +144,9 @@ class PacketIn (Event):
   Fired in response to PacketIn events
   port (int) - number of port the packet came in on
   data (bytes) - raw packet data
-  parsed (packet subclasses) - pox.lib.packet's parsed version
+  parsed (packet subclasses) - pox.lib.packet's parsed version (parsed
+                               lazily, so layers nobody looks at cost
+                               next to nothing)
   """
   def __init__ (self, connection, ofp):
     Event.__init__(self)
@@ -157,7 +159,7 @@ class PacketIn (Event):
 
   def parse (self):
     if self._parsed is None:
-      self._parsed = ethernet(self.data)
+      self._parsed = ethernet(self.data, lazy=True)
     return self._parsed
 
   @property
@@ -219,6 +221,27 @@ class BarrierIn (Event):
     self.dpid = connection.dpid
     self.xid = ofp.xid
 
+class SendQueueHigh (Event):
+  """
+  Fired when the data queued for a switch (because its socket couldn't
+  take it yet) reaches the connection's send_high_water mark.  Senders
+  which can hold off should do so until SendQueueLow.
+  """
+  def __init__ (self, connection):
+    Event.__init__(self)
+    self.connection = connection
+    self.dpid = connection.dpid
+
+class SendQueueLow (Event):
+  """
+  Fired when a connection which raised SendQueueHigh has drained down to
+  its send_low_water mark.
+  """
+  def __init__ (self, connection):
+    Event.__init__(self)
+    self.connection = connection
+    self.dpid = connection.dpid
+
 class ConnectionIn (Event):
   def __init__ (self, connection):
     super(ConnectionIn,self).__init__()
@@ -51,6 +51,8 @@ class OpenFlowNexus (EventMixin):
     PortStatsReceived,
     QueueStatsReceived,
     FlowRemoved,
+    SendQueueHigh,
+    SendQueueLow,
   ])
 
   # Bytes to send to controller when a packet misses all flows
@@ -80,6 +82,19 @@ class OpenFlowNexus (EventMixin):
       print "Couldn't send to", dpid, "because we're not connected to it!"
       return False
 
+  def sendBatchToDPID (self, dpid, messages, callback = None):
+    """
+    Send messages to a specific DPID followed by a barrier.
+
+    Returns a Batch (see Connection.send_batch()), or None if we're not
+    connected to the DPID.
+    """
+    con = self._connections.get(dpid)
+    if con is None:
+      print "Couldn't send to", dpid, "because we're not connected to it!"
+      return None
+    return con.send_batch(messages, callback)
+
   def _handle_DownEvent (self, event):
     for c in self._connections.values():
       try:
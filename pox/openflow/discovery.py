@@ -36,6 +36,7 @@ from pox.lib.packet.lldp          import lldp, chassis_id, port_id, end_tlv
 from pox.lib.packet.lldp          import ttl, system_description
 import pox.openflow.libopenflow_01 as of
 from pox.lib.util                 import dpidToStr
+from pox.lib.addresses            import EthAddr
 from pox.core import core
 
 import struct
@@ -43,77 +44,140 @@ import array
 import socket
 import time
 import copy
+import heapq
+import random
 from collections import *
 
 LLDP_TTL             = 120 # currently ignored
 LLDP_SEND_CYCLE      = 5.0
+LLDP_SEND_SLOTS      = 20 # Number of times per cycle we send something
 TIMEOUT_CHECK_PERIOD = 5.0
 LINK_TIMEOUT         = 10.0
 
+# Where the per-port fields are in the probes create_discovery_packet()
+# makes.  The chassis and port IDs are fixed width, so the layout is too.
+_PROBE_PORT_OFFSET    = 20 # Output action's port; it follows the 16 byte
+                           # packet_out header
+_PROBE_SRC_OFFSET     = 30 # Ethernet source; the frame starts at 24
+_PROBE_PORT_ID_OFFSET = 65 # Port ID TLV's value; it follows the 24 byte
+                           # chassis ID TLV at the start of the LLDP (38)
+
+# What's fixed in our probes' Ethernet frames, for _decodeProbe()
+_PROBE_CHASSIS = b'\x88\xcc\x02\x16\x07dpid:' # Ethertype to the dpid, at 12
+_PROBE_PORT    = b'\x04\x06\x02' # Port ID TLV up to its value, at 38
+
+_LLDP_TYPE_RAW = struct.pack("!H", ethernet.LLDP_TYPE)
+_NDP_MULTICAST_RAW = NDP_MULTICAST.toRaw()
+
 log = core.getLogger()
 
 class LLDPSender (object):
   """
-  Cycles through a list of packets, sending them such that it completes the
-  entire list every LLDP_SEND_CYCLE.
-  """
+  Sends an LLDP probe out of every port of every switch once every
+  LLDP_SEND_CYCLE.
 
-  SendItem = namedtuple("LLDPSenderItem",
-                      ('dpid','portNum','packet'))
-
-  #NOTE: This class keeps the packets to send in a flat list, which makes
-  #      adding/removing them on switch join/leave or (especially) port
-  #      status changes relatively expensive. This could easily be improved.
+  All of a switch's probes are packed into a single buffer which is sent
+  in one go.  The cycle is split into LLDP_SEND_SLOTS time slots, and each
+  switch is put in one of the least busy ones at random, so the sending is
+  spread out over the cycle.
+  """
 
   def __init__ (self):
-    self._packets = []
+    self._ports = {} # dpid -> {portNum: raw portAddr}
+    self._templates = {} # dpid -> bytearray probe for the switch
+    self._buffers = {} # dpid -> packed probes (None until needed)
+    self._slotOf = {} # dpid -> index into _slots
+    self._slots = [set() for i in range(LLDP_SEND_SLOTS)]
+    self._nextSlot = 0
     self._timer = None
 
   def addSwitch (self, dpid, ports):
     """ Ports are (portNum, portAddr) """
-    self._packets = [p for p in self._packets if p.dpid != dpid]
-
-    for portNum, portAddr in ports:
-      if portNum > of.OFPP_MAX:
-        # Ignore local
-        continue
-      self._packets.append(LLDPSender.SendItem(dpid, portNum,
-       self.create_discovery_packet(dpid, portNum, portAddr)))
+    self._ports[dpid] = dict((portNum, EthAddr(portAddr).toRaw())
+                             for portNum, portAddr in ports
+                             if portNum <= of.OFPP_MAX) # Ignore local
+    self._buffers[dpid] = None
+
+    if dpid not in self._slotOf:
+      slots = self._slots
+      least = min(len(slot) for slot in slots)
+      slot = random.choice([i for i in range(len(slots))
+                            if len(slots[i]) == least])
+      slots[slot].add(dpid)
+      self._slotOf[dpid] = slot
 
     self._setTimer()
 
   def delSwitch (self, dpid):
-    self._packets = [p for p in self._packets if p.dpid != dpid]
+    if dpid not in self._ports: return
+    del self._ports[dpid]
+    del self._buffers[dpid]
+    self._templates.pop(dpid, None)
+    self._slots[self._slotOf.pop(dpid)].discard(dpid)
     self._setTimer()
 
   def delPort (self, dpid, portNum):
-    self._packets = [p for p in self._packets
-                     if p.dpid != dpid or p.portNum != portNum]
-    self._setTimer()
+    ports = self._ports.get(dpid)
+    if ports is None or portNum not in ports: return
+    del ports[portNum]
+    self._buffers[dpid] = None
 
   def addPort (self, dpid, portNum, portAddr):
     if portNum > of.OFPP_MAX: return
-    self.delPort(dpid, portNum)
-    self._packets.append(LLDPSender.SendItem(dpid, portNum,
-     self.create_discovery_packet(dpid, portNum, portAddr)))
-    self._setTimer()
+    if dpid not in self._ports:
+      self.addSwitch(dpid, [(portNum, portAddr)])
+      return
+    self._ports[dpid][portNum] = EthAddr(portAddr).toRaw()
+    self._buffers[dpid] = None
 
   def _setTimer (self):
-    if self._timer: self._timer.cancel()
-    self._timer = None
-    if len(self._packets) != 0:
-      self._timer = Timer(LLDP_SEND_CYCLE / len(self._packets),
-                          self._timerHandler, recurring=True)
+    if self._ports:
+      if self._timer is None:
+        self._timer = Timer(LLDP_SEND_CYCLE / LLDP_SEND_SLOTS,
+                            self._timerHandler, recurring=True)
+    elif self._timer:
+      self._timer.cancel()
+      self._timer = None
 
   def _timerHandler (self):
     """
-    Called by a timer to actually send packet.
-    Picks the first packet off the queue, sends it, and puts it back on the
-    end of the queue.
+    Called by a timer to send the probes for the switches in the next slot
+    """
+    slot = self._slots[self._nextSlot]
+    self._nextSlot = (self._nextSlot + 1) % len(self._slots)
+    # Sending can disconnect a switch, which takes it out of the slot
+    for dpid in tuple(slot):
+      if dpid not in self._buffers: continue
+      data = self._buffers[dpid]
+      if data is None:
+        data = self._buffers[dpid] = self._pack(dpid)
+      if data:
+        core.openflow.sendToDPID(dpid, data)
+
+  def _pack (self, dpid):
     """
-    item = self._packets.pop(0)
-    self._packets.append(item)
-    core.openflow.sendToDPID(item.dpid, item.packet)
+    Packs probes for all of a switch's ports
+
+    They're copies of the switch's template with the port fields patched.
+    """
+    template = self._templates.get(dpid)
+    if template is None:
+      template = bytearray(self.create_discovery_packet(dpid, 0,
+                                              EthAddr("00:00:00:00:00:00")))
+      self._templates[dpid] = template
+    size = len(template)
+    ports = self._ports[dpid]
+    buf = bytearray(size * len(ports))
+    offset = 0
+    for portNum, portAddr in ports.iteritems():
+      buf[offset:offset + size] = template
+      struct.pack_into("!H", buf, offset + _PROBE_PORT_OFFSET, portNum)
+      o = offset + _PROBE_SRC_OFFSET
+      buf[o:o + 6] = portAddr
+      o = offset + _PROBE_PORT_ID_OFFSET
+      buf[o:o + 5] = b"%05i" % (portNum,)
+      offset += size
+    return bytes(buf)
 
   def create_discovery_packet (self, dpid, portNum, portAddr):
     """ Create LLDP packet """
@@ -122,11 +186,11 @@ class LLDPSender (object):
 
     cid = chassis_id()
     # Maybe this should be a MAC.  But a MAC of what?  Local port, maybe?
-    cid.fill(cid.SUB_LOCAL, bytes('dpid:' + hex(long(dpid))[2:-1]))
+    cid.fill(cid.SUB_LOCAL, bytes('dpid:%016x' % (dpid,)))
     discovery_packet.add_tlv(cid)
 
     pid = port_id()
-    pid.fill(pid.SUB_PORT, str(portNum))
+    pid.fill(pid.SUB_PORT, bytes('%05i' % (portNum,)))
     discovery_packet.add_tlv(pid)
 
     ttlv = ttl()
@@ -134,7 +198,7 @@ class LLDPSender (object):
     discovery_packet.add_tlv(ttlv)
 
     sysdesc = system_description()
-    sysdesc.fill(bytes('dpid:' + hex(long(dpid))[2:-1]))
+    sysdesc.fill(bytes('dpid:%016x' % (dpid,)))
     discovery_packet.add_tlv(sysdesc)
 
     discovery_packet.add_tlv(end_tlv())
@@ -150,6 +214,24 @@ class LLDPSender (object):
     return po.pack()
 
 
+def _decodeProbe (data):
+  """
+  Gets (dpid, port) from one of the probes LLDPSender sends
+
+  Their layout is fixed, so they can just be picked apart.  Returns None
+  for frames which aren't laid out like them.
+  """
+  if len(data) < 46: return None
+  if data[12:22] != _PROBE_CHASSIS or data[38:41] != _PROBE_PORT:
+    return None
+  port = data[41:46]
+  if not port.isdigit(): return None
+  try:
+    return int(data[22:38], 16), int(port)
+  except ValueError:
+    return None
+
+
 class LinkEvent (Event):
   def __init__ (self, add, link):
     Event.__init__(self)
@@ -186,8 +268,25 @@ class Discovery (EventMixin):
 
     self._dps = set()
     self.adjacency = {} # From Link to time.time() stamp
+
+    # Indexes into adjacency, which only _addLink() and _deleteLinks()
+    # should change.  Empty sets are removed.
+    self._dpidLinks = {} # dpid -> Links with it at either end
+    self._portLinks = {} # (dpid, port) -> Links with it at either end
+    self._pairLinks = {} # (dpid1, dpid2) -> Links from dpid1 to dpid2
+
+    # Heap of (deadline, Link), with at most one live entry per link, whose
+    # deadline is kept in _deadlines.  A link's entry isn't updated when
+    # it's refreshed; _expireLinks() just pushes it again with a new
+    # deadline if it's still fresh when the old one comes due.  Entries for
+    # deleted links stay until they come due, and get reused if the link
+    # comes back before then.
+    self._expiry = []
+    self._deadlines = {} # Link -> deadline of its entry in _expiry
+
     self._sender = LLDPSender()
-    Timer(TIMEOUT_CHECK_PERIOD, self._expireLinks, recurring=True)
+    self._expireTimer = Timer(TIMEOUT_CHECK_PERIOD, self._expireLinks,
+                              recurring=True)
 
     if core.hasComponent("openflow"):
       self.listenTo(core.openflow)
@@ -222,12 +321,7 @@ class Discovery (EventMixin):
     self._dps.remove(event.dpid)
     self._sender.delSwitch(event.dpid)
 
-    deleteme = []
-    for link in self.adjacency:
-      if link.dpid1 == event.dpid or link.dpid2 == event.dpid:
-        deleteme.append(link)
-
-    self._deleteLinks(deleteme)
+    self._deleteLinks(self.linksForDPID(event.dpid))
 
   def _handle_PortStatus (self, event):
     '''
@@ -249,14 +343,27 @@ class Discovery (EventMixin):
     refreshed recently.
     '''
     curtime = time.time()
+    expiry = self._expiry
+    deadlines = self._deadlines
 
     deleteme = []
-    for link,timestamp in self.adjacency.iteritems():
+    while expiry and expiry[0][0] < curtime:
+      deadline, link = heapq.heappop(expiry)
+      if deadlines.get(link) != deadline: continue # Superseded
+      timestamp = self.adjacency.get(link)
+      if timestamp is None: # Already deleted
+        del deadlines[link]
+        continue
       if curtime - timestamp > LINK_TIMEOUT:
+        del deadlines[link]
         deleteme.append(link)
         log.info('link timeout: %s.%i -> %s.%i' %
                  (dpidToStr(link.dpid1), link.port1,
                   dpidToStr(link.dpid2), link.port2))
+      else:
+        # Refreshed since this entry was pushed
+        deadline = deadlines[link] = timestamp + LINK_TIMEOUT
+        heapq.heappush(expiry, (deadline, link))
 
     if deleteme:
       self._deleteLinks(deleteme)
@@ -264,17 +371,48 @@ class Discovery (EventMixin):
   def _handle_PacketIn (self, event):
     """ Handle incoming lldp packets.  Use to maintain link state """
 
-    packet = event.parsed
+    # Most PACKET_INs aren't LLDP, so weed them out by looking at the raw
+    # data rather than parsing it
+    data = event.data
+    if not data or data[12:14] != _LLDP_TYPE_RAW: return
+    if data[:6] != _NDP_MULTICAST_RAW: return
+
+    originator = _decodeProbe(data)
+    if originator is None:
+      # Not one of ours (or not quite); do it the long way
+      originator = self._parseLLDP(event)
+      if originator is None: return
+    else:
+      self._dropLLDP(event)
+    originatorDPID, originatorPort = originator
 
-    if packet.type != ethernet.LLDP_TYPE: return
-    if packet.dst != NDP_MULTICAST: return
+    # if chassid is from a switch we're not connected to, ignore
+    if originatorDPID not in self._dps:
+      log.info('Received LLDP packet from unconnected switch')
+      return
 
-    if not packet.next:
-      log.error("lldp packet could not be parsed")
+    if (event.dpid, event.port) == (originatorDPID, originatorPort):
+      log.error('Loop detected; received our own LLDP event')
       return
 
-    assert isinstance(packet.next, lldp)
+    # print 'LLDP packet in from',chassid,' port',str(portid)
+
+    link = Discovery.Link(originatorDPID, originatorPort, event.dpid,
+                          event.port)
+
+    if link not in self.adjacency:
+      self._addLink(link)
+      log.info('link detected: %s.%i -> %s.%i' %
+               (dpidToStr(link.dpid1), link.port1,
+                dpidToStr(link.dpid2), link.port2))
+      self.raiseEventNoErrors(LinkEvent, True, link)
+    else:
+      # Just update timestamp
+      self.adjacency[link] = time.time()
+
+    return EventHalt # Probably nobody else needs this event
 
+  def _dropLLDP (self, event):
     if self.explicit_drop:
       if event.ofp.buffer_id != -1:
         log.debug("Dropping LLDP packet %i", event.ofp.buffer_id)
@@ -283,13 +421,29 @@ class Discovery (EventMixin):
         msg.in_port = event.port
         event.connection.send(msg)
 
+  def _parseLLDP (self, event):
+    """
+    Finds the originating (dpid, port) in any sort of LLDP packet
+
+    Returns None if it can't.
+    """
+    packet = event.parsed
+
+    if not packet.next:
+      log.error("lldp packet could not be parsed")
+      return None
+
+    assert isinstance(packet.next, lldp)
+
+    self._dropLLDP(event)
+
     lldph = packet.next
     if  len(lldph.tlvs) < 3 or \
       (lldph.tlvs[0].tlv_type != lldp.CHASSIS_ID_TLV) or\
       (lldph.tlvs[1].tlv_type != lldp.PORT_ID_TLV) or\
       (lldph.tlvs[2].tlv_type != lldp.TTL_TLV):
       log.error("lldp_input_handler invalid lldp packet")
-      return
+      return None
 
     def lookInSysDesc():
       r = None
@@ -318,7 +472,7 @@ class Discovery (EventMixin):
         if lldph.tlvs[0].id.startswith('dpid:'):
           # This is how NOX does it at the time of writing
           try:
-            originatorDPID = int(lldph.tlvs[0].id.tostring()[5:], 16)
+            originatorDPID = int(lldph.tlvs[0].id[5:], 16)
           except:
             pass
       if originatorDPID == None:
@@ -334,17 +488,12 @@ class Discovery (EventMixin):
 
     if originatorDPID == None:
       log.warning("Couldn't find a DPID in the LLDP packet")
-      return
-
-    # if chassid is from a switch we're not connected to, ignore
-    if originatorDPID not in self._dps:
-      log.info('Received LLDP packet from unconnected switch')
-      return
+      return None
 
     # grab port ID from port tlv
     if lldph.tlvs[1].subtype != port_id.SUB_PORT:
       log.warning("Thought we found a DPID, but packet didn't have a port")
-      return # not one of ours
+      return None # not one of ours
     originatorPort = None
     if lldph.tlvs[1].id.isdigit():
       # We expect it to be a decimal value
@@ -358,44 +507,68 @@ class Discovery (EventMixin):
     if originatorPort is None:
       log.warning("Thought we found a DPID, but port number didn't " +
                   "make sense")
-      return
-
-    if (event.dpid, event.port) == (originatorDPID, originatorPort):
-      log.error('Loop detected; received our own LLDP event')
-      return
-
-    # print 'LLDP packet in from',chassid,' port',str(portid)
-
-    link = Discovery.Link(originatorDPID, originatorPort, event.dpid,
-                          event.port)
-
-    if link not in self.adjacency:
-      self.adjacency[link] = time.time()
-      log.info('link detected: %s.%i -> %s.%i' %
-               (dpidToStr(link.dpid1), link.port1,
-                dpidToStr(link.dpid2), link.port2))
-      self.raiseEventNoErrors(LinkEvent, True, link)
-    else:
-      # Just update timestamp
-      self.adjacency[link] = time.time()
-
-    return EventHalt # Probably nobody else needs this event
+      return None
+
+    return originatorDPID, originatorPort
+
+  def _addLink (self, link, timestamp = None):
+    if timestamp is None: timestamp = time.time()
+    self.adjacency[link] = timestamp
+    for index, key in self._indexKeys(link):
+      s = index.get(key)
+      if s is None:
+        s = index[key] = set()
+      s.add(link)
+    deadline = timestamp + LINK_TIMEOUT
+    # An existing entry which comes due sooner will do
+    if self._deadlines.get(link, float('inf')) > deadline:
+      self._deadlines[link] = deadline
+      heapq.heappush(self._expiry, (deadline, link))
 
   def _deleteLinks (self, links):
     for link in links:
       del self.adjacency[link]
+      for index, key in self._indexKeys(link):
+        # A link from a switch to itself has its dpid in here twice
+        s = index.get(key)
+        if s is None: continue
+        s.discard(link)
+        if not s: del index[key]
+      # Its heap entry gets dropped when it comes due (or reused if it
+      # comes back first)
       self.raiseEvent(LinkEvent, False, link)
 
+  def _indexKeys (self, link):
+    return ((self._dpidLinks, link.dpid1), (self._dpidLinks, link.dpid2),
+            (self._portLinks, (link.dpid1, link.port1)),
+            (self._portLinks, (link.dpid2, link.port2)),
+            (self._pairLinks, (link.dpid1, link.dpid2)))
+
+  def linksForDPID (self, dpid):
+    """ Returns a list of the links to or from the given switch """
+    return list(self._dpidLinks.get(dpid, ()))
+
+  def linksForPort (self, dpid, port):
+    """ Returns a list of the links to or from the given switch port """
+    return list(self._portLinks.get((dpid, port), ()))
+
+  def linksBetween (self, dpid1, dpid2, bidirectional = False):
+    """
+    Returns a list of the links from dpid1 to dpid2
+
+    If bidirectional is True, only those which also have a link going back
+    the other way between the same ports are returned.
+    """
+    links = self._pairLinks.get((dpid1, dpid2), ())
+    if not bidirectional: return list(links)
+    return [l for l in links
+            if Discovery.Link(l.dpid2, l.port2, l.dpid1, l.port1)
+            in self.adjacency]
 
   def isSwitchOnlyPort (self, dpid, port):
     """ Returns True if (dpid, port) designates a port that has any
     neighbor switches"""
-    for link in self.adjacency:
-      if link.dpid1 == dpid and link.port1 == port:
-        return True
-      if link.dpid2 == dpid and link.port2 == port:
-        return True
-    return False
+    return (dpid, port) in self._portLinks
 
 def launch (explicit_drop = False, install_flow = True):
   explicit_drop = str(explicit_drop).lower() == "true"
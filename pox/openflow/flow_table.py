@@ -7,9 +7,14 @@ Implementation of an OpenFlow flow table
 """
 from collections import namedtuple
 from libopenflow_01 import *
+from libopenflow_01 import _match_simple_fields, _eth_raw, _ip_unsigned
 from pox.lib.revent import *
 
 import time
+import bisect
+import heapq
+import itertools
+import operator
 
 # FlowTable Entries:
 #   match - ofp_match (13-tuple)
@@ -74,6 +79,16 @@ class TableEntry (object):
     if now==None: now = time.time()
     return (self.hard_timeout > 0 and now - self.counters["created"] > self.hard_timeout) or (self.idle_timeout > 0 and now - self.counters["last_touched"] > self.idle_timeout)
 
+  def expiry_time(self):
+    """ return the time after which this entry will be expired unless it's touched first, or None if it never expires """
+    t = None
+    if self.hard_timeout > 0:
+      t = self.counters["created"] + self.hard_timeout
+    if self.idle_timeout > 0:
+      idle = self.counters["last_touched"] + self.idle_timeout
+      if t is None or idle < t: t = idle
+    return t
+
   def __str__ (self):
     return self.__class__.__name__ + "\n  " + self.show()
 
@@ -106,6 +121,299 @@ class FlowTableModification (Event):
     self.added = added
     self.removed = removed
 
+# Where an entry goes in the table: exact matches first, then by priority
+_EXACT_RANK = (1<<16) + 1
+
+def _rank (entry):
+  return entry.priority if entry.match.is_wildcarded else _EXACT_RANK
+
+# Stands in for a packet's wildcarded fields; no entry ever has it
+_WILD = object()
+
+# Indexes of nw_src and nw_dst in the lists _match_values() returns
+_NW_SRC = len(_match_simple_fields)
+_NW_DST = _NW_SRC + 1
+
+def _nw_bits (wildcards, mask, shift):
+  """ Returns how many leading bits of an address are matched (0 to 32) """
+  w = (wildcards & mask) >> shift
+  return 32 - w if w <= 32 else 0
+
+def _netmask (bits):
+  return (0xffFFffFF << (32 - bits)) & 0xffFFffFF
+
+def _match_values (match, wild = _WILD):
+  """
+  Returns match's values for _match_simple_fields followed by nw_src and
+  nw_dst, as raw bytes/integers, with 'wild' for wildcarded fields
+  """
+  w = match.wildcards
+  values = []
+  for slot, bit in _match_simple_fields:
+    if w & bit:
+      values.append(wild)
+    else:
+      v = getattr(match, slot)
+      if v is not None and (slot == '_dl_src' or slot == '_dl_dst'):
+        v = _eth_raw(v)
+      values.append(v)
+  if (w & OFPFW_NW_SRC_ALL) == OFPFW_NW_SRC_ALL:
+    values.append(wild)
+  else:
+    values.append(_ip_unsigned(match._nw_src))
+  if (w & OFPFW_NW_DST_ALL) == OFPFW_NW_DST_ALL:
+    values.append(wild)
+  else:
+    values.append(_ip_unsigned(match._nw_dst))
+  return values
+
+class _MaskGroup (object):
+  """
+  All the classifier's entries with one particular set of wildcards, hashed
+  on the fields those wildcards leave in.  The group with no wildcards at
+  all is the exact-match table.
+  """
+  def __init__ (self, wildcards):
+    self.wildcards = wildcards
+    self.simple_bits = wildcards & ~(OFPFW_NW_SRC_MASK | OFPFW_NW_DST_MASK)
+    self.fields = [i for i, (slot, bit) in enumerate(_match_simple_fields)
+                   if not wildcards & bit]
+    self.src_bits = _nw_bits(wildcards, OFPFW_NW_SRC_MASK, OFPFW_NW_SRC_SHIFT)
+    self.dst_bits = _nw_bits(wildcards, OFPFW_NW_DST_MASK, OFPFW_NW_DST_SHIFT)
+    self.src_mask = _netmask(self.src_bits)
+    self.dst_mask = _netmask(self.dst_bits)
+    self.buckets = {} # key -> [entries in table order]
+    self.ranks = {}   # rank -> number of entries with it
+    self.max_rank = -1
+    # Entries with address bits set beyond their prefix length.  They never
+    # match a packet, but do match some flow_mods, so they keep us from
+    # looking flow_mods up by key.
+    self.unaligned = 0
+
+  def entry_key (self, values):
+    key = [values[i] for i in self.fields]
+    if self.src_bits: key.append(values[_NW_SRC])
+    if self.dst_bits: key.append(values[_NW_DST])
+    return tuple(key)
+
+  def packet_key (self, values):
+    """ Returns the key a packet's values must have to match, or None """
+    key = [values[i] for i in self.fields]
+    if self.src_bits:
+      v = values[_NW_SRC]
+      if v is _WILD: return None
+      key.append(v & self.src_mask)
+    if self.dst_bits:
+      v = values[_NW_DST]
+      if v is _WILD: return None
+      key.append(v & self.dst_mask)
+    return tuple(key)
+
+  def keys_within (self, values, src_bits, dst_bits):
+    """
+    Returns the keys of the buckets whose entries have all of values' (as
+    from _match_values()) non-wildcarded simple fields, and addresses within
+    values' nw_src and nw_dst prefixes (of length src_bits and dst_bits)
+    """
+    positions = [p for p, i in enumerate(self.fields) if values[i] is not _WILD]
+    keys = self.buckets.keys()
+    if positions:
+      get = operator.itemgetter(*positions)
+      want = get([values[i] for i in self.fields])
+      keys = [k for k in keys if get(k) == want]
+    pos = len(self.fields)
+    if self.src_bits:
+      if src_bits:
+        mask = _netmask(src_bits)
+        value = values[_NW_SRC]
+        keys = [k for k in keys if k[pos] & mask == value]
+      pos += 1
+    if self.dst_bits and dst_bits:
+      mask = _netmask(dst_bits)
+      value = values[_NW_DST]
+      keys = [k for k in keys if k[pos] & mask == value]
+    return keys
+
+  def is_unaligned (self, values):
+    return ((self.src_bits and values[_NW_SRC] & ~self.src_mask)
+            or (self.dst_bits and values[_NW_DST] & ~self.dst_mask))
+
+class _Classifier (object):
+  """
+  Indexes a FlowTable's entries
+
+  Finding the entry for a packet is a tuple space search: entries are
+  grouped by their wildcards, and each group is a hash table keyed on the
+  fields it doesn't wildcard, so a lookup is one probe per group.  Groups
+  are tried in order of their best entry, and we stop as soon as no
+  remaining group can beat what we've found.
+
+  Entries are also indexed by (match, priority) for strict flow_mods, and
+  kept in table order in 'entries'.  An entry's match and priority must not
+  change while it's in the table.
+  """
+  def __init__ (self):
+    self.entries = [] # In table order
+    self._orders = [] # Parallels entries
+    self._order = {}  # entry -> (-rank, insertion number)
+    self._next = 0
+    self._groups = {} # wildcards -> _MaskGroup
+    self._by_rank = [] # Groups, best first
+    self._strict = {} # (match key, priority) -> [entries in table order]
+
+  def __len__ (self):
+    return len(self.entries)
+
+  def __contains__ (self, entry):
+    return entry in self._order
+
+  def add (self, entry):
+    if entry in self._order:
+      # Already there (e.g., reinstalled after a reconnect)
+      return
+    rank = _rank(entry)
+    order = (-rank, self._next)
+    self._next += 1
+    self._order[entry] = order
+    # Nothing already in the table has a higher insertion number, so this
+    # goes after everything of the same rank
+    i = bisect.bisect_right(self._orders, order)
+    self.entries.insert(i, entry)
+    self._orders.insert(i, order)
+
+    match = entry.match
+    values = _match_values(match)
+    g = self._groups.get(match.wildcards)
+    if g is None:
+      g = _MaskGroup(match.wildcards)
+      self._groups[match.wildcards] = g
+      self._by_rank.append(g)
+    g.buckets.setdefault(g.entry_key(values), []).append(entry)
+    g.ranks[rank] = g.ranks.get(rank, 0) + 1
+    if g.is_unaligned(values): g.unaligned += 1
+    if rank > g.max_rank:
+      g.max_rank = rank
+      self._sort_groups()
+
+    self._strict.setdefault((match.key, entry.priority), []).append(entry)
+
+  def remove (self, entries):
+    """
+    Removes entries, raising ValueError if any aren't in the table
+    """
+    for entry in entries:
+      if entry not in self._order:
+        raise ValueError("Entry is not in the table")
+    if len(entries) > 16:
+      # Cheaper to rebuild the ordered lists than to delete one at a time
+      for entry in entries: self._unindex(entry)
+      order = self._order
+      self.entries[:] = [e for e in self.entries if e in order]
+      self._orders[:] = [order[e] for e in self.entries]
+    else:
+      for entry in entries:
+        i = bisect.bisect_left(self._orders, self._order[entry])
+        del self.entries[i]
+        del self._orders[i]
+        self._unindex(entry)
+
+  def _unindex (self, entry):
+    del self._order[entry]
+    rank = _rank(entry)
+    match = entry.match
+    values = _match_values(match)
+    g = self._groups[match.wildcards]
+    key = g.entry_key(values)
+    bucket = g.buckets[key]
+    bucket.remove(entry)
+    if not bucket: del g.buckets[key]
+    if g.is_unaligned(values): g.unaligned -= 1
+    g.ranks[rank] -= 1
+    if not g.ranks[rank]:
+      del g.ranks[rank]
+      if not g.ranks:
+        del self._groups[match.wildcards]
+        self._by_rank.remove(g)
+      elif rank == g.max_rank:
+        g.max_rank = max(g.ranks)
+        self._sort_groups()
+
+    key = (match.key, entry.priority)
+    bucket = self._strict[key]
+    bucket.remove(entry)
+    if not bucket: del self._strict[key]
+
+  def _sort_groups (self):
+    self._by_rank.sort(key=lambda g: g.max_rank, reverse=True)
+
+  def lookup (self, packet_match):
+    """
+    Returns the first entry in table order which matches packet_match (as
+    from ofp_match.from_packet()), or None
+    """
+    values = _match_values(packet_match)
+    order = self._order
+    best = None
+    best_order = None
+    for g in self._by_rank:
+      if best is not None and g.max_rank < -best_order[0]: break
+      key = g.packet_key(values)
+      if key is None: continue
+      bucket = g.buckets.get(key)
+      if bucket is None: continue
+      o = order[bucket[0]]
+      if best is None or o < best_order:
+        best = bucket[0]
+        best_order = o
+    return best
+
+  def strict (self, match, priority):
+    """
+    Returns the entries with exactly this match and priority
+    """
+    return list(self._strict.get((match.key, priority), ()))
+
+  def matching (self, match):
+    """
+    Returns the entries which match is a superset of (in the sense of
+    ofp_match.matches_with_wildcards()) in table order
+    """
+    w = match.wildcards
+    src_bits = _nw_bits(w, OFPFW_NW_SRC_MASK, OFPFW_NW_SRC_SHIFT)
+    dst_bits = _nw_bits(w, OFPFW_NW_DST_MASK, OFPFW_NW_DST_SHIFT)
+    simple_bits = w & ~(OFPFW_NW_SRC_MASK | OFPFW_NW_DST_MASK)
+    if simple_bits == (OFPFW_ALL & ~(OFPFW_NW_SRC_MASK | OFPFW_NW_DST_MASK)) \
+       and src_bits == 0 and dst_bits == 0:
+      # Matches everything
+      return list(self.entries)
+
+    values = _match_values(match)
+    found = []
+    for g in self._groups.itervalues():
+      # Only entries at least as specific as match can be in it
+      if simple_bits | g.simple_bits != simple_bits: continue
+      if g.src_bits < src_bits or g.dst_bits < dst_bits: continue
+      if g.wildcards != w:
+        buckets = g.buckets
+        candidates = itertools.chain(*(buckets[k] for k in
+                                       g.keys_within(values, src_bits, dst_bits)))
+      elif not g.unaligned:
+        # Every entry in here that matches has match's key
+        candidates = g.buckets.get(g.entry_key(values), ())
+      else:
+        # Entries equal to match always match it, even if their addresses
+        # have bits set past the prefix length, so check them all
+        candidates = itertools.chain(*g.buckets.itervalues())
+      for entry in candidates:
+        if match.matches_with_wildcards(entry.match):
+          found.append(entry)
+    self.sort(found)
+    return found
+
+  def sort (self, entries):
+    """ Sorts a list of entries in the table into table order """
+    entries.sort(key=self._order.__getitem__)
+
 class FlowTable (EventMixin):
   _eventMixin_events = set([FlowTableModification])
 
@@ -115,14 +423,19 @@ class FlowTable (EventMixin):
   """
   def __init__(self):
     EventMixin.__init__(self)
-    # For now we represent the table as a multidimensional array.
-    #
-    # [ (cookie, match, counters, actions),
-    #   (cookie, match, counters, actions),
-    #    ...                        ]
-    # 
-    # Implies O(N) lookup for now. TODO: fix
-    self._table = []
+    self._classifier = _Classifier()
+    # The entries in table order (the classifier keeps this up to date)
+    self._table = self._classifier.entries
+
+    # Timeouts are kept in a heap of (expiry time, sequence number, entry),
+    # with each entry's current expiry time in _expiry_times.  Touching an
+    # entry doesn't update the heap: when an entry comes off the heap and
+    # turns out to have been touched, it just goes back on with its new
+    # expiry time.  Heap items whose time doesn't match _expiry_times (for
+    # entries that have since been removed) are ignored.
+    self._expiry_heap = []
+    self._expiry_times = {}
+    self._expiry_seq = itertools.count()
 
   @property
   def entries(self):
@@ -134,20 +447,62 @@ class FlowTable (EventMixin):
   def add_entry(self, entry):
     if not isinstance(entry, TableEntry):
       raise "Not an Entry type"
-    self._table.append(entry)
-
-    # keep table sorted by descending priority, with exact matches always going first
-    # note: python sort is stable
-    self._table.sort(key=lambda(e): (e.priority if e.match.is_wildcarded else (1<<16) + 1), reverse=True)
+    # the table is kept sorted by descending priority, with exact matches always going first
+    self._classifier.add(entry)
+    self._schedule_expiry(entry)
 
     self.raiseEvent(FlowTableModification(added=[entry]))
 
   def remove_entry(self, entry):
     if not isinstance(entry, TableEntry):
       raise "Not an Entry type"
-    self._table.remove(entry)
+    self._remove([entry])
     self.raiseEvent(FlowTableModification(removed=[entry]))
 
+  def _remove(self, entries):
+    self._classifier.remove(entries)
+    times = self._expiry_times
+    for entry in entries:
+      times.pop(entry, None)
+    if len(self._expiry_heap) > 2 * len(times) + 64:
+      # Mostly stale; start over
+      self._expiry_heap = [ (t, self._expiry_seq.next(), e) for e,t in times.iteritems() ]
+      heapq.heapify(self._expiry_heap)
+
+  def _schedule_expiry(self, entry):
+    t = entry.expiry_time()
+    if t is None: return
+    self._expiry_times[entry] = t
+    heapq.heappush(self._expiry_heap, (t, self._expiry_seq.next(), entry))
+
+  def _pop_expired(self, now):
+    """ take the entries expired by now off the expiry heap and return them in table order """
+    heap = self._expiry_heap
+    times = self._expiry_times
+    expired = []
+    touched = []
+    while heap and heap[0][0] < now:
+      (t, _, entry) = heapq.heappop(heap)
+      if times.get(entry) != t: continue
+      del times[entry]
+      if entry.is_expired(now):
+        expired.append(entry)
+      else:
+        touched.append(entry)
+    for entry in touched:
+      self._schedule_expiry(entry)
+    self._classifier.sort(expired)
+    return expired
+
+  @property
+  def next_expiry(self):
+    """ the earliest time an entry might expire, or None if none of them can """
+    heap = self._expiry_heap
+    times = self._expiry_times
+    while heap and times.get(heap[0][2]) != heap[0][0]:
+      heapq.heappop(heap)
+    return heap[0][0] if heap else None
+
   def entries_for_port(self, port_no):
     entries = []
     for entry in self._table:
@@ -161,38 +516,45 @@ class FlowTable (EventMixin):
     return entries
 
   def matching_entries(self, match, priority=0, strict=False, out_port=None):
-    return [ entry for entry in self._table if entry.is_matched_by(match, priority, strict, out_port) ]
+    if strict:
+      entries = self._classifier.strict(match, priority)
+    else:
+      entries = self._classifier.matching(match)
+    if out_port is not None:
+      entries = [ entry for entry in entries if entry.is_matched_by(match, priority, strict, out_port) ]
+    return entries
 
   def flow_stats(self, match, out_port=None, now=None):
     return ( e.flow_stats() for e in self.matching_entries(match=match, strict=False, out_port=out_port))
 
   def expired_entries(self, now=None):
-    return [ entry for entry in self._table if entry.is_expired(now) ]
+    if now == None: now = time.time()
+    expired = self._pop_expired(now)
+    # they're staying in the table for now, so they're still due
+    for entry in expired:
+      self._schedule_expiry(entry)
+    return expired
 
   def remove_expired_entries(self, now=None):
-    remove_flows = self.expired_entries(now)
-    for entry in remove_flows:
-        self._table.remove(entry)
-    self.raiseEvent(FlowTableModification(removed=remove_flows))
+    """ remove the expired entries, raising one FlowTableModification for all of them (or none if nothing expired).
+    only looks at the entries which are actually due, so calling this often is cheap. """
+    if now == None: now = time.time()
+    remove_flows = self._pop_expired(now)
+    if remove_flows:
+      self._remove(remove_flows)
+      self.raiseEvent(FlowTableModification(removed=remove_flows))
     return remove_flows
 
   def remove_matching_entries(self, match, priority=0, strict=False):
     remove_flows = self.matching_entries(match, priority, strict)
-    for entry in remove_flows:
-        self._table.remove(entry)
+    self._remove(remove_flows)
     self.raiseEvent(FlowTableModification(removed=remove_flows))
     return remove_flows
 
   def entry_for_packet(self, packet, in_port):
     """ return the highest priority flow table entry that matches the given packet 
     on the given in_port, or None if no matching entry is found. """
-    packet_match = ofp_match.from_packet(packet, in_port)
-
-    for entry in self._table:
-      if entry.match.matches_with_wildcards(packet_match, consider_other_wildcards=False):
-        return entry
-    else:
-      return None
+    return self._classifier.lookup(ofp_match.from_packet(packet, in_port))
 
 class SwitchFlowTable(FlowTable):
   """ 
@@ -213,12 +575,10 @@ class SwitchFlowTable(FlowTable):
       return ("added", self.add_entry(TableEntry.from_flow_mod(flow_mod)))
     elif flow_mod.command == OFPFC_MODIFY or flow_mod.command == OFPFC_MODIFY_STRICT:
       is_strict = (flow_mod.command == OFPFC_MODIFY_STRICT)
-      modified = []
-      for entry in self._table:
+      modified = self.matching_entries(flow_mod.match, priority=flow_mod.priority, strict=is_strict)
+      for entry in modified:
         # update the actions field in the matching flows
-        if(entry.is_matched_by(flow_mod.match, priority=flow_mod.priority, strict=is_strict)):
-          entry.actions = flow_mod.actions
-          modified.append(entry)
+        entry.actions = flow_mod.actions
       if(len(modified) == 0):
         # if no matching entry is found, modify acts as add
         return ("added", self.add_entry(TableEntry.from_flow_mod(flow_mod)))
@@ -361,9 +721,8 @@ class NOMFlowTable(EventMixin):
   def _handle_FlowRemoved(self, event):
     """ process a flow removed event -- remove the matching flow from the table. """
     flow_removed = event.ofp
-    for entry in self.flow_table.entries:
-      if(flow_removed.match == entry.match and flow_removed.priority == entry.priority):
-        self.flow_table.remove_entry(entry)
-        self.raiseEvent(FlowTableModification(removed=[entry]))
-        return EventHalt
+    for entry in self.flow_table.matching_entries(flow_removed.match, flow_removed.priority, strict=True):
+      self.flow_table.remove_entry(entry)
+      self.raiseEvent(FlowTableModification(removed=[entry]))
+      return EventHalt
     return EventContinue
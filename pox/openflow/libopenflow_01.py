@@ -32,6 +32,7 @@ from pox.lib.packet.tcp import tcp
 from pox.lib.packet.icmp import icmp
 from pox.lib.packet.arp import arp
 from pox.lib.packet.mpls import mpls
+from pox.lib.packet.packet_utils import flow_key
 
 from pox.lib.addresses import *
 from pox.lib.util import assert_type
@@ -44,8 +45,16 @@ _PAD3 = _PAD*3
 _PAD4 = _PAD*4
 _PAD6 = _PAD*6
 
+# Precompiled structs for the messages we pack and unpack the most
+_header_struct = struct.Struct("!BBHL")
+_match_struct = struct.Struct("!LH6s6sHBxHBBxxLLHH")
+_action_output_struct = struct.Struct("!HHHH")
+_flow_mod_struct = struct.Struct("!BBHL" + "LH6s6sHBxHBBxxLLHH" + "QHHHHLHH")
+_packet_out_struct = struct.Struct("!BBHLLHH")
+
 
 EMPTY_ETH = EthAddr(None)
+_EMPTY_ETH_RAW = EMPTY_ETH.toRaw()
 
 MAX_XID = 0x7fFFffFF
 _nextXID = 1
@@ -65,6 +74,20 @@ def xid_generator(start=1):
     yield n
     n  = ( n + 1 )  % (MAX_XID + 1)
 
+def _getstate (self):
+  """
+  __getstate__ for classes with __slots__ (pickle protocols < 2 need one)
+  """
+  state = dict(getattr(self, '__dict__', ()))
+  for cls in type(self).__mro__:
+    for k in cls.__dict__.get('__slots__', ()):
+      if hasattr(self, k): state[k] = getattr(self, k)
+  return state
+
+def _setstate (self, state):
+  for k,v in state.iteritems():
+    setattr(self, k, v)
+
 def _format_body (body, prefix):
   if hasattr(body, 'show'):
     #TODO: Check this (spacing may well be wrong)
@@ -79,6 +102,10 @@ TABLE_EMERGENCY = 0xfe
 
 #1. Openflow Header
 class ofp_header (object):
+  __slots__ = ('version', 'header_type', 'length', 'xid')
+  __getstate__ = _getstate
+  __setstate__ = _setstate
+
   def __init__ (self, **kw):
     self.version = OFP_VERSION
     self.header_type = 0
@@ -97,15 +124,28 @@ class ofp_header (object):
     if(assertstruct):
       if(not ofp_header._assert(self)[0]):
         raise RuntimeError("assertstruct failed")
-    packed = ""
-    packed += struct.pack("!BBHL", self.version, self.header_type, self.length,
-                          self.xid)
-    return packed
+    return _header_struct.pack(self.version, self.header_type, self.length,
+                               self.xid)
+
+  def pack_into (self, buf, offset = 0, assertstruct=True):
+    """
+    Packs the whole message into buf (e.g., a bytearray) at offset.
+
+    Returns the offset just past it.  Messages which send a lot override
+    this to pack directly; the rest just copy in the result of pack().
+    Either way, they're checked the same as by pack().
+    """
+    packed = self.pack(assertstruct)
+    if packed is None:
+      raise RuntimeError("assertstruct failed")
+    end = offset + len(packed)
+    buf[offset:end] = packed
+    return end
 
   def unpack (self, binaryString):
     if (len(binaryString) < 8):
       return binaryString
-    (self.version, self.header_type, self.length, self.xid) = struct.unpack_from("!BBHL", binaryString, 0)
+    (self.version, self.header_type, self.length, self.xid) = _header_struct.unpack_from(binaryString, 0)
     return binaryString[8:]
 
   def __len__ (self):
@@ -412,12 +452,18 @@ class ofp_match (object):
 
     match = cls()
 
+    # This sets the fields directly and works out the wildcards as it goes,
+    # which is much quicker than going through the field properties.
+    w = match.wildcards
     if in_port is not None:
-      match.in_port = in_port
-
-    match.dl_src = packet.src
-    match.dl_dst = packet.dst
-    match.dl_type = packet.type
+      match._in_port = in_port
+      w &= ~OFPFW_IN_PORT
+
+    match._dl_src = packet.src
+    match._dl_dst = packet.dst
+    match._dl_type = packet.type
+    w &= ~(OFPFW_DL_SRC | OFPFW_DL_DST | OFPFW_DL_TYPE
+           | OFPFW_DL_VLAN | OFPFW_DL_VLAN_PCP)
     p = packet.next
 #    if isinstance(p, mpls):
 #      match.mpls_label = p.label
@@ -426,32 +472,85 @@ class ofp_match (object):
 #      match.mpls_label = 0
 #      match.mpls_tc = 0
     if isinstance(p, vlan):
-      match.dl_vlan = p.id
-      match.dl_vlan_pcp = p.pcp
+      match._dl_vlan = p.id
+      match._dl_vlan_pcp = p.pcp
+      match._dl_type = p.eth_type
       p = p.next
     else:
-      match.dl_vlan = OFP_VLAN_NONE
-      match.dl_vlan_pcp = 0
+      match._dl_vlan = OFP_VLAN_NONE
+      match._dl_vlan_pcp = 0
 
     if isinstance(p, ipv4):
-      match.nw_src = p.srcip
-      match.nw_dst = p.dstip
-      match.nw_proto = p.protocol
-      match.nw_tos = p.tos
+      match._nw_src = p.srcip
+      match._nw_dst = p.dstip
+      match._nw_proto = p.protocol
+      match._nw_tos = p.tos
+      w &= ~(OFPFW_NW_SRC_MASK | OFPFW_NW_DST_MASK | OFPFW_NW_PROTO
+             | OFPFW_NW_TOS)
       p = p.next
 
       if isinstance(p, udp) or isinstance(p, tcp):
-        match.tp_src = p.srcport
-        match.tp_dst = p.dstport
+        match._tp_src = p.srcport
+        match._tp_dst = p.dstport
+        w &= ~(OFPFW_TP_SRC | OFPFW_TP_DST)
       elif isinstance(p, icmp):
-        match.tp_src = p.type
-        match.tp_dst = p.code
+        match._tp_src = p.type
+        match._tp_dst = p.code
+        w &= ~(OFPFW_TP_SRC | OFPFW_TP_DST)
     elif isinstance(p, arp):
       if p.opcode <= 255:
-        match.nw_proto = p.opcode
-        match.nw_src = p.protosrc
-        match.nw_dst = p.protodst
+        match._nw_proto = p.opcode
+        match._nw_src = p.protosrc
+        match._nw_dst = p.protodst
+        w &= ~(OFPFW_NW_SRC_MASK | OFPFW_NW_DST_MASK | OFPFW_NW_PROTO)
 
+    match.wildcards = w
+    return match
+
+  @classmethod
+  def from_raw (cls, data, in_port = None):
+    """
+    Like from_packet(), but works on an unparsed ethernet frame (e.g., the
+    data of a PACKET_IN), so no packet objects get built
+    """
+    key = flow_key(data)
+    match = cls()
+    w = match.wildcards
+    if in_port is not None:
+      match._in_port = in_port
+      w &= ~OFPFW_IN_PORT
+    w &= ~(OFPFW_DL_SRC | OFPFW_DL_DST | OFPFW_DL_TYPE
+           | OFPFW_DL_VLAN | OFPFW_DL_VLAN_PCP)
+    if key is None:
+      match._dl_vlan = OFP_VLAN_NONE
+      match.wildcards = w
+      return match
+
+    (dl_src, dl_dst, dl_vlan, dl_vlan_pcp, dl_type, nw_tos, nw_proto,
+     nw_src, nw_dst, tp_src, tp_dst) = key
+    match._dl_src = EthAddr(dl_src)
+    match._dl_dst = EthAddr(dl_dst)
+    match._dl_type = dl_type
+    if dl_vlan is None:
+      match._dl_vlan = OFP_VLAN_NONE
+    else:
+      match._dl_vlan = dl_vlan
+      match._dl_vlan_pcp = dl_vlan_pcp
+    if nw_proto is not None:
+      match._nw_proto = nw_proto
+      w &= ~OFPFW_NW_PROTO
+    if nw_tos is not None:
+      match._nw_tos = nw_tos
+      w &= ~OFPFW_NW_TOS
+    if nw_src is not None:
+      match._nw_src = IPAddr(nw_src)
+      match._nw_dst = IPAddr(nw_dst)
+      w &= ~(OFPFW_NW_SRC_MASK | OFPFW_NW_DST_MASK)
+    if tp_src is not None:
+      match._tp_src = tp_src
+      match._tp_dst = tp_dst
+      w &= ~(OFPFW_TP_SRC | OFPFW_TP_DST)
+    match.wildcards = w
     return match
 
   def optimize (self):
@@ -485,12 +584,30 @@ class ofp_match (object):
     return self # for chaining
 
   def clone (self):
+    """
+    Returns a (mutable) copy
+    """
     n = ofp_match()
-    for k,v in ofp_match_data.iteritems():
-      setattr(n, '_' + k, getattr(self, '_' + k))
-    n.wildcards = self.wildcards
+    for k in ofp_match._slots:
+      setattr(n, k, getattr(self, k))
     return n
 
+  def freeze (self):
+    """
+    Returns an immutable, hashable copy (an ofp_match_frozen)
+    """
+    return ofp_match_frozen(self)
+
+  # The match fields (dl_src, etc.) are properties (see _init_match_fields)
+  # which store their values in these slots.  When a field is wildcarded,
+  # its property reads as None.
+  _slots = ('wildcards', '_in_port', '_dl_src', '_dl_dst', '_dl_vlan',
+            '_dl_vlan_pcp', '_dl_type', '_nw_tos', '_nw_proto', '_nw_src',
+            '_nw_dst', '_tp_src', '_tp_dst')
+  __slots__ = _slots
+  __getstate__ = _getstate
+  __setstate__ = _setstate
+
   def __init__ (self, **kw):
     for k,v in ofp_match_data.iteritems():
       setattr(self, '_' + k, v[0])
@@ -520,7 +637,7 @@ class ofp_match (object):
   def set_nw_dst (self, *args, **kw):
     a = self._make_addr(*args, **kw)
     if a == None:
-      self._nw_src = ofp_match_data['nw_dst'][0]
+      self._nw_dst = ofp_match_data['nw_dst'][0]
       self.wildcards &= ~OFPFW_NW_DST_MASK
       self.wildcards |= ofp_match_data['nw_dst'][1]
       return
@@ -546,8 +663,7 @@ class ofp_match (object):
     if type(ipOrIPAndBits) is tuple:
       ip = ipOrIPAndBits[0]
       b = int(ipOrIPAndBits[1])
-
-    if (type(ipOrIPAndBits) is str) and (len(ipOrIPAndBits) != 4):
+    elif (type(ipOrIPAndBits) is str) and (len(ipOrIPAndBits) != 4):
       if ipOrIPAndBits.find('/') != -1:
         s = ipOrIPAndBits.split('/')
         ip = s[0]
@@ -568,36 +684,6 @@ class ofp_match (object):
 
     return (ip, b)
 
-  def __setattr__ (self, name, value):
-    if name not in ofp_match_data:
-      self.__dict__[name] = value
-      return
-
-    if name == 'nw_dst' or name == 'nw_src':
-      # Special handling
-      getattr(self, 'set_' + name)(value)
-      return value
-
-    if value is None:
-      setattr(self, '_' + name, ofp_match_data[name][0])
-      self.wildcards |= ofp_match_data[name][1]
-    else:
-      setattr(self, '_' + name, value)
-      self.wildcards = self.wildcards & ~ofp_match_data[name][1]
-
-    return value
-
-  def __getattr__ (self, name):
-    if name in ofp_match_data:
-      if (self.wildcards & ofp_match_data[name][1]) == ofp_match_data[name][1]:
-        # It's wildcarded -- always return None
-        return None
-      if name == 'nw_dst' or name == 'nw_src':
-        # Special handling
-        return getattr(self, 'get_' + name)()[0]
-      return self.__dict__['_' + name]
-    raise AttributeError("attribute not found: "+name)
-
   def _assert (self):
     #if not isinstance(self._dl_src, list):
     #  return "self.dl_src is not list"
@@ -609,39 +695,52 @@ class ofp_match (object):
       return "self.dl_dst is not of size 6"
     return None
 
+  def _pack_values (self):
+    """
+    Returns the values to pack, in _match_struct order
+
+    This is also the match's canonical form: wildcarded fields are zero
+    (whatever is stored for them) and addresses are raw bytes/integers.
+    """
+    w = self.wildcards
+    return (w,
+            0 if w & OFPFW_IN_PORT else self._in_port or 0,
+            _EMPTY_ETH_RAW if w & OFPFW_DL_SRC else _eth_raw(self._dl_src),
+            _EMPTY_ETH_RAW if w & OFPFW_DL_DST else _eth_raw(self._dl_dst),
+            0 if w & OFPFW_DL_VLAN else self._dl_vlan or 0,
+            0 if w & OFPFW_DL_VLAN_PCP else self._dl_vlan_pcp or 0,
+            0 if w & OFPFW_DL_TYPE else self._dl_type or 0,
+            0 if w & OFPFW_NW_TOS else self._nw_tos or 0,
+            0 if w & OFPFW_NW_PROTO else self._nw_proto or 0,
+            0 if w & OFPFW_NW_SRC_ALL else _ip_unsigned(self._nw_src),
+            0 if w & OFPFW_NW_DST_ALL else _ip_unsigned(self._nw_dst),
+            0 if w & OFPFW_TP_SRC else self._tp_src or 0,
+            0 if w & OFPFW_TP_DST else self._tp_dst or 0)
+
+  @property
+  def key (self):
+    """
+    A hashable tuple which is equal for equal matches
+    """
+    return self._pack_values()
+
   def pack (self, assertstruct=True):
     if(assertstruct):
       if self._assert() is not None:
         raise RuntimeError(self._assert())
-
-    packed = ""
-    packed += struct.pack("!LH", self.wildcards, self.in_port or 0)
-    if self.dl_src == None:
-      packed += EMPTY_ETH.toRaw()
-    elif type(self.dl_src) is bytes:
-      packed += self.dl_src
-    else:
-      packed += self.dl_src.toRaw()
-    if self.dl_dst == None:
-      packed += EMPTY_ETH.toRaw()
-    elif type(self.dl_dst) is bytes:
-      packed += self.dl_dst
-    else:
-      packed += self.dl_dst.toRaw()
-    packed += struct.pack("!HB", self.dl_vlan or 0, self.dl_vlan_pcp or 0)
-    packed += _PAD # Hardcode padding
-    packed += struct.pack("!HBB", self.dl_type or 0, self.nw_tos or 0, self.nw_proto or 0)
-    packed += _PAD2 # Hardcode padding
-    def fix (addr):
-      if addr is None: return 0
-      if type(addr) is int: return addr & 0xffFFffFF
-      if type(addr) is long: return addr & 0xffFFffFF
-      return addr.toUnsigned()
-    packed += struct.pack("!LLHH", fix(self.nw_src), fix(self.nw_dst),
-                          self.tp_src or 0, self.tp_dst or 0)
 #    if USE_MPLS_MATCH:
 #        packed += struct.pack("!IBxxx", self.mpls_label or 0, self.mpls_tc or 0)
-    return packed
+    return _match_struct.pack(*self._pack_values())
+
+  def pack_into (self, buf, offset = 0, assertstruct=True):
+    """
+    Packs into buf at offset and returns the offset just past the match
+    """
+    if(assertstruct):
+      if self._assert() is not None:
+        raise RuntimeError(self._assert())
+    _match_struct.pack_into(buf, offset, *self._pack_values())
+    return offset + 40
 
   def _normalize_wildcards (self, wildcards):
     """ nw_src and nw_dst values greater than 32 mean the same thing as 32.
@@ -666,14 +765,14 @@ class ofp_match (object):
   def unpack (self, binaryString):
     if (len(binaryString) < self.__len__()):
       return binaryString
-    (wildcards, self._in_port) = struct.unpack_from("!LH", binaryString, 0)
-    self._dl_src = EthAddr(struct.unpack_from("!BBBBBB", binaryString, 6))
-    self._dl_dst = EthAddr(struct.unpack_from("!BBBBBB", binaryString, 12))
-    (self._dl_vlan, self._dl_vlan_pcp) = struct.unpack_from("!HB", binaryString, 18)
-    (self._dl_type, self._nw_tos, self._nw_proto) = struct.unpack_from("!HBB", binaryString, 22)
-    (self._nw_src, self._nw_dst, self._tp_src, self._tp_dst) = struct.unpack_from("!LLHH", binaryString, 28)
-    self._nw_src = IPAddr(self._nw_src)
-    self._nw_dst = IPAddr(self._nw_dst)
+    (wildcards, self._in_port, dl_src, dl_dst, self._dl_vlan,
+     self._dl_vlan_pcp, self._dl_type, self._nw_tos, self._nw_proto,
+     nw_src, nw_dst, self._tp_src, self._tp_dst) = \
+        _match_struct.unpack_from(binaryString, 0)
+    self._dl_src = EthAddr(dl_src)
+    self._dl_dst = EthAddr(dl_dst)
+    self._nw_src = IPAddr(nw_src)
+    self._nw_dst = IPAddr(nw_dst)
 #    if USE_MPLS_MATCH:
 #      (self.mpls_label, self.mpls_tc) = struct.unpack_from("!IBxxx", binaryString, 40)
     self.wildcards = self._normalize_wildcards(wildcards) # Overide
@@ -687,18 +786,9 @@ class ofp_match (object):
   def hash_code (self):
     '''
     ofp_match is not properly hashable since it is mutable, but it can still be
-    useful to easily generate a hash code.
+    useful to easily generate a hash code.  (See also freeze().)
     '''
-
-    h = self.wildcards
-    for f in ofp_match_data:
-      v = getattr(self, f)
-      if type(v) is int:
-        h ^= v
-      elif type(v) is long:
-        h ^= v
-
-    return int(h & 0x7fFFffFF)
+    return hash(self._pack_values()) & 0x7fFFffFF
 
   def matches_with_wildcards (self, other, consider_other_wildcards=True):
     """
@@ -715,19 +805,14 @@ class ofp_match (object):
       other_bits = other.wildcards & ~(OFPFW_NW_SRC_MASK | OFPFW_NW_DST_MASK)
       if( self_bits | other_bits != self_bits): return False
 
-    def match_fail(mine, others):
-      return mine != None and mine != others
-
-    if match_fail(self.in_port, other.in_port): return False
-    if match_fail(self.dl_vlan, other.dl_vlan): return False
-    if match_fail(self.dl_src, other.dl_src): return False
-    if match_fail(self.dl_dst, other.dl_dst): return False
-    if match_fail(self.dl_type, other.dl_type): return False
-    if match_fail(self.nw_proto, other.nw_proto): return False
-    if match_fail(self.tp_src, other.tp_src): return False
-    if match_fail(self.tp_dst, other.tp_dst): return False
-    if match_fail(self.dl_vlan_pcp, other.dl_vlan_pcp): return False
-    if match_fail(self.nw_tos, other.nw_tos): return False
+    # Every field that we don't wildcard must have the same value in other
+    # (where it's None if wildcarded)
+    w = self.wildcards
+    ow = other.wildcards
+    for slot, bit in _match_simple_fields:
+      if w & bit: continue
+      if ow & bit or getattr(self, slot) != getattr(other, slot):
+        return False
 
     self_nw_src = self.get_nw_src()
     if(self_nw_src[0] != None):
@@ -741,24 +826,16 @@ class ofp_match (object):
     return True
 
   def __eq__ (self, other):
-    if type(self) != type(other): return False
+    if not isinstance(other, ofp_match): return False
     if self.wildcards !=  other.wildcards: return False
-    if self.in_port !=  other.in_port: return False
-    if self.dl_src !=  other.dl_src: return False
-    if self.dl_dst !=  other.dl_dst: return False
-    if self.dl_vlan !=  other.dl_vlan: return False
-    if self.dl_vlan_pcp !=  other.dl_vlan_pcp: return False
-    if self.dl_type !=  other.dl_type: return False
-    if self.nw_tos !=  other.nw_tos: return False
-    if self.nw_proto !=  other.nw_proto: return False
-    if self.nw_src !=  other.nw_src: return False
-    if self.nw_dst !=  other.nw_dst: return False
-    if self.tp_src !=  other.tp_src: return False
-    if self.tp_dst !=  other.tp_dst: return False
-    return True
+    return self._pack_values() == other._pack_values()
 
   def __ne__ (self, other): return not self.__eq__(other)
 
+  # Equal matches would hash differently (by id), so mutable matches can't
+  # be dict keys or set members at all; use freeze() or .key for that.
+  __hash__ = None
+
   def __str__ (self):
     return self.__class__.__name__ + "\n  " + self.show('  ').strip()
 
@@ -788,7 +865,7 @@ class ofp_match (object):
     outstr = ''
     outstr += prefix + 'wildcards: ' + show_wildcards(self.wildcards) + ' (' + binstr(self.wildcards) + ' = ' + hex(self.wildcards) + ')\n'
     def append (f, formatter=str):
-      v = self.__getattr__(f)
+      v = getattr(self, f)
       if v is None: return ''
       return prefix + f + ": " + formatter(v) + "\n"
     outstr += append('in_port')
@@ -905,6 +982,10 @@ class ofp_action_header (object):
     return outstr
 
 class ofp_action_output (object):
+  __slots__ = ('type', 'length', 'port', 'max_len')
+  __getstate__ = _getstate
+  __setstate__ = _setstate
+
   def __init__ (self, **kw):
     self.type = OFPAT_OUTPUT
     self.length = 8
@@ -922,14 +1003,23 @@ class ofp_action_output (object):
     if(assertstruct):
       if(not self._assert()[0]):
         return None
-    packed = ""
-    packed += struct.pack("!HHHH", self.type, self.length, self.port, self.max_len)
-    return packed
+    return _action_output_struct.pack(self.type, self.length, self.port,
+                                      self.max_len)
+
+  def pack_into (self, buf, offset = 0, assertstruct=True):
+    if self.port != OFPP_CONTROLLER:
+      self.max_len = 0
+    if(assertstruct):
+      if(not self._assert()[0]):
+        raise RuntimeError("assertstruct failed")
+    _action_output_struct.pack_into(buf, offset, self.type, self.length,
+                                    self.port, self.max_len)
+    return offset + 8
 
   def unpack (self, binaryString):
     if (len(binaryString) < 8):
       return binaryString
-    (self.type, self.length, self.port, self.max_len) = struct.unpack_from("!HHHH", binaryString, 0)
+    (self.type, self.length, self.port, self.max_len) = _action_output_struct.unpack_from(binaryString, 0)
     return binaryString[8:]
 
   def __len__ (self):
@@ -1751,6 +1841,9 @@ ofp_config_flags_rev_map = {
 
 ##3.3 Modify State Messages
 class ofp_flow_mod (ofp_header):
+  __slots__ = ('match', 'cookie', 'command', 'idle_timeout', 'hard_timeout',
+               'priority', 'buffer_id', 'out_port', 'flags', 'actions')
+
   def __init__ (self, **kw):
     ofp_header.__init__(self)
     self.header_type = OFPT_FLOW_MOD
@@ -1786,18 +1879,45 @@ class ofp_flow_mod (ofp_header):
       return (False, "match is not class ofp_match")
     return (True, None)
 
+  def _pack_values (self):
+    """
+    Returns the values to pack, in _flow_mod_struct order
+    """
+    self.length = len(self)
+    if self.xid is None:
+      self.xid = generateXID()
+    return ((self.version, self.header_type, self.length, self.xid)
+            + self.match._pack_values()
+            + (self.cookie, self.command, self.idle_timeout,
+               self.hard_timeout, self.priority, self.buffer_id & 0xffffffff,
+               self.out_port, self.flags))
+
   def pack (self, assertstruct=True):
     if(assertstruct):
       if(not self._assert()[0]):
         return None
-    packed = ""
-    self.length = len(self)
-    packed += ofp_header.pack(self)
-    packed += self.match.pack()
-    packed += struct.pack("!QHHHHLHH", self.cookie, self.command, self.idle_timeout, self.hard_timeout, self.priority, self.buffer_id & 0xffffffff, self.out_port, self.flags)
-    for i in self.actions:
-      packed += i.pack(assertstruct)
-    return packed
+      if(not ofp_header._assert(self)[0]):
+        raise RuntimeError("assertstruct failed")
+      if self.match._assert() is not None:
+        raise RuntimeError(self.match._assert())
+    packed = _flow_mod_struct.pack(*self._pack_values())
+    if not self.actions: return packed
+    return packed + b''.join([i.pack(assertstruct) for i in self.actions])
+
+  def pack_into (self, buf, offset = 0, assertstruct=True):
+    """
+    Packs into buf (e.g., a bytearray) at offset, and returns the offset
+    just past the message.
+    """
+    if(assertstruct):
+      if(not self._assert()[0]):
+        raise RuntimeError(self._assert()[1])
+      if(not ofp_header._assert(self)[0]):
+        raise RuntimeError("assertstruct failed")
+      if self.match._assert() is not None:
+        raise RuntimeError(self.match._assert())
+    _flow_mod_struct.pack_into(buf, offset, *self._pack_values())
+    return _pack_actions_into(self.actions, buf, offset + 72, assertstruct)
 
   def unpack (self, binaryString):
     if (len(binaryString) < 72):
@@ -1812,7 +1932,7 @@ class ofp_flow_mod (ofp_header):
     return binaryString[offset:]
 
   def __len__ (self):
-    l = 32 + len(self.match)
+    l = 72 # Header, match and fixed fields
     for i in self.actions:
       l += len(i)#.length()
     return l
@@ -2366,7 +2486,7 @@ class ofp_flow_stats (object):
     return packed
 
   def unpack (self, binaryString):
-    if (len(binaryString) < 48 + len(self.match())):
+    if (len(binaryString) < 48 + len(self.match)):
       return binaryString
     (self.length, self.table_id, pad) = struct.unpack_from("!HBB", binaryString, 0)
     self.match.unpack(binaryString[4:])
@@ -2820,6 +2940,8 @@ ofp_stats_reply_class_to_type_map = {
 
 ##3.6 Send Packet Message
 class ofp_packet_out (ofp_header):
+  __slots__ = ('buffer_id', 'in_port', 'actions', '_data')
+
   def __init__ (self, **kw):
     ofp_header.__init__(self)
     self.header_type = OFPT_PACKET_OUT
@@ -2862,22 +2984,47 @@ class ofp_packet_out (ofp_header):
       if self._assert() is not True:
         raise RuntimeError(self._assert())
 
-    actions = b''.join((i.pack(assertstruct) for i in self.actions))
+    actions = b''.join([i.pack(assertstruct) for i in self.actions])
     actions_len = len(actions)
 
     self.length = 16 + actions_len
     if self.data is not None:
       self.length += len(self.data)
+    if self.xid is None:
+      self.xid = generateXID()
 
+    header = _packet_out_struct.pack(self.version, self.header_type,
+                                     self.length, self.xid,
+                                     self.buffer_id & 0xffFFffFF,
+                                     self.in_port, actions_len)
     if self.data is not None:
-      return b''.join((ofp_header.pack(self),
-      struct.pack("!LHH", self.buffer_id & 0xffFFffFF, self.in_port, actions_len),
-      actions,
-      self.data))
+      return b''.join((header, actions, self.data))
     else:
-      return b''.join((ofp_header.pack(self),
-      struct.pack("!LHH", self.buffer_id & 0xffFFffFF, self.in_port, actions_len),
-      actions))
+      return header + actions
+
+  def pack_into (self, buf, offset = 0, assertstruct=True):
+    """
+    Packs into buf (e.g., a bytearray) at offset, and returns the offset
+    just past the message.
+    """
+    if(assertstruct):
+      if self._assert() is not True:
+        raise RuntimeError(self._assert())
+
+    end = _pack_actions_into(self.actions, buf, offset + 16, assertstruct)
+    actions_len = end - offset - 16
+    data = self.data or b''
+
+    self.length = 16 + actions_len + len(data)
+    if self.xid is None:
+      self.xid = generateXID()
+
+    _packet_out_struct.pack_into(buf, offset, self.version, self.header_type,
+                                 self.length, self.xid,
+                                 self.buffer_id & 0xffFFffFF,
+                                 self.in_port, actions_len)
+    buf[end:end + len(data)] = data
+    return end + len(data)
 
   def unpack (self, binaryString):
     if (len(binaryString) < 16):
@@ -3815,10 +3962,216 @@ ofp_type_rev_map = {
   'OFPT_QUEUE_GET_CONFIG_REPLY'   : 21,
 }
 
+#6. Lazy decoding
+#
+# The classes below stand in for some of the classes above when decoding
+# messages from switches.  unpack() just holds on to the bytes, and each
+# field is decoded the first time it's read (after which it's an ordinary
+# attribute and can be changed as usual).  Code that only looks at a few
+# fields -- or just passes the message along using .raw -- skips most of
+# the decoding.  They're only meant for unpacking; build messages to send
+# with the regular classes.
+
+class _lazy_field (object):
+  """
+  A struct field decoded from the object's buffer on first access
+  """
+  def __init__ (self, name, fmt, offset, convert = None):
+    self.name = name
+    self.struct = struct.Struct(fmt)
+    self.offset = offset
+    self.convert = convert
+
+  def __get__ (self, obj, cls):
+    if obj is None: return self
+    v = self.struct.unpack_from(obj._buf, obj._offset + self.offset)[0]
+    if self.convert is not None: v = self.convert(v)
+    obj.__dict__[self.name] = v
+    return v
+
+class _lazy_group_field (object):
+  """
+  One of several adjacent fields which are all decoded together the
+  first time any of them is accessed
+  """
+  def __init__ (self, name, names, s, offset):
+    self.name = name
+    self.names = names
+    self.struct = s
+    self.offset = offset
+
+  def __get__ (self, obj, cls):
+    if obj is None: return self
+    values = self.struct.unpack_from(obj._buf, obj._offset + self.offset)
+    d = obj.__dict__
+    for n,v in zip(self.names, values):
+      # Don't clobber any that have been set
+      if n not in d: d[n] = v
+    return d[self.name]
+
+def _lazy_group (cls, names, fmt, offset):
+  """
+  Adds fields to cls for names, all decoded on first access to any of them
+  """
+  s = struct.Struct(fmt)
+  for n in names:
+    setattr(cls, n, _lazy_group_field(n, names, s, offset))
+
+class _lazy_property (object):
+  """
+  Like _lazy_field, but decoded by the wrapped method
+  """
+  def __init__ (self, func):
+    self.func = func
+    self.name = func.__name__
+
+  def __get__ (self, obj, cls):
+    if obj is None: return self
+    v = self.func(obj)
+    obj.__dict__[self.name] = v
+    return v
+
+class _lazy_struct (object):
+  """
+  Base for lazily decoded structures.
+
+  The structure's bytes start at _offset within _buf, which is an
+  immutable string (possibly shared with the enclosing message).
+  """
+  def __init__ (self, buf = b'', offset = 0):
+    self._buf = buf
+    self._offset = offset
+
+  def _size (self):
+    return len(self)
+
+  def unpack (self, binaryString):
+    self._buf = binaryString
+    self._offset = 0
+    size = self._size()
+    # binaryString may be a view of a buffer which is about to be reused,
+    # so keep a copy of just our own bytes.
+    raw = binaryString[:size]
+    if isinstance(raw, memoryview): raw = raw.tobytes()
+    self._buf = raw
+    return binaryString[size:]
+
+class _lazy_header (_lazy_struct):
+  version = _lazy_field('version', '!B', 0)
+  header_type = _lazy_field('header_type', '!B', 1)
+  length = _lazy_field('length', '!H', 2)
+  xid = _lazy_field('xid', '!L', 4)
+
+  def _size (self):
+    return self.length
+
+  @property
+  def raw (self):
+    """
+    The message as it was received
+    """
+    return self._buf
+
+class ofp_packet_in_lazy (_lazy_header, ofp_packet_in):
+  buffer_id = _lazy_field('buffer_id', '!L', 8,
+                          lambda v: -1 if v == 0xffFFffFF else v)
+  _total_len = _lazy_field('_total_len', '!H', 12)
+  in_port = _lazy_field('in_port', '!H', 14)
+  reason = _lazy_field('reason', '!B', 16)
+
+  @_lazy_property
+  def _data (self):
+    return self._buf[18:self.length]
+
+class ofp_stats_reply_lazy (_lazy_header, ofp_stats_reply):
+  type = _lazy_field('type', '!H', 8)
+  flags = _lazy_field('flags', '!H', 10)
+  _body_data = (None, None)
+
+  @_lazy_property
+  def body (self):
+    return self._buf[12:self.length]
+
+  def unpack_body (self, cls):
+    """
+    Returns the body as a list of lazy cls instances (e.g.,
+    ofp_flow_stats_lazy) which share this message's bytes
+    """
+    r = []
+    buf = self._buf
+    offset = 12
+    end = self.length
+    while offset < end:
+      obj = cls(buf, offset)
+      size = obj._size()
+      if size <= 0 or offset + size > end:
+        raise RuntimeError("Bad stats body entry length: " + str(size))
+      r.append(obj)
+      offset += size
+    return r
+
+class ofp_flow_stats_lazy (_lazy_struct, ofp_flow_stats):
+  length = _lazy_field('length', '!H', 0)
+  table_id = _lazy_field('table_id', '!B', 2)
+
+  @_lazy_property
+  def match (self):
+    m = ofp_match()
+    m.unpack(buffer(self._buf, self._offset + 4, 40))
+    return m
+
+  @_lazy_property
+  def actions (self):
+    return _unpack_actions(self._buf, self.length - 88, self._offset + 88)[0]
+
+  def _size (self):
+    return self.length
+
+  def __len__ (self):
+    return self.length
+
+_lazy_group(ofp_flow_stats_lazy, ('duration_sec', 'duration_nsec', 'priority',
+            'idle_timeout', 'hard_timeout'), '!LLHHH', 44)
+_lazy_group(ofp_flow_stats_lazy, ('cookie', 'packet_count', 'byte_count'),
+            '!QQQ', 64)
+
+class ofp_port_stats_lazy (_lazy_struct, ofp_port_stats):
+  port_no = _lazy_field('port_no', '!H', 0)
+
+_lazy_group(ofp_port_stats_lazy, ('rx_packets', 'tx_packets', 'rx_bytes',
+            'tx_bytes', 'rx_dropped', 'tx_dropped', 'rx_errors', 'tx_errors',
+            'rx_frame_err', 'rx_over_err', 'rx_crc_err', 'collisions'),
+            '!QQQQQQQQQQQQ', 8)
+
+# Maps classes to their lazy versions
+lazy_class_map = {
+  ofp_packet_in   : ofp_packet_in_lazy,
+  ofp_stats_reply : ofp_stats_reply_lazy,
+  ofp_flow_stats  : ofp_flow_stats_lazy,
+  ofp_port_stats  : ofp_port_stats_lazy,
+}
+
 # Table that maps an action type to a callable that creates that type
 # (This is filled in by _init after the globals have been created)
 _action_map = {}
 
+def _pack_actions_into (actions, buf, offset, assertstruct=True):
+  """
+  Packs actions into buf at offset and returns the offset past them
+  """
+  for a in actions:
+    pack_into = getattr(a, 'pack_into', None)
+    if pack_into is not None:
+      offset = pack_into(buf, offset, assertstruct)
+    else:
+      packed = a.pack(assertstruct)
+      if packed is None:
+        raise RuntimeError("assertstruct failed")
+      end = offset + len(packed)
+      buf[offset:end] = packed
+      offset = end
+  return offset
+
 def _unpack_actions (b, length, offset=0):
   """
   Parses actions from a buffer
@@ -4007,3 +4360,75 @@ ofp_match_data = {
 #  'mpls_label': (0, OFPFW_MPLS_LABEL),
 #  'mpls_tc': (0, OFPFW_MPLS_TC),
 }
+
+# (slot, wildcard bit) for the ofp_match fields that are simply wildcarded
+# or not (i.e., not nw_src/nw_dst)
+_match_simple_fields = tuple(('_' + k, v[1])
+                             for k,v in ofp_match_data.iteritems()
+                             if k not in ('nw_src', 'nw_dst'))
+
+def _eth_raw (addr):
+  if addr is None: return _EMPTY_ETH_RAW
+  if type(addr) is bytes: return addr
+  return addr.toRaw()
+
+def _ip_unsigned (addr):
+  if addr is None: return 0
+  if type(addr) is int or type(addr) is long: return addr & 0xffFFffFF
+  return addr.toUnsigned()
+
+def _init_match_fields ():
+  """
+  Adds a property to ofp_match for each match field
+  """
+  def make (name, default, bit):
+    slot = '_' + name
+    def get (self):
+      if self.wildcards & bit: return None
+      return getattr(self, slot)
+    def set (self, value):
+      if value is None:
+        setattr(self, slot, default)
+        self.wildcards |= bit
+      else:
+        setattr(self, slot, value)
+        self.wildcards &= ~bit
+    return property(get, set)
+  for name, (default, bit) in ofp_match_data.iteritems():
+    if name in ('nw_src', 'nw_dst'): continue
+    setattr(ofp_match, name, make(name, default, bit))
+  ofp_match.nw_src = property(lambda self: self.get_nw_src()[0],
+                              ofp_match.set_nw_src.im_func)
+  ofp_match.nw_dst = property(lambda self: self.get_nw_dst()[0],
+                              ofp_match.set_nw_dst.im_func)
+
+_init_match_fields()
+
+class ofp_match_frozen (ofp_match):
+  """
+  An immutable, hashable ofp_match, usable as a dict key or set member.
+
+  Compares equal to any ofp_match with the same contents.  Mutable
+  ofp_matches aren't hashable, so to look one up, freeze() it first.  Get
+  a mutable copy back with clone().
+  """
+  __slots__ = ('_hash',)
+
+  def __init__ (self, match = None, **kw):
+    if match is None:
+      match = ofp_match(**kw)
+    for k in ofp_match._slots:
+      object.__setattr__(self, k, getattr(match, k))
+    object.__setattr__(self, '_hash', hash(self._pack_values()))
+
+  def __setattr__ (self, name, value):
+    raise TypeError("ofp_match_frozen is immutable")
+
+  def __hash__ (self):
+    return self._hash
+
+  def freeze (self):
+    return self
+
+  def __reduce__ (self):
+    return (ofp_match_frozen, (self.clone(),))
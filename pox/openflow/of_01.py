@@ -38,29 +38,31 @@ log = core.getLogger()
 import socket
 import select
 
-try:
-  PIPE_BUF = select.PIPE_BUF
-except:
-  try:
-    # Try to get it from where PyPy (sometimes) has it
-    import IN
-    PIPE_BUF = IN.PIPE_BUF
-  except:
-    # (Hopefully) reasonable default
-    PIPE_BUF = 512
-
 import pox.openflow.libopenflow_01 as of
 
-import threading
 import os
 import sys
+import subprocess
+import shlex
 import exceptions
+import threading
+from collections import deque
 from errno import EAGAIN, ECONNRESET
+import pox.openflow.of_01_worker as of_01_worker
 
 
 import traceback
 
 
+# Default number of bytes to ask for from each recv_into() on a switch
+# connection.  Can be overridden with of_01's --read_size option.
+DEFAULT_READ_SIZE = 2048
+
+# Maximum number of bytes of queued data to gather into a single send()
+# when flushing a connection's send queue.
+SEND_COALESCE_SIZE = 64 * 1024
+
+
 def handle_HELLO (con, msg): #S
   #con.msg("HELLO wire protocol " + hex(msg.version))
 
@@ -157,17 +159,23 @@ def handle_PACKET_IN (con, msg): #A
 def handle_ERROR_MSG (con, msg): #A
   log.error(str(con) + " OpenFlow Error:\n" +
             msg.show(str(con) + " Error: ").strip())
+  if con._batches: con._batch_error(msg)
   con.ofnexus.raiseEventNoErrors(ErrorIn, con, msg)
   con.raiseEventNoErrors(ErrorIn, con, msg)
 
 def handle_BARRIER (con, msg):
+  if con._batches: con._batch_done(msg.xid)
   con.ofnexus.raiseEventNoErrors(BarrierIn, con, msg)
   con.raiseEventNoErrors(BarrierIn, con, msg)
 
 #TODO: def handle_VENDOR (con, msg): #S
 
 
-def _processStatsBody (body, obj):
+def _processStatsBody (part, obj):
+  lazy = of.lazy_class_map.get(obj.__class__)
+  if lazy is not None and isinstance(part, of.ofp_stats_reply_lazy):
+    return part.unpack_body(lazy)
+  body = part.body
   r = []
   t = obj.__class__
   remaining = len(body)
@@ -189,7 +197,7 @@ def handle_OFPST_DESC (con, parts):
 def handle_OFPST_FLOW (con, parts):
   msg = []
   for part in parts:
-    msg += _processStatsBody(part.body, of.ofp_flow_stats())
+    msg += _processStatsBody(part, of.ofp_flow_stats())
   con.ofnexus.raiseEventNoErrors(FlowStatsReceived, con, parts, msg)
   con.raiseEventNoErrors(FlowStatsReceived, con, parts, msg)
 
@@ -203,21 +211,21 @@ def handle_OFPST_AGGREGATE (con, parts):
 def handle_OFPST_TABLE (con, parts):
   msg = []
   for part in parts:
-    msg += _processStatsBody(part.body, of.ofp_table_stats())
+    msg += _processStatsBody(part, of.ofp_table_stats())
   con.ofnexus.raiseEventNoErrors(TableStatsReceived, con, parts, msg)
   con.raiseEventNoErrors(TableStatsReceived, con, parts, msg)
 
 def handle_OFPST_PORT (con, parts):
   msg = []
   for part in parts:
-    msg += _processStatsBody(part.body, of.ofp_port_stats())
+    msg += _processStatsBody(part, of.ofp_port_stats())
   con.ofnexus.raiseEventNoErrors(PortStatsReceived, con, parts, msg)
   con.raiseEventNoErrors(PortStatsReceived, con, parts, msg)
 
 def handle_OFPST_QUEUE (con, parts):
   msg = []
   for part in parts:
-    msg += _processStatsBody(part.body, of.ofp_queue_stats())
+    msg += _processStatsBody(part, of.ofp_queue_stats())
   con.ofnexus.raiseEventNoErrors(QueueStatsReceived, con, parts, msg)
   con.raiseEventNoErrors(QueueStatsReceived, con, parts, msg)
 
@@ -226,6 +234,9 @@ def handle_OFPST_QUEUE (con, parts):
 # class for that type
 classes = []
 
+# Like classes, but using the lazily-decoding classes where there are any
+lazy_classes = []
+
 # A list, where the index is an OFPT, and the value is a function to
 # call for that type
 # This is generated automatically based on handlerMap
@@ -253,114 +264,6 @@ statsHandlerMap = {
   of.OFPST_QUEUE : handle_OFPST_QUEUE,
 }
 
-# Deferred sending should be unusual, so don't worry too much about
-# efficiency
-class DeferredSender (threading.Thread):
-  """
-  Class that handles sending when a socket write didn't complete
-  """
-  def __init__ (self):
-    # Threads, not recoco?
-    threading.Thread.__init__(self)
-    self._dataForConnection = {}
-    self._lock = threading.RLock()
-    self._waker = pox.lib.util.makePinger()
-    self.daemon = True
-    self.sending = False
-
-    self.start()
-
-  def _sliceup (self, data):
-    """
-    Takes an array of data bytes, and slices into elements of
-    PIPE_BUF bytes each
-    """
-    out = []
-    while len(data) > PIPE_BUF:
-      out.append(data[0:PIPE_BUF])
-      data = data[PIPE_BUF:]
-    if len(data) > 0:
-      out.append(data)
-    return out
-
-  def send (self, con, data):
-    with self._lock:
-      self.sending = True
-
-      data = self._sliceup(data)
-
-      if con not in self._dataForConnection:
-        self._dataForConnection[con] = data
-      else:
-        self._dataForConnection[con].extend(data)
-
-      self._waker.ping()
-
-  def kill (self, con):
-    with self._lock:
-      try:
-        del self._dataForConnection[con]
-      except:
-        pass
-
-      self._waker.ping()
-
-  def run (self):
-    while core.running:
-
-      with self._lock:
-        cons = self._dataForConnection.keys()
-
-      rlist, wlist, elist = select.select([self._waker], cons, cons, 1)
-      if not core.running: break
-
-      with self._lock:
-        if len(rlist) > 0:
-          self._waker.pongAll()
-
-        for con in elist:
-          try:
-            del self._dataForConnection[con]
-          except:
-            pass
-
-        for con in wlist:
-          try:
-            alldata = self._dataForConnection[con]
-            while len(alldata):
-              data = alldata[0]
-              try:
-                l = con.sock.send(data)
-                if l != len(data):
-                  alldata[0] = data[l:]
-                  break
-                del alldata[0]
-              except socket.error as (errno, strerror):
-                if errno != EAGAIN:
-                  con.msg("DeferredSender/Socket error: " + strerror)
-                  con.disconnect()
-                  del self._dataForConnection[con]
-                break
-              except:
-                con.msg("Unknown error doing deferred sending")
-                break
-            if len(alldata) == 0:
-              try:
-                del self._dataForConnection[con]
-                if len(self._dataForConnection) == 0:
-                  self.sending = False
-                  break
-              except:
-                pass
-          except:
-            try:
-              del self._dataForConnection[con]
-            except:
-              pass
-
-# Used by the Connection class below
-deferredSender = DeferredSender()
-
 class DummyOFNexus (object):
   def raiseEventNoErrors (self, event, *args, **kw):
     log.warning("%s raised on dummy OpenFlow nexus" % event)
@@ -444,6 +347,58 @@ class OFCaptureSocket (CaptureSocket):
       l = len(self._sbuf)
 
 
+class Batch (object):
+  """
+  Messages sent to a switch together, followed by a barrier (see
+  Connection.send_batch())
+
+  Once the switch has answered the barrier, done is True and errors holds
+  any error messages the switch sent for messages in the batch.  If the
+  connection goes down first, done and lost are both True.
+  """
+  def __init__ (self, connection, xids, barrier_xid):
+    self.connection = connection
+    self.xids = xids # XIDs of the messages in the batch
+    self.barrier_xid = barrier_xid
+    self.done = False
+    self.lost = False
+    self.errors = []
+    self._callbacks = []
+
+  @property
+  def ok (self):
+    """
+    True once the switch has processed the whole batch without complaint
+    """
+    return self.done and not self.lost and not self.errors
+
+  def add_callback (self, callback):
+    """
+    Arranges for callback(batch) to be called when the batch is done (or
+    calls it right away if it already is)
+    """
+    if self.done:
+      callback(self)
+    else:
+      self._callbacks.append(callback)
+
+  def _finish (self, lost = False):
+    self.done = True
+    self.lost = lost
+    callbacks = self._callbacks
+    self._callbacks = []
+    for callback in callbacks:
+      try:
+        callback(self)
+      except:
+        log.exception("Exception in batch callback")
+
+  def __repr__ (self):
+    state = "lost" if self.lost else ("done" if self.done else "pending")
+    return "<Batch of %i on %s: %s>" % (len(self.xids), self.connection,
+                                        state)
+
+
 class Connection (EventMixin):
   """
   A Connection object represents a single TCP session with an
@@ -466,7 +421,15 @@ class Connection (EventMixin):
     PortStatsReceived,
     QueueStatsReceived,
     FlowRemoved,
+    SendQueueHigh,
+    SendQueueLow,
   ])
+
+  # When this many bytes are queued waiting for the switch, SendQueueHigh
+  # is raised and send_blocked becomes True.  Once the queue has drained
+  # to send_low_water bytes, SendQueueLow is raised.
+  send_high_water = 1024 * 1024
+  send_low_water = 256 * 1024
   
   # Globally unique identifier for the Connection instance
   ID = 0
@@ -482,12 +445,45 @@ class Connection (EventMixin):
     #print str(self), m
     log.info(str(self) + " " + str(m))
 
-  def __init__ (self, sock):
+  def __init__ (self, sock, read_size = None, lazy = False):
     self._previous_stats = []
 
     self.ofnexus = _dummyOFNexus
     self.sock = sock
-    self.buf = ''
+
+    # Receive buffer.  Data between _rstart and _rend has been received but
+    # not yet consumed.  Messages are framed by offset and handed to the
+    # parsers as read-only buffer views, so nothing gets copied or resliced
+    # on a per-message basis.  When there isn't room for another read, the
+    # unconsumed tail (at most a partial message) is moved to the front.
+    self.read_size = int(read_size or DEFAULT_READ_SIZE)
+    self._rbuf = bytearray(self.read_size * 2)
+    self._rview = memoryview(self._rbuf)
+    self._rstart = 0
+    self._rend = 0
+    self._recv_into = getattr(sock, 'recv_into', None)
+
+    # Message classes to decode with, indexed by OFPT
+    self._classes = lazy_classes if lazy else classes
+
+    # Data the socket wouldn't take yet, waiting to be flushed when the
+    # socket becomes writable.  Each connection has its own, so a slow
+    # switch only ever holds up itself.  send() may be called from other
+    # threads, so the queue and socket writes are guarded by _send_lock.
+    # (It's not reentrant, so no events are raised while it's held.)
+    self._send_queue = deque()
+    self._send_queued = 0 # Bytes in _send_queue
+    self._send_lock = threading.Lock()
+    self.send_blocked = False
+    # Called with this Connection when its send queue becomes non-empty
+    # (the OpenFlow task uses this to start watching for writability)
+    self.on_send_pending = None
+    # Called with this Connection when it's disconnected
+    self.on_disconnect = None
+
+    # Batches waiting for their barrier replies, by barrier XID
+    self._batches = {}
+
     Connection.ID += 1
     self.ID = Connection.ID
     # TODO: dpid and features don't belong here; they should be eventually
@@ -534,11 +530,13 @@ class Connection (EventMixin):
     if self.dpid != None:
       self.ofnexus.raiseEventNoErrors(ConnectionDown(self))
 
-    try:
-      #deferredSender.kill(self)
-      pass
-    except:
-      pass
+    with self._send_lock:
+      self._send_queue.clear()
+      self._send_queued = 0
+    batches = self._batches
+    self._batches = {}
+    for batch in batches.itervalues():
+      batch._finish(lost = True)
     try:
       if hard:
         self.sock.shutdown(socket.SHUT_RDWR)
@@ -548,11 +546,11 @@ class Connection (EventMixin):
       pass
     except:
       pass
-    try:
-      pass
-      #TODO disconnect notification
-    except:
-      pass
+    if self.on_disconnect is not None:
+      try:
+        self.on_disconnect(self)
+      except:
+        log.exception("Exception in disconnect notification")
 
   def send (self, data):
     """
@@ -562,66 +560,265 @@ class Connection (EventMixin):
     method and call it (hoping the result will be a bytes object).  This
     way, you can just pass one of the OpenFlow objects from the OpenFlow
     library to it and get the expected result, for example.
+
+    Data the socket can't take right away is queued on this connection
+    and written out when the switch catches up.
     """
     if self.disconnected: return
     if type(data) is not bytes:
       if hasattr(data, 'pack'):
         data = data.pack()
 
-    if deferredSender.sending:
-      log.debug("deferred sender is sending!")
-      deferredSender.send(self, data)
-      return
-    try:
-      l = self.sock.send(data)
-      if l != len(data):
-        self.msg("Didn't send complete buffer.")
-        data = data[l:]
-        deferredSender.send(self, data)
-    except socket.error as (errno, strerror):
-      if errno == EAGAIN:
-        self.msg("Out of send buffer space.  " +
-                 "Consider increasing SO_SNDBUF.")
-        deferredSender.send(self, data)
+    error = None
+    with self._send_lock:
+      if self._send_queue:
+        # Already backed up -- get in line so ordering is preserved
+        high = self._enqueue(data)
       else:
-        self.msg("Socket error: " + strerror)
-        self.disconnect()
+        high = False
+        try:
+          l = self.sock.send(data)
+          if l != len(data):
+            self.msg("Didn't send complete buffer.")
+            high = self._enqueue(data[l:])
+        except socket.error as (errno, strerror):
+          if errno == EAGAIN:
+            self.msg("Out of send buffer space.  " +
+                     "Consider increasing SO_SNDBUF.")
+            high = self._enqueue(data)
+          else:
+            error = strerror
+
+    # Events are raised without holding the lock
+    if error is not None:
+      self.msg("Socket error: " + error)
+      self.disconnect()
+    elif high:
+      self.ofnexus.raiseEventNoErrors(SendQueueHigh, self)
+      self.raiseEventNoErrors(SendQueueHigh, self)
+
+  def send_batch (self, messages, callback = None):
+    """
+    Send a number of messages (e.g., flow_mods) followed by a barrier.
+
+    They're packed into a single buffer and written all at once, which is
+    much quicker than sending them one at a time.  Returns a Batch, which
+    is done when the switch replies to the barrier; if callback is given,
+    it's added to the Batch.
+    """
+    barrier = of.ofp_barrier_request()
+    size = len(barrier)
+    for m in messages:
+      size += len(m)
+    buf = bytearray(size)
+    offset = 0
+    xids = set()
+    for m in messages:
+      offset = m.pack_into(buf, offset)
+      xids.add(m.xid)
+    offset = barrier.pack_into(buf, offset)
+    del buf[offset:]
+
+    batch = Batch(self, xids, barrier.xid)
+    if callback is not None:
+      batch.add_callback(callback)
+    if self.disconnected:
+      batch._finish(lost = True)
+      return batch
+    self._batches[barrier.xid] = batch
+    self.send(str(buf))
+    return batch
+
+  def _batch_done (self, xid):
+    batch = self._batches.pop(xid, None)
+    if batch is not None:
+      batch._finish()
+
+  def _batch_error (self, msg):
+    batch = self._batches.get(msg.xid)
+    if batch is not None:
+      # Probably a switch that doesn't do barriers; call it done
+      batch.errors.append(msg)
+      self._batch_done(msg.xid)
+      return
+    for batch in self._batches.itervalues():
+      if msg.xid in batch.xids:
+        batch.errors.append(msg)
+        return
+
+  @property
+  def send_queue_length (self):
+    """
+    Number of bytes waiting to be written to the switch
+    """
+    return self._send_queued
+
+  def _enqueue (self, data):
+    """
+    Queues data (with _send_lock held)
+
+    Returns True if the queue just went over the high water mark, in which
+    case the caller should raise SendQueueHigh once it lets go of the lock.
+    """
+    first = len(self._send_queue) == 0
+    self._send_queue.append(data)
+    self._send_queued += len(data)
+    if first and self.on_send_pending is not None:
+      self.on_send_pending(self)
+    if not self.send_blocked and self._send_queued >= self.send_high_water:
+      self.send_blocked = True
+      return True
+    return False
+
+  def flush (self):
+    """
+    Write out as much queued data as the socket will take.  Usually called
+    by the OpenFlow loop when the socket becomes writable.
+
+    Queued chunks are gathered into sends of up to SEND_COALESCE_SIZE bytes,
+    so lots of small messages cost one syscall rather than one each.
+
+    Returns True if the send queue is now empty.
+    """
+    q = self._send_queue
+    error = None
+    with self._send_lock:
+      while q:
+        data = q[0]
+        if len(q) > 1 and len(data) < SEND_COALESCE_SIZE:
+          parts = []
+          size = 0
+          while q and size < SEND_COALESCE_SIZE:
+            d = q.popleft()
+            parts.append(d)
+            size += len(d)
+          data = b''.join(parts)
+          q.appendleft(data)
+        try:
+          l = self.sock.send(data)
+        except socket.error as (errno, strerror):
+          if errno == EAGAIN: break
+          error = strerror
+          break
+        self._send_queued -= l
+        if l != len(data):
+          q[0] = data[l:]
+          break
+        q.popleft()
+
+      low = self.send_blocked and self._send_queued <= self.send_low_water
+      if low: self.send_blocked = False
+      empty = len(q) == 0
+
+    if error is not None:
+      self.msg("Socket error: " + error)
+      self.disconnect()
+      return True
+    if low:
+      self.ofnexus.raiseEventNoErrors(SendQueueLow, self)
+      self.raiseEventNoErrors(SendQueueLow, self)
+
+    return empty
+
+  def _make_read_room (self, room = None):
+    """
+    Ensure there are at least room (default read_size) free bytes at the
+    end of the receive buffer, compacting or growing it as needed.
+    """
+    if room is None: room = self.read_size
+    size = len(self._rbuf)
+    if size - self._rend >= room: return
+    pending = self._rend - self._rstart
+    if pending + room > size:
+      # A single message bigger than the buffer -- grow it
+      newbuf = bytearray(max(size * 2, pending + room))
+      newbuf[0:pending] = self._rview[self._rstart:self._rend]
+      self._rbuf = newbuf
+      self._rview = memoryview(newbuf)
+    elif pending:
+      self._rview[0:pending] = self._rview[self._rstart:self._rend]
+    self._rstart = 0
+    self._rend = pending
 
   def read (self):
     """
     Read data from this connection.  Generally this is just called by the
     main OpenFlow loop below.
 
+    Returns False if the connection has been closed or is broken, and None
+    if the socket is non-blocking and there was nothing to read.
+
     Note: This function will block if data is not available.
     """
-    d = self.sock.recv(2048)
-    if len(d) == 0:
+    self._make_read_room()
+    try:
+      if self._recv_into is not None:
+        l = self._recv_into(self._rview[self._rend:], self.read_size)
+      else:
+        d = self.sock.recv(self.read_size)
+        l = len(d)
+        self._rbuf[self._rend:self._rend + l] = d
+    except socket.error as (errno, strerror):
+      if errno == EAGAIN: return None
+      raise
+    if l == 0:
       return False
-    self.buf += d
-    l = len(self.buf)
-    while l > 4:
-      if ord(self.buf[0]) != of.OFP_VERSION:
-        log.warning("Bad OpenFlow version (" + str(ord(self.buf[0])) +
-                    ") on connection " + str(self))
-        return False
-      # OpenFlow parsing occurs here:
-      ofp_type = ord(self.buf[1])
-      packet_length = ord(self.buf[2]) << 8 | ord(self.buf[3])
-      if packet_length > l: break
-      msg = classes[ofp_type]()
-      # msg.unpack implicitly only examines its own bytes, and not trailing
-      # bytes 
-      msg.unpack(self.buf)
-      self.buf = self.buf[packet_length:]
-      l = len(self.buf)
-      try:
-        h = handlers[ofp_type]
-        h(self, msg)
-      except:
-        log.exception("%s: Exception while handling OpenFlow message:\n" +
-                      "%s %s", self,self,
-                      ("\n" + str(self) + " ").join(str(msg).split('\n')))
-        continue
+    self._rend += l
+    return self._process_input()
+
+  def feed (self, data):
+    """
+    Process data from the switch which was received by some means other
+    than read() (e.g., by an of_01 worker process).
+
+    Returns False if the data was bad.
+    """
+    l = len(data)
+    self._make_read_room(l)
+    self._rbuf[self._rend:self._rend + l] = data
+    self._rend += l
+    return self._process_input()
+
+  def _process_input (self):
+    """
+    Parse and handle all complete messages in the receive buffer
+    """
+    buf = self._rbuf
+    start = self._rstart
+    end = self._rend
+    try:
+      while end - start >= 4:
+        if buf[start] != of.OFP_VERSION:
+          log.warning("Bad OpenFlow version (" + str(buf[start]) +
+                      ") on connection " + str(self))
+          return False
+        # OpenFlow parsing occurs here:
+        ofp_type = buf[start+1]
+        packet_length = buf[start+2] << 8 | buf[start+3]
+        if packet_length < 8:
+          log.warning("Bad OpenFlow message length (" + str(packet_length) +
+                      ") on connection " + str(self))
+          return False
+        if packet_length > end - start: break
+        msg = self._classes[ofp_type]()
+        # msg.unpack only examines its own bytes, and the view keeps it
+        # from seeing (or copying) anything past them
+        msg.unpack(buffer(buf, start, packet_length))
+        start += packet_length
+        self._rstart = start
+        try:
+          h = handlers[ofp_type]
+          h(self, msg)
+        except:
+          log.exception("%s: Exception while handling OpenFlow message:\n" +
+                        "%s %s", self,self,
+                        ("\n" + str(self) + " ").join(str(msg).split('\n')))
+          continue
+    finally:
+      if self._rstart == self._rend:
+        # Everything consumed; start over at the front of the buffer
+        self._rstart = 0
+        self._rend = 0
     return True
 
   def _incoming_stats_reply (self, ofp):
@@ -685,25 +882,70 @@ class OpenFlow_01_Task (Task):
   """
   The main recoco thread for listening to openflow messages
   """
-  def __init__ (self, port = 6633, address = '0.0.0.0'):
+  def __init__ (self, port = 6633, address = '0.0.0.0', read_size = None,
+                listen_fd = None, lazy = False, priority = PRIORITY_HIGH):
     Task.__init__(self)
+    # Switch I/O runs ahead of other tasks by default (see recoco)
+    self.priority = priority
     self.port = int(port)
     self.address = address
+    self.read_size = read_size
+    self.lazy = lazy
+    # If set, an already-listening socket to use instead of making one
+    self.listen_fd = listen_fd
+
+    # Connections with queued data, which we select on for writability
+    self._write_pending = set()
+    self._pinger = pox.lib.util.makePinger()
 
     core.addListener(pox.core.GoingUpEvent, self._handle_GoingUpEvent)
 
   def _handle_GoingUpEvent (self, event):
     self.start()
 
+  def _listen (self, backlog = 16):
+    """
+    Returns the listening socket for switch connections
+    """
+    if self.listen_fd is not None:
+      listener = socket.fromfd(self.listen_fd, socket.AF_INET,
+                               socket.SOCK_STREAM)
+      os.close(self.listen_fd)
+      self.listen_fd = None
+      return listener
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind((self.address, self.port))
+    listener.listen(backlog)
+    return listener
+
+  def _send_pending (self, con):
+    """
+    Called by a Connection when it has data queued
+    """
+    self._write_pending.add(con)
+    self._pinger.ping()
+
+  def _flush (self, con):
+    """
+    Flushes a Connection which was waiting to write
+
+    Once it's caught up, we stop watching it.  Another thread may queue
+    more (and add it back) between flush() and our discard, so we look
+    again afterwards rather than lose that wakeup.
+    """
+    if con.disconnected or con.flush():
+      self._write_pending.discard(con)
+      if con.send_queue_length and not con.disconnected:
+        self._write_pending.add(con)
+
   def run (self):
     # List of open sockets/connections to select on
     sockets = []
 
-    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    listener.bind((self.address, self.port))
-    listener.listen(16)
+    listener = self._listen()
     sockets.append(listener)
+    sockets.append(self._pinger)
 
     log.debug("Listening for connections on %s:%s" %
               (self.address, self.port))
@@ -713,7 +955,9 @@ class OpenFlow_01_Task (Task):
       try:
         while True:
           con = None
-          rlist, wlist, elist = yield Select(sockets, [], sockets, 5)
+          rlist, wlist, elist = yield Select(sockets,
+                                             list(self._write_pending),
+                                             sockets, 5)
           if len(rlist) == 0 and len(wlist) == 0 and len(elist) == 0:
             """
             try:
@@ -737,22 +981,33 @@ class OpenFlow_01_Task (Task):
                 sockets.remove(con)
               except:
                 pass
+              self._write_pending.discard(con)
+
+          for con in wlist:
+            self._flush(con)
 
           for con in rlist:
-            if con is listener:
+            if con is self._pinger:
+              self._pinger.pongAll()
+            elif con is listener:
               new_sock = listener.accept()[0]
               if pox.openflow.debug.pcap_traces:
                 new_sock = wrap_socket(new_sock)
               new_sock.setblocking(0)
               # Note that instantiating a Connection object fires a
               # ConnectionUp event (after negotation has completed)
-              newcon = Connection(new_sock)
+              newcon = Connection(new_sock, read_size = self.read_size,
+                                  lazy = self.lazy)
+              newcon.on_send_pending = self._send_pending
+              if newcon.send_queue_length:
+                self._write_pending.add(newcon)
               sockets.append( newcon )
               #print str(newcon) + " connected"
             else:
               if con.read() is False:
                 con.disconnect(True)
                 sockets.remove(con)
+                self._write_pending.discard(con)
       except exceptions.KeyboardInterrupt:
         break
       except:
@@ -776,12 +1031,441 @@ class OpenFlow_01_Task (Task):
           sockets.remove(con)
         except:
           pass
+        self._write_pending.discard(con)
 
     log.debug("No longer listening for connections")
 
     #pox.core.quit()
 
+class OpenFlow_01_EpollTask (OpenFlow_01_Task):
+  """
+  An OpenFlow listener which keeps switch sockets in an edge-triggered
+  epoll set, registering each one just once when it connects.
+
+  Only the epoll object itself is handed to the scheduler's select loop,
+  so a wakeup costs work proportional to the number of switches with
+  something to say rather than the number connected, and there's no
+  FD_SETSIZE limit on how many switches we can talk to.
+  """
+
+  # Maximum reads to do on one connection before giving the others a
+  # turn.  Connections that hit this are serviced again on the next pass.
+  max_reads_per_wake = 16
+
+  def run (self):
+    listener = self._listen(1024)
+    listener.setblocking(0)
+    listener_fd = listener.fileno()
+
+    # (The EPOLL* constants only exist where epoll does)
+    self._events = select.EPOLLIN | select.EPOLLOUT | select.EPOLLET
+    self._epoll = epoll = select.epoll()
+    epoll.register(listener_fd, select.EPOLLIN | select.EPOLLET)
+
+    self._connections = {} # fd -> Connection
+    self._fds = {}         # Connection -> fd
+    # Connections which may have unread data
+    self._backlog = deque()
+    self._in_backlog = set()
+    # Connections disconnected since the last pass (maybe by other threads)
+    self._dead = deque()
+
+    log.debug("Listening for connections on %s:%s (epoll)" %
+              (self.address, self.port))
+
+    while core.running:
+      try:
+        timeout = 0 if self._backlog else 5
+        yield Select([epoll], [], [], timeout)
+        while self._dead:
+          self._forget(self._dead.popleft())
+        events = epoll.poll(0)
+        if not events and not self._backlog:
+          if not core.running: break
+          continue
+
+        for fd,ev in events:
+          if fd == listener_fd:
+            self._accept(listener)
+            continue
+          con = self._connections.get(fd)
+          if con is None: continue
+          if con.disconnected:
+            self._forget(con)
+            continue
+          if ev & select.EPOLLOUT and con.send_queue_length:
+            con.flush()
+          if ev & (select.EPOLLIN | select.EPOLLERR | select.EPOLLHUP):
+            if con not in self._in_backlog:
+              self._in_backlog.add(con)
+              self._backlog.append(con)
+
+        for _ in range(len(self._backlog)):
+          con = self._backlog.popleft()
+          self._in_backlog.discard(con)
+          self._service(con)
+      except exceptions.KeyboardInterrupt:
+        break
+      except:
+        log.exception("Exception on OpenFlow listener.  Aborting.")
+        break
+
+    log.debug("No longer listening for connections")
+
+  def _accept (self, listener):
+    while True:
+      try:
+        new_sock = listener.accept()[0]
+      except socket.error as (errno, strerror):
+        if errno == EAGAIN: return
+        raise
+      if pox.openflow.debug.pcap_traces:
+        new_sock = wrap_socket(new_sock)
+      new_sock.setblocking(0)
+      fd = new_sock.fileno()
+      old = self._connections.get(fd)
+      if old is not None:
+        # Leftover from a connection closed behind our back
+        self._fds.pop(old, None)
+      try:
+        self._epoll.register(fd, self._events)
+      except IOError:
+        self._epoll.modify(fd, self._events)
+      newcon = Connection(new_sock, read_size = self.read_size,
+                          lazy = self.lazy)
+      self._connections[fd] = newcon
+      self._fds[newcon] = fd
+      newcon.on_disconnect = self._dead.append
+      if newcon.disconnected: self._dead.append(newcon)
+
+  def _service (self, con):
+    """
+    Read from a connection until it runs dry or uses up its turn
+    """
+    try:
+      for _ in xrange(self.max_reads_per_wake):
+        r = con.read()
+        if r is None: return
+        if r is False or con.disconnected: break
+      else:
+        # Still may have more -- come back on the next pass
+        self._in_backlog.add(con)
+        self._backlog.append(con)
+        return
+    except:
+      if sys.exc_info()[0] is socket.error and sys.exc_info()[1][0] == ECONNRESET:
+        con.info("Connection reset")
+      else:
+        log.exception("Exception reading connection " + str(con))
+    try:
+      con.disconnect(True)
+    except:
+      pass
+    self._forget(con)
+
+  def _forget (self, con):
+    fd = self._fds.pop(con, None)
+    if fd is None: return
+    if self._connections.get(fd) is con:
+      del self._connections[fd]
+      try:
+        self._epoll.unregister(fd)
+      except Exception:
+        pass
+    self._in_backlog.discard(con)
+
+
+# Directory containing the pox package and pox.py
+_pox_root = os.path.dirname(os.path.dirname(os.path.abspath(pox.__file__)))
+
+
+# If this much is waiting to go down to a worker, Connections keep what
+# they're sent in their own send queues until it catches up.
+WORKER_CHANNEL_HIGH_WATER = 4 * 1024 * 1024
+
+
+class _WorkerSocket (object):
+  """
+  Stands in for the socket of a switch connection owned by a worker
+
+  Like a real non-blocking socket, it refuses data with EAGAIN when the
+  switch is backed up (which the worker tells us about) or the channel to
+  the worker is.  The Connection then queues it, and the worker task
+  flushes it once there's room again.
+  """
+  def __init__ (self, channel, cid):
+    self._channel = channel
+    self._cid = cid
+    self.closed = False
+    self.queued = 0 # Bytes the worker last said it had queued for the switch
+    self.blocked = False
+
+  def send (self, data):
+    if self.closed: return len(data)
+    ch = self._channel
+    if self.blocked or ch.queued >= WORKER_CHANNEL_HIGH_WATER:
+      raise socket.error(EAGAIN, "Worker is backed up")
+    ch.send(of_01_worker.SEND, self._cid, data)
+    return len(data)
+
+  def shutdown (self, how):
+    pass
+
+  def close (self):
+    if self.closed: return
+    self.closed = True
+    self._channel.connections.pop(self._cid, None)
+    self._channel.send(of_01_worker.CLOSE, self._cid)
+
+  def fileno (self):
+    return -1
+
+
+class _WorkerChannel (object):
+  """
+  Our end of the uplink to an of_01 worker process
+  """
+  def __init__ (self, sock, process, on_pending):
+    self.sock = sock
+    self.sock.setblocking(0)
+    self.process = process
+    self.connections = {} # Connection ID -> Connection
+    # Connections with data in their own send queues
+    self.waiting = set()
+    self._on_pending = on_pending
+    self._outq = of_01_worker.SendQueue() # Frames not written yet
+    # Connections may be sent to from other threads
+    self._lock = threading.Lock()
+    self._inbuf = ''      # Partial frames from the worker
+
+  def fileno (self):
+    return self.sock.fileno()
+
+  @property
+  def queued (self):
+    """
+    Bytes waiting to be written to the worker
+    """
+    return self._outq.size
+
+  def send (self, kind, cid, data = ''):
+    with self._lock:
+      first = not self._outq
+      self._outq.append(of_01_worker.FRAME.pack(kind, cid, len(data)))
+      if data: self._outq.append(data)
+      if first: self._on_pending(self)
+
+  def flush (self):
+    """
+    Write out as much as we can.  Returns True if nothing is left.
+    """
+    with self._lock:
+      return self._outq.write(self.sock)
+
+  def connection_pending (self, con):
+    """
+    Called by a Connection when it has data queued
+    """
+    self.waiting.add(con)
+
+  def flush_waiting (self):
+    """
+    Flushes Connections whose switches (and we) can take more data
+    """
+    for con in list(self.waiting):
+      if self.queued >= WORKER_CHANNEL_HIGH_WATER: break
+      if con.sock.blocked and not con.disconnected: continue
+      if con.disconnected or con.flush():
+        self.waiting.discard(con)
+        # It may have queued more since flush() (see _flush())
+        if con.send_queue_length and not con.disconnected:
+          self.waiting.add(con)
+
+  def read (self):
+    """
+    Returns a list of (kind, connection ID, payload) frames, or None if
+    the worker has gone away.
+    """
+    try:
+      d = self.sock.recv(256 * 1024)
+    except socket.error as (errno, strerror):
+      if errno == EAGAIN: return []
+      d = ''
+    if not d: return None
+    buf = self._inbuf + d if self._inbuf else d
+    frames, offset = of_01_worker.split_frames(buf)
+    self._inbuf = buf[offset:]
+    return frames
+
+
+class OpenFlow_01_WorkerTask (OpenFlow_01_Task):
+  """
+  Does switch socket I/O in a pool of worker processes (see of_01_worker).
+
+  The workers share our listening socket, each taking some of the
+  switches.  They do the reading, writing, framing and echo handling for
+  their switches and send the rest of the messages up to us, where they're
+  handled by ordinary Connection objects.  To the rest of POX, things look
+  just like they do when of_01 does its own I/O.
+  """
+  def __init__ (self, workers, *args, **kw):
+    OpenFlow_01_Task.__init__(self, *args, **kw)
+    self.workers = int(workers)
+    self._channels = []
+
+  def _spawn (self, listener):
+    import fcntl # Not on Windows
+    ours, theirs = socket.socketpair()
+    # Keep our end out of workers spawned later, or they'd hold it open and
+    # this worker would never see us go away
+    fd = ours.fileno()
+    fcntl.fcntl(fd, fcntl.F_SETFD, fcntl.fcntl(fd, fcntl.F_GETFD)
+                | fcntl.FD_CLOEXEC)
+    p = subprocess.Popen([sys.executable, "-m", "pox.openflow.of_01_worker",
+                          str(listener.fileno()), str(theirs.fileno())],
+                         cwd = _pox_root, close_fds = False)
+    theirs.close()
+    return _WorkerChannel(ours, p, self._send_pending)
+
+  def run (self):
+    listener = self._listen(1024)
+    for _ in range(self.workers):
+      self._channels.append(self._spawn(listener))
+    # The workers have their own copies
+    listener.close()
+    log.debug("Listening for connections on %s:%s (%i workers)",
+              self.address, self.port, self.workers)
+
+    while core.running and self._channels:
+      try:
+        rlist, wlist, elist = yield Select(self._channels + [self._pinger],
+                                           list(self._write_pending),
+                                           [], 5)
+        for ch in rlist:
+          if ch is self._pinger:
+            self._pinger.pongAll()
+            continue
+          frames = ch.read()
+          if frames is None:
+            self._lost_worker(ch)
+            continue
+          for kind, cid, payload in frames:
+            self._handle_frame(ch, kind, cid, payload)
+
+        # Flush anything our handlers sent, plus anything left over, and
+        # then anything Connections queued while the worker was backed up
+        self._flush_channels()
+      except exceptions.KeyboardInterrupt:
+        break
+      except:
+        log.exception("Exception in OpenFlow worker loop")
+
+    log.debug("No longer listening for connections")
+
+  def _flush_channels (self):
+    # As in _flush(), a channel which gets more queued (from another
+    # thread) just after it empties goes back into _write_pending
+    for ch in list(self._write_pending):
+      if ch.flush():
+        self._write_pending.discard(ch)
+        if ch.queued: self._write_pending.add(ch)
+    for ch in self._channels:
+      if ch.waiting:
+        ch.flush_waiting()
+
+  def _handle_frame (self, ch, kind, cid, payload):
+    if kind == of_01_worker.MESSAGE:
+      con = ch.connections.get(cid)
+      if con is None: return
+      if con.feed(payload) is False:
+        con.disconnect(True)
+    elif kind == of_01_worker.QUEUED:
+      con = ch.connections.get(cid)
+      if con is None: return
+      queued = of_01_worker.QUEUED_LENGTH.unpack(payload)[0]
+      con.sock.queued = queued
+      con.sock.blocked = queued > of_01_worker.SWITCH_LOW_WATER
+    elif kind == of_01_worker.CONNECTED:
+      con = Connection(_WorkerSocket(ch, cid), read_size = self.read_size,
+                       lazy = self.lazy)
+      con.on_send_pending = ch.connection_pending
+      if con.send_queue_length:
+        ch.waiting.add(con)
+      ch.connections[cid] = con
+    elif kind == of_01_worker.DISCONNECTED:
+      con = ch.connections.pop(cid, None)
+      if con is None: return
+      ch.waiting.discard(con)
+      con.sock.closed = True
+      con.disconnect(True)
+
+  def _lost_worker (self, ch):
+    log.error("OpenFlow worker %s exited; dropping its %i switches",
+              ch.process.pid, len(ch.connections))
+    for con in ch.connections.values():
+      con.sock.closed = True
+      try:
+        con.disconnect(True)
+      except:
+        pass
+    ch.connections.clear()
+    ch.waiting.clear()
+    self._channels.remove(ch)
+    self._write_pending.discard(ch)
+    ch.sock.close()
+
+
+class OpenFlow_01_ShardTask (OpenFlow_01_Task):
+  """
+  Splits switches between several complete POX processes ("shards").
+
+  Each shard runs of_01 on a listening socket shared with the others, plus
+  the components given in shard_args, so apps which keep their state per
+  switch (e.g., forwarding.l2_learning) run in parallel, each instance
+  seeing only its own shard's switches.  The switches aren't visible in
+  this process at all.
+  """
+  def __init__ (self, workers, shard_args, *args, **kw):
+    OpenFlow_01_Task.__init__(self, *args, **kw)
+    self.workers = int(workers)
+    self.shard_args = shlex.split(shard_args)
+    self._processes = []
+    core.addListener(pox.core.DownEvent, self._handle_DownEvent)
+
+  def _handle_DownEvent (self, event):
+    for p in self._processes:
+      try:
+        p.terminate()
+      except OSError:
+        pass
+
+  def run (self):
+    listener = self._listen(1024)
+    cmd = [sys.executable, os.path.join(_pox_root, "pox.py"), "--no-cli",
+           "openflow.of_01", "--epoll", "--listen_fd=%i" % (listener.fileno(),)]
+    if self.read_size is not None:
+      cmd.append("--read_size=%i" % (self.read_size,))
+    if self.lazy:
+      cmd.append("--lazy")
+    cmd += self.shard_args
+    for _ in range(self.workers):
+      self._processes.append(subprocess.Popen(cmd, cwd = _pox_root,
+                                              close_fds = False))
+    listener.close()
+    log.debug("Listening for connections on %s:%s (%i shards)",
+              self.address, self.port, self.workers)
+
+    while core.running and self._processes:
+      yield Sleep(5)
+      for p in list(self._processes):
+        if p.poll() is not None:
+          log.error("OpenFlow shard %s exited with status %s", p.pid,
+                    p.returncode)
+          self._processes.remove(p)
+
+
 classes.extend( make_type_to_class_table())
+lazy_classes.extend(of.lazy_class_map.get(c, c) for c in classes)
 
 handlers.extend([None] * (1 + sorted(handlerMap.keys(), reverse=True)[0]))
 for h in handlerMap:
@@ -789,10 +1473,57 @@ for h in handlerMap:
   #print handlerMap[h]
 
 
-def launch (port = 6633, address = "0.0.0.0"):
+def launch (port = 6633, address = "0.0.0.0", read_size = None,
+            epoll = False, workers = 0, shard = None, listen_fd = None,
+            lazy = False, priority = "high"):
+  """
+  Listen for OpenFlow 1.0 switches.
+
+  --epoll uses an edge-triggered epoll set for switch sockets, which scales
+  to many more switches than the default select()-based loop (Linux only).
+
+  --workers=N does switch socket I/O in N worker processes which pass
+  messages to this one.  If --shard is also given, the N processes are
+  instead full POX instances which each run the components listed in the
+  --shard string (e.g., --shard="forwarding.l2_learning") for their share
+  of the switches.  (Both need epoll, so are Linux only.)
+
+  --lazy decodes packet-ins and stats replies lazily: fields are only
+  decoded when something reads them (see libopenflow_01's ofp_*_lazy
+  classes).
+
+  --priority is the recoco priority class of the OpenFlow task: high (the
+  default, so switch I/O isn't kept waiting behind timers and other
+  background tasks), normal or low.
+
+  --listen_fd is used internally by shards.
+  """
   if core.hasComponent('of_01'):
     return None
-  l = OpenFlow_01_Task(port = int(port), address = address)
+  if read_size is not None: read_size = int(read_size)
+  if listen_fd is not None: listen_fd = int(listen_fd)
+  priorities = {'high':PRIORITY_HIGH, 'normal':PRIORITY_NORMAL,
+                'low':PRIORITY_LOW}
+  if priority not in priorities:
+    raise RuntimeError("Unknown priority '%s' (expected one of %s)"
+                       % (priority, ", ".join(sorted(priorities))))
+  kw = dict(port = int(port), address = address, read_size = read_size,
+            listen_fd = listen_fd, lazy = pox.lib.util.str_to_bool(lazy),
+            priority = priorities[priority])
+  workers = int(workers)
+  if workers > 0 and not hasattr(select, 'epoll'):
+    # Workers and shards do their I/O with epoll
+    raise RuntimeError("--workers isn't available on this platform")
+  if workers > 0 and shard:
+    l = OpenFlow_01_ShardTask(workers, shard, **kw)
+  elif workers > 0:
+    l = OpenFlow_01_WorkerTask(workers, **kw)
+  elif pox.lib.util.str_to_bool(epoll):
+    if not hasattr(select, 'epoll'):
+      raise RuntimeError("--epoll isn't available on this platform")
+    l = OpenFlow_01_EpollTask(**kw)
+  else:
+    l = OpenFlow_01_Task(**kw)
   core.register("of_01", l)
   return l
 
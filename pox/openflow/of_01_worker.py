@@ -0,0 +1,363 @@
+# Copyright 2011 James McCauley
+#
+# This file is part of POX.
+#
+# POX is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# POX is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with POX.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Worker processes for spreading OpenFlow switch I/O over several cores.
+
+openflow.of_01 --workers=N starts N of these.  Each one accepts switches
+from a listening socket it shares with the others, does the socket I/O
+and message framing for the switches it gets, answers their echo requests
+itself, and passes everything else to the controller process over a
+socketpair (the "uplink").  Messages from the controller to a switch come
+back over the same uplink.
+
+Frames on the uplink are a FRAME header (kind, connection ID, length)
+followed by length bytes.  A worker gathers everything it has for the
+controller into a single write per pass through its loop.
+
+When a switch doesn't keep up with what's sent to it, the worker queues
+the data and tells the controller how much is queued (a QUEUED frame)
+when that goes over SWITCH_HIGH_WATER bytes and again when it drains to
+SWITCH_LOW_WATER.  In between, the controller keeps further data for the
+switch in its Connection's own send queue, so SendQueueHigh and
+SendQueueLow work the same as when of_01 does its own I/O.
+
+Workers don't run a POX core, so this module mustn't import pox.core.
+It's run as:
+  python -m pox.openflow.of_01_worker <listener fd> <uplink fd>
+"""
+
+import sys
+import os
+import socket
+import select
+import struct
+from collections import deque
+from errno import EAGAIN, EINTR, ECONNRESET
+
+import pox.openflow.libopenflow_01 as of
+
+FRAME = struct.Struct("!BLL")
+QUEUED_LENGTH = struct.Struct("!L")
+
+# Worker -> controller
+CONNECTED = 1    # A new switch connected (no payload)
+MESSAGE = 2      # One complete OpenFlow message from the switch
+DISCONNECTED = 3 # The switch went away (no payload)
+QUEUED = 6       # Bytes queued for the switch crossed a water mark
+                 # (payload is QUEUED_LENGTH)
+
+# Controller -> worker
+SEND = 4         # Data to write to the switch
+CLOSE = 5        # Close the switch connection
+
+READ_SIZE = 64 * 1024
+
+# If this much is waiting to go up to the controller, stop reading from
+# switches until it catches up.
+UPLINK_HIGH_WATER = 4 * 1024 * 1024
+
+# Water marks for data queued for a switch (see QUEUED)
+SWITCH_HIGH_WATER = 256 * 1024
+SWITCH_LOW_WATER = 64 * 1024
+
+# Maximum number of bytes of queued data to gather into a single send()
+COALESCE_SIZE = 64 * 1024
+
+_ECHO_REQUEST = chr(of.OFPT_ECHO_REQUEST)
+_ECHO_REPLY = chr(of.OFPT_ECHO_REPLY)
+
+
+def split_frames (buf, offset = 0):
+  """
+  Splits complete frames out of buf starting at offset.
+
+  Returns ([(kind, connection ID, payload), ...], offset of the first byte
+  not consumed).
+  """
+  frames = []
+  end = len(buf)
+  size = FRAME.size
+  while end - offset >= size:
+    kind, cid, length = FRAME.unpack_from(buf, offset)
+    if end - offset - size < length: break
+    start = offset + size
+    offset = start + length
+    frames.append((kind, cid, buf[start:offset]))
+  return frames, offset
+
+
+class SendQueue (object):
+  """
+  Data waiting to be written to a non-blocking socket
+
+  Chunks are gathered into sends of up to COALESCE_SIZE bytes when written,
+  the same as Connection.flush() does, so queueing is never worse than
+  linear in the amount of data.
+  """
+  def __init__ (self):
+    self._q = deque()
+    self.size = 0 # Bytes queued
+
+  def __len__ (self):
+    return self.size
+
+  def append (self, data):
+    self._q.append(data)
+    self.size += len(data)
+
+  def write (self, sock):
+    """
+    Writes as much as sock will take, and returns True if nothing is left
+
+    Socket errors other than EAGAIN are raised.
+    """
+    q = self._q
+    while q:
+      data = q[0]
+      if len(q) > 1 and len(data) < COALESCE_SIZE:
+        parts = []
+        size = 0
+        while q and size < COALESCE_SIZE:
+          d = q.popleft()
+          parts.append(d)
+          size += len(d)
+        data = b''.join(parts)
+        q.appendleft(data)
+      try:
+        l = sock.send(data)
+      except socket.error as e:
+        if e.args[0] == EAGAIN: return False
+        raise
+      self.size -= l
+      if l != len(data):
+        q[0] = data[l:]
+        return False
+      q.popleft()
+    return True
+
+  def clear (self):
+    self._q.clear()
+    self.size = 0
+
+
+class _Switch (object):
+  """
+  A switch connection owned by a worker
+  """
+  def __init__ (self, cid, sock):
+    self.cid = cid
+    self.sock = sock
+    self.fd = sock.fileno()
+    self.inbuf = ''
+    self.outq = SendQueue()
+    self.blocked = False # Whether we've told the controller it's backed up
+
+
+class Worker (object):
+  def __init__ (self, listener, uplink):
+    self.listener = listener
+    self.uplink = uplink
+    listener.setblocking(0)
+    uplink.setblocking(0)
+
+    self.epoll = select.epoll()
+    self.epoll.register(listener.fileno(), select.EPOLLIN)
+    self.epoll.register(uplink.fileno(), select.EPOLLIN)
+
+    self.switches = {} # fd -> _Switch
+    self.by_cid = {}   # connection ID -> _Switch
+    self._next_cid = 1
+
+    self._up = []      # Frames for the controller from this pass
+    self._upq = SendQueue() # Data the uplink wouldn't take yet
+    self._down = ''    # Partial frames from the controller
+
+  def run (self):
+    listener_fd = self.listener.fileno()
+    uplink_fd = self.uplink.fileno()
+    while True:
+      if self._upq.size > UPLINK_HIGH_WATER:
+        # Controller is behind; stop taking on more until it catches up
+        select.select([], [self.uplink], [])
+        self._flush_uplink()
+        continue
+      try:
+        events = self.epoll.poll(1)
+      except IOError as e:
+        if e.errno == EINTR: continue
+        raise
+      for fd,ev in events:
+        if fd == listener_fd:
+          self._accept()
+        elif fd == uplink_fd:
+          if ev & select.EPOLLIN:
+            if not self._read_uplink(): return
+          if ev & select.EPOLLOUT:
+            self._flush_uplink()
+        else:
+          sw = self.switches.get(fd)
+          if sw is None: continue
+          if ev & select.EPOLLOUT:
+            self._write_switch(sw)
+          if ev & (select.EPOLLIN | select.EPOLLERR | select.EPOLLHUP):
+            self._read_switch(sw)
+      if self._up:
+        self._upq.append(''.join(self._up))
+        del self._up[:]
+        self._flush_uplink()
+
+  def _accept (self):
+    while True:
+      try:
+        sock = self.listener.accept()[0]
+      except socket.error as e:
+        if e.args[0] == EAGAIN: return
+        raise
+      sock.setblocking(0)
+      cid = self._next_cid
+      self._next_cid += 1
+      sw = _Switch(cid, sock)
+      self.switches[sw.fd] = sw
+      self.by_cid[cid] = sw
+      self.epoll.register(sw.fd, select.EPOLLIN)
+      self._up.append(FRAME.pack(CONNECTED, cid, 0))
+
+  def _read_switch (self, sw):
+    try:
+      d = sw.sock.recv(READ_SIZE)
+    except socket.error as e:
+      if e.args[0] == EAGAIN: return
+      d = ''
+    if not d:
+      self._drop(sw)
+      return
+    buf = sw.inbuf + d if sw.inbuf else d
+    offset = 0
+    end = len(buf)
+    up = self._up
+    while end - offset >= 4:
+      if ord(buf[offset]) != of.OFP_VERSION:
+        self._drop(sw)
+        return
+      length = ord(buf[offset+2]) << 8 | ord(buf[offset+3])
+      if length < 8:
+        self._drop(sw)
+        return
+      if length > end - offset: break
+      msg = buf[offset:offset+length]
+      if msg[1] == _ECHO_REQUEST:
+        # Keepalives never need to bother the controller
+        self._send_switch(sw, msg[0] + _ECHO_REPLY + msg[2:])
+      else:
+        up.append(FRAME.pack(MESSAGE, sw.cid, length))
+        up.append(msg)
+      offset += length
+    sw.inbuf = buf[offset:]
+
+  def _send_switch (self, sw, data):
+    q = sw.outq
+    if not q:
+      try:
+        l = sw.sock.send(data)
+      except socket.error as e:
+        if e.args[0] != EAGAIN:
+          self._drop(sw)
+          return
+        l = 0
+      if l == len(data): return
+      data = data[l:]
+      self.epoll.modify(sw.fd, select.EPOLLIN | select.EPOLLOUT)
+    q.append(data)
+    if not sw.blocked and q.size >= SWITCH_HIGH_WATER:
+      sw.blocked = True
+      self._report_queued(sw)
+
+  def _write_switch (self, sw):
+    q = sw.outq
+    try:
+      empty = q.write(sw.sock)
+    except socket.error:
+      self._drop(sw)
+      return
+    if empty:
+      self.epoll.modify(sw.fd, select.EPOLLIN)
+    if sw.blocked and q.size <= SWITCH_LOW_WATER:
+      sw.blocked = False
+      self._report_queued(sw)
+
+  def _report_queued (self, sw):
+    self._up.append(FRAME.pack(QUEUED, sw.cid, QUEUED_LENGTH.size))
+    self._up.append(QUEUED_LENGTH.pack(sw.outq.size))
+
+  def _drop (self, sw, tell = True):
+    if self.by_cid.pop(sw.cid, None) is None: return
+    del self.switches[sw.fd]
+    try:
+      self.epoll.unregister(sw.fd)
+    except Exception:
+      pass
+    try:
+      sw.sock.close()
+    except Exception:
+      pass
+    sw.outq.clear()
+    if tell:
+      self._up.append(FRAME.pack(DISCONNECTED, sw.cid, 0))
+
+  def _read_uplink (self):
+    try:
+      d = self.uplink.recv(READ_SIZE)
+    except socket.error as e:
+      if e.args[0] == EAGAIN: return True
+      if e.args[0] != ECONNRESET: raise
+      d = ''
+    if not d:
+      # Controller went away
+      return False
+    buf = self._down + d if self._down else d
+    frames, offset = split_frames(buf)
+    self._down = buf[offset:]
+    for kind, cid, payload in frames:
+      sw = self.by_cid.get(cid)
+      if sw is None: continue
+      if kind == SEND:
+        self._send_switch(sw, payload)
+      elif kind == CLOSE:
+        self._drop(sw, tell=False)
+    return True
+
+  def _flush_uplink (self):
+    if not self._upq: return
+    mask = select.EPOLLIN
+    if not self._upq.write(self.uplink): mask |= select.EPOLLOUT
+    self.epoll.modify(self.uplink.fileno(), mask)
+
+
+def main (listener_fd, uplink_fd):
+  listener = socket.fromfd(listener_fd, socket.AF_INET, socket.SOCK_STREAM)
+  uplink = socket.fromfd(uplink_fd, socket.AF_UNIX, socket.SOCK_STREAM)
+  os.close(listener_fd)
+  os.close(uplink_fd)
+  try:
+    Worker(listener, uplink).run()
+  except KeyboardInterrupt:
+    pass
+
+
+if __name__ == '__main__':
+  main(int(sys.argv[1]), int(sys.argv[2]))
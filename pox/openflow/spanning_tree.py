@@ -24,111 +24,189 @@ from pox.lib.util import dpidToStr
 
 log = core.getLogger()
 
-#_adj = defaultdict(lambda:defaultdict(lambda:[]))
+# The tree is kept up to date a link at a time rather than recalculated
+# on every LinkEvent.  _adj has the single symmetric link we use between
+# each pair of connected switches, and _tree has the ones of those which
+# make up a spanning forest of them (one tree per connected group).
 
-def _calc_spanning_tree ():
-  def flip (link):
-    return Discovery.Link(link[2],link[3], link[0],link[1])
-
-  adj = defaultdict(lambda:defaultdict(lambda:[]))
-  switches = set()
-  # Add all links and switches
-  for l in core.openflow_discovery.adjacency:
-    adj[l.dpid1][l.dpid2].append(l)
-    switches.add(l.dpid1)
-    switches.add(l.dpid2)
-
-  # Cull links -- we want a single symmetric link connecting nodes
-  for s1 in switches:
-    for s2 in switches:
-      if s2 not in adj[s1]:
-        continue
-      if not isinstance(adj[s1][s2], list):
-        continue
-      assert s1 is not s2
-      good = False
-      for l in adj[s1][s2]:
-        if flip(l) in core.openflow_discovery.adjacency:
-          # This is a good one
-          adj[s1][s2] = l.port1
-          adj[s2][s1] = l.port2
-          good = True
-          break
-      if not good:
-        del adj[s1][s2]
-        if s1 in adj[s2]:
-          # Delete the other way too
-          del adj[s2][s1]
-
-  q = []
-  more = set(switches)
-
-  done = set()
+_adj = defaultdict(dict) # dpid -> {neighbor dpid: port to it}
+_tree = defaultdict(set) # dpid -> neighbor dpids it has tree edges to
 
+def _calc_spanning_tree ():
+  """
+  Returns the current spanning tree as {dpid: set((neighbor, port))}
+  """
   tree = defaultdict(set)
+  for sw, nbrs in _tree.iteritems():
+    for w in nbrs:
+      tree[sw].add((w, _adj[sw][w]))
+  return tree
 
+def _connected (a, b):
+  """
+  Returns True if a and b are in the same tree
+  """
+  seen = set([a])
+  todo = [a]
+  while todo:
+    v = todo.pop()
+    for w in _tree[v]:
+      if w == b: return True
+      if w not in seen:
+        seen.add(w)
+        todo.append(w)
+  return False
+
+def _smaller_side (a, b):
+  """
+  Returns the switches in whichever of a's and b's trees is smaller
+
+  The two are walked in step, so this only takes as long as the smaller
+  one does.
+  """
+  seen = (set([a]), set([b]))
+  todo = ([a], [b])
   while True:
-    q = sorted(list(more)) + q
-    more.clear()
-    if len(q) == 0: break
-    v = q.pop(False)
-    if v in done: continue
-    done.add(v)
-    for w,p in adj[v].iteritems():
-      if w in tree: continue
-      more.add(w)
-      tree[v].add((w,p))
-      tree[w].add((v,adj[w][v]))
-
-  if False:
-    log.debug("*** SPANNING TREE ***")
-    for sw,ports in tree.iteritems():
-      #print " ", dpidToStr(sw), ":", sorted(list(ports))
-      #print " ", sw, ":", [l[0] for l in sorted(list(ports))]
-      log.debug((" %i : " % sw) + " ".join([str(l[0]) for l in
-                                           sorted(list(ports))]))
-    log.debug("*********************")
-
-  log.debug("Spanning tree updated")
-
-  return tree
+    for i in (0, 1):
+      if not todo[i]: return seen[i]
+      v = todo[i].pop()
+      for w in _tree[v]:
+        if w not in seen[i]:
+          seen[i].add(w)
+          todo[i].append(w)
+
+def _add_tree_edge (a, b, dirty):
+  _tree[a].add(b)
+  _tree[b].add(a)
+  dirty.add((a, _adj[a][b]))
+  dirty.add((b, _adj[b][a]))
+
+def _cut_tree_edge (a, b, dirty):
+  """
+  Removes a tree edge, replacing it with another link if there is one
+  """
+  _tree[a].discard(b)
+  _tree[b].discard(a)
+  side = _smaller_side(a, b)
+  for v in side:
+    for w in _adj[v]:
+      if w not in side:
+        # Connects the two halves again
+        _add_tree_edge(v, w, dirty)
+        return
+
+def _update_link (link, dirty):
+  """
+  Updates the tree for a link having come or gone
+
+  Ports whose flood state might have changed are added to dirty.
+  """
+  s1, s2 = link.dpid1, link.dpid2
+  # Whether the link's ends are switch-only ports may have changed
+  dirty.add((s1, link.port1))
+  dirty.add((s2, link.port2))
+
+  old = None
+  if s2 in _adj[s1]:
+    old = (_adj[s1][s2], _adj[s2][s1])
+  new = None
+  links = core.openflow_discovery.linksBetween(s1, s2, bidirectional=True)
+  if links:
+    l = min(links)
+    new = (l.port1, l.port2)
+  if new == old: return
+
+  if old is not None:
+    dirty.add((s1, old[0]))
+    dirty.add((s2, old[1]))
+  if new is None:
+    del _adj[s1][s2]
+    del _adj[s2][s1]
+    if s2 in _tree[s1]:
+      _cut_tree_edge(s1, s2, dirty)
+    return
+
+  _adj[s1][s2] = new[0]
+  _adj[s2][s1] = new[1]
+  if old is not None:
+    # Just a different link between the same switches
+    dirty.add((s1, new[0]))
+    dirty.add((s2, new[1]))
+  elif not _connected(s1, s2):
+    _add_tree_edge(s1, s2, dirty)
 
 _prev = defaultdict(lambda : defaultdict(lambda : None))
+# Switches to push every port of next time, since a push to them failed
+_resync = set()
 
-def _handle (event):
-  tree = _calc_spanning_tree()
+def _push (dirty):
+  """
+  Sends port_mods for the given (dpid, port)s whose flood state changed
+
+  Each switch's port_mods are sent as a single batch.
+  """
+  if _resync:
+    for sw in _resync:
+      con = core.openflow.getConnection(sw)
+      if con is not None:
+        dirty.update((sw, p.port_no) for p in con.features.ports)
+    _resync.clear()
+
+  by_switch = defaultdict(list)
+  for sw, port in dirty:
+    by_switch[sw].append(port)
 
   try:
     change_count = 0
-    for sw, ports in tree.iteritems():
+    for sw, ports in by_switch.iteritems():
       con = core.openflow.getConnection(sw)
-      if con is None: continue # Must have disconnected
-      tree_ports = [p[1] for p in ports]
-      for p in con.features.ports:
-        if p.port_no < of.OFPP_MAX:
-          flood = p.port_no in tree_ports
-          if not flood:
-            if not core.openflow_discovery.isSwitchOnlyPort(sw, p.port_no):
-              flood = True
-          if _prev[sw][p.port_no] is flood:
-            continue # Skip
-          change_count += 1
-          _prev[sw][p.port_no] = flood
-          #print sw,p.port_no,flood
-          #TODO: Check results
-
-          pm = of.ofp_port_mod( port_no=p.port_no,
-                               hw_addr=p.hw_addr,
-                               config = 0 if flood else of.OFPPC_NO_FLOOD,
-                               mask = of.OFPPC_NO_FLOOD )
-          con.send(pm)
+      if con is None:
+        # Must have disconnected; we don't know what it'll be like if it
+        # comes back
+        _prev.pop(sw, None)
+        continue
+      tree_ports = set(_adj[sw][w] for w in _tree[sw])
+      phy_ports = dict((p.port_no, p) for p in con.features.ports)
+      msgs = []
+      for port in ports:
+        p = phy_ports.get(port)
+        if p is None or port >= of.OFPP_MAX: continue
+        flood = port in tree_ports
+        if not flood:
+          if not core.openflow_discovery.isSwitchOnlyPort(sw, port):
+            flood = True
+        if _prev[sw][port] is flood:
+          continue # Skip
+        _prev[sw][port] = flood
+        #TODO: Check results
+
+        msgs.append(of.ofp_port_mod(port_no=port,
+                                    hw_addr=p.hw_addr,
+                                    config = 0 if flood else of.OFPPC_NO_FLOOD,
+                                    mask = of.OFPPC_NO_FLOOD))
+      if msgs:
+        change_count += len(msgs)
+        con.send_batch(msgs)
     if change_count:
       log.info("%i ports changed", change_count)
   except:
+    # We don't know which port_mods made it, so send them all again on the
+    # next push
+    _resync.update(_prev)
+    _resync.update(_adj)
     _prev.clear()
     log.exception("Couldn't push spanning tree")
 
+def _handle (event):
+  dirty = set()
+  _update_link(event.link, dirty)
+  _push(dirty)
+
 def launch ():
-  handler = lambda event : _calc_spanning_tree()
-  core.openflow_discovery.addListenerByName("LinkEvent", _handle)
+  # Catch up with any links discovery already knows about
+  dirty = set()
+  for link in core.openflow_discovery.adjacency.keys():
+    _update_link(link, dirty)
+  _push(dirty)
 
+  core.openflow_discovery.addListenerByName("LinkEvent", _handle)
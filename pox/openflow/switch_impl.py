@@ -409,26 +409,38 @@ class SwitchImpl(EventMixin):
     def set_dl_dst(action, packet):
       packet.dst = action.dl_addr
       return packet
-    def set_nw_src(action, packet):
-      if(isinstance(packet.next, ipv4)):
-        packet.next.nw_src = action.nw_addr
+    # Header rewrites just set the fields; the checksums are recalculated
+    # when the packet is packed
+    def find_layer(packet, classes):
+      # Unlike packet.find(), this also works on packets we built ourselves
+      while packet is not None and not isinstance(packet, classes):
+        packet = getattr(packet, 'next', None)
       return packet
-    def set_nw_dst(action, packet):
-      if(isinstance(packet.next, ipv4)):
-        packet.next.nw_dst = action.nw_addr
+    def set_nw_addr(packet, attr, addr):
+      ip = find_layer(packet, ipv4)
+      if ip is None:
+        return packet
+      setattr(ip, attr, addr)
       return packet
+    def set_nw_src(action, packet):
+      return set_nw_addr(packet, 'srcip', action.nw_addr)
+    def set_nw_dst(action, packet):
+      return set_nw_addr(packet, 'dstip', action.nw_addr)
     def set_nw_tos(action, packet):
-      if(isinstance(packet.next, ipv4)):
-        packet.next.tos = action.nw_tos
+      ip = find_layer(packet, ipv4)
+      if ip is not None:
+        ip.tos = action.nw_tos
       return packet
-    def set_tp_src(action, packet):
-      if(isinstance(packet.next, udp) or isinstance(packet.next, tcp)):
-        packet.next.srcport = action.tp_port
+    def set_tp_port(packet, attr, port):
+      tp = find_layer(packet, (tcp, udp))
+      if tp is None:
+        return packet
+      setattr(tp, attr, port)
       return packet
+    def set_tp_src(action, packet):
+      return set_tp_port(packet, 'srcport', action.tp_port)
     def set_tp_dst(action, packet):
-      if(isinstance(packet.next, udp) or isinstance(packet.next, tcp)):
-        packet.next.dstport = action.tp_port
-      return packet
+      return set_tp_port(packet, 'dstport', action.tp_port)
     def enqueue(action, packet):
       self.log.warn("output_enqueue not supported yet. Performing regular output")
       return output_packet(action.tp_port, packet)
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+
+"""
+Measures the EthAddr and IPAddr operations that happen for every packet:
+creating them from raw header bytes, hashing them into dicts (MAC and ARP
+tables), comparing them, packing them back and checking subnets.
+
+Run from the top of the tree, e.g.:
+  tests/benchmarks/addresses.py --addresses=1000
+"""
+
+import sys
+from os import path
+import time
+import random
+from optparse import OptionParser
+
+SCRIPT_DIR = path.dirname(path.abspath(__file__))
+ROOT = path.abspath(path.join(SCRIPT_DIR, "../.."))
+sys.path.append(ROOT)
+
+from pox.lib.addresses import EthAddr, IPAddr
+
+
+def rate (func, seconds):
+  count = 0
+  start = time.time()
+  end = start + seconds
+  while True:
+    for _ in xrange(100): func()
+    count += 100
+    now = time.time()
+    if now >= end: break
+  return count / (now - start)
+
+
+def cycle (items):
+  state = [0]
+  def next ():
+    state[0] = (state[0] + 1) % len(items)
+    return items[state[0]]
+  return next
+
+
+def main ():
+  parser = OptionParser(usage="usage: %prog [options]")
+  parser.add_option("-n", "--addresses", type="int", default=1000,
+                    help="number of distinct hosts")
+  parser.add_option("--seconds", type="float", default=1,
+                    help="time to spend on each measurement")
+  (options, args) = parser.parse_args()
+
+  rand = random.Random(0)
+  raw_macs = ["".join(chr(rand.randint(0, 255)) for i in range(6))
+              for j in range(options.addresses)]
+  raw_ips = ["\x0a" + "".join(chr(rand.randint(0, 255)) for i in range(3))
+             for j in range(options.addresses)]
+  str_ips = [str(IPAddr(ip)) for ip in raw_ips]
+  macs = [EthAddr(m) for m in raw_macs]
+  ips = [IPAddr(ip) for ip in raw_ips]
+  mac_table = dict((EthAddr(m), i) for i,m in enumerate(raw_macs))
+  arp_table = dict((IPAddr(ip), i) for i,ip in enumerate(raw_ips))
+
+  next_raw_mac = cycle(raw_macs)
+  next_raw_ip = cycle(raw_ips)
+  next_str_ip = cycle(str_ips)
+  next_mac = cycle(macs)
+  next_ip = cycle(ips)
+
+  tests = [
+    ("EthAddr(raw)", lambda: EthAddr(next_raw_mac())),
+    ("IPAddr(raw)", lambda: IPAddr(next_raw_ip())),
+    ("IPAddr(dotted quad)", lambda: IPAddr(next_str_ip())),
+    ("mac_table[EthAddr(raw)]",
+      lambda: mac_table[EthAddr(next_raw_mac())]),
+    ("arp_table[IPAddr(raw)]",
+      lambda: arp_table[IPAddr(next_raw_ip())]),
+    ("EthAddr == EthAddr", lambda: next_mac() == next_mac()),
+    ("IPAddr == IPAddr", lambda: next_ip() == next_ip()),
+    ("IPAddr == str", lambda: next_ip() == "10.0.0.1"),
+    ("EthAddr.toRaw()", lambda: next_mac().toRaw()),
+    ("IPAddr.toRaw()", lambda: next_ip().toRaw()),
+    ("IPAddr.toUnsigned()", lambda: next_ip().toUnsigned()),
+    ("IPAddr.inNetwork('10.0.0.0/9')",
+      lambda: next_ip().inNetwork("10.0.0.0/9")),
+  ]
+  for name, func in tests:
+    print "%-32s %10.0f/s" % (name, rate(func, options.seconds))
+
+
+if __name__ == '__main__':
+  main()
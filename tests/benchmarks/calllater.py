@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+
+"""
+Measures how many Scheduler.callLater() calls per second other threads
+can get run on the recoco scheduler (as webcore's HTTP threads, pxpcap's
+capture threads and the like do through core.callLater()), and how long
+a single call takes to get run when the scheduler is otherwise idle.
+
+Run from the top of the tree, e.g.:
+  tests/benchmarks/calllater.py --threads=1,4
+"""
+
+import sys
+from os import path
+import time
+import threading
+from optparse import OptionParser
+
+SCRIPT_DIR = path.dirname(path.abspath(__file__))
+ROOT = path.abspath(path.join(SCRIPT_DIR, "../.."))
+sys.path.append(ROOT)
+
+from pox.lib.recoco import Scheduler
+
+
+def percentile (values, p):
+  values = sorted(values)
+  return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def main ():
+  parser = OptionParser(usage="usage: %prog [options]")
+  parser.add_option("--threads", default="1,4",
+                    help="comma-separated numbers of calling threads")
+  parser.add_option("--calls", type="int", default=10,
+                    help="idle wakeups to time")
+  parser.add_option("-n", "--count", type="int", default=200000,
+                    help="calls to make in each measurement")
+  (options, args) = parser.parse_args()
+
+  s = Scheduler(isDefaultScheduler=False, daemon=True)
+  counter = [0]
+  def count ():
+    counter[0] += 1
+
+  for n in [int(x) for x in options.threads.split(",")]:
+    def produce ():
+      for _ in xrange(options.count // n):
+        s.callLater(count)
+    threads = [threading.Thread(target=produce) for i in range(n)]
+    for t in threads: t.daemon = True
+    start_time = time.time()
+    for t in threads: t.start()
+    for t in threads: t.join()
+    # Wait for the scheduler to catch up
+    done = threading.Event()
+    s.callLater(done.set)
+    done.wait()
+    elapsed = time.time() - start_time
+    print "%2i threads: %10.0f calls/s" % (n, options.count / elapsed)
+
+  delays = []
+  for i in range(options.calls):
+    time.sleep(0.1) # Let the scheduler go idle
+    done = threading.Event()
+    start = time.time()
+    s.callLater(done.set)
+    done.wait()
+    delays.append(time.time() - start)
+  print "idle wakeup: median %8.1fus, max %8.1fus" % (
+      percentile(delays, 0.5) * 1e6, max(delays) * 1e6)
+  s.quit()
+
+
+if __name__ == '__main__':
+  main()
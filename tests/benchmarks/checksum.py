@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+
+"""
+Measures packet_utils.checksum() over a range of packet sizes, against
+the old one-word-at-a-time loop, and checksum_update() for the kinds of
+header rewrites a switch does (an IP address, a port).
+
+Run from the top of the tree, e.g.:
+  tests/benchmarks/checksum.py --sizes=20,64,576,1500,9000
+"""
+
+import sys
+from os import path
+import os
+import time
+import array
+import struct
+from socket import ntohs
+from optparse import OptionParser
+
+SCRIPT_DIR = path.dirname(path.abspath(__file__))
+ROOT = path.abspath(path.join(SCRIPT_DIR, "../.."))
+sys.path.append(ROOT)
+
+from pox.lib.packet import packet_utils
+from pox.lib.packet.packet_utils import checksum, checksum_update
+
+
+def rate (func, seconds):
+  count = 0
+  start = time.time()
+  end = start + seconds
+  while True:
+    for _ in xrange(100): func()
+    count += 100
+    now = time.time()
+    if now >= end: break
+  return count / (now - start)
+
+
+def old_checksum (data, start = 0, skip_word = None):
+  """ What packet_utils.checksum() used to do """
+  if len(data) % 2 != 0:
+    arr = array.array('H', data[:-1])
+  else:
+    arr = array.array('H', data)
+
+  if skip_word is not None:
+    for i in range(0, len(arr)):
+      if i == skip_word:
+        continue
+      start +=  arr[i]
+  else:
+    for i in range(0, len(arr)):
+      start +=  arr[i]
+
+  if len(data) % 2 != 0:
+    start += struct.unpack('H', data[-1]+'\0')[0]
+
+  start  = (start >> 16) + (start & 0xffff)
+  start += (start >> 16)
+
+  return ntohs(~start & 0xffff)
+
+
+def main ():
+  parser = OptionParser(usage="usage: %prog [options]")
+  parser.add_option("--sizes", default="20,64,128,576,1500,9000",
+                    help="comma-separated packet sizes in bytes")
+  parser.add_option("--seconds", type="float", default=0.5,
+                    help="time to spend on each measurement")
+  (options, args) = parser.parse_args()
+
+  print "NumPy: %s" % ("yes" if packet_utils._numpy is not None else "no",)
+  print "%6s %14s %14s %8s" % ("bytes", "old/s", "checksum()/s", "speedup")
+  for size in [int(s) for s in options.sizes.split(",")]:
+    data = os.urandom(size)
+    assert checksum(data) == old_checksum(data)
+    old = rate(lambda: old_checksum(data, 0, 5), options.seconds)
+    new = rate(lambda: checksum(data, 0, 5), options.seconds)
+    print "%6i %14.0f %14.0f %7.1fx" % (size, old, new, new / old)
+
+  csum = checksum(os.urandom(1500))
+  for name, old, new in (("address", "\x0a\x00\x00\x01", "\x0a\x00\x00\x02"),
+                         ("port", "\x00\x50", "\x1f\x90")):
+    r = rate(lambda: checksum_update(csum, old, new), options.seconds)
+    print "checksum_update() (%s) %10.0f/s" % (name, r)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+
+"""
+Measures what openflow.discovery's link bookkeeping costs with lots of
+links: a periodic expiry check where nothing has timed out, an
+isSwitchOnlyPort() lookup (as host_tracker and spanning_tree make for
+every port they look at), and a switch with a handful of links
+disconnecting.
+
+Run from the top of the tree, e.g.:
+  tests/benchmarks/discovery.py --links=1000,10000,100000
+"""
+
+import sys
+from os import path
+import time
+import random
+from optparse import OptionParser
+
+SCRIPT_DIR = path.dirname(path.abspath(__file__))
+ROOT = path.abspath(path.join(SCRIPT_DIR, "../.."))
+sys.path.append(ROOT)
+
+from pox.openflow.discovery import Discovery
+
+
+class MockEvent (object):
+  def __init__ (self, dpid):
+    self.dpid = dpid
+
+
+def timed (func, count):
+  start = time.time()
+  for i in xrange(count):
+    func()
+  return (time.time() - start) / count
+
+
+def main ():
+  parser = OptionParser(usage="usage: %prog [options]")
+  parser.add_option("--links", default="1000,10000,100000",
+                    help="comma-separated numbers of links")
+  parser.add_option("--degree", type="int", default=8,
+                    help="links from each switch")
+  (options, args) = parser.parse_args()
+
+  rand = random.Random(0)
+  for n in [int(x) for x in options.links.split(",")]:
+    d = Discovery()
+    d._expireTimer.cancel()
+    switches = max(2, n // options.degree)
+    d._dps.update(range(1, switches + 1))
+    while len(d.adjacency) < n:
+      a, b = rand.sample(xrange(1, switches + 1), 2)
+      pa, pb = rand.randint(1, 48), rand.randint(1, 48)
+      for l in (Discovery.Link(a, pa, b, pb), Discovery.Link(b, pb, a, pa)):
+        if l not in d.adjacency: d._addLink(l)
+
+    expire = timed(d._expireLinks, 20)
+    lookup = timed(lambda: d.isSwitchOnlyPort(rand.randint(1, switches),
+                                              rand.randint(1, 48)), 1000)
+    def down ():
+      dpid = rand.randint(1, switches)
+      links = [(l, d.adjacency[l]) for l in d.adjacency
+               if dpid in (l.dpid1, l.dpid2)]
+      start = time.time()
+      d._handle_ConnectionDown(MockEvent(dpid))
+      elapsed = time.time() - start
+      d._dps.add(dpid)
+      for l,t in links:
+        d._addLink(l, t)
+      return elapsed
+    down = sum(down() for i in range(20)) / 20
+    print "%6i links: expiry check %9.1fus, isSwitchOnlyPort %7.1fus, " \
+          "switch down %9.1fus" % (len(d.adjacency), expire * 1e6,
+          lookup * 1e6, down * 1e6)
+
+
+if __name__ == '__main__':
+  main()
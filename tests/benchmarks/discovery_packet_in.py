@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+
+"""
+Measures how long openflow.discovery's PACKET_IN handler takes per
+packet, both for ordinary traffic (which it just has to ignore) and for
+its own LLDP probes coming back in over links it already knows about.
+
+Run from the top of the tree, e.g.:
+  tests/benchmarks/discovery_packet_in.py --count=100000
+"""
+
+import sys
+from os import path
+import time
+from optparse import OptionParser
+
+SCRIPT_DIR = path.dirname(path.abspath(__file__))
+ROOT = path.abspath(path.join(SCRIPT_DIR, "../.."))
+sys.path.append(ROOT)
+
+import pox.openflow.libopenflow_01 as of
+from pox.openflow import PacketIn
+from pox.openflow.discovery import Discovery, LLDPSender
+from pox.lib.addresses import EthAddr, IPAddr
+from pox.lib.packet.ethernet import ethernet
+from pox.lib.packet.ipv4 import ipv4
+from pox.lib.packet.tcp import tcp
+
+
+class MockConnection (object):
+  def __init__ (self, dpid):
+    self.dpid = dpid
+
+  def send (self, msg):
+    pass
+
+
+def main ():
+  parser = OptionParser(usage="usage: %prog [options]")
+  parser.add_option("-n", "--count", type="int", default=100000,
+                    help="PACKET_INs to time of each kind")
+  (options, args) = parser.parse_args()
+
+  d = Discovery()
+  d._expireTimer.cancel()
+  d._dps.update([1, 2])
+  con = MockConnection(2)
+
+  t = tcp(srcport=1234, dstport=80)
+  ip = ipv4(srcip=IPAddr("10.0.0.1"), dstip=IPAddr("10.0.0.2"),
+            protocol=ipv4.TCP_PROTOCOL)
+  ip.payload = t
+  eth = ethernet(src=EthAddr("02:00:00:00:00:01"),
+                 dst=EthAddr("02:00:00:00:00:02"), type=ethernet.IP_TYPE)
+  eth.payload = ip
+  po = of.ofp_packet_out()
+  po.unpack(LLDPSender().create_discovery_packet(1, 1,
+                                                 EthAddr("02:00:00:00:00:01")))
+
+  for name, data in (("non-LLDP", eth.pack()), ("own probe", po.data)):
+    events = [PacketIn(con, of.ofp_packet_in(in_port=1, data=data))
+              for i in xrange(options.count)]
+    handler = d._handle_PacketIn
+    start = time.time()
+    for event in events:
+      handler(event)
+    elapsed = time.time() - start
+    print "%-9s: %6.2fus per PACKET_IN" % (name,
+                                          elapsed / options.count * 1e6)
+
+
+if __name__ == '__main__':
+  main()
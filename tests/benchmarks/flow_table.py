@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+
+"""
+Measures FlowTable with a mix of exact-match and wildcarded entries:
+filling the table, finding the entry for a packet, strict and non-strict
+matching (as for flow_mods), strict removal and expiry.
+
+Most of the entries are exact matches for UDP flows between hosts; the
+rest are wildcarded per-destination, per-subnet, per-port and catch-all
+rules at a few different priorities.  Entries get idle timeouts of 10 to
+600 seconds.
+
+Run from the top of the tree, e.g.:
+  tests/benchmarks/flow_table.py --entries=100000
+"""
+
+import sys
+from os import path
+import time
+import random
+from optparse import OptionParser
+
+SCRIPT_DIR = path.dirname(path.abspath(__file__))
+ROOT = path.abspath(path.join(SCRIPT_DIR, "../.."))
+sys.path.append(ROOT)
+
+import pox.openflow.libopenflow_01 as of
+from pox.openflow.flow_table import FlowTable, TableEntry
+from pox.lib.packet import ethernet, ipv4, udp
+from pox.lib.addresses import EthAddr, IPAddr
+
+
+def rate (func, seconds):
+  count = 0
+  start = time.time()
+  end = start + seconds
+  while True:
+    for _ in xrange(100): func()
+    count += 100
+    now = time.time()
+    if now >= end: break
+  return count / (now - start)
+
+
+def host (n):
+  return (EthAddr("02:00:00:%02x:%02x:%02x" % (n >> 16 & 0xff, n >> 8 & 0xff,
+                                               n & 0xff)),
+          IPAddr("10.%i.%i.%i" % (n >> 16 & 0xff, n >> 8 & 0xff, n & 0xff)))
+
+
+def make_packet (src, dst, port):
+  (src_mac, src_ip), (dst_mac, dst_ip) = host(src), host(dst)
+  e = ethernet(src=src_mac, dst=dst_mac, type=ethernet.IP_TYPE)
+  e.payload = ipv4(srcip=src_ip, dstip=dst_ip, protocol=ipv4.UDP_PROTOCOL)
+  e.payload.payload = udp(srcport=port, dstport=port, payload="x")
+  return e
+
+
+def make_entries (count, wild_fraction, hosts, rand):
+  entries = []
+  for i in xrange(count):
+    if rand.random() < wild_fraction:
+      kind = rand.randint(0, 3)
+      dst = rand.randint(1, hosts)
+      if kind == 0:
+        match = of.ofp_match(dl_dst=host(dst)[0])
+      elif kind == 1:
+        match = of.ofp_match(dl_type=0x800, nw_dst=(host(dst)[1], 24))
+      elif kind == 2:
+        match = of.ofp_match(dl_type=0x800, nw_proto=17,
+                             tp_dst=rand.randint(1, 1024))
+      else:
+        match = of.ofp_match(in_port=rand.randint(1, 48))
+      priority = rand.choice((10, 100, 1000, 30000))
+    else:
+      packet = make_packet(rand.randint(1, hosts), rand.randint(1, hosts),
+                           rand.randint(1, 1024))
+      match = of.ofp_match.from_packet(packet, rand.randint(1, 48))
+      priority = of.OFP_DEFAULT_PRIORITY
+    entries.append(TableEntry(priority=priority, match=match, now=0,
+                              idle_timeout=rand.randint(10, 600),
+                              actions=[of.ofp_action_output(port=1)]))
+  return entries
+
+
+def main ():
+  parser = OptionParser(usage="usage: %prog [options]")
+  parser.add_option("-n", "--entries", type="int", default=100000)
+  parser.add_option("--wild", type="float", default=0.1,
+                    help="fraction of entries which are wildcarded")
+  parser.add_option("--hosts", type="int", default=1000)
+  parser.add_option("--seconds", type="float", default=1,
+                    help="time to spend on each measurement")
+  (options, args) = parser.parse_args()
+
+  rand = random.Random(0)
+  entries = make_entries(options.entries, options.wild, options.hosts, rand)
+
+  table = FlowTable()
+  start = time.time()
+  for e in entries:
+    table.add_entry(e)
+  elapsed = time.time() - start
+  print "%i entries (%i wildcarded) added in %0.2fs: %10.0f/s" % (
+      len(table), sum(1 for e in entries if e.match.is_wildcarded),
+      elapsed, len(entries) / elapsed)
+
+  exact = [e for e in entries if not e.match.is_wildcarded]
+  hits = []
+  for e in rand.sample(exact, min(len(exact), 1000)):
+    packet = make_packet(1, 1, 1)
+    packet.src = e.match.dl_src
+    packet.dst = e.match.dl_dst
+    packet.payload.srcip = e.match.nw_src
+    packet.payload.dstip = e.match.nw_dst
+    packet.payload.payload.srcport = e.match.tp_src
+    packet.payload.payload.dstport = e.match.tp_dst
+    hits.append((packet, e.match.in_port))
+  others = [(make_packet(rand.randint(1, options.hosts),
+                         rand.randint(1, options.hosts),
+                         rand.randint(1, 2048)), rand.randint(1, 48))
+            for i in range(1000)]
+  wild = rand.sample([e for e in entries if e.match.is_wildcarded] or entries,
+                     100)
+
+  def cycle (items):
+    state = [0]
+    def next ():
+      state[0] = (state[0] + 1) % len(items)
+      return items[state[0]]
+    return next
+
+  next_hit = cycle(hits)
+  next_other = cycle(others)
+  next_entry = cycle(entries)
+  next_wild = cycle(wild)
+  tests = [
+    ("entry_for_packet() (exact)",
+      lambda: table.entry_for_packet(*next_hit())),
+    ("entry_for_packet() (other)",
+      lambda: table.entry_for_packet(*next_other())),
+    ("matching_entries() strict",
+      lambda: table.matching_entries(next_entry().match,
+                                     of.OFP_DEFAULT_PRIORITY, strict=True)),
+    ("matching_entries() wildcard",
+      lambda: table.matching_entries(next_wild().match)),
+  ]
+  for name, func in tests:
+    print "%-30s %10.0f/s" % (name, rate(func, options.seconds))
+
+  doomed = rand.sample(entries, min(len(entries), 1000))
+  start = time.time()
+  for e in doomed:
+    table.remove_entry(e)
+  print "%-30s %10.0f/s" % ("remove_entry()",
+                            len(doomed) / (time.time() - start))
+
+  print "%-30s %10.0f/s" % ("remove_expired_entries() (idle)",
+      rate(lambda: table.remove_expired_entries(now=5), options.seconds))
+  for now in (20, 40):
+    start = time.time()
+    expired = table.remove_expired_entries(now=now)
+    print "sweep at %is expired %i entries in %0.4fs" % (
+        now, len(expired), time.time() - start)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+
+"""
+Measures pox.lib.graph.Graph queries on a graph of switches and hosts:
+looking a node up by a field value, get_one() on a unique field, has()
+for a type, and find_links() between a given switch and any host.
+
+Run from the top of the tree, e.g.:
+  tests/benchmarks/graph.py --nodes=1000,10000
+"""
+
+import sys
+from os import path
+import time
+import random
+from optparse import OptionParser
+
+SCRIPT_DIR = path.dirname(path.abspath(__file__))
+ROOT = path.abspath(path.join(SCRIPT_DIR, "../.."))
+sys.path.append(ROOT)
+
+from pox.lib.graph.graph import *
+
+
+class Switch (object):
+  def __init__ (self, dpid):
+    self.dpid = dpid
+
+class Host (object):
+  def __init__ (self, mac):
+    self.mac = mac
+
+class Controller (object):
+  pass
+
+
+def timed (func, count):
+  start = time.time()
+  for i in xrange(count):
+    func()
+  return (time.time() - start) / count
+
+
+def main ():
+  parser = OptionParser(usage="usage: %prog [options]")
+  parser.add_option("--nodes", default="1000,10000",
+                    help="comma-separated numbers of nodes")
+  parser.add_option("--count", type="int", default=200,
+                    help="queries of each kind to time")
+  (options, args) = parser.parse_args()
+
+  rand = random.Random(0)
+  for n in [int(x) for x in options.nodes.split(",")]:
+    g = Graph()
+    if hasattr(g, 'add_index'):
+      g.add_index('dpid')
+      g.add_index('mac')
+    switches = [Switch(i) for i in range(1, n // 10 + 1)]
+    hosts = [Host(i) for i in range(n - len(switches))]
+    for x in switches + hosts:
+      g.add(x)
+    g.add(Controller())
+    for i, h in enumerate(hosts):
+      g.link((h, 0), (rand.choice(switches), i + 1))
+    for i in range(len(switches)):
+      a, b = rand.sample(switches, 2)
+      g.link((a, 100000 + i), (b, 100000 + i))
+
+    find = timed(lambda: g.find(Equal(F('dpid'),
+                                      rand.randint(1, len(switches)))),
+                 options.count)
+    get = timed(lambda: g.get_one(mac = rand.randrange(len(hosts))),
+                options.count)
+    has = timed(lambda: g.has(type = Controller), options.count)
+    q = Equal(F('dpid'), 1)
+    links = timed(lambda: g.find_links(q, IsInstance(Host)), options.count)
+    print "%6i nodes: find %8.1fus, get_one %8.1fus, has %8.1fus, " \
+          "find_links %8.1fus" % (n + 1, find * 1e6, get * 1e6, has * 1e6,
+          links * 1e6)
+
+
+if __name__ == '__main__':
+  main()
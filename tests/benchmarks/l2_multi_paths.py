@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+
+"""
+Measures how long l2_multi takes to handle a link going down or coming
+back up and then find paths for a handful of new flows, on a fabric of
+switches in a ring with random shortcuts.  Also counts how many of the
+flows installed beforehand each change removes -- every one of them
+means PACKET_INs to set it up again.  (The flow_mods l2_multi sends go
+to mock connections which just count them.)
+
+Run from the top of the tree, e.g.:
+  tests/benchmarks/l2_multi_paths.py --switches=300 --flaps=20
+"""
+
+import sys
+from os import path
+import time
+import random
+from optparse import OptionParser
+
+SCRIPT_DIR = path.dirname(path.abspath(__file__))
+ROOT = path.abspath(path.join(SCRIPT_DIR, "../.."))
+sys.path.append(ROOT)
+
+from pox.core import core
+from pox.openflow.discovery import Discovery, LinkEvent
+import pox.openflow.libopenflow_01 as of
+import pox.forwarding.l2_multi as l2_multi
+from pox.lib.addresses import EthAddr
+
+
+class MockConnection (object):
+  flows = 0 # Installed flow entries
+  removed = 0 # Flow entries removed
+
+  def send (self, msg):
+    if not isinstance(msg, of.ofp_flow_mod): return
+    if msg.command == of.OFPFC_ADD:
+      self.flows += 1
+    elif msg.command == of.OFPFC_DELETE:
+      # A wildcard delete removes everything
+      self.removed += self.flows
+      self.flows = 0
+    else:
+      self.removed += 1
+      self.flows -= 1
+
+  def send_batch (self, messages, callback = None):
+    for m in messages:
+      self.send(m)
+
+class MockDiscovery (object):
+  def __init__ (self):
+    self.adjacency = {}
+
+  def linksBetween (self, dpid1, dpid2, bidirectional = False):
+    return [l for l in self.adjacency
+            if (l.dpid1, l.dpid2) == (dpid1, dpid2)
+            and (not bidirectional or
+                 Discovery.Link(l.dpid2, l.port2, l.dpid1, l.port1)
+                 in self.adjacency)]
+
+
+def main ():
+  parser = OptionParser(usage="usage: %prog [options]")
+  parser.add_option("-n", "--switches", type="int", default=300)
+  parser.add_option("--shortcuts", type="int", default=300,
+                    help="random links added to the ring")
+  parser.add_option("--flaps", type="int", default=20,
+                    help="links to take down and bring back up")
+  parser.add_option("--flows", type="int", default=10,
+                    help="paths looked up after each change")
+  parser.add_option("--installed", type="int", default=1000,
+                    help="paths installed before each change")
+  (options, args) = parser.parse_args()
+
+  rand = random.Random(0)
+  discovery = MockDiscovery()
+  core.components['openflow_discovery'] = discovery
+  l2 = l2_multi.l2_multi.__new__(l2_multi.l2_multi)
+  l2.reoptimize = False
+  core.components['l2_multi'] = l2
+
+  dpids = range(1, options.switches + 1)
+  for dpid in dpids:
+    sw = l2_multi.Switch()
+    sw.dpid = dpid
+    sw.connection = MockConnection()
+    l2_multi.switches[dpid] = sw
+
+  def link (a, b, up):
+    links = (Discovery.Link(a, b, b, a), Discovery.Link(b, a, a, b))
+    for l in links:
+      if up:
+        discovery.adjacency[l] = 0
+      else:
+        del discovery.adjacency[l]
+    for l in links:
+      l2._handle_LinkEvent(LinkEvent(up, l))
+
+  links = set()
+  for a in dpids:
+    links.add((a, a % options.switches + 1))
+  while len(links) < options.switches + options.shortcuts:
+    a, b = sorted(rand.sample(dpids, 2))
+    links.add((a, b))
+  for a,b in links:
+    link(a, b, True)
+
+  def flows ():
+    for i in range(options.flows):
+      a, b = rand.sample(dpids, 2)
+      l2_multi._get_path(l2_multi.switches[a], l2_multi.switches[b], 1)
+
+  def install ():
+    sws = l2_multi.switches
+    for i in range(options.installed):
+      a, b = rand.sample(dpids, 2)
+      p = l2_multi._get_path(sws[a], sws[b], 1000)
+      if p is None: continue
+      match = of.ofp_match(dl_dst = EthAddr("02:00:00:00:%02x:%02x"
+                                            % (i // 256, i % 256)))
+      sws[a]._install_path(p, match)
+
+  def removed ():
+    return sum(sw.connection.removed for sw in l2_multi.switches.values())
+
+  flows() # Warm up
+  links = sorted(links)
+  times = []
+  lost = []
+  for i in range(options.flaps):
+    a, b = rand.choice(links)
+    for up in (False, True):
+      install()
+      before = removed()
+      start = time.time()
+      link(a, b, up)
+      flows()
+      times.append(time.time() - start)
+      lost.append(removed() - before)
+  times.sort()
+  print "%i switches, %i links: link change + %i paths: " \
+        "median %.2fms, max %.2fms" % (options.switches, len(links),
+        options.flows, times[len(times) // 2] * 1000, times[-1] * 1000)
+  print "flow entries removed per change: %.0f on average" % (
+      float(sum(lost)) / len(lost),)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+
+"""
+Measures how many messages per second libopenflow_01 can decode, by
+message type, with the regular classes and with the lazy ones.
+
+"touch" decodes and reads just the xid and the number of stats entries
+(as something that just forwards or counts messages might).  "all" decodes and reads every field.
+
+Run from the top of the tree, e.g.:
+  tests/benchmarks/libopenflow_decode.py --seconds=1
+"""
+
+import sys
+from os import path
+import time
+from optparse import OptionParser
+
+SCRIPT_DIR = path.dirname(path.abspath(__file__))
+ROOT = path.abspath(path.join(SCRIPT_DIR, "../.."))
+sys.path.append(ROOT)
+
+import pox.openflow.libopenflow_01 as of
+from pox.openflow.util import make_type_to_class_table
+
+classes = make_type_to_class_table()
+
+
+def samples (entries):
+  """
+  Returns [(name, packed message, stats body class or None)]
+  """
+  r = []
+  r.append(("packet_in", of.ofp_packet_in(in_port=1, buffer_id=5,
+                                          data="x" * 128).pack(), None))
+  r.append(("echo_request", of.ofp_echo_request().pack(), None))
+  r.append(("barrier_reply", of.ofp_barrier_reply().pack(), None))
+  ports = [of.ofp_phy_port(port_no=i, hw_addr=of.EthAddr("02:00:00:00:00:%02x"
+           % (i,)), name="eth%i" % (i,)) for i in range(1, 9)]
+  r.append(("features_reply", of.ofp_features_reply(datapath_id=1,
+                                                    ports=ports).pack(), None))
+  r.append(("port_status", of.ofp_port_status(desc=ports[0]).pack(), None))
+  match = of.ofp_match(in_port=1, dl_type=0x800, nw_src="10.0.0.1",
+                       nw_dst="10.0.0.2", nw_proto=6, tp_dst=80)
+  r.append(("flow_removed", of.ofp_flow_removed(match=match).pack(), None))
+
+  flows = []
+  for i in range(entries):
+    f = of.ofp_flow_stats(match=match, packet_count=i,
+                          actions=[of.ofp_action_output(port=2)])
+    f.length = len(f)
+    flows.append(f.pack())
+  r.append(("flow_stats[%i]" % (entries,),
+            of.ofp_stats_reply(type=of.OFPST_FLOW, body="".join(flows)).pack(),
+            of.ofp_flow_stats))
+  body = "".join(of.ofp_port_stats(port_no=i).pack() for i in range(entries))
+  r.append(("port_stats[%i]" % (entries,),
+            of.ofp_stats_reply(type=of.OFPST_PORT, body=body).pack(),
+            of.ofp_port_stats))
+  return r
+
+
+def decode (cls, data, body_class):
+  """
+  Decodes like of_01 does, including the stats body
+  """
+  msg = cls()
+  msg.unpack(buffer(data))
+  if body_class is None: return [msg]
+  lazy = of.lazy_class_map.get(body_class)
+  if isinstance(msg, of.ofp_stats_reply_lazy):
+    return [msg] + msg.unpack_body(lazy)
+  r = [msg]
+  body = msg.body
+  while body:
+    obj = body_class()
+    body = obj.unpack(body)
+    r.append(obj)
+  return r
+
+
+def touch (objs):
+  return objs[0].xid, len(objs)
+
+
+def touch_all (objs):
+  for o in objs:
+    o.__eq__(o) # Reads every field
+
+
+def rate (func, seconds):
+  count = 0
+  start = time.time()
+  end = start + seconds
+  while True:
+    for _ in xrange(100): func()
+    count += 100
+    now = time.time()
+    if now >= end: break
+  return count / (now - start)
+
+
+def main ():
+  parser = OptionParser(usage="usage: %prog [options]")
+  parser.add_option("--seconds", type="float", default=1,
+                    help="time to spend on each measurement")
+  parser.add_option("--entries", type="int", default=50,
+                    help="entries in the stats replies")
+  (options, args) = parser.parse_args()
+
+  print "%-18s %-6s %12s %12s %12s" % ("message", "", "decode/s",
+                                       "touch/s", "all/s")
+  for name, data, body_class in samples(options.entries):
+    eager = classes[ord(data[1])]
+    for kind, cls in (("eager", eager),
+                      ("lazy", of.lazy_class_map.get(eager))):
+      if cls is None: continue
+      d = rate(lambda: decode(cls, data, body_class), options.seconds)
+      t = rate(lambda: touch(decode(cls, data, body_class)), options.seconds)
+      a = rate(lambda: touch_all(decode(cls, data, body_class)),
+               options.seconds)
+      print "%-18s %-6s %12.0f %12.0f %12.0f" % (name, kind, d, t, a)
+
+
+if __name__ == '__main__':
+  main()
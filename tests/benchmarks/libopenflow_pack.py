@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+
+"""
+Measures how fast libopenflow_01 can pack the messages a controller sends
+most (flow_mods and packet_outs), and how much memory a flow_mod takes.
+
+Run from the top of the tree, e.g.:
+  tests/benchmarks/libopenflow_pack.py --seconds=1
+"""
+
+import sys
+from os import path
+import time
+from optparse import OptionParser
+
+SCRIPT_DIR = path.dirname(path.abspath(__file__))
+ROOT = path.abspath(path.join(SCRIPT_DIR, "../.."))
+sys.path.append(ROOT)
+
+import pox.openflow.libopenflow_01 as of
+
+
+def make_flow_mod ():
+  return of.ofp_flow_mod(xid=1, idle_timeout=10, buffer_id=5,
+                         match=of.ofp_match(in_port=1, dl_type=0x800,
+                                            dl_src=of.EthAddr("02:00:00:00:00:01"),
+                                            dl_dst=of.EthAddr("02:00:00:00:00:02"),
+                                            nw_src="10.0.0.1",
+                                            nw_dst="10.0.0.2",
+                                            nw_proto=6, tp_src=1234,
+                                            tp_dst=80),
+                         actions=[of.ofp_action_output(port=2)])
+
+
+def make_packet_out ():
+  return of.ofp_packet_out(xid=1, in_port=1, data="x" * 64,
+                           actions=[of.ofp_action_output(port=2)])
+
+
+def rate (func, seconds):
+  count = 0
+  start = time.time()
+  end = start + seconds
+  while True:
+    for _ in xrange(100): func()
+    count += 100
+    now = time.time()
+    if now >= end: break
+  return count / (now - start)
+
+
+def size_of (obj, seen = None):
+  """
+  Rough deep size of an object in bytes
+  """
+  if seen is None: seen = set()
+  if id(obj) in seen: return 0
+  seen.add(id(obj))
+  size = sys.getsizeof(obj)
+  d = getattr(obj, '__dict__', None)
+  if d is not None:
+    size += size_of(d, seen)
+    for v in d.itervalues(): size += size_of(v, seen)
+  for s in getattr(type(obj), '__mro__', ()):
+    for n in s.__dict__.get('__slots__', ()):
+      if hasattr(obj, n): size += size_of(getattr(obj, n), seen)
+  if isinstance(obj, (list, tuple)):
+    for v in obj: size += size_of(v, seen)
+  return size
+
+
+def main ():
+  parser = OptionParser(usage="usage: %prog [options]")
+  parser.add_option("--seconds", type="float", default=1,
+                    help="time to spend on each measurement")
+  (options, args) = parser.parse_args()
+
+  fm = make_flow_mod()
+  po = make_packet_out()
+  results = [
+    ("ofp_match.pack()", lambda: fm.match.pack()),
+    ("ofp_flow_mod()", make_flow_mod),
+    ("ofp_flow_mod.pack()", lambda: fm.pack()),
+    ("ofp_packet_out.pack()", lambda: po.pack()),
+  ]
+  if hasattr(fm, 'pack_into'):
+    buf = bytearray(len(fm) * 100)
+    def pack_into ():
+      offset = 0
+      for _ in xrange(100):
+        offset = fm.pack_into(buf, offset)
+    results.append(("ofp_flow_mod.pack_into()",
+                    lambda: pack_into()))
+  for name, func in results:
+    r = rate(func, options.seconds)
+    if name.endswith("pack_into()"): r *= 100
+    print "%-26s %10.0f/s" % (name, r)
+  print "%-26s %10i bytes" % ("ofp_flow_mod size", size_of(make_flow_mod()))
+
+
+if __name__ == '__main__':
+  main()
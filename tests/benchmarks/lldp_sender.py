@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+
+"""
+Measures what openflow.discovery's LLDPSender costs: how often its timer
+fires, how much CPU it takes to send a whole cycle of probes to every port
+of every switch, and how long a port coming and going takes to handle.
+(Sends go to a mock which just counts them.)
+
+Run from the top of the tree, e.g.:
+  tests/benchmarks/lldp_sender.py --switches=100,1000 --ports=20
+"""
+
+import sys
+from os import path
+import time
+from optparse import OptionParser
+
+SCRIPT_DIR = path.dirname(path.abspath(__file__))
+ROOT = path.abspath(path.join(SCRIPT_DIR, "../.."))
+sys.path.append(ROOT)
+
+from pox.core import core
+import pox.openflow.discovery as discovery
+from pox.lib.addresses import EthAddr
+
+
+class MockOpenFlow (object):
+  def __init__ (self):
+    self.sends = 0
+    self.bytes = 0
+
+  def sendToDPID (self, dpid, data):
+    self.sends += 1
+    self.bytes += len(data)
+    return True
+
+
+def main ():
+  parser = OptionParser(usage="usage: %prog [options]")
+  parser.add_option("--switches", default="100,1000",
+                    help="comma-separated numbers of switches")
+  parser.add_option("--ports", type="int", default=20,
+                    help="ports per switch")
+  parser.add_option("--cycles", type="int", default=5,
+                    help="send cycles to time")
+  (options, args) = parser.parse_args()
+
+  openflow = MockOpenFlow()
+  core.components['openflow'] = openflow
+  addr = EthAddr("02:00:00:00:00:01")
+
+  for n in [int(x) for x in options.switches.split(",")]:
+    sender = discovery.LLDPSender()
+    for dpid in range(1, n + 1):
+      sender.addSwitch(dpid, [(p, addr) for p in range(1, options.ports + 1)])
+    sender._timer.cancel()
+    fires = discovery.LLDP_SEND_SLOTS
+
+    openflow.sends = 0
+    start = time.time()
+    for i in range(options.cycles * fires):
+      sender._timerHandler()
+    cycle = (time.time() - start) / options.cycles
+    sends = openflow.sends // options.cycles
+
+    start = time.time()
+    for dpid in range(1, n + 1):
+      sender.delPort(dpid, 1)
+      sender.addPort(dpid, 1, addr)
+    flap = (time.time() - start) / n
+
+    print "%5i switches, %6i ports: %6i timer fires (every %8.2fms) and " \
+          "%6i sends per cycle, %8.1fms CPU per cycle, port flap %7.1fus" % (
+          n, n * options.ports, fires,
+          discovery.LLDP_SEND_CYCLE / fires * 1000, sends, cycle * 1000,
+          flap * 1e6)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+
+"""
+Measures how fast a Connection can push out flow_mods when they're sent
+one at a time (plus a barrier) and when they're sent with send_batch().
+
+The "switch" is a child process which reads and throws away everything
+it gets over a socketpair.
+
+Run from the top of the tree, e.g.:
+  tests/benchmarks/of_01_batch.py --size=100
+"""
+
+import sys
+import os
+from os import path
+import socket
+import time
+from optparse import OptionParser
+
+SCRIPT_DIR = path.dirname(path.abspath(__file__))
+ROOT = path.abspath(path.join(SCRIPT_DIR, "../.."))
+sys.path.append(ROOT)
+
+import pox.openflow.libopenflow_01 as of
+import pox.openflow.of_01 as of_01
+from pox.lib.addresses import EthAddr
+
+
+def rate (func, seconds):
+  count = 0
+  start = time.time()
+  end = start + seconds
+  while True:
+    for _ in xrange(10): func()
+    count += 10
+    now = time.time()
+    if now >= end: break
+  return count / (now - start)
+
+
+def main ():
+  parser = OptionParser(usage="usage: %prog [options]")
+  parser.add_option("--size", type="int", default=100,
+                    help="flow_mods per batch")
+  parser.add_option("--seconds", type="float", default=2,
+                    help="time to spend on each measurement")
+  (options, args) = parser.parse_args()
+
+  ours, theirs = socket.socketpair()
+  pid = os.fork()
+  if pid == 0:
+    ours.close()
+    while theirs.recv(1024 * 1024): pass
+    os._exit(0)
+  theirs.close()
+
+  con = of_01.Connection(ours)
+  msgs = [of.ofp_flow_mod(match=of.ofp_match(dl_dst=EthAddr(
+                                             "02:00:00:00:%02x:%02x"
+                                             % (i >> 8, i & 0xff))),
+                          idle_timeout=10,
+                          actions=[of.ofp_action_output(port=i % 48 + 1)])
+          for i in range(options.size)]
+
+  def one_at_a_time ():
+    for m in msgs:
+      m.xid = None
+      con.send(m)
+    con.send(of.ofp_barrier_request())
+
+  def batch ():
+    for m in msgs:
+      m.xid = None
+    con.send_batch(msgs)
+    con._batches.clear() # Nobody's going to answer
+
+  for name, func in (("send() each", one_at_a_time),
+                     ("send_batch()", batch)):
+    r = rate(func, options.seconds) * options.size
+    print "%-14s %10.0f flow_mods/s" % (name, r)
+
+  ours.close()
+  os.waitpid(pid, 0)
+
+
+if __name__ == '__main__':
+  main()
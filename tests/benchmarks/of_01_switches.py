@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+
+"""
+Connects thousands of emulated switches to a POX controller and measures
+how long the handshakes take and the echo round trip time once they're all
+connected and (mostly) idle.
+
+Run from the top of the tree, e.g.:
+  tests/benchmarks/of_01_switches.py --switches=5000 --epoll
+  tests/benchmarks/of_01_switches.py --switches=900
+
+The controller is started as a subprocess running openflow.of_01 only.
+Without --epoll, of_01 uses select() and can't get past FD_SETSIZE
+(usually 1024) sockets.
+"""
+
+import sys
+import os
+from os import path
+import socket
+import select
+import struct
+import subprocess
+import signal
+import resource
+import random
+import time
+from errno import EAGAIN, EINPROGRESS
+from optparse import OptionParser
+
+SCRIPT_DIR = path.dirname(path.abspath(__file__))
+ROOT = path.abspath(path.join(SCRIPT_DIR, "../.."))
+sys.path.append(ROOT)
+
+import pox.openflow.libopenflow_01 as of
+
+
+class EmulatedSwitch (object):
+  """
+  Just enough of a switch to get through the of_01 handshake and answer
+  echoes
+  """
+  def __init__ (self, dpid, address):
+    self.dpid = dpid
+    self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    self.sock.setblocking(0)
+    err = self.sock.connect_ex(address)
+    if err not in (0, EINPROGRESS):
+      raise socket.error(err, os.strerror(err))
+    self.buf = ''
+    self.out = of.ofp_hello().pack()
+    self.connected = False
+    self.echo_xid = None
+    self.echo_sent = None
+    self.rtt = None
+
+  def fileno (self):
+    return self.sock.fileno()
+
+  def send (self, data):
+    self.out += data
+    self.flush()
+
+  def flush (self):
+    while self.out:
+      try:
+        l = self.sock.send(self.out)
+      except socket.error as e:
+        if e.args[0] == EAGAIN: return
+        raise
+      self.out = self.out[l:]
+
+  def echo (self, xid):
+    self.echo_xid = xid
+    self.echo_sent = time.time()
+    self.send(of.ofp_echo_request(xid=xid).pack())
+
+  def read (self):
+    while True:
+      try:
+        d = self.sock.recv(65536)
+      except socket.error as e:
+        if e.args[0] == EAGAIN: break
+        raise
+      if not d: raise RuntimeError("Switch %i disconnected" % (self.dpid,))
+      self.buf += d
+    offset = 0
+    buf = self.buf
+    while len(buf) - offset >= 8:
+      l = struct.unpack_from("!H", buf, offset + 2)[0]
+      if len(buf) - offset < l: break
+      self.handle(buf[offset:offset + l])
+      offset += l
+    self.buf = buf[offset:]
+
+  def handle (self, msg):
+    t = ord(msg[1])
+    xid = struct.unpack_from("!L", msg, 4)[0]
+    if t == of.OFPT_FEATURES_REQUEST:
+      self.send(of.ofp_features_reply(datapath_id=self.dpid,
+                                      xid=xid).pack())
+    elif t == of.OFPT_BARRIER_REQUEST:
+      self.send(of.ofp_barrier_reply(xid=xid).pack())
+      self.connected = True
+    elif t == of.OFPT_ECHO_REQUEST:
+      self.send(of.ofp_echo_reply(xid=xid).pack())
+    elif t == of.OFPT_ECHO_REPLY and xid == self.echo_xid:
+      self.rtt = time.time() - self.echo_sent
+      self.echo_xid = None
+
+
+def pump (ep, switches, timeout):
+  for fd,ev in ep.poll(timeout):
+    s = switches[fd]
+    if ev & select.EPOLLOUT: s.flush()
+    if ev & (select.EPOLLIN | select.EPOLLHUP | select.EPOLLERR): s.read()
+
+
+def percentile (values, p):
+  values = sorted(values)
+  return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def raise_fd_limit (want):
+  soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+  if soft < want:
+    try:
+      resource.setrlimit(resource.RLIMIT_NOFILE, (min(want, hard), hard))
+    except ValueError:
+      pass
+
+
+def start_controller (python, args):
+  """
+  Starts pox.py with the given arguments and gives it a moment to come up
+  """
+  cmd = [python, path.join(ROOT, "pox.py"), "--no-cli",
+         "log.level", "--openflow=WARNING", "--forwarding=WARNING"] + args
+  # In its own process group so stop_controller() gets any children too
+  controller = subprocess.Popen(cmd, cwd=ROOT, preexec_fn=os.setsid)
+  time.sleep(2)
+  return controller
+
+
+def stop_controller (controller):
+  try:
+    os.killpg(controller.pid, signal.SIGKILL)
+  except OSError:
+    pass
+  controller.wait()
+
+
+def connect_switches (ep, switches, factory, count, connect_rate,
+                      timeout = 600):
+  """
+  Creates count switches with factory(dpid), adds them to switches (keyed
+  by fd), and pumps until they've all finished their handshakes.
+  """
+  start = time.time()
+  for i in range(1, count + 1):
+    s = factory(i)
+    switches[s.fileno()] = s
+    ep.register(s.fileno(), select.EPOLLIN | select.EPOLLOUT | select.EPOLLET)
+    if i % 50 == 0:
+      # Pace ourselves so we don't overrun the listen backlog
+      deadline = start + float(i) / connect_rate
+      while time.time() < deadline:
+        pump(ep, switches, max(0, deadline - time.time()))
+  while not all(s.connected for s in switches.itervalues()):
+    pump(ep, switches, 0.1)
+    if time.time() - start > timeout:
+      raise RuntimeError("Timed out waiting for switches to connect")
+  return time.time() - start
+
+
+def main ():
+  parser = OptionParser(usage="usage: %prog [options]")
+  parser.add_option("-n", "--switches", type="int", default=2000)
+  parser.add_option("--epoll", action="store_true", default=False,
+                    help="run of_01 with --epoll")
+  parser.add_option("--port", type="int", default=16633)
+  parser.add_option("--echoes", type="int", default=500,
+                    help="number of echo round trips to time")
+  parser.add_option("--connect-rate", type="int", default=500,
+                    help="new connections per second")
+  parser.add_option("--python", default=sys.executable,
+                    help="interpreter to run pox.py with")
+  (options, args) = parser.parse_args()
+
+  raise_fd_limit(options.switches * 2 + 100)
+
+  args = ["openflow.of_01", "--port=%i" % (options.port,)]
+  if options.epoll: args.append("--epoll")
+  controller = start_controller(options.python, args)
+  try:
+    address = ("127.0.0.1", options.port)
+    ep = select.epoll()
+    switches = {}
+    elapsed = connect_switches(ep, switches,
+                               lambda dpid: EmulatedSwitch(dpid, address),
+                               options.switches, options.connect_rate)
+    print "%i switches connected in %0.2fs" % (options.switches, elapsed)
+
+    all_switches = switches.values()
+    rtts = []
+    for xid in range(1, options.echoes + 1):
+      s = random.choice(all_switches)
+      s.echo(xid)
+      while s.rtt is None:
+        pump(ep, switches, 1)
+      rtts.append(s.rtt)
+      s.rtt = None
+    print "echo RTT with %i idle switches: median %0.3fms, p99 %0.3fms" % (
+        options.switches, percentile(rtts, 0.5) * 1000,
+        percentile(rtts, 0.99) * 1000)
+  finally:
+    stop_controller(controller)
+
+
+if __name__ == '__main__':
+  main()
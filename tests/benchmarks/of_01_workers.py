@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+
+"""
+Measures PACKET_IN throughput of forwarding.l2_learning with of_01 doing
+its own I/O, with switch I/O in worker processes (--workers), and with
+the switches split between complete POX shards (--workers and --shard).
+
+Each emulated switch keeps a window of PACKET_INs outstanding between two
+hosts and counts the PACKET_OUTs/FLOW_MODs that come back.
+
+Run from the top of the tree, e.g.:
+  tests/benchmarks/of_01_workers.py --workers=4 --switches=64
+"""
+
+import sys
+from os import path
+import select
+import time
+from optparse import OptionParser
+
+SCRIPT_DIR = path.dirname(path.abspath(__file__))
+ROOT = path.abspath(path.join(SCRIPT_DIR, "../.."))
+sys.path.append(ROOT)
+sys.path.append(SCRIPT_DIR)
+
+import pox.openflow.libopenflow_01 as of
+from pox.lib.packet import ethernet, ipv4, udp
+from pox.lib.addresses import EthAddr, IPAddr
+from of_01_switches import (EmulatedSwitch, pump, raise_fd_limit,
+                            start_controller, stop_controller,
+                            connect_switches)
+
+
+class TrafficSwitch (EmulatedSwitch):
+  """
+  An emulated switch which, once started, keeps 'window' PACKET_INs
+  outstanding
+  """
+  def __init__ (self, dpid, address, window):
+    EmulatedSwitch.__init__(self, dpid, address)
+    self.window = window
+    self.responses = 0
+    self.outstanding = 0
+    self.started = False
+
+    def make (src, dst, port):
+      e = ethernet(src=EthAddr(src), dst=EthAddr(dst), type=ethernet.IP_TYPE)
+      e.payload = ipv4(srcip=IPAddr("10.0.0.1"), dstip=IPAddr("10.0.0.2"),
+                       protocol=ipv4.UDP_PROTOCOL)
+      e.payload.payload = udp(srcport=1000, dstport=2000, payload="x" * 64)
+      return of.ofp_packet_in(in_port=port, buffer_id=1, data=e.pack()).pack()
+    a = "02:00:00:%02x:%02x:01" % (dpid >> 8 & 0xff, dpid & 0xff)
+    b = "02:00:00:%02x:%02x:02" % (dpid >> 8 & 0xff, dpid & 0xff)
+    self.packets = [make(a, b, 1), make(b, a, 2)]
+    self._next = 0
+
+  def start (self):
+    self.started = True
+    self.fill()
+
+  def fill (self):
+    out = []
+    while self.outstanding < self.window:
+      out.append(self.packets[self._next])
+      self._next ^= 1
+      self.outstanding += 1
+    if out: self.send(''.join(out))
+
+  def read (self):
+    EmulatedSwitch.read(self)
+    if self.started: self.fill()
+
+  def handle (self, msg):
+    t = ord(msg[1])
+    if t == of.OFPT_PACKET_OUT or t == of.OFPT_FLOW_MOD:
+      if self.outstanding:
+        self.outstanding -= 1
+        self.responses += 1
+    else:
+      EmulatedSwitch.handle(self, msg)
+
+
+def run (options, mode, workers):
+  args = ["openflow.of_01", "--port=%i" % (options.port,)]
+  if mode == "workers":
+    args += ["--workers=%i" % (workers,), "forwarding.l2_learning"]
+  elif mode == "shards":
+    args += ["--workers=%i" % (workers,), "--shard=forwarding.l2_learning"]
+  else:
+    args += ["--epoll", "forwarding.l2_learning"]
+  controller = start_controller(options.python, args)
+  try:
+    address = ("127.0.0.1", options.port)
+    ep = select.epoll()
+    switches = {}
+    connect_switches(ep, switches,
+                     lambda dpid: TrafficSwitch(dpid, address, options.window),
+                     options.switches, options.connect_rate)
+    for s in switches.itervalues(): s.start()
+
+    # Warm up (l2_learning learns the hosts), then measure
+    end = time.time() + 1
+    while time.time() < end: pump(ep, switches, 0.1)
+    before = sum(s.responses for s in switches.itervalues())
+    start = time.time()
+    end = start + options.duration
+    while time.time() < end: pump(ep, switches, 0.1)
+    count = sum(s.responses for s in switches.itervalues()) - before
+    elapsed = time.time() - start
+    for s in switches.itervalues(): s.sock.close()
+    return count / elapsed
+  finally:
+    stop_controller(controller)
+    time.sleep(1) # Let the port free up
+
+
+def main ():
+  parser = OptionParser(usage="usage: %prog [options]")
+  parser.add_option("-n", "--switches", type="int", default=64)
+  parser.add_option("-w", "--workers", type="int", default=4)
+  parser.add_option("--window", type="int", default=16,
+                    help="PACKET_INs each switch keeps outstanding")
+  parser.add_option("--duration", type="float", default=10,
+                    help="seconds to measure each mode for")
+  parser.add_option("--port", type="int", default=16633)
+  parser.add_option("--connect-rate", type="int", default=500,
+                    help="new connections per second")
+  parser.add_option("--modes", default="single,workers,shards",
+                    help="comma-separated modes to run")
+  parser.add_option("--python", default=sys.executable,
+                    help="interpreter to run pox.py with")
+  (options, args) = parser.parse_args()
+
+  raise_fd_limit(options.switches * 2 + 100)
+
+  for mode in options.modes.split(","):
+    workers = 1 if mode == "single" else options.workers
+    rate = run(options, mode, workers)
+    print "%-8s %2i process(es), %i switches: %10.0f PACKET_IN/s" % (
+        mode, workers, options.switches, rate)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+
+"""
+Measures the common ofp_match operations: building one from a packet,
+field access, comparison, wildcard matching and hashing.
+
+Run from the top of the tree, e.g.:
+  tests/benchmarks/ofp_match.py --seconds=1
+"""
+
+import sys
+from os import path
+import time
+from optparse import OptionParser
+
+SCRIPT_DIR = path.dirname(path.abspath(__file__))
+ROOT = path.abspath(path.join(SCRIPT_DIR, "../.."))
+sys.path.append(ROOT)
+
+import pox.openflow.libopenflow_01 as of
+from pox.lib.packet import ethernet, ipv4, tcp
+from pox.lib.addresses import EthAddr, IPAddr
+
+
+def rate (func, seconds):
+  count = 0
+  start = time.time()
+  end = start + seconds
+  while True:
+    for _ in xrange(100): func()
+    count += 100
+    now = time.time()
+    if now >= end: break
+  return count / (now - start)
+
+
+def main ():
+  parser = OptionParser(usage="usage: %prog [options]")
+  parser.add_option("--seconds", type="float", default=1,
+                    help="time to spend on each measurement")
+  (options, args) = parser.parse_args()
+
+  e = ethernet(src=EthAddr("02:00:00:00:00:01"),
+               dst=EthAddr("02:00:00:00:00:02"), type=ethernet.IP_TYPE)
+  e.payload = ipv4(srcip=IPAddr("10.0.0.1"), dstip=IPAddr("10.0.0.2"),
+                   protocol=ipv4.TCP_PROTOCOL)
+  e.payload.payload = tcp(srcport=1234, dstport=80)
+  packet = ethernet(e.pack())
+
+  exact = of.ofp_match.from_packet(packet, 1)
+  exact2 = of.ofp_match.from_packet(packet, 1)
+  wild = of.ofp_match(dl_type=0x800, nw_dst="10.0.0.0/8", tp_dst=80)
+
+  tests = [
+    ("from_packet()", lambda: of.ofp_match.from_packet(packet, 1)),
+    ("read 4 fields", lambda: (exact.in_port, exact.dl_src, exact.nw_dst,
+                               exact.tp_dst)),
+    ("== (equal)", lambda: exact == exact2),
+    ("matches_with_wildcards()",
+      lambda: wild.matches_with_wildcards(exact)),
+    ("hash_code()", lambda: exact.hash_code()),
+  ]
+  if hasattr(exact, 'freeze'):
+    d = {exact.freeze(): 1}
+    tests.append(("dict lookup (frozen)", lambda: d[exact.freeze()]))
+  for name, func in tests:
+    print "%-26s %10.0f/s" % (name, rate(func, options.seconds))
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+
+"""
+Measures what it costs to get at packet headers from PACKET_IN data,
+comparing eager parsing (what PacketIn.parsed used to do), lazy parsing
+(what it does now) when a handler only looks at the ethernet header or
+goes all the way down, and the flow_key() / ofp_match.from_raw()
+extractors which don't build packet objects at all.
+
+The traffic is a mix of TCP, UDP (DNS and otherwise), ARP, ICMP, VLAN
+tagged and LLDP frames, roughly weighted toward TCP.
+
+Run from the top of the tree, e.g.:
+  tests/benchmarks/packet_parse.py --seconds=2
+"""
+
+import sys
+from os import path
+import time
+import random
+from optparse import OptionParser
+
+SCRIPT_DIR = path.dirname(path.abspath(__file__))
+ROOT = path.abspath(path.join(SCRIPT_DIR, "../.."))
+sys.path.append(ROOT)
+
+import pox.openflow.libopenflow_01 as of
+from pox.lib.packet import *
+from pox.lib.packet.icmp import echo, TYPE_ECHO_REQUEST
+from pox.lib.packet.lldp import chassis_id, port_id, ttl, end_tlv
+from pox.lib.packet.ethernet import NDP_MULTICAST
+from pox.lib.packet.packet_utils import flow_key
+from pox.lib.addresses import EthAddr, IPAddr
+
+
+def rate (func, seconds):
+  count = 0
+  start = time.time()
+  end = start + seconds
+  while True:
+    for _ in xrange(100): func()
+    count += 100
+    now = time.time()
+    if now >= end: break
+  return count / (now - start)
+
+
+def make_frames (count, rand):
+  def mac ():
+    return EthAddr("02:00:00:00:%02x:%02x" % (rand.randint(0, 255),
+                                              rand.randint(1, 255)))
+  def ip (payload, protocol):
+    return ipv4(srcip=IPAddr("10.0.%i.%i" % (rand.randint(0, 255),
+                                             rand.randint(1, 254))),
+                dstip=IPAddr("10.1.%i.%i" % (rand.randint(0, 255),
+                                             rand.randint(1, 254))),
+                protocol=protocol, payload=payload)
+  def eth (payload, type):
+    return ethernet(src=mac(), dst=mac(), type=type, payload=payload)
+
+  def tcp_frame ():
+    t = tcp(srcport=rand.randint(1024, 65535), dstport=rand.choice((80, 443)),
+            off=5, flags=tcp.ACK_flag, payload="x" * rand.randint(0, 1400))
+    return eth(ip(t, ipv4.TCP_PROTOCOL), ethernet.IP_TYPE)
+  def udp_frame ():
+    u = udp(srcport=rand.randint(1024, 65535), dstport=5001,
+            payload="y" * rand.randint(20, 1200))
+    return eth(ip(u, ipv4.UDP_PROTOCOL), ethernet.IP_TYPE)
+  def dns_frame ():
+    # A query for example.com/A (dns can't currently pack() itself)
+    d = ("\x12\x34\x01\x00\x00\x01\x00\x00\x00\x00\x00\x00"
+         "\x07example\x03com\x00\x00\x01\x00\x01")
+    u = udp(srcport=rand.randint(1024, 65535), dstport=53, payload=d)
+    return eth(ip(u, ipv4.UDP_PROTOCOL), ethernet.IP_TYPE)
+  def arp_frame ():
+    a = arp(opcode=arp.REQUEST, hwsrc=mac(), protosrc=IPAddr("10.0.0.1"),
+            protodst=IPAddr("10.0.0.%i" % (rand.randint(2, 254),)))
+    return eth(a, ethernet.ARP_TYPE)
+  def icmp_frame ():
+    e = echo(id=rand.randint(0, 65535), seq=1, payload="z" * 56)
+    i = icmp(type=TYPE_ECHO_REQUEST, payload=e)
+    return eth(ip(i, ipv4.ICMP_PROTOCOL), ethernet.IP_TYPE)
+  def vlan_frame ():
+    f = tcp_frame()
+    v = vlan(id=rand.randint(1, 4094), pcp=0, eth_type=ethernet.IP_TYPE,
+             payload=f.payload)
+    v.c = 0
+    f.payload = v
+    f.type = ethernet.VLAN_TYPE
+    return f
+  def lldp_frame ():
+    l = lldp()
+    cid = chassis_id()
+    cid.fill(cid.SUB_LOCAL, "dpid:1")
+    l.add_tlv(cid)
+    pid = port_id()
+    pid.fill(pid.SUB_PORT, "1")
+    l.add_tlv(pid)
+    t = ttl()
+    t.fill(120)
+    l.add_tlv(t)
+    l.add_tlv(end_tlv())
+    return ethernet(src=mac(), dst=NDP_MULTICAST, type=ethernet.LLDP_TYPE,
+                    payload=l)
+
+  kinds = ((tcp_frame, 50), (udp_frame, 15), (dns_frame, 10), (arp_frame, 10),
+           (icmp_frame, 5), (vlan_frame, 5), (lldp_frame, 5))
+  weighted = [f for f,w in kinds for _ in range(w)]
+  return [rand.choice(weighted)().pack() for i in range(count)]
+
+
+def main ():
+  parser = OptionParser(usage="usage: %prog [options]")
+  parser.add_option("-n", "--frames", type="int", default=1000)
+  parser.add_option("--seconds", type="float", default=1,
+                    help="time to spend on each measurement")
+  (options, args) = parser.parse_args()
+
+  frames = make_frames(options.frames, random.Random(0))
+
+  state = [0]
+  def next_frame ():
+    state[0] = (state[0] + 1) % len(frames)
+    return frames[state[0]]
+
+  def ethernet_only (lazy):
+    def f ():
+      p = ethernet(next_frame(), lazy=lazy)
+      return p.src, p.dst, p.type
+    return f
+
+  def to_match (lazy):
+    return lambda: of.ofp_match.from_packet(ethernet(next_frame(), lazy=lazy),
+                                            1)
+
+  tests = [
+    ("eager parse, src/dst/type", ethernet_only(False)),
+    ("lazy parse, src/dst/type", ethernet_only(True)),
+    ("eager parse, from_packet()", to_match(False)),
+    ("lazy parse, from_packet()", to_match(True)),
+    ("flow_key()", lambda: flow_key(next_frame())),
+    ("ofp_match.from_raw()", lambda: of.ofp_match.from_raw(next_frame(), 1)),
+  ]
+  for name, func in tests:
+    print "%-30s %10.0f/s" % (name, rate(func, options.seconds))
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+
+"""
+Measures how many task slices per second the recoco scheduler runs with
+a given number of busy background tasks (each yielding 0 to go to the
+back of the queue), and how long a task which gets woken up -- as of_01's
+task is when a switch sends something -- waits to run while they're busy,
+both at the normal priority and at the high one.
+
+Run from the top of the tree, e.g.:
+  tests/benchmarks/recoco.py --tasks=10,100,1000
+"""
+
+import sys
+from os import path
+import time
+from optparse import OptionParser
+
+SCRIPT_DIR = path.dirname(path.abspath(__file__))
+ROOT = path.abspath(path.join(SCRIPT_DIR, "../.."))
+sys.path.append(ROOT)
+
+from pox.lib.recoco import BaseTask, Scheduler, PRIORITY_HIGH
+
+
+def rate (func, seconds):
+  count = 0
+  start = time.time()
+  end = start + seconds
+  while True:
+    for _ in xrange(100): func()
+    count += 100
+    now = time.time()
+    if now >= end: break
+  return count / (now - start)
+
+
+class Busy (BaseTask):
+  def run (self):
+    while True:
+      yield 0
+
+class Woken (BaseTask):
+  """ Records how long after being scheduled each slice started """
+  def __init__ (self):
+    BaseTask.__init__(self)
+    self.woken = None
+    self.delays = []
+
+  def run (self):
+    while True:
+      self.delays.append(time.time() - self.woken)
+      yield False # Sleep until woken again
+
+
+def percentile (values, p):
+  values = sorted(values)
+  return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def main ():
+  parser = OptionParser(usage="usage: %prog [options]")
+  parser.add_option("--tasks", default="10,100,1000",
+                    help="comma-separated numbers of busy tasks")
+  parser.add_option("--wakes", type="int", default=200,
+                    help="times to wake the woken task per measurement")
+  parser.add_option("--seconds", type="float", default=1,
+                    help="time to spend on each measurement")
+  (options, args) = parser.parse_args()
+
+  for n in [int(x) for x in options.tasks.split(",")]:
+    s = Scheduler(isDefaultScheduler=False, startInThread=False)
+    for i in range(n):
+      s.fast_schedule(Busy())
+    print "%5i busy tasks: %10.0f slices/s" % (n, rate(s.cycle,
+                                                       options.seconds))
+    for name, priority in (("normal", None), ("high", PRIORITY_HIGH)):
+      w = Woken()
+      if priority is not None: w.priority = priority
+      for i in range(options.wakes):
+        w.woken = time.time()
+        s.fast_schedule(w)
+        while len(w.delays) <= i:
+          s.cycle()
+      print "  woken %-6s task waits: median %8.1fus, 99th %8.1fus" % (
+          name, percentile(w.delays, 0.5) * 1e6,
+          percentile(w.delays, 0.99) * 1e6)
+    s.quit()
+
+
+if __name__ == '__main__':
+  main()
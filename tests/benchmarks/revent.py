@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+
+"""
+Measures how many events per second EventMixin.raiseEvent() can deliver
+with 1, 5 and 20 listeners, both when raising by class (which constructs
+the event, as of_01 does for every PacketIn) and when raising an already
+constructed event.  Also measures raising an event nobody listens for,
+and adding and removing a listener (by EID, and as a once=True handler
+which fires) on a source which already has lots of listeners.
+
+Run from the top of the tree, e.g.:
+  tests/benchmarks/revent.py --listeners=1,5,20
+"""
+
+import sys
+from os import path
+import time
+from optparse import OptionParser
+
+SCRIPT_DIR = path.dirname(path.abspath(__file__))
+ROOT = path.abspath(path.join(SCRIPT_DIR, "../.."))
+sys.path.append(ROOT)
+
+from pox.lib.revent import Event, EventMixin
+
+
+def rate (func, seconds):
+  count = 0
+  start = time.time()
+  end = start + seconds
+  while True:
+    for _ in xrange(100): func()
+    count += 100
+    now = time.time()
+    if now >= end: break
+  return count / (now - start)
+
+
+class Ping (Event):
+  def __init__ (self, connection, msg):
+    Event.__init__(self)
+    self.connection = connection
+    self.msg = msg
+
+class Unheard (Event):
+  pass
+
+class Source (EventMixin):
+  _eventMixin_events = set([Ping, Unheard])
+
+class Sink (object):
+  def __init__ (self):
+    self.count = 0
+  def _handle_Ping (self, event):
+    self.count += 1
+
+
+def main ():
+  parser = OptionParser(usage="usage: %prog [options]")
+  parser.add_option("--listeners", default="1,5,20",
+                    help="comma-separated listener counts")
+  parser.add_option("--existing", type="int", default=10000,
+                    help="listeners already present for the churn tests")
+  parser.add_option("--seconds", type="float", default=1,
+                    help="time to spend on each measurement")
+  (options, args) = parser.parse_args()
+
+  for n in [int(x) for x in options.listeners.split(",")]:
+    source = Source()
+    for i in range(n):
+      source.addListeners(Sink())
+    event = Ping(None, None)
+    by_class = rate(lambda: source.raiseEventNoErrors(Ping, None, None),
+                    options.seconds)
+    by_instance = rate(lambda: source.raiseEvent(event), options.seconds)
+    print "%2i listeners: %10.0f events/s by class, %10.0f by instance" % (
+        n, by_class, by_instance)
+
+  source = Source()
+  print "no listeners: %10.0f events/s" % (
+      rate(lambda: source.raiseEvent(Unheard), options.seconds),)
+
+  source = Source()
+  for i in range(options.existing):
+    source.addListener(Unheard, Sink()._handle_Ping)
+  handler = Sink()._handle_Ping
+  def add_remove ():
+    source.removeListener(source.addListener(Ping, handler)[1])
+  def once ():
+    source.addListener(Ping, handler, once=True)
+    source.raiseEvent(Ping, None, None)
+  print "with %i other listeners:" % (options.existing,)
+  print "  addListener() + removeListener(eid): %10.0f/s" % (
+      rate(add_remove, options.seconds),)
+  print "  once=True listener added and fired:  %10.0f/s" % (
+      rate(once, options.seconds),)
+
+
+if __name__ == '__main__':
+  main()
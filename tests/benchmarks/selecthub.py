@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+
+"""
+Measures how long it takes the recoco SelectHub to wake a task when one
+of the sockets it's waiting on becomes readable while lots of others stay
+idle, as of_01's task does with one busy switch among many quiet ones.
+The time is from sending a byte to the task having read it.
+
+select() can't handle descriptors past FD_SETSIZE (usually 1024), so
+only epoll is tried with more idle sockets than that.
+
+Run from the top of the tree, e.g.:
+  tests/benchmarks/selecthub.py --idle=100,1000,10000
+"""
+
+import sys
+from os import path
+import time
+import threading
+import socket
+from optparse import OptionParser
+
+SCRIPT_DIR = path.dirname(path.abspath(__file__))
+ROOT = path.abspath(path.join(SCRIPT_DIR, "../.."))
+sys.path.append(ROOT)
+
+from pox.lib.recoco import BaseTask, Scheduler, Select
+
+
+class Reader (BaseTask):
+  def __init__ (self, idle, active):
+    BaseTask.__init__(self)
+    self.idle = idle
+    self.active = active
+    self.got = threading.Event()
+
+  def run (self):
+    while True:
+      rl, wl, xl = yield Select(self.idle + [self.active], [], [])
+      if self.active in rl:
+        self.active.recv(1)
+        self.got.set()
+
+
+def percentile (values, p):
+  values = sorted(values)
+  return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def main ():
+  parser = OptionParser(usage="usage: %prog [options]")
+  parser.add_option("--idle", default="100,1000,10000",
+                    help="comma-separated numbers of idle sockets")
+  parser.add_option("--wakes", type="int", default=500,
+                    help="wakeups to time for each measurement")
+  (options, args) = parser.parse_args()
+
+  for n in [int(x) for x in options.idle.split(",")]:
+    # Both ends of n/2 pairs
+    pairs = [socket.socketpair() for i in range(n // 2)]
+    idle = [s for pair in pairs for s in pair]
+    for use_epoll in (False, True):
+      if not use_epoll and n >= 1000: continue
+      s = Scheduler(isDefaultScheduler=False, daemon=True, useEpoll=use_epoll)
+      active, other = socket.socketpair()
+      r = Reader(idle, active)
+      r.start(s, fast=True)
+      delays = []
+      for i in range(options.wakes):
+        start = time.time()
+        other.send("x")
+        r.got.wait()
+        delays.append(time.time() - start)
+        r.got.clear()
+      s.quit()
+      s._selectHub._cycle()
+      print "%5i idle, %-6s: median %8.1fus, 99th %8.1fus" % (
+          n, "epoll" if use_epoll else "select",
+          percentile(delays, 0.5) * 1e6, percentile(delays, 0.99) * 1e6)
+    for a,b in pairs:
+      a.close()
+      b.close()
+
+
+if __name__ == '__main__':
+  main()
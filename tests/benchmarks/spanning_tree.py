@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+
+"""
+Measures how long openflow.spanning_tree takes to handle a LinkEvent, and
+how many port_mods it sends for it, on a fabric of switches in a ring with
+random shortcuts where links keep going down and coming back up.  (The
+port_mods go to mock connections which just count them.)
+
+Run from the top of the tree, e.g.:
+  tests/benchmarks/spanning_tree.py --switches=100,1000
+"""
+
+import sys
+from os import path
+import time
+import random
+from optparse import OptionParser
+
+SCRIPT_DIR = path.dirname(path.abspath(__file__))
+ROOT = path.abspath(path.join(SCRIPT_DIR, "../.."))
+sys.path.append(ROOT)
+
+from pox.core import core
+import pox.openflow.libopenflow_01 as of
+from pox.openflow.discovery import Discovery, LinkEvent
+from pox.lib.addresses import EthAddr
+import pox.openflow.spanning_tree as spanning_tree
+
+
+class MockConnection (object):
+  def __init__ (self, ports):
+    self.features = of.ofp_switch_features()
+    self.features.ports = [of.ofp_phy_port(port_no = p,
+                                           hw_addr = EthAddr(p))
+                           for p in range(1, ports + 1)]
+    self.sends = 0
+    self.port_mods = 0
+
+  def send (self, msg):
+    self.sends += 1
+    self.port_mods += 1
+
+  def send_batch (self, messages, callback = None):
+    self.sends += 1
+    self.port_mods += len(messages)
+
+class MockOpenFlow (object):
+  def __init__ (self):
+    self.connections = {}
+
+  def getConnection (self, dpid):
+    return self.connections.get(dpid)
+
+
+def main ():
+  parser = OptionParser(usage="usage: %prog [options]")
+  parser.add_option("--switches", default="100,1000",
+                    help="comma-separated numbers of switches")
+  parser.add_option("--shortcuts", type="float", default=1,
+                    help="random links added to the ring, per switch")
+  parser.add_option("--ports", type="int", default=48,
+                    help="ports per switch")
+  parser.add_option("--flaps", type="int", default=50,
+                    help="links to take down and bring back up")
+  (options, args) = parser.parse_args()
+
+  for n in [int(x) for x in options.switches.split(",")]:
+    rand = random.Random(0)
+    for d in (spanning_tree._adj, spanning_tree._tree, spanning_tree._prev):
+      d.clear()
+    core.components.pop('openflow', None) # So discovery doesn't listen to it
+    discovery = Discovery()
+    discovery._expireTimer.cancel()
+    openflow = MockOpenFlow()
+    core.components['openflow_discovery'] = discovery
+    core.components['openflow'] = openflow
+    dpids = range(1, n + 1)
+    for dpid in dpids:
+      openflow.connections[dpid] = MockConnection(options.ports)
+
+    links = set()
+    for a in dpids:
+      links.add((a, a % n + 1))
+    while len(links) < n + int(n * options.shortcuts):
+      a, b = sorted(rand.sample(dpids, 2))
+      links.add((a, b))
+    ports = {}
+    next_port = dict((dpid, 1) for dpid in dpids)
+    for a, b in links:
+      ports[a, b] = (next_port[a], next_port[b])
+      next_port[a] += 1
+      next_port[b] += 1
+
+    def link (a, b, up):
+      pa, pb = ports[a, b]
+      ls = (Discovery.Link(a, pa, b, pb), Discovery.Link(b, pb, a, pa))
+      for l in ls:
+        if up:
+          discovery._addLink(l)
+        else:
+          discovery._deleteLinks([l])
+        spanning_tree._handle(LinkEvent(up, l))
+
+    for a, b in sorted(links):
+      link(a, b, True)
+
+    for con in openflow.connections.itervalues():
+      con.sends = con.port_mods = 0
+    links = sorted(links)
+    times = []
+    for i in range(options.flaps):
+      a, b = rand.choice(links)
+      for up in (False, True):
+        start = time.time()
+        link(a, b, up)
+        times.append((time.time() - start) / 2)
+    times.sort()
+    events = options.flaps * 4
+    sends = sum(c.sends for c in openflow.connections.itervalues())
+    mods = sum(c.port_mods for c in openflow.connections.itervalues())
+    print "%5i switches, %5i links: LinkEvent median %8.2fms, " \
+          "max %8.2fms; per event %5.1f port_mods in %5.1f sends" % (n,
+          len(links), times[len(times) // 2] * 1000, times[-1] * 1000,
+          float(mods) / events, float(sends) / events)
+
+
+if __name__ == '__main__':
+  main()
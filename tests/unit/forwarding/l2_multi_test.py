@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+
+import unittest
+import sys
+import os.path
+import random
+import itertools
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from pox.core import core
+import pox.openflow.libopenflow_01 as of
+from pox.lib.addresses import EthAddr
+from pox.openflow.discovery import Discovery, LinkEvent
+import pox.forwarding.l2_multi as l2_multi
+
+class MockConnection (object):
+  def __init__ (self):
+    self.sent = []
+
+  def send (self, msg):
+    self.sent.append(msg)
+
+  def send_batch (self, messages, callback = None):
+    self.sent.extend(messages)
+
+class MockDiscovery (object):
+  def __init__ (self):
+    self.adjacency = {}
+
+  def linksBetween (self, dpid1, dpid2, bidirectional = False):
+    return [l for l in self.adjacency
+            if (l.dpid1, l.dpid2) == (dpid1, dpid2)
+            and (not bidirectional or
+                 Discovery.Link(l.dpid2, l.port2, l.dpid1, l.port1)
+                 in self.adjacency)]
+
+class L2MultiPathTest (unittest.TestCase):
+  def setUp (self):
+    for d in (l2_multi.adjacency, l2_multi.switches, l2_multi.mac_map,
+              l2_multi.path_map, l2_multi.installed_paths,
+              l2_multi.path_index, l2_multi._path_expirations):
+      d.clear()
+    l2_multi._next_cookie = itertools.count(1)
+    self.discovery = MockDiscovery()
+    self._old = dict((k, core.components.get(k))
+                     for k in ('openflow_discovery', 'l2_multi'))
+    self.l2 = l2_multi.l2_multi.__new__(l2_multi.l2_multi)
+    self.l2.reoptimize = False
+    core.components['openflow_discovery'] = self.discovery
+    core.components['l2_multi'] = self.l2
+    self.links = set()
+    for dpid in range(1, 21):
+      sw = l2_multi.Switch()
+      sw.dpid = dpid
+      sw.connection = MockConnection()
+      l2_multi.switches[dpid] = sw
+
+  def tearDown (self):
+    for k,v in self._old.iteritems():
+      if v is None:
+        del core.components[k]
+      else:
+        core.components[k] = v
+
+  def link (self, a, b, up = True):
+    """
+    Brings the link between a and b (port b on a, port a on b) up or down
+    """
+    links = (Discovery.Link(a, b, b, a), Discovery.Link(b, a, a, b))
+    for l in links:
+      if up:
+        self.discovery.adjacency[l] = 0
+      else:
+        del self.discovery.adjacency[l]
+    for l in links:
+      self.l2._handle_LinkEvent(LinkEvent(up, l))
+    if up:
+      self.links.add((min(a,b), max(a,b)))
+    else:
+      self.links.discard((min(a,b), max(a,b)))
+
+  def distance (self, src, dst):
+    """
+    Hops from src to dst, the slow way
+    """
+    seen = set([src])
+    frontier = [src]
+    d = 0
+    while frontier:
+      if dst in frontier: return d
+      d += 1
+      nxt = []
+      for a in frontier:
+        for x,y in self.links:
+          for n in ((y,) if x == a else (x,) if y == a else ()):
+            if n not in seen:
+              seen.add(n)
+              nxt.append(n)
+      frontier = nxt
+    return None
+
+  def check_paths (self, pairs):
+    sws = l2_multi.switches
+    for a,b in pairs:
+      p = l2_multi._get_path(sws[a], sws[b], 99)
+      d = self.distance(a, b)
+      if d is None:
+        self.assertEqual(p, None)
+      else:
+        self.assertEqual(len(p), d + 1)
+        self.assertEqual(p[0][0], sws[a])
+        self.assertEqual(p[-1], (sws[b], 99))
+        for (s1,port),(s2,_) in zip(p[:-1], p[1:]):
+          self.assertEqual(port, s2.dpid) # Port numbers are neighbor dpids
+
+  def test_line (self):
+    for i in range(1, 5):
+      self.link(i, i + 1)
+    sws = l2_multi.switches
+    self.assertEqual(l2_multi._get_path(sws[1], sws[5], 7),
+                     [(sws[1], 2), (sws[2], 3), (sws[3], 4), (sws[4], 5),
+                      (sws[5], 7)])
+    self.assertEqual(l2_multi._get_path(sws[3], sws[3], 7), [(sws[3], 7)])
+    self.assertEqual(l2_multi._get_path(sws[1], sws[6], 7), None)
+
+  def test_targeted_invalidation (self):
+    for i in range(1, 5):
+      self.link(i, i + 1)
+    self.link(10, 11)
+    sws = l2_multi.switches
+    self.check_paths([(1, 5), (5, 1), (10, 11)])
+    tree1 = l2_multi.path_map[sws[1]]
+    tree10 = l2_multi.path_map[sws[10]]
+    # A shortcut changes 1's paths but not 10's
+    self.link(1, 4)
+    self.assertFalse(sws[1] in l2_multi.path_map)
+    self.assertTrue(l2_multi.path_map[sws[10]] is tree10)
+    self.check_paths([(1, 5), (5, 1)])
+    # Links which don't shorten anything for 1 leave its paths alone
+    tree1 = l2_multi.path_map[sws[1]]
+    self.link(12, 13)
+    self.link(2, 4)
+    self.assertTrue(l2_multi.path_map[sws[1]] is tree1)
+    # Taking down a link 10's tree doesn't use leaves it alone
+    self.link(4, 5, False)
+    self.assertTrue(l2_multi.path_map[sws[10]] is tree10)
+    self.check_paths([(1, 5), (5, 1), (10, 11)])
+
+  def install (self, src, dst, mac, port = 99):
+    sws = l2_multi.switches
+    p = l2_multi._get_path(sws[src], sws[dst], port)
+    sws[src]._install_path(p, of.ofp_match(dl_dst = EthAddr(mac)))
+    return p
+
+  def sent (self):
+    """
+    Returns and forgets the (dpid, command, cookie) of what was sent
+    """
+    r = []
+    for sw in l2_multi.switches.itervalues():
+      r.extend((sw.dpid, m.command, m.cookie) for m in sw.connection.sent)
+      del sw.connection.sent[:]
+    return sorted(r)
+
+  def test_flow_removal (self):
+    for i in range(1, 5):
+      self.link(i, i + 1)
+    self.link(5, 6)
+    self.install(1, 3, "00:00:00:00:00:01") # 1 -> 2 -> 3
+    self.install(4, 6, "00:00:00:00:00:02", 7) # 4 -> 5 -> 6 -> host
+    add = of.OFPFC_ADD
+    self.assertEqual(self.sent(), [(1, add, 1), (2, add, 1), (3, add, 1),
+                                   (4, add, 2), (5, add, 2), (6, add, 2)])
+    # Only the flows which used the link are removed
+    self.link(2, 3, False)
+    delete = of.OFPFC_DELETE_STRICT
+    self.assertEqual(self.sent(), [(1, delete, 1), (2, delete, 1),
+                                   (3, delete, 1)])
+    self.assertEqual(l2_multi.installed_paths.keys(), [2])
+    # A new link doesn't disturb flows unless it's where we thought a host
+    # was
+    self.link(1, 4)
+    self.assertEqual(self.sent(), [])
+    self.link(6, 7)
+    self.assertEqual(self.sent(), [(4, delete, 2), (5, delete, 2),
+                                   (6, delete, 2)])
+    self.assertEqual(l2_multi.installed_paths, {})
+    self.assertEqual(l2_multi.path_index, {})
+
+  def test_reoptimize (self):
+    self.l2.reoptimize = True
+    for i in range(1, 5):
+      self.link(i, i + 1)
+    self.install(1, 5, "00:00:00:00:00:01")
+    self.install(2, 4, "00:00:00:00:00:02")
+    self.sent()
+    # 1 -> 5 gets shorter, 2 -> 4 doesn't
+    self.link(1, 5)
+    delete = of.OFPFC_DELETE_STRICT
+    self.assertEqual(self.sent(), [(i, delete, 1) for i in range(1, 6)])
+    self.assertEqual(l2_multi.installed_paths.keys(), [2])
+
+  def test_expiry (self):
+    self.link(1, 2)
+    self.install(1, 2, "00:00:00:00:00:01")
+    l2_multi._path_expirations[0] = (0, 1) # Long gone
+    self.install(1, 2, "00:00:00:00:00:02")
+    self.assertEqual(l2_multi.installed_paths.keys(), [2])
+
+  def test_random_changes (self):
+    rand = random.Random(0)
+    dpids = range(1, 21)
+    for i in range(200):
+      a, b = rand.sample(dpids, 2)
+      key = (min(a,b), max(a,b))
+      self.link(a, b, key not in self.links)
+      self.check_paths([rand.sample(dpids, 2) for j in range(5)])
+
+if __name__ == '__main__':
+  unittest.main()
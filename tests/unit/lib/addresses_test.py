@@ -19,4 +19,51 @@ class MockEthAddrTest(unittest.TestCase):
     self.assertEqual(int_val, 1<<8)
     with_int_ctor = EthAddr(int_val) 
     self.assertEqual(int_val, with_int_ctor.toInt())
-    self.assertEqual(str(with_int_ctor), "00:00:00:00:01:00")
\ No newline at end of file
+    self.assertEqual(str(with_int_ctor), "00:00:00:00:01:00")
+  def test_interned(self):
+    raw = "\x00\x11\x22\x33\x44\x55"
+    self.assertTrue(EthAddr(raw) is EthAddr(raw))
+    self.assertTrue(EthAddr(EthAddr(raw)) is EthAddr(raw))
+    self.assertEqual(EthAddr(raw), EthAddr("00-11-22-33-44-55"))
+    self.assertEqual(hash(EthAddr(raw)), hash(EthAddr("00:11:22:33:44:55")))
+    self.assertTrue(copy(EthAddr(raw)) is EthAddr(raw))
+    self.assertRaises(TypeError, setattr, EthAddr(raw), "_value", "x")
+
+  def test_compare(self):
+    a = EthAddr("00:00:00:00:00:01")
+    b = EthAddr("00:00:00:00:00:02")
+    self.assertTrue(a < b and b > a and a != b)
+    self.assertEqual(sorted([b, a]), [a, b])
+    self.assertEqual(a, "\x00\x00\x00\x00\x00\x01")
+
+class IPAddrTest(unittest.TestCase):
+  def test_formats(self):
+    ip = IPAddr("10.1.2.3")
+    self.assertEqual(ip, IPAddr(0x0a010203))
+    self.assertEqual(ip, IPAddr("\x0a\x01\x02\x03"))
+    self.assertEqual(ip, IPAddr(ip.toUnsigned(networkOrder=True),
+                                networkOrder=True))
+    self.assertEqual(ip.toUnsigned(), 0x0a010203)
+    self.assertEqual(ip.toRaw(), "\x0a\x01\x02\x03")
+    self.assertEqual(IPAddr("255.0.0.1").toSigned(), -16777215)
+    self.assertEqual(str(ip), "10.1.2.3")
+
+  def test_interned(self):
+    self.assertTrue(IPAddr("10.1.2.3") is IPAddr("10.1.2.3"))
+    ip = IPAddr(0x0a010203)
+    self.assertTrue(IPAddr(ip) is ip)
+    self.assertEqual(hash(ip), hash(IPAddr("10.1.2.3")))
+    self.assertEqual({ip: 1}[IPAddr("\x0a\x01\x02\x03")], 1)
+
+  def test_compare(self):
+    self.assertTrue(IPAddr("9.0.0.1") < IPAddr("10.0.0.0"))
+    self.assertEqual(IPAddr("10.0.0.1"), "10.0.0.1")
+    self.assertNotEqual(IPAddr("10.0.0.1"), None)
+
+  def test_in_network(self):
+    ip = IPAddr("10.1.2.3")
+    self.assertTrue(ip.inNetwork("10.0.0.0/8"))
+    self.assertTrue(ip.inNetwork("10.1.2.0", "255.255.255.0"))
+    self.assertTrue(ip.inNetwork((IPAddr("10.1.0.0"), 16)))
+    self.assertFalse(ip.inNetwork("10.1.3.0/24"))
+    self.assertFalse(ip.inNetwork("11.0.0.0/8"))
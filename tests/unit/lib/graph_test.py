@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+
+import unittest
+import sys
+import os.path
+import random
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from pox.lib.graph.graph import *
+from pox.lib.addresses import EthAddr, IPAddr
+
+class Node (object):
+  def __init__ (self, num, color = None):
+    self.num = num
+    if color is not None: self.color = color
+    self.tests = 0
+
+  def __getattribute__ (self, name):
+    if name == 'num':
+      # Count how many times the node gets looked at
+      object.__setattr__(self, 'tests', object.__getattribute__(self,
+                                                                'tests') + 1)
+    return object.__getattribute__(self, name)
+
+  def __repr__ (self):
+    return "%s(%s)" % (type(self).__name__, self.num)
+
+class Switch (Node):
+  pass
+
+class Host (Node):
+  pass
+
+class GraphTest (unittest.TestCase):
+  def setUp (self):
+    rand = random.Random(0)
+    self.g = Graph()
+    self.g.add_index('num')
+    self.g.add_index('color')
+    self.nodes = []
+    for i in range(60):
+      cls = rand.choice((Node, Switch, Host))
+      n = cls(i, rand.choice((None, "red", "blue", ["unhashable"])))
+      self.nodes.append(n)
+      self.g.add(n)
+    for i in range(80):
+      a, b = rand.sample(self.nodes, 2)
+      self.g.link((a, rand.randint(0, 5)), (b, rand.randint(0, 5)))
+
+  def brute_find (self, *args, **kw):
+    return set(n for n in self.g._g.nodes()
+               if self.g._test_node(n, args, kw))
+
+  def brute_links (self, q1, q2):
+    if q2 is None: q2 = q1 # Both ends the same
+    if q1 == (): q1 = None
+    if q2 == (): q2 = None
+    r = set()
+    for n1, n2, k, d in self.g._g.edges(data=True, keys=True):
+      l = d[LINK]
+      for a, b in ((l[0][0], l[1][0]), (l[1][0], l[0][0])):
+        if ((q1 is None or self.g._test_node(a, (q1,), link=l)) and
+            (q2 is None or self.g._test_node(b, (q2,), link=l))):
+          r.add((a, b))
+    return r
+
+  def queries (self):
+    return [
+      ((Equal(F('num'), 7),), {}),
+      ((Equal(17, F('num')),), {}),
+      ((), {'num': 3}),
+      ((), {'color': "red"}),
+      ((), {'type': Switch}),
+      ((), {'is_a': Node}),
+      ((IsType('Host'),), {}),
+      ((IsInstance(Switch),), {}),
+      ((And(Equal(F('color'), "blue"), IsType(Switch)),), {}),
+      ((Or(Equal(F('num'), 5), Equal(F('color'), "red")),), {}),
+      ((Or(Equal(F('num'), 5), Not(Equal(F('color'), "red"))),), {}),
+      ((Equal(F('color'), ["unhashable"]),), {}),
+      ((Equal(F('num'), 99),), {'type': Host}),
+    ]
+
+  def test_find (self):
+    for args, kw in self.queries():
+      self.assertEqual(set(self.g.find(*args, **kw)),
+                       self.brute_find(*args, **kw), (args, kw))
+      self.assertEqual(self.g.has(*args, **kw),
+                       bool(self.brute_find(*args, **kw)))
+
+  def test_find_links (self):
+    queries = [a[0] for a, kw in self.queries() if a] + [None, ()]
+    for q1 in queries:
+      for q2 in queries:
+        found = set((l[0][0], l[1][0]) for l in self.g.find_links(q1, q2))
+        # find_links() only gives each link one way around
+        expected = self.brute_links(q1, q2)
+        self.assertTrue(found <= expected)
+        self.assertEqual(found | set((b, a) for a, b in found
+                                     if (b, a) in expected), expected,
+                         (q1, q2))
+        self.assertEqual(self.g.has_link(q1, q2), bool(expected))
+
+  def test_indexed_lookups (self):
+    q = Equal(F('num'), 30)
+    for n in self.nodes: n.tests = 0
+    self.assertEqual(self.g.get_one(q), self.nodes[30])
+    # Only the node which can match gets tested (F() looks at a field twice)
+    self.assertEqual(sum(n.tests for n in self.nodes), 2)
+
+    for n in self.nodes: n.tests = 0
+    self.assertTrue(self.g.has(Equal(F('num'), 30), is_a = Node))
+    self.assertEqual(sum(n.tests for n in self.nodes), 2)
+
+  def test_short_circuit (self):
+    for n in self.nodes: n.tests = 0
+    self.assertTrue(self.g.has(Not(Equal(F('num'), -1))))
+    self.assertEqual(sum(n.tests for n in self.nodes), 2)
+    self.assertRaises(RuntimeError, self.g.get_one, Not(Equal(F('num'), -1)))
+    self.assertEqual(sum(n.tests for n in self.nodes), 6)
+
+  def test_reindex (self):
+    n = self.nodes[10]
+    n.num = 1000
+    self.g.reindex(n)
+    self.assertEqual(self.g.find(num = 1000), [n])
+    self.assertEqual(self.g.find(num = 10), [])
+    self.g.remove(n)
+    self.assertEqual(self.g.find(num = 1000), [])
+    self.assertFalse(n in self.g.find(is_a = Node))
+
+  def test_equal_across_kinds (self):
+    """ Values which are equal but hash differently are still found """
+    g = Graph()
+    g.add_index('ip')
+    g.add_index('mac')
+    g.add_index('num')
+    a = Node(1)
+    a.ip = IPAddr("10.0.0.1")
+    a.mac = EthAddr("00:00:00:00:00:01")
+    g.add(a)
+    self.assertEqual(g.find(ip = "10.0.0.1"), [a])
+    self.assertEqual(g.find(Equal(F('ip'), "10.0.0.1")), [a])
+    self.assertEqual(g.find(ip = "10.0.0.2"), [])
+    self.assertEqual(g.find(mac = EthAddr("00:00:00:00:00:01")), [a])
+    self.assertEqual(g.find(num = 1.0), [a])
+    self.assertEqual(g.find(num = 1L), [a])
+    # With values of more than one kind, the index isn't used
+    b = Node(2)
+    b.ip = "10.0.0.1"
+    g.add(b)
+    self.assertEqual(set(g.find(ip = "10.0.0.1")), set([a, b]))
+    self.assertEqual(set(g.find(ip = IPAddr("10.0.0.1"))), set([a, b]))
+    self.assertEqual(g.find(Or(Equal(F('ip'), IPAddr("10.0.0.1")),
+                               Equal(F('num'), 5)), num = 1), [a])
+    g.remove(b)
+    self.assertEqual(g._indexes['ip'].kinds, {IPAddr: 1})
+
+  def test_plan_cache (self):
+    q = Equal(F('color'), "red")
+    self.g._plans.clear()
+    self.g.find(q)
+    self.g.find(q)
+    self.assertEqual(len(self.g._plans), 1)
+    # New fields to index mean new plans
+    self.g.add_index('tests')
+    self.assertEqual(len(self.g._plans), 0)
+    self.assertEqual(set(self.g.find(q)), self.brute_find(q))
+
+if __name__ == '__main__':
+  unittest.main()
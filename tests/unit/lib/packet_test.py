@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+
+import unittest
+import sys
+import os.path
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from pox.lib.packet import *
+from pox.lib.packet.packet_utils import flow_key, checksum, checksum_update
+from pox.lib.packet.packet_base import _unparsed
+from pox.lib.addresses import *
+
+def make_udp (vlan_id = None):
+  e = ethernet(src=EthAddr("00:00:00:00:00:01"),
+               dst=EthAddr("00:00:00:00:00:02"))
+  ip = ipv4(srcip=IPAddr("10.0.0.1"), dstip=IPAddr("10.0.0.2"),
+            protocol=ipv4.UDP_PROTOCOL, tos=4)
+  ip.payload = udp(srcport=1234, dstport=5000, payload="hello")
+  if vlan_id is None:
+    e.type = ethernet.IP_TYPE
+    e.payload = ip
+  else:
+    e.type = ethernet.VLAN_TYPE
+    v = vlan(id=vlan_id, pcp=3, eth_type=ethernet.IP_TYPE)
+    v.c = 0
+    v.payload = ip
+    e.payload = v
+  return e.pack()
+
+class LazyParseTest (unittest.TestCase):
+  def test_layers_parsed_on_demand (self):
+    raw = make_udp()
+    p = ethernet(raw, lazy=True)
+    self.assertEqual(p.src, EthAddr("00:00:00:00:00:01"))
+    self.assertEqual(p.type, ethernet.IP_TYPE)
+    self.assertTrue(type(p.__dict__['_next']) is _unparsed)
+
+    ip = p.find('ipv4')
+    self.assertEqual(ip.srcip, IPAddr("10.0.0.1"))
+    self.assertTrue(p.next is ip)
+    self.assertTrue(isinstance(ip.payload, udp))
+    self.assertEqual(ip.next.dstport, 5000)
+    self.assertEqual(ip.next.next, "hello")
+
+  def test_same_as_eager (self):
+    for raw in (make_udp(), make_udp(vlan_id=7)):
+      lazy = ethernet(raw, lazy=True)
+      eager = ethernet(raw)
+      self.assertEqual(str(lazy), str(eager))
+      self.assertEqual(lazy.pack(), eager.pack())
+
+class FlowKeyTest (unittest.TestCase):
+  def test_udp (self):
+    self.assertEqual(flow_key(make_udp()),
+                     ("\x00\x00\x00\x00\x00\x01", "\x00\x00\x00\x00\x00\x02",
+                      None, None, ethernet.IP_TYPE, 4, ipv4.UDP_PROTOCOL,
+                      IPAddr("10.0.0.1").toUnsigned(),
+                      IPAddr("10.0.0.2").toUnsigned(), 1234, 5000))
+
+  def test_vlan (self):
+    key = flow_key(make_udp(vlan_id=7))
+    self.assertEqual(key[2:5], (7, 3, ethernet.IP_TYPE))
+    self.assertEqual(key[9:], (1234, 5000))
+
+  def test_arp_and_short (self):
+    a = arp(opcode=arp.REQUEST, protosrc=IPAddr("10.0.0.1"),
+            protodst=IPAddr("10.0.0.2"))
+    e = ethernet(type=ethernet.ARP_TYPE, payload=a)
+    key = flow_key(e.pack())
+    self.assertEqual(key[4:9], (ethernet.ARP_TYPE, None, arp.REQUEST,
+                                IPAddr("10.0.0.1").toUnsigned(),
+                                IPAddr("10.0.0.2").toUnsigned()))
+    self.assertEqual(key[9:], (None, None))
+    self.assertEqual(flow_key("\x00" * 13), None)
+    # Truncated UDP header -> no ports
+    self.assertEqual(flow_key(make_udp()[:14+20+4])[9:], (None, None))
+
+class ChecksumTest (unittest.TestCase):
+  def test_known (self):
+    # A sample IPv4 header whose checksum is b861
+    hdr = ("\x45\x00\x00\x73\x00\x00\x40\x00\x40\x11\x00\x00"
+           "\xc0\xa8\x00\x01\xc0\xa8\x00\xc7")
+    self.assertEqual(checksum(hdr), 0xb861)
+    self.assertEqual(checksum(bytearray(hdr)), 0xb861)
+    self.assertEqual(checksum(hdr[:10] + "\xb8\x61" + hdr[12:], 0, 5),
+                     0xb861)
+    self.assertEqual(checksum(hdr[:10] + "\xb8\x61" + hdr[12:]), 0)
+
+  def test_odd_length (self):
+    self.assertEqual(checksum("\x01\x02\x03"), checksum("\x01\x02\x03\x00"))
+
+  def test_update (self):
+    import random
+    rand = random.Random(0)
+    for i in range(200):
+      data = "".join(chr(rand.randint(0, 255)) for j in range(40))
+      off = rand.randint(0, 18) * 2
+      new = "".join(chr(rand.randint(0, 255)) for j in range(4))
+      changed = data[:off] + new + data[off+4:]
+      self.assertEqual(checksum_update(checksum(data), data[off:off+4], new),
+                       checksum(changed))
+    self.assertRaises(ValueError, checksum_update, 0, "ab", "abcd")
+
+if __name__ == '__main__':
+  unittest.main()
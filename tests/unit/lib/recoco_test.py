@@ -0,0 +1,250 @@
+#!/usr/bin/env python
+
+import unittest
+import sys
+import os.path
+import socket
+import select
+import threading
+import time
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from pox.lib.recoco import *
+import pox.lib.recoco.recoco as recoco
+
+class Recorder (BaseTask):
+  def __init__ (self, log, name, count = 1):
+    BaseTask.__init__(self)
+    self.log = log
+    self.name = name
+    self.count = count
+
+  def run (self):
+    for i in range(self.count):
+      self.log.append(self.name)
+      yield 0 # Go to the back of the queue
+    yield False
+
+class FuncTask (BaseTask):
+  def run (self, func):
+    return func()
+
+class SchedulerTest (unittest.TestCase):
+  def setUp (self):
+    self.scheduler = Scheduler(isDefaultScheduler = False,
+                               startInThread = False)
+    self.log = []
+
+  def tearDown (self):
+    self.scheduler.quit()
+
+  def start (self, name, priority = None, count = 1):
+    t = Recorder(self.log, name, count)
+    t.start(self.scheduler, priority, fast = True)
+    return t
+
+  def run_all (self, limit = 1000):
+    for i in range(limit):
+      if not self.scheduler.cycle(): return
+    self.fail("Tasks still running")
+
+  def test_priority_classes (self):
+    self.start("low", PRIORITY_LOW)
+    self.start("normal")
+    self.start("high", PRIORITY_HIGH)
+    self.start("normal 2", PRIORITY_NORMAL)
+    self.start("higher", 10)
+    self.run_all()
+    self.assertEqual(self.log, ["high", "higher", "normal", "normal 2", "low"])
+
+  def test_round_robin (self):
+    self.start("a", count = 3)
+    self.start("b", count = 2)
+    self.run_all()
+    self.assertEqual(self.log, ["a", "b", "a", "b", "a"])
+
+  def test_schedule_first (self):
+    self.start("a")
+    self.scheduler.fast_schedule(Recorder(self.log, "b"), first = True)
+    self.run_all()
+    self.assertEqual(self.log, ["b", "a"])
+
+  def test_no_starvation (self):
+    busy = recoco.STARVATION_LIMIT * 2
+    self.start("high", PRIORITY_HIGH, count = busy)
+    self.start("low", PRIORITY_LOW)
+    self.run_all()
+    self.assertEqual(self.log.index("low"), recoco.STARVATION_LIMIT)
+    self.assertEqual(self.log.count("high"), busy)
+
+  def test_no_starvation_all_busy (self):
+    limit = recoco.STARVATION_LIMIT
+    self.start("high", PRIORITY_HIGH, count = limit * 4)
+    self.start("normal", PRIORITY_NORMAL, count = limit * 4)
+    self.start("low", PRIORITY_LOW, count = 2)
+    self.run_all()
+    # The lower classes take turns at the slices high has to give up
+    self.assertEqual(self.log[limit], "normal")
+    self.assertEqual(self.log[limit * 2 + 1], "low")
+    self.assertEqual(self.log[limit * 3 + 2], "normal")
+    self.assertEqual(self.log[limit * 4 + 3], "low")
+
+  def test_accounting (self):
+    t = self.start("a", count = 3)
+    self.assertEqual(t.slices, 0)
+    self.run_all()
+    # Three yields of 0 and the final yield of False
+    self.assertEqual(t.slices, 4)
+    self.assertTrue(t.run_time >= 0)
+    self.assertFalse(t._queued)
+
+class SelectHubTest (unittest.TestCase):
+  use_epoll = False
+
+  def setUp (self):
+    self.scheduler = Scheduler(isDefaultScheduler = False, daemon = True,
+                               useEpoll = self.use_epoll)
+    self.pairs = [socket.socketpair() for i in range(3)]
+    self.woken = []
+    self.done = threading.Event()
+
+  def tearDown (self):
+    self.scheduler.quit()
+    self.scheduler._selectHub._cycle()
+    for a,b in self.pairs:
+      a.close()
+      b.close()
+
+  def start (self, gen):
+    t = FuncTask(gen)
+    t.start(self.scheduler, fast = True)
+    return t
+
+  def wait (self):
+    self.assertTrue(self.done.wait(5))
+    self.done.clear()
+
+  def test_select (self):
+    socks = [a for a,b in self.pairs]
+    def reader ():
+      while len(self.woken) < 4:
+        rl, wl, xl = yield Select(socks, [], [], 5)
+        for s in rl:
+          self.woken.append(s.recv(1))
+        self.done.set()
+    self.start(reader)
+    for msg in ("x", "y"):
+      self.pairs[1][1].send(msg)
+      self.wait()
+    # Readable while the task was busy; it should see it when it waits again
+    self.pairs[0][1].send("z")
+    self.pairs[2][1].send("w")
+    while len(self.woken) < 4:
+      self.wait()
+    self.assertEqual(self.woken[:2], ["x", "y"])
+    self.assertEqual(sorted(self.woken[2:]), ["w", "z"])
+
+  def test_timers (self):
+    def sleeper (name, seconds):
+      def run ():
+        yield Select([self.pairs[0][0]], [], [], seconds)
+        self.woken.append(name)
+        if len(self.woken) == 3: self.done.set()
+        yield False
+      return run
+    self.start(sleeper("c", 0.3))
+    self.start(sleeper("a", 0.1))
+    self.start(sleeper("b", 0.2))
+    self.wait()
+    self.assertEqual(self.woken, ["a", "b", "c"])
+
+  def test_interest_changes (self):
+    a, b = self.pairs[0][0], self.pairs[1][0]
+    def reader ():
+      rl, wl, xl = yield Select([a, b], [], [], 5)
+      self.woken.append(rl)
+      self.done.set()
+      # Now only interested in b
+      rl, wl, xl = yield Select([b], [], [], 0.5)
+      self.woken.append(rl)
+      self.done.set()
+      yield False
+    self.start(reader)
+    self.pairs[0][1].send("x")
+    self.wait()
+    self.assertEqual(self.woken, [[a]])
+    # a is still readable, but nobody wants it now
+    self.wait()
+    self.assertEqual(self.woken, [[a], []])
+
+  def test_closed_and_reused (self):
+    a = self.pairs[0][0]
+    def reader ():
+      rl, wl, xl = yield Select([a], [], [], 5)
+      a.close() # Its fd is likely to be reused by the next socketpair()
+      self.pairs.append(socket.socketpair())
+      b = self.pairs[-1][0]
+      self.done.set()
+      rl, wl, xl = yield Select([b], [], [], 5)
+      self.woken.append(rl == [b])
+      self.done.set()
+      yield False
+    self.start(reader)
+    self.pairs[0][1].send("x")
+    self.wait()
+    self.pairs[-1][1].send("y")
+    self.wait()
+    self.assertEqual(self.woken, [True])
+
+  def test_ended_tasks_forgotten (self):
+    hub = self.scheduler._selectHub
+    def reader (a):
+      def run ():
+        yield Select([a], [], [a], 5)
+        self.woken.append(a)
+        if len(self.woken) == 100: self.done.set()
+      return run
+    def failer (a):
+      def run ():
+        yield Select([a], [a], [], 5)
+        self.woken.append(a)
+        if len(self.woken) == 100: self.done.set()
+        raise RuntimeError("Oops (this is part of the test)")
+      return run
+    for i in range(100):
+      a, b = socket.socketpair()
+      self.pairs.append((a, b))
+      b.send("x")
+      self.start((failer if i % 25 == 0 else reader)(a))
+    self.wait()
+    for i in range(100):
+      if not hub._interest and not hub._readers: break
+      time.sleep(0.01)
+    for d in (hub._interest, hub._lists, hub._suspended, hub._readers,
+              hub._writers, hub._errors):
+      self.assertEqual(len(d), 0)
+
+  def test_call_later (self):
+    def call (i):
+      self.woken.append(i)
+      if len(self.woken) == 4000: self.done.set()
+    def produce (start):
+      for i in range(start, start + 1000):
+        self.scheduler.callLater(call, i)
+    threads = [threading.Thread(target = produce, args = (i * 1000,))
+               for i in range(4)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    self.wait()
+    self.assertEqual(sorted(self.woken), range(4000))
+    # Each thread's calls are made in order
+    for i in range(4):
+      mine = [x for x in self.woken if x // 1000 == i]
+      self.assertEqual(mine, range(i * 1000, i * 1000 + 1000))
+
+if hasattr(select, 'epoll'):
+  class EpollSelectHubTest (SelectHubTest):
+    use_epoll = True
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+
+import unittest
+import sys
+import os.path
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from pox.lib.revent import *
+
+class Ping (Event):
+  def __init__ (self, value = None):
+    Event.__init__(self)
+    self.value = value
+
+class Custom (Event):
+  def _invoke (self, handler, *args, **kw):
+    return handler(self, "extra", *args, **kw)
+
+class Source (EventMixin):
+  _eventMixin_events = set([Ping, Custom])
+
+class ReventTest (unittest.TestCase):
+  def setUp (self):
+    self.source = Source()
+    self.calls = []
+
+  def handler (self, name, rv = None):
+    def h (event, *args):
+      self.calls.append((name,) + args)
+      return rv
+    return h
+
+  def test_by_class_and_instance (self):
+    s = self.source
+    self.assertEqual(s.raiseEvent(Ping, 1), None) # No listeners
+    s.addListener(Ping, self.handler("a"))
+    e = s.raiseEvent(Ping, 5)
+    self.assertEqual((e.value, e.source), (5, s))
+    e = Ping(6)
+    self.assertTrue(s.raiseEvent(e) is e)
+    self.assertEqual(self.calls, [("a",), ("a",)])
+
+  def test_priority_and_changes (self):
+    s = self.source
+    s.addListener(Ping, self.handler("low"), priority=1)
+    s.raiseEvent(Ping)
+    s.addListener(Ping, self.handler("high"), priority=10)
+    eid = s.addListener(Ping, self.handler("mid"), priority=5)
+    s.raiseEvent(Ping)
+    s.removeListener(eid)
+    s.raiseEvent(Ping)
+    self.assertEqual(self.calls, [("low",), ("high",), ("mid",), ("low",),
+                                  ("high",), ("low",)])
+
+  def test_return_values (self):
+    s = self.source
+    s.addListener(Ping, self.handler("once"), once=True)
+    s.addListener(Ping, self.handler("remove", EventRemove))
+    s.addListener(Ping, self.handler("halt", EventHalt))
+    s.addListener(Ping, self.handler("never"))
+    s.raiseEvent(Ping)
+    s.raiseEvent(Ping)
+    self.assertEqual(self.calls, [("once",), ("remove",), ("halt",),
+                                  ("halt",)])
+
+  def test_event_halt (self):
+    s = self.source
+    def halter (event):
+      self.calls.append("halter")
+      event.halt = True
+      return EventContinue
+    s.addListener(Ping, halter)
+    s.addListener(Ping, self.handler("never"))
+    s.raiseEvent(Ping)
+    self.assertEqual(self.calls, ["halter"])
+
+  def test_custom_invoke (self):
+    s = self.source
+    s.addListener(Custom, self.handler("c"))
+    s.raiseEvent(Custom)
+    s.raiseEvent(Custom(), 1)
+    self.assertEqual(self.calls, [("c", "extra"), ("c", "extra", 1)])
+
+  def test_change_during_dispatch (self):
+    s = self.source
+    def adder (event):
+      self.calls.append("adder")
+      s.addListener(Ping, self.handler("added"))
+      return EventRemove
+    s.addListener(Ping, adder)
+    s.raiseEvent(Ping)
+    s.raiseEvent(Ping)
+    self.assertEqual(self.calls, ["adder", ("added",)])
+
+  def test_remove (self):
+    s = self.source
+    h = self.handler("h")
+    by_pair = s.addListener(Ping, self.handler("pair"))
+    by_eid = s.addListener(Ping, self.handler("eid"))
+    s.addListener(Ping, h)
+    s.addListener(Custom, h)
+    self.assertEqual(s._eventMixin_get_listener_count(), 4)
+    self.assertTrue(s.removeListener(by_pair))
+    self.assertFalse(s.removeListener(by_pair))
+    self.assertFalse(s.removeListener(by_eid[1], Custom))
+    self.assertTrue(s.removeListener(by_eid[1]))
+    self.assertTrue(s.removeListener(h, Ping))
+    self.assertEqual(s._eventMixin_get_listener_count(), 1)
+    s.raiseEvent(Ping)
+    s.raiseEvent(Custom)
+    self.assertEqual(self.calls, [("h", "extra")])
+    self.assertTrue(s.removeListener(h))
+    self.assertEqual(s._eventMixin_get_listener_count(), 0)
+
+  def test_compaction (self):
+    s = self.source
+    eids = [s.addListener(Ping, self.handler(i), priority=i % 3)
+            for i in range(100)]
+    for eid in eids[::2] + eids[1:50:2]:
+      s.removeListener(eid)
+    self.assertTrue(len(s._eventMixin_handlers[Ping]) < 100)
+    s.raiseEvent(Ping)
+    # Higher priority first, otherwise in the order they were added
+    left = range(51, 100, 2)
+    self.assertEqual(self.calls, [(i,) for p in (2, 1, 0) for i in left
+                                  if i % 3 == p])
+
+  def test_undefined_event (self):
+    class Other (Event): pass
+    self.assertRaises(RuntimeError, self.source.raiseEvent, Other())
+    self.assertRaises(RuntimeError, self.source.addListener, Other,
+                      self.handler("x"))
+
+if __name__ == '__main__':
+  unittest.main()
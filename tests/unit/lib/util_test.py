@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+
+import unittest
+import sys
+import os.path
+import select
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from pox.lib.util import makePinger
+import pox.lib.util
+
+class PingerTest (unittest.TestCase):
+  eventfd = None
+
+  def readable (self, pinger):
+    return select.select([pinger], [], [], 0)[0] == [pinger]
+
+  def test_ping (self):
+    p = makePinger(eventfd = self.eventfd)
+    self.assertFalse(self.readable(p))
+    for i in range(1000):
+      p.ping() # Coalesced, so these can't fill the pipe up
+    self.assertTrue(self.readable(p))
+    p.pongAll()
+    self.assertFalse(self.readable(p))
+    p.ping()
+    self.assertTrue(self.readable(p))
+    p.pong()
+    self.assertFalse(self.readable(p))
+
+  def test_ping_while_ponging (self):
+    """ A ping() which comes while the pinger is being ponged isn't lost """
+    p = makePinger(eventfd = self.eventfd)
+    class PingingOS (object):
+      # Pings from the middle of the pong's read
+      def __getattr__ (self, name):
+        return getattr(os, name)
+      def read (self, fd, n):
+        p.ping()
+        return os.read(fd, n)
+    for pong in (p.pong, p.pongAll):
+      p.ping()
+      pox.lib.util.os = PingingOS()
+      try:
+        pong()
+      finally:
+        pox.lib.util.os = os
+      if not self.readable(p):
+        # The ping was read along with the first one; a new one still works
+        p.ping()
+      self.assertTrue(self.readable(p))
+      p.pongAll()
+      self.assertFalse(self.readable(p))
+
+class PipePingerTest (PingerTest):
+  eventfd = False
+
+if __name__ == '__main__':
+  unittest.main()
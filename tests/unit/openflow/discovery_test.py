@@ -0,0 +1,304 @@
+#!/usr/bin/env python
+
+import unittest
+import sys
+import os.path
+import time
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from pox.core import core
+import pox.openflow.libopenflow_01 as of
+from pox.lib.addresses import EthAddr
+from pox.lib.packet.ethernet import ethernet, NDP_MULTICAST
+from pox.lib.packet.lldp import lldp, chassis_id, port_id, ttl, end_tlv
+from pox.openflow import PacketIn
+import pox.openflow.discovery as discovery
+from pox.openflow.discovery import Discovery, LLDPSender
+
+Link = Discovery.Link
+
+class MockEvent (object):
+  def __init__ (self, dpid):
+    self.dpid = dpid
+
+class DiscoveryLinkTest (unittest.TestCase):
+  def setUp (self):
+    self.d = Discovery()
+    self.events = []
+    self.d.addListenerByName("LinkEvent",
+        lambda event: self.events.append((event.added, event.link)))
+
+  def tearDown (self):
+    self.d._expireTimer.cancel()
+
+  def add (self, *links, **kw):
+    for l in links:
+      self.d._addLink(l, **kw)
+
+  def test_indexes (self):
+    ab = Link(1, 2, 2, 1)
+    ba = Link(2, 1, 1, 2)
+    ab2 = Link(1, 3, 2, 3) # Parallel link, one way only
+    bc = Link(2, 4, 3, 1)
+    self.add(ab, ba, ab2, bc)
+    self.assertEqual(sorted(self.d.linksForDPID(2)),
+                     sorted([ab, ba, ab2, bc]))
+    self.assertEqual(self.d.linksForDPID(4), [])
+    self.assertEqual(sorted(self.d.linksForPort(1, 2)), sorted([ab, ba]))
+    self.assertEqual(self.d.linksForPort(3, 1), [bc])
+    self.assertEqual(sorted(self.d.linksBetween(1, 2)), sorted([ab, ab2]))
+    self.assertEqual(self.d.linksBetween(1, 2, bidirectional=True), [ab])
+    self.assertEqual(self.d.linksBetween(2, 3, bidirectional=True), [])
+    self.assertTrue(self.d.isSwitchOnlyPort(2, 3))
+    self.assertTrue(self.d.isSwitchOnlyPort(3, 1))
+    self.assertFalse(self.d.isSwitchOnlyPort(3, 2))
+
+    self.d._deleteLinks([ab2, bc])
+    self.assertEqual(self.events, [(False, ab2), (False, bc)])
+    self.assertFalse(self.d.isSwitchOnlyPort(2, 3))
+    self.assertEqual(self.d.linksForDPID(3), [])
+    # Nothing is left behind for deleted links
+    self.assertFalse(3 in self.d._dpidLinks)
+    self.assertFalse((2, 3) in self.d._pairLinks)
+    self.assertEqual(len(self.d._portLinks), 2)
+
+  def test_self_link (self):
+    loop = Link(1, 1, 1, 2) # Two ports of one switch cabled together
+    same = Link(1, 3, 1, 3) # A port looped back on itself
+    self.add(loop, same)
+    self.assertEqual(sorted(self.d.linksForDPID(1)), sorted([loop, same]))
+    self.assertTrue(self.d.isSwitchOnlyPort(1, 2))
+    self.assertTrue(self.d.isSwitchOnlyPort(1, 3))
+
+    self.d._deleteLinks([loop, same])
+    self.assertEqual(self.events, [(False, loop), (False, same)])
+    self.assertFalse(self.d.isSwitchOnlyPort(1, 1))
+    self.assertFalse(self.d.isSwitchOnlyPort(1, 3))
+    self.assertEqual(self.d._dpidLinks, {})
+    self.assertEqual(self.d._portLinks, {})
+    self.assertEqual(self.d._pairLinks, {})
+
+  def test_connection_down (self):
+    links = [Link(1, 2, 2, 1), Link(2, 1, 1, 2),
+             Link(2, 3, 3, 2), Link(3, 2, 2, 3),
+             Link(3, 1, 1, 3)]
+    self.add(*links)
+    self.d._dps.update([1, 2, 3])
+    self.d._handle_ConnectionDown(MockEvent(2))
+    self.assertEqual(sorted(l for added,l in self.events),
+                     sorted(links[:4]))
+    self.assertEqual(self.d.adjacency.keys(), [links[4]])
+    self.assertEqual(self.d.linksForDPID(2), [])
+
+  def test_expiry (self):
+    old = time.time() - discovery.LINK_TIMEOUT - 1
+    stale = Link(1, 1, 2, 1)
+    fresh = Link(2, 1, 1, 1)
+    gone = Link(3, 1, 4, 1)
+    self.add(stale, fresh, gone, timestamp = old)
+    self.d.adjacency[fresh] = time.time() # Refreshed
+    self.d._deleteLinks([gone])
+    del self.events[:]
+    self.d._expireLinks()
+    self.assertEqual(self.events, [(False, stale)])
+    self.assertEqual(self.d.adjacency.keys(), [fresh])
+    # Only the refreshed link is still in the heap, with its new deadline
+    self.assertEqual(len(self.d._expiry), 1)
+    self.assertTrue(self.d._expiry[0][0] > time.time())
+
+    # Nothing else comes due yet
+    del self.events[:]
+    self.d._expireLinks()
+    self.assertEqual(self.events, [])
+
+  def test_flapping (self):
+    ab = Link(1, 2, 2, 1)
+    for i in range(100):
+      self.add(ab)
+      self.d._deleteLinks([ab])
+    self.add(ab)
+    self.assertEqual(len(self.d._expiry), 1)
+    # Every entry which comes due is dealt with, not pushed again
+    old = time.time() - discovery.LINK_TIMEOUT - 1
+    self.add(Link(3, 1, 4, 1), Link(4, 1, 3, 1), timestamp = old)
+    self.d._deleteLinks([Link(3, 1, 4, 1)])
+    self.add(Link(3, 1, 4, 1))
+    self.d._expireLinks()
+    self.assertEqual(sorted(self.d._deadlines), sorted([ab, Link(3, 1, 4, 1)]))
+    self.assertEqual(len(self.d._expiry), 2)
+    self.assertFalse(Link(4, 1, 3, 1) in self.d.adjacency)
+
+class MockOpenFlow (object):
+  def __init__ (self):
+    self.sent = []
+
+  def sendToDPID (self, dpid, data):
+    self.sent.append((dpid, data))
+    return True
+
+class LLDPSenderTest (unittest.TestCase):
+  def setUp (self):
+    self.sender = LLDPSender()
+    self.openflow = MockOpenFlow()
+    self._old = core.components.get('openflow')
+    core.components['openflow'] = self.openflow
+
+  def tearDown (self):
+    if self.sender._timer: self.sender._timer.cancel()
+    if self._old is None:
+      del core.components['openflow']
+    else:
+      core.components['openflow'] = self._old
+
+  def ports (self, *nums):
+    return [(n, EthAddr("02:00:00:00:%02x:%02x" % (n >> 8, n & 0xff)))
+            for n in nums]
+
+  def cycle (self):
+    """ Runs a whole send cycle and returns the probes sent per dpid """
+    del self.openflow.sent[:]
+    for i in range(discovery.LLDP_SEND_SLOTS):
+      self.sender._timerHandler()
+    probes = {}
+    for dpid, data in self.openflow.sent:
+      self.assertFalse(dpid in probes, "Switch sent to more than once")
+      probes[dpid] = []
+      while data:
+        po = of.ofp_packet_out()
+        data = po.unpack(data)
+        probes[dpid].append(po)
+    return probes
+
+  def expected (self, dpid, ports):
+    return sorted(self.sender.create_discovery_packet(dpid, n, a)[8:]
+                  for n, a in ports)
+
+  def test_probes (self):
+    ports = self.ports(1, 2, 7, of.OFPP_MAX)
+    self.sender.addSwitch(0x123456789a, ports + self.ports(of.OFPP_LOCAL))
+    probes = self.cycle()
+    self.assertEqual(probes.keys(), [0x123456789a])
+    # The same as packing them from scratch, apart from the xid
+    self.assertEqual(sorted(po.pack()[8:] for po in probes[0x123456789a]),
+                     self.expected(0x123456789a, ports))
+
+  def test_port_changes (self):
+    self.sender.addSwitch(1, self.ports(1, 2, 3))
+    self.cycle()
+    self.sender.delPort(1, 2)
+    self.sender.addPort(1, 4, self.ports(4)[0][1])
+    self.sender.addPort(2, 1, self.ports(1)[0][1]) # New switch
+    probes = self.cycle()
+    self.assertEqual(sorted(po.pack()[8:] for po in probes[1]),
+                     self.expected(1, self.ports(1, 3, 4)))
+    self.assertEqual(len(probes[2]), 1)
+    self.sender.delSwitch(1)
+    self.assertEqual(self.cycle().keys(), [2])
+    self.sender.delSwitch(2)
+    self.assertEqual(self.sender._timer, None)
+
+  def test_slots (self):
+    slots = discovery.LLDP_SEND_SLOTS
+    for dpid in range(1, slots * 2 + 2):
+      self.sender.addSwitch(dpid, self.ports(1))
+    sizes = sorted(len(s) for s in self.sender._slots)
+    self.assertEqual(sizes, [2] * (slots - 1) + [3])
+    self.assertEqual(sorted(self.cycle().keys()), range(1, slots * 2 + 2))
+
+  def test_disconnect_while_sending (self):
+    slots = discovery.LLDP_SEND_SLOTS
+    for dpid in range(1, slots * 3 + 1):
+      self.sender.addSwitch(dpid, self.ports(1))
+    # A failed send disconnects the switch, which deletes it right away
+    def sendToDPID (dpid, data):
+      self.openflow.sent.append((dpid, data))
+      self.sender.delSwitch(dpid)
+      return False
+    self.openflow.sendToDPID = sendToDPID
+    self.assertEqual(len(self.cycle()), slots * 3)
+    self.assertEqual(self.sender._ports, {})
+    self.assertEqual(self.cycle(), {})
+
+class MockConnection (object):
+  def __init__ (self, dpid):
+    self.dpid = dpid
+    self.sent = []
+
+  def send (self, msg):
+    self.sent.append(msg)
+
+class PacketInTest (unittest.TestCase):
+  def setUp (self):
+    self.d = Discovery(explicit_drop = True)
+    self.d._dps.update([1, 2, 0x123456789abc])
+    self.events = []
+    self.d.addListenerByName("LinkEvent",
+        lambda event: self.events.append((event.added, event.link)))
+
+  def tearDown (self):
+    self.d._expireTimer.cancel()
+
+  def packet_in (self, dpid, port, data, buffer_id = -1):
+    event = PacketIn(MockConnection(dpid),
+                     of.ofp_packet_in(in_port = port, data = data,
+                                      buffer_id = buffer_id))
+    return event, self.d._handle_PacketIn(event)
+
+  def probe (self, dpid, port):
+    """ Frame of one of our probes, as LLDPSender would send it """
+    po = of.ofp_packet_out()
+    po.unpack(LLDPSender().create_discovery_packet(dpid, port,
+              EthAddr("02:00:00:00:00:01")))
+    return po.data
+
+  def test_probe (self):
+    event, rv = self.packet_in(2, 3, self.probe(0x123456789abc, 65000), 7)
+    self.assertEqual(rv, discovery.EventHalt)
+    self.assertEqual(self.events, [(True, Link(0x123456789abc, 65000, 2, 3))])
+    # It was decoded without parsing
+    self.assertEqual(event._parsed, None)
+    # Dropped
+    self.assertEqual(event.connection.sent[0].buffer_id, 7)
+
+  def test_not_lldp (self):
+    eth = ethernet(src = EthAddr("02:00:00:00:00:01"), dst = NDP_MULTICAST,
+                   type = ethernet.IP_TYPE)
+    eth.payload = self.probe(1, 1)[14:]
+    event, rv = self.packet_in(2, 3, eth.pack())
+    self.assertEqual(rv, None)
+    self.assertEqual(event._parsed, None)
+    self.assertEqual(self.events, [])
+
+  def test_other_lldp (self):
+    """ LLDP not laid out like ours goes the long way """
+    l = lldp()
+    cid = chassis_id()
+    cid.fill(cid.SUB_LOCAL, b"dpid:1")
+    l.add_tlv(cid)
+    pid = port_id()
+    pid.fill(pid.SUB_PORT, b"4")
+    l.add_tlv(pid)
+    t = ttl()
+    t.fill(120)
+    l.add_tlv(t)
+    l.add_tlv(end_tlv())
+    eth = ethernet(src = EthAddr("02:00:00:00:00:01"), dst = NDP_MULTICAST,
+                   type = ethernet.LLDP_TYPE)
+    eth.payload = l
+    event, rv = self.packet_in(2, 3, eth.pack())
+    self.assertEqual(rv, discovery.EventHalt)
+    self.assertEqual(self.events, [(True, Link(1, 4, 2, 3))])
+    self.assertNotEqual(event._parsed, None)
+
+  def test_ignored (self):
+    # From a switch we aren't connected to
+    self.packet_in(2, 3, self.probe(5, 1))
+    # Looped back to where it was sent from
+    self.packet_in(1, 1, self.probe(1, 1))
+    # Not to the NDP multicast address
+    data = self.probe(1, 1)
+    self.packet_in(2, 3, b"\x01\x80\xc2\x00\x00\x00" + data[6:])
+    self.assertEqual(self.events, [])
+
+if __name__ == '__main__':
+  unittest.main()
@@ -13,6 +13,7 @@ import unittest
 import sys
 import os.path
 import itertools
+import random
 
 sys.path.append(os.path.dirname(__file__) + "/../../..")
 from pox.openflow.libopenflow_01 import *
@@ -20,6 +21,12 @@ from pox.openflow.flow_table import *
 from pox.openflow import *
 from pox.openflow.topology import *
 
+def _udp_packet(src, dst, port=1):
+  e = ethernet(src=EthAddr("00:00:00:00:00:%02x" % src), dst=EthAddr("00:00:00:00:00:%02x" % dst), type=ethernet.IP_TYPE)
+  e.payload = ipv4(srcip=IPAddr("10.0.0.%d" % src), dstip=IPAddr("10.0.0.%d" % dst), protocol=ipv4.UDP_PROTOCOL)
+  e.payload.payload = udp(srcport=port, dstport=port, payload="x")
+  return e
+
 class TableEntryTest(unittest.TestCase):
   def test_create(self):
     e = TableEntry(priority=5, cookie=0xDEADBEEF, match=ofp_match(), actions=[ofp_action_output(port=1)])
@@ -101,6 +108,75 @@ class FlowTableTest(unittest.TestCase):
       t.remove_expired_entries(now=time)
       self.assertEqual([e.cookie for e in t.entries ], remaining)
 
+  def test_expiry_events(self):
+    """ each sweep raises at most one event, and touched entries get put off """
+    t = FlowTable()
+    events = []
+    t.addListener(FlowTableModification, lambda(event): events.append(event))
+    for (cookie, idle, hard) in ( (1, 5, 0), (2, 5, 0), (3, 0, 8), (4, 0, 0) ):
+      t.add_entry(TableEntry(now=0, cookie=cookie, idle_timeout=idle, hard_timeout=hard))
+    del events[:]
+    self.assertEqual(t.next_expiry, 5)
+
+    t.entries[0].touch_packet(1, now=4)
+    self.assertEqual([e.cookie for e in t.expired_entries(now=6)], [2])
+    self.assertEqual([e.cookie for e in t.remove_expired_entries(now=6)], [2])
+    self.assertEqual(t.remove_expired_entries(now=7), [])
+    self.assertEqual(t.next_expiry, 8)
+    self.assertEqual([e.cookie for e in t.remove_expired_entries(now=10)], [1,3])
+    self.assertEqual([[e.cookie for e in ev.removed] for ev in events], [[2], [1,3]])
+    self.assertEqual(t.next_expiry, None)
+
+    # removed entries are forgotten
+    e = TableEntry(now=10, cookie=5, hard_timeout=1)
+    t.add_entry(e)
+    t.remove_entry(e)
+    self.assertEqual(t.next_expiry, None)
+    self.assertEqual(t.remove_expired_entries(now=20), [])
+
+  def test_priority_order(self):
+    """ exact matches go first, then by descending priority, then oldest first """
+    t = FlowTable()
+    for (cookie, priority, match) in ( (1, 5, ofp_match(in_port=1)), (2, 9, ofp_match(in_port=2)),
+                                       (3, 5, ofp_match(in_port=3)), (4, 0, ofp_match.from_packet(_udp_packet(1, 2), 1)),
+                                       (5, 9, ofp_match()) ):
+      t.add_entry(TableEntry(cookie=cookie, priority=priority, match=match))
+    self.assertEqual([e.cookie for e in t.entries], [4,2,5,1,3])
+    t.remove_entry(t.entries[2])
+    self.assertEqual([e.cookie for e in t.entries], [4,2,1,3])
+
+  def test_classifier_agrees_with_scan(self):
+    """ lookups give what scanning the table in order would """
+    rand = random.Random(5)
+    def random_match():
+      m = ofp_match.from_packet(_udp_packet(rand.randint(1,3), rand.randint(1,3), rand.randint(1,3)), rand.randint(1,2))
+      for f in ('in_port', 'dl_src', 'dl_dst', 'dl_type', 'nw_proto', 'tp_src', 'tp_dst'):
+        if rand.random() < 0.3: setattr(m, f, None)
+      if rand.random() < 0.3: m.nw_src = ("10.0.0.0", rand.choice((0, 8, 24, 30)))
+      if rand.random() < 0.1: m.nw_dst = ("10.0.0.%d" % rand.randint(1,3), 31)
+      return m
+    t = FlowTable()
+    for i in range(300):
+      t.add_entry(TableEntry(cookie=i, priority=rand.randint(0,3), match=random_match()))
+    for i in range(100):
+      t.remove_entry(rand.choice(t.entries))
+
+    for i in range(200):
+      packet = _udp_packet(rand.randint(1,3), rand.randint(1,3), rand.randint(1,3))
+      in_port = rand.randint(1,2)
+      packet_match = ofp_match.from_packet(packet, in_port)
+      expected = None
+      for entry in t.entries:
+        if entry.match.matches_with_wildcards(packet_match, consider_other_wildcards=False):
+          expected = entry
+          break
+      self.assertTrue(t.entry_for_packet(packet, in_port) is expected)
+
+      match = random_match()
+      for strict in (False, True):
+        expected = [ e for e in t.entries if e.is_matched_by(match, 2, strict) ]
+        self.assertEqual(t.matching_entries(match, 2, strict), expected)
+
 class SwitchFlowTableTest(unittest.TestCase):
   def test_process_flow_mod_add(self):
     """ test that simple insertion of a flow works"""
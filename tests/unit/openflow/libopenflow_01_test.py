@@ -68,6 +68,37 @@ class ofp_match_test(unittest.TestCase):
       self.assertEquals(getattr(m, "get_"+attr)(), (None, 0), "get_%s for unset %s should return (None,0)" % (attr, attr))
       self.assertTrue( ((m.wildcards & bitmask) >> shift) >= 32)
 
+  def test_frozen(self):
+    """ ofp_match: frozen matches are immutable and hashable """
+    m = ofp_match(in_port=1, dl_type=0x800, nw_dst="10.0.0.0/8")
+    f = m.freeze()
+    self.assertEqual(f, m)
+    self.assertEqual(m, f)
+    self.assertEqual(f.nw_dst, "10.0.0.0")
+    self.assertRaises(TypeError, setattr, f, "in_port", 2)
+    d = { f : 1 }
+    self.assertEqual(d[ofp_match(in_port=1, dl_type=0x800,
+                                 nw_dst="10.0.0.0/8").freeze()], 1)
+    self.assertFalse(ofp_match(in_port=1).freeze() in d)
+    # Mutable matches can't be hashed (they'd hash by id, unlike f)
+    self.assertRaises(TypeError, hash, m)
+    self.assertRaises(TypeError, d.get, m)
+    self.assertEqual(hash(f), hash(m.freeze()))
+    # Stored values of wildcarded fields don't matter
+    w = m.clone()
+    w.wildcards |= OFPFW_IN_PORT
+    self.assertEqual(w.freeze(), ofp_match(dl_type=0x800,
+                                           nw_dst="10.0.0.0/8").freeze())
+    c = f.clone()
+    c.in_port = 2
+    self.assertEqual(c.in_port, 2)
+
+  def test_unset_nw_dst(self):
+    m = ofp_match(nw_src="1.2.3.4", nw_dst="5.6.7.8")
+    m.nw_dst = None
+    self.assertEqual(m.nw_dst, None)
+    self.assertEqual(m.nw_src, "1.2.3.4")
+
   def test_match_with_wildcards(self):
     """ ofp_match: test the matches_with_wildcards method """
     def create(wildcards=(), **kw):
@@ -119,6 +150,39 @@ class ofp_match_test(unittest.TestCase):
     assertMatch(create(nw_src="10.0.0.0/25"), create(nw_src="10.0.0.127"))
     assertNoMatch(create(nw_src="10.0.0.0/25"), create(nw_src="10.0.0.128"))
 
+  def test_from_raw(self):
+    """ ofp_match.from_raw() agrees with from_packet() """
+    from pox.lib.packet import ethernet, vlan, ipv4, udp, tcp, arp
+    from pox.lib.addresses import EthAddr, IPAddr
+    def eth(payload, type):
+      return ethernet(src=EthAddr("00:00:00:00:00:01"),
+                      dst=EthAddr("00:00:00:00:00:02"),
+                      type=type, payload=payload)
+    def ip(payload, protocol):
+      return ipv4(srcip=IPAddr("10.0.0.1"), dstip=IPAddr("10.0.0.2"),
+                  protocol=protocol, tos=8, payload=payload)
+    frames = [
+      eth(ip(udp(srcport=1, dstport=2, payload="x"), ipv4.UDP_PROTOCOL),
+          ethernet.IP_TYPE),
+      eth(ip(tcp(srcport=3, dstport=4, off=5), ipv4.TCP_PROTOCOL),
+          ethernet.IP_TYPE),
+      eth(arp(opcode=arp.REPLY, protosrc=IPAddr("10.0.0.1"),
+              protodst=IPAddr("10.0.0.2")), ethernet.ARP_TYPE),
+      eth("opaque", 0x88b5),
+    ]
+    v = vlan(id=12, pcp=5, eth_type=ethernet.IP_TYPE,
+             payload=frames[0].payload)
+    v.c = 0
+    frames.append(eth(v, ethernet.VLAN_TYPE))
+    for f in frames:
+      raw = f.pack()
+      self.assertEqual(ofp_match.from_raw(raw, 3),
+                       ofp_match.from_packet(ethernet(raw), 3))
+      self.assertEqual(ofp_match.from_raw(raw),
+                       ofp_match.from_packet(ethernet(raw)))
+    self.assertEqual(ofp_match.from_raw(frames[-1].pack()).dl_type,
+                     ethernet.IP_TYPE)
+
 class ofp_command_test(unittest.TestCase):
   # custom map of POX class to header type, for validation
   ofp_type = {
@@ -250,6 +314,56 @@ class ofp_command_test(unittest.TestCase):
             for (check_attr,val) in attrs.iteritems():
               self.assertEqual(getattr(unpacked, check_attr), val)
 
+  def test_pack_into(self):
+    match = ofp_match(in_port=1, dl_src=EthAddr("00:00:00:00:00:01"),
+                      nw_src="10.0.0.0/8", tp_dst=80)
+    msgs = [ofp_flow_mod(xid=1, match=match, actions=actions)
+            for actions in self.some_actions]
+    msgs.append(ofp_packet_out(xid=2, data="abc",
+                               action=ofp_action_output(port=1)))
+    msgs.append(ofp_packet_out(xid=3, buffer_id=7, in_port=2,
+                               actions=[ofp_action_vlan_vid(vlan_vid=5),
+                                        ofp_action_output(port=3)]))
+    msgs.append(ofp_packet_out(xid=4, data="x" * 100))
+    buf = bytearray(4096)
+    offset = 3
+    for m in msgs:
+      end = m.pack_into(buf, offset)
+      self.assertEqual(str(buf[offset:end]), m.pack())
+      offset = end
+
+    # These pack straight into the buffer rather than copying from pack()
+    class NoPack (object):
+      def pack (self, assertstruct=True):
+        raise AssertionError("pack() was called")
+    for cls in (ofp_flow_mod, ofp_packet_out):
+      m = type("NoPack", (NoPack, cls), {})(action=ofp_action_output(port=1))
+      self.assertEqual(m.pack_into(buf), len(m))
+
+  def test_pack_into_checks(self):
+    """ pack_into() refuses what pack() refuses """
+    buf = bytearray(4096)
+    bad = ofp_barrier_request()
+    bad.header_type = 200
+    self.assertRaises(RuntimeError, bad.pack)
+    self.assertRaises(RuntimeError, bad.pack_into, buf)
+    bad = ofp_flow_mod(match=ofp_match())
+    bad.header_type = 200
+    self.assertRaises(RuntimeError, bad.pack)
+    self.assertRaises(RuntimeError, bad.pack_into, buf)
+    # Unless told not to check
+    self.assertEqual(bad.pack_into(buf, 0, assertstruct=False), 72)
+    bad = ofp_packet_out(buffer_id=1, data="abc")
+    self.assertRaises(RuntimeError, bad.pack)
+    self.assertRaises(RuntimeError, bad.pack_into, buf)
+    self.assertEqual(bad.pack_into(buf, 0, assertstruct=False), 16 + 3)
+
+  def test_wildcarded_fields_pack_as_zero(self):
+    m = ofp_match(in_port=5, tp_src=7)
+    m.wildcards |= OFPFW_IN_PORT | OFPFW_TP_SRC
+    # Everything past the wildcards should be zero/empty
+    self.assertEqual(m.pack()[4:], ofp_match().pack()[4:])
+
 class ofp_action_test(unittest.TestCase):
   def assert_packed_action(self, cls, packed, a_type, length):
     self.assertEqual(extract_num(packed, 0,2), a_type, "Action %s: expected type %d (but is %d)" % (cls, a_type, extract_num(packed, 0,2)))
@@ -293,5 +407,69 @@ class ofp_action_test(unittest.TestCase):
     c(ofp_action_mpls_tc, OFPAT_SET_MPLS_TC, {'mpls_tc': 0xac}, 8)
     c(ofp_action_mpls_ttl, OFPAT_SET_MPLS_TTL, {'mpls_ttl': 0xaf}, 8)
 
+class ofp_lazy_test(unittest.TestCase):
+  def _flow_stats (self):
+    r = []
+    for i in range(1, 4):
+      f = ofp_flow_stats(table_id=i, priority=100+i, cookie=i<<40,
+                         packet_count=i*10, byte_count=i*1000,
+                         match=ofp_match(in_port=i, dl_type=0x800,
+                                         nw_src="10.0.0.%i" % (i,)),
+                         actions=[ofp_action_output(port=i)] * i)
+      f.length = len(f)
+      r.append(f)
+    return r
+
+  def test_packet_in (self):
+    m = ofp_packet_in(xid=7, in_port=3, buffer_id=NO_BUFFER, reason=1,
+                      data="somedata")
+    packed = m.pack()
+    lazy = ofp_packet_in_lazy()
+    rest = lazy.unpack(buffer(packed + "trailing"))
+    self.assertEqual(rest, "trailing")
+    self.assertEqual(lazy.raw, packed)
+    self.assertEqual(lazy.in_port, 3)
+    self.assertEqual(lazy.buffer_id, -1)
+    self.assertEqual(lazy.reason, 1)
+    self.assertEqual(lazy.data, "somedata")
+    self.assertEqual(lazy.xid, 7)
+    self.assertEqual(lazy.pack(), packed)
+    lazy.in_port = 9
+    self.assertEqual(lazy.in_port, 9)
+
+  def test_flow_stats (self):
+    stats = self._flow_stats()
+    reply = ofp_stats_reply(xid=3, type=OFPST_FLOW,
+                            body="".join(f.pack() for f in stats))
+    packed = reply.pack()
+    lazy = ofp_stats_reply_lazy()
+    lazy.unpack(packed)
+    self.assertEqual(lazy.type, OFPST_FLOW)
+    self.assertEqual(lazy.body, reply.body)
+    got = lazy.unpack_body(ofp_flow_stats_lazy)
+    self.assertEqual(len(got), len(stats))
+    for a,b in zip(got, stats):
+      self.assertEqual(a.packet_count, b.packet_count)
+      self.assertEqual(a.cookie, b.cookie)
+      self.assertEqual(a.match, b.match)
+      self.assertEqual(len(a.actions), len(b.actions))
+      self.assertEqual(a.actions[0].port, b.actions[0].port)
+      self.assertEqual(a.pack(), b.pack())
+
+  def test_flow_stats_eager (self):
+    f = self._flow_stats()[2]
+    g = ofp_flow_stats()
+    g.unpack(f.pack())
+    self.assertEqual(g, f)
+
+  def test_port_stats (self):
+    p = ofp_port_stats(port_no=4, rx_packets=5, collisions=6)
+    lazy = ofp_port_stats_lazy()
+    lazy.unpack(p.pack())
+    self.assertEqual(lazy.port_no, 4)
+    self.assertEqual(lazy.rx_packets, 5)
+    self.assertEqual(lazy.collisions, 6)
+    self.assertEqual(lazy.tx_bytes, 0)
+
 if __name__ == '__main__':
   unittest.main()
@@ -0,0 +1,589 @@
+#!/usr/bin/env python
+
+import unittest
+import sys
+import os.path
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from pox.openflow.libopenflow_01 import *
+from pox.openflow import PacketIn, SendQueueHigh, SendQueueLow
+import socket
+import subprocess
+import select
+import threading
+import random
+from errno import EAGAIN
+import pox.openflow.of_01 as of_01
+
+class ChunkSocket (object):
+  """ Fake socket which hands out pre-arranged chunks of data """
+  def __init__ (self, chunks = []):
+    self.chunks = list(chunks)
+    self.sent = []
+
+  def send (self, data):
+    self.sent.append(data)
+    return len(data)
+
+  def recv (self, bufsize):
+    if not self.chunks: return ''
+    d = self.chunks[0][:bufsize]
+    self.chunks[0] = self.chunks[0][bufsize:]
+    if not self.chunks[0]: del self.chunks[0]
+    return d
+
+  def fileno (self):
+    return -1
+
+  def close (self):
+    pass
+
+class ChunkSocketInto (ChunkSocket):
+  def recv_into (self, buf, nbytes = 0):
+    d = self.recv(nbytes or len(buf))
+    buf[0:len(d)] = d
+    return len(d)
+
+class ThrottledSocket (ChunkSocket):
+  """ Fake socket which only accepts 'room' bytes before EAGAIN """
+  def __init__ (self, room):
+    ChunkSocket.__init__(self)
+    self.room = room
+    self.sends = 0
+
+  def send (self, data):
+    self.sends += 1
+    if self.room == 0:
+      raise socket.error(EAGAIN, "Resource temporarily unavailable")
+    l = min(self.room, len(data))
+    self.room -= l
+    self.sent.append(data[:l])
+    return l
+
+class RecordingNexus (object):
+  def __init__ (self):
+    self.events = []
+  def raiseEventNoErrors (self, event, *args, **kw):
+    self.events.append((event, args))
+  def _disconnect (self, dpid):
+    pass
+
+def packet_ins (count):
+  return [ofp_packet_in(xid=i, in_port=i, data="x" * (i % 50))
+          for i in range(1, count+1)]
+
+class ConnectionReadTest (unittest.TestCase):
+  def _read_all (self, sock, **kw):
+    con = of_01.Connection(sock, **kw)
+    nexus = RecordingNexus()
+    con.ofnexus = nexus
+    while con.read(): pass
+    return con, [e[1][1] for e in nexus.events if e[0] is PacketIn]
+
+  def _check (self, sock_class, chunk_size, read_size = None):
+    msgs = packet_ins(200)
+    data = "".join(m.pack() for m in msgs)
+    chunks = [data[i:i+chunk_size] for i in range(0, len(data), chunk_size)]
+    con, got = self._read_all(sock_class(chunks), read_size = read_size)
+    self.assertEqual(len(got), len(msgs))
+    for a,b in zip(got, msgs):
+      self.assertEqual(a.xid, b.xid)
+      self.assertEqual(a.in_port, b.in_port)
+      self.assertEqual(a.data, b.data)
+      self.assertTrue(type(a.data) is str)
+    self.assertEqual(con._rstart, con._rend)
+
+  def test_hello_sent (self):
+    sock = ChunkSocketInto()
+    of_01.Connection(sock)
+    m = ofp_hello()
+    m.unpack(sock.sent[0])
+    self.assertEqual(m.header_type, OFPT_HELLO)
+
+  def test_recv_into_split (self):
+    for chunk_size in (1, 7, 100, 3000):
+      self._check(ChunkSocketInto, chunk_size)
+
+  def test_recv_fallback (self):
+    self._check(ChunkSocket, 37)
+
+  def test_small_read_size_grows (self):
+    # Messages bigger than the read size must still be framed correctly
+    big = ofp_packet_in(xid=5, in_port=3, data="y" * 5000)
+    con, got = self._read_all(ChunkSocketInto([big.pack()]), read_size=64)
+    self.assertEqual(len(got), 1)
+    self.assertEqual(got[0].data, big.data)
+
+  def test_lazy (self):
+    msgs = packet_ins(50)
+    data = "".join(m.pack() for m in msgs)
+    con, got = self._read_all(ChunkSocketInto([data[:1000], data[1000:]]),
+                              lazy = True)
+    self.assertTrue(all(type(m) is ofp_packet_in_lazy for m in got))
+    self.assertEqual([(m.xid, m.in_port, m.data) for m in got],
+                     [(m.xid, m.in_port, m.data) for m in msgs])
+
+  def test_bad_version (self):
+    sock = ChunkSocketInto(["\x02\x00\x00\x08\x00\x00\x00\x01"])
+    con = of_01.Connection(sock)
+    con.ofnexus = RecordingNexus()
+    self.assertFalse(con.read())
+
+class ConnectionSendTest (unittest.TestCase):
+  def setUp (self):
+    self.sock = ThrottledSocket(0)
+    self.con = of_01.Connection(self.sock)
+    self.nexus = RecordingNexus()
+    self.con.ofnexus = self.nexus
+    self.pending = []
+    self.con.on_send_pending = self.pending.append
+
+  def test_queue_and_coalesce (self):
+    msgs = [ofp_barrier_request(xid=i).pack() for i in range(1, 101)]
+    for m in msgs:
+      self.con.send(m)
+    # Hello (queued before on_send_pending was set) plus the barriers
+    self.assertEqual(self.pending, [])
+    self.assertEqual(self.con.send_queue_length, 8 * 101)
+
+    self.sock.room = 10000
+    self.sock.sends = 0
+    self.assertTrue(self.con.flush())
+    self.assertEqual(self.sock.sends, 1)
+    data = "".join(self.sock.sent)[8:]
+    self.assertEqual(data, "".join(msgs))
+    self.assertEqual(self.con.send_queue_length, 0)
+
+  def test_send_pending_notification (self):
+    sock = ThrottledSocket(100)
+    con = of_01.Connection(sock)
+    pending = []
+    con.on_send_pending = pending.append
+    con.send("x" * 150)
+    con.send("y" * 10)
+    self.assertEqual(pending, [con])
+    self.assertEqual(con.send_queue_length, 8 + 150 + 10 - 100)
+    sock.room = 1000
+    self.assertTrue(con.flush())
+    self.assertEqual("".join(sock.sent)[8:], "x" * 150 + "y" * 10)
+
+  def test_partial_flush (self):
+    self.con.send("a" * 100)
+    self.sock.room = 50
+    self.assertFalse(self.con.flush())
+    self.assertEqual(self.con.send_queue_length, 108 - 50)
+    self.sock.room = 1000
+    self.assertTrue(self.con.flush())
+    self.assertEqual("".join(self.sock.sent)[8:], "a" * 100)
+
+  def test_water_marks (self):
+    self.con.send_high_water = 1000
+    self.con.send_low_water = 200
+    for i in range(20):
+      self.con.send("z" * 100)
+    self.assertTrue(self.con.send_blocked)
+    events = [e[0] for e in self.nexus.events]
+    self.assertEqual(events, [SendQueueHigh])
+
+    self.sock.room = 1000
+    self.con.flush()
+    self.assertTrue(self.con.send_blocked)
+    self.sock.room = 1000
+    self.con.flush()
+    self.assertFalse(self.con.send_blocked)
+    events = [e[0] for e in self.nexus.events]
+    self.assertEqual(events, [SendQueueHigh, SendQueueLow])
+
+  def test_disconnect_notification (self):
+    gone = []
+    self.con.on_disconnect = gone.append
+    self.con.disconnect()
+    self.assertEqual(gone, [self.con])
+
+  def test_disconnect_clears_queue (self):
+    self.con.send("q" * 100)
+    self.con.disconnect()
+    self.assertEqual(self.con.send_queue_length, 0)
+
+class LostWakeupTest (unittest.TestCase):
+  """
+  A send which lands between flush() emptying the queue and the task
+  forgetting the Connection keeps it pending
+  """
+  def test_send_after_flush (self):
+    task = of_01.OpenFlow_01_Task()
+    sock = ThrottledSocket(0)
+    con = of_01.Connection(sock)
+    con.on_send_pending = task._send_pending
+    con.send("a" * 10)
+    task._write_pending.add(con) # (The hello went before we were hooked up)
+
+    flush = con.flush
+    def racing_flush ():
+      r = flush()
+      sock.room = 0
+      con.send("b" * 10) # As if from another thread
+      return r
+    con.flush = racing_flush
+    sock.room = 1000
+    task._flush(con)
+    self.assertEqual(con.send_queue_length, 10)
+    self.assertEqual(task._write_pending, set([con]))
+
+    con.flush = flush
+    sock.room = 1000
+    task._flush(con)
+    self.assertEqual(task._write_pending, set())
+    self.assertEqual("".join(sock.sent)[8:], "a" * 10 + "b" * 10)
+
+class RandomSocket (ChunkSocket):
+  """ Fake socket which takes a random amount each time (maybe none) """
+  def __init__ (self, seed):
+    ChunkSocket.__init__(self)
+    self.rand = random.Random(seed)
+
+  def send (self, data):
+    l = self.rand.choice((0, 0, 1, 7, 100, len(data)))
+    if l == 0:
+      raise socket.error(EAGAIN, "Resource temporarily unavailable")
+    l = min(l, len(data))
+    self.sent.append(data[:l])
+    return l
+
+class ThreadedSendTest (unittest.TestCase):
+  def test_order (self):
+    """ Sends from other threads don't get mixed up with flushing """
+    # Races don't show up every time
+    for seed in range(10):
+      self.check_order(seed)
+
+  def check_order (self, seed):
+    old = sys.getcheckinterval()
+    sys.setcheckinterval(1) # Switch threads as often as possible
+    try:
+      sock = RandomSocket(seed)
+      con = of_01.Connection(sock)
+      count = 2000
+      def sender (name):
+        for i in range(count):
+          con.send("%s%i;" % (name, i))
+      threads = [threading.Thread(target = sender, args = (n,))
+                 for n in "abcd"]
+      for t in threads: t.start()
+      while any(t.is_alive() for t in threads):
+        con.flush()
+      for t in threads: t.join()
+      for i in range(100000):
+        if con.flush(): break
+    finally:
+      sys.setcheckinterval(old)
+    self.assertEqual(con.send_queue_length, 0)
+    data = "".join(sock.sent)[8:].split(";")[:-1]
+    for n in "abcd":
+      self.assertEqual([d for d in data if d[0] == n],
+                       ["%s%i" % (n, i) for i in range(count)])
+
+class BatchTest (unittest.TestCase):
+  def setUp (self):
+    self.sock = ChunkSocket()
+    self.con = of_01.Connection(self.sock)
+    self.con.ofnexus = RecordingNexus()
+    del self.sock.sent[:]
+
+  def test_one_write (self):
+    msgs = [ofp_flow_mod(match=ofp_match(in_port=i),
+                         actions=[ofp_action_output(port=i+1)])
+            for i in range(1, 11)]
+    done = []
+    batch = self.con.send_batch(msgs, done.append)
+    self.assertEqual(len(self.sock.sent), 1)
+    data = self.sock.sent[0]
+    self.assertEqual(data, "".join(m.pack() for m in msgs)
+                     + ofp_barrier_request(xid=batch.barrier_xid).pack())
+    self.assertEqual(batch.xids, set(m.xid for m in msgs))
+
+    self.assertFalse(batch.done)
+    self.con.feed(ofp_barrier_reply(xid=batch.barrier_xid + 1).pack())
+    self.assertEqual(done, [])
+    self.con.feed(ofp_barrier_reply(xid=batch.barrier_xid).pack())
+    self.assertEqual(done, [batch])
+    self.assertTrue(batch.ok)
+    self.assertEqual(self.con._batches, {})
+
+  def test_errors (self):
+    msgs = [ofp_flow_mod(), ofp_flow_mod()]
+    batch = self.con.send_batch(msgs)
+    self.con.feed(ofp_error(xid=msgs[1].xid, type=OFPET_FLOW_MOD_FAILED).pack())
+    self.con.feed(ofp_barrier_reply(xid=batch.barrier_xid).pack())
+    self.assertTrue(batch.done)
+    self.assertFalse(batch.ok)
+    self.assertEqual([e.xid for e in batch.errors], [msgs[1].xid])
+
+  def test_invalid (self):
+    bad = ofp_flow_mod()
+    bad.header_type = 200
+    self.assertRaises(RuntimeError, self.con.send_batch, [ofp_flow_mod(), bad])
+    self.assertEqual(self.sock.sent, [])
+
+  def test_lost (self):
+    batch = self.con.send_batch([ofp_flow_mod()])
+    self.con.disconnect()
+    self.assertTrue(batch.done and batch.lost)
+    done = []
+    batch.add_callback(done.append)
+    self.assertEqual(done, [batch])
+
+class WorkerFrameTest (unittest.TestCase):
+  def test_split_frames (self):
+    from pox.openflow.of_01_worker import FRAME, MESSAGE, CLOSE, split_frames
+    data = (FRAME.pack(MESSAGE, 7, 3) + "abc" + FRAME.pack(CLOSE, 8, 0)
+            + FRAME.pack(MESSAGE, 9, 10) + "part")
+    frames, offset = split_frames(data)
+    self.assertEqual(frames, [(MESSAGE, 7, "abc"), (CLOSE, 8, "")])
+    self.assertEqual(data[offset:], FRAME.pack(MESSAGE, 9, 10) + "part")
+
+  def test_feed (self):
+    # Worker mode hands Connections data rather than having them read it
+    msgs = packet_ins(20)
+    data = "".join(m.pack() for m in msgs)
+    con = of_01.Connection(ChunkSocket())
+    nexus = RecordingNexus()
+    con.ofnexus = nexus
+    self.assertTrue(con.feed(data[:100]))
+    self.assertTrue(con.feed(data[100:]))
+    got = [e[1][1] for e in nexus.events if e[0] is PacketIn]
+    self.assertEqual([m.xid for m in got], [m.xid for m in msgs])
+
+class NoEpollTest (unittest.TestCase):
+  """ of_01 without epoll (e.g., on Mac OS or Windows) """
+  def run_without_epoll (self, code):
+    root = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        "../../..")
+    # Also no fcntl, as on Windows (where subprocess doesn't need it)
+    setup = ("import sys, select, subprocess\n"
+             "sys.modules['fcntl'] = None\n"
+             "for n in dir(select):\n"
+             "  if 'poll' in n.lower(): delattr(select, n)\n")
+    p = subprocess.Popen([sys.executable, "-c", setup + code], cwd = root,
+                         stdout = subprocess.PIPE, stderr = subprocess.STDOUT)
+    out = p.communicate()[0]
+    self.assertEqual(p.returncode, 0, out)
+    return out
+
+  def test_import (self):
+    self.run_without_epoll("import pox.openflow.of_01\n")
+
+  def test_epoll_option (self):
+    out = self.run_without_epoll(
+        "import pox.openflow.of_01 as of_01\n"
+        "try:\n"
+        "  of_01.launch(epoll = True)\n"
+        "except RuntimeError as e:\n"
+        "  print e\n")
+    self.assertTrue("--epoll isn't available" in out, out)
+
+  def test_workers_option (self):
+    out = self.run_without_epoll(
+        "import pox.openflow.of_01 as of_01\n"
+        "try:\n"
+        "  of_01.launch(workers = 2)\n"
+        "except RuntimeError as e:\n"
+        "  print e\n")
+    self.assertTrue("--workers isn't available" in out, out)
+
+if hasattr(select, 'epoll'):
+  class EpollTaskTest (unittest.TestCase):
+    def test_forget_while_busy (self):
+      """ Disconnected switches are forgotten even when others are busy """
+      from pox.core import core
+      listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+      listener.bind(("127.0.0.1", 0))
+      listener.listen(16)
+      task = of_01.OpenFlow_01_EpollTask()
+      task._listen = lambda backlog: listener
+      loop = task.run()
+      loop.next()
+      busy = socket.create_connection(listener.getsockname())
+      quiet = socket.create_connection(listener.getsockname())
+      try:
+        loop.send(None)
+        self.assertEqual(len(task._fds), 2)
+        gone = [c for c in task._fds
+                if c.sock.getpeername() == quiet.getsockname()][0]
+        task._epoll.poll(0) # Use up the edges from connecting
+        gone.disconnect() # As if by some other component
+
+        busy.sendall(ofp_echo_request().pack())
+        select.select([task._epoll], [], [], 5)
+        loop.send(None)
+        self.assertEqual(len(task._fds), 1)
+        self.assertFalse(gone in task._fds)
+        self.assertFalse(gone in task._connections.values())
+
+        core.running = False
+        self.assertRaises(StopIteration, loop.send, None)
+      finally:
+        core.running = True
+        for s in (listener, busy, quiet):
+          s.close()
+
+class SendQueueTest (unittest.TestCase):
+  def test_coalesce (self):
+    from pox.openflow.of_01_worker import SendQueue, COALESCE_SIZE
+    q = SendQueue()
+    chunks = ["%i;" % (i,) for i in range(20000)]
+    for c in chunks:
+      q.append(c)
+    self.assertEqual(len(q), len("".join(chunks)))
+    sock = ThrottledSocket(1000)
+    self.assertFalse(q.write(sock))
+    self.assertEqual(sock.sends, 1)
+    sock.room = 10 ** 6
+    self.assertTrue(q.write(sock))
+    self.assertEqual(len(q), 0)
+    self.assertEqual("".join(sock.sent), "".join(chunks))
+    self.assertTrue(max(len(d) for d in sock.sent) <= COALESCE_SIZE + 10)
+
+class WorkerSocket (ChunkSocket):
+  def setblocking (self, flag):
+    pass
+
+class WorkerBackpressureTest (unittest.TestCase):
+  """
+  Switches which don't keep up hold up sends in worker mode too
+  """
+  def setUp (self):
+    from pox.openflow import of_01_worker
+    self.w = of_01_worker
+    self.task = of_01.OpenFlow_01_WorkerTask(1)
+    self.sock = WorkerSocket()
+    self.ch = of_01._WorkerChannel(self.sock, None, lambda ch: None)
+    self.task._handle_frame(self.ch, self.w.CONNECTED, 1, "")
+    self.con = self.ch.connections[1]
+    self.nexus = RecordingNexus()
+    self.con.ofnexus = self.nexus
+    self.con.send_high_water = 1000
+    self.con.send_low_water = 200
+
+  def queued (self, n):
+    self.task._handle_frame(self.ch, self.w.QUEUED, 1,
+                            self.w.QUEUED_LENGTH.pack(n))
+
+  def sent (self):
+    """ Data which went down to the worker for the switch """
+    self.assertTrue(self.ch.flush())
+    frames = self.w.split_frames("".join(self.sock.sent))[0]
+    return "".join(p for k, cid, p in frames if k == self.w.SEND)
+
+  def test_switch_backed_up (self):
+    self.queued(self.w.SWITCH_HIGH_WATER)
+    for i in range(20):
+      self.con.send("%0100i" % (i,))
+    self.assertEqual(self.con.send_queue_length, 2000)
+    self.assertEqual([e[0] for e in self.nexus.events], [SendQueueHigh])
+    self.ch.flush_waiting()
+    self.assertEqual(self.con.send_queue_length, 2000)
+
+    self.queued(self.w.SWITCH_LOW_WATER)
+    self.ch.flush_waiting()
+    self.assertEqual(self.con.send_queue_length, 0)
+    self.assertEqual(self.ch.waiting, set())
+    self.assertEqual([e[0] for e in self.nexus.events],
+                     [SendQueueHigh, SendQueueLow])
+    self.assertEqual(self.sent()[8:],
+                     "".join("%0100i" % (i,) for i in range(20)))
+
+  def test_channel_backed_up (self):
+    old = of_01.WORKER_CHANNEL_HIGH_WATER
+    of_01.WORKER_CHANNEL_HIGH_WATER = 500
+    try:
+      for i in range(20):
+        self.con.send("%0100i" % (i,))
+      self.assertEqual(self.ch.queued, 8 + 9 + 5 * (100 + 9))
+      self.assertEqual(self.con.send_queue_length, 1500)
+      self.ch.flush_waiting() # Channel still full
+      self.assertEqual(self.con.send_queue_length, 1500)
+      self.assertTrue(self.ch.flush())
+      self.ch.flush_waiting()
+      self.assertEqual(self.con.send_queue_length, 0)
+    finally:
+      of_01.WORKER_CHANNEL_HIGH_WATER = old
+    self.assertEqual(self.sent()[8:],
+                     "".join("%0100i" % (i,) for i in range(20)))
+
+  def test_channel_send_after_flush (self):
+    """ A channel which gets more queued as it empties stays pending """
+    self.ch._on_pending = self.task._send_pending
+    self.task._channels.append(self.ch)
+    self.assertTrue(self.ch.flush())
+    self.ch.send(self.w.SEND, 1, "a")
+    self.assertEqual(self.task._write_pending, set([self.ch]))
+
+    flush = self.ch.flush
+    def racing_flush ():
+      r = flush()
+      self.ch.send(self.w.SEND, 1, "b") # As if from another thread
+      return r
+    self.ch.flush = racing_flush
+    self.task._flush_channels()
+    self.assertEqual(self.task._write_pending, set([self.ch]))
+    self.assertTrue(self.ch.queued)
+
+  def test_connection_send_after_flush (self):
+    """ Likewise for a Connection waiting on its switch """
+    self.queued(self.w.SWITCH_HIGH_WATER)
+    self.con.send("a" * 10)
+    self.assertEqual(self.ch.waiting, set([self.con]))
+    self.queued(0)
+
+    flush = self.con.flush
+    def racing_flush ():
+      r = flush()
+      self.queued(self.w.SWITCH_HIGH_WATER)
+      self.con.send("b" * 10) # As if from another thread
+      return r
+    self.con.flush = racing_flush
+    self.ch.flush_waiting()
+    self.assertEqual(self.con.send_queue_length, 10)
+    self.assertEqual(self.ch.waiting, set([self.con]))
+
+  def test_worker_reports (self):
+    w = self.w
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    uplink, controller = socket.socketpair()
+    ours, theirs = socket.socketpair()
+    try:
+      worker = w.Worker(listener, uplink)
+      ours.setblocking(0)
+      sw = w._Switch(1, ours)
+      worker.switches[sw.fd] = sw
+      worker.by_cid[1] = sw
+      worker.epoll.register(sw.fd, select.EPOLLIN)
+      data = "".join("%09i;" % (i,) for i in range(w.SWITCH_HIGH_WATER / 5))
+      worker._send_switch(sw, data)
+      self.assertTrue(sw.blocked)
+      frames = w.split_frames("".join(worker._up))[0]
+      self.assertEqual([(k, cid) for k, cid, p in frames], [(w.QUEUED, 1)])
+      self.assertEqual(w.QUEUED_LENGTH.unpack(frames[0][2])[0],
+                       sw.outq.size)
+      del worker._up[:]
+
+      got = []
+      while sw.outq:
+        got.append(theirs.recv(1024 * 1024))
+        worker._write_switch(sw)
+      self.assertFalse(sw.blocked)
+      frames = w.split_frames("".join(worker._up))[0]
+      self.assertEqual(frames, [(w.QUEUED, 1, w.QUEUED_LENGTH.pack(0))])
+      theirs.setblocking(0)
+      try:
+        got.append(theirs.recv(len(data)))
+      except socket.error:
+        pass
+      self.assertEqual("".join(got), data)
+    finally:
+      for s in (listener, uplink, controller, ours, theirs):
+        s.close()
+
+if __name__ == '__main__':
+  unittest.main()
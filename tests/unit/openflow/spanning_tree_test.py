@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+
+import unittest
+import sys
+import os.path
+import random
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from pox.core import core
+import pox.openflow.libopenflow_01 as of
+from pox.lib.addresses import EthAddr
+from pox.openflow.discovery import Discovery, LinkEvent
+import pox.openflow.spanning_tree as spanning_tree
+
+Link = Discovery.Link
+
+SWITCHES = 12
+PORTS = 4 # Links between a pair of switches use port (other dpid * PORTS + i)
+
+class MockConnection (object):
+  def __init__ (self, dpid):
+    self.features = of.ofp_switch_features()
+    self.features.ports = [
+        of.ofp_phy_port(port_no = p,
+                        hw_addr = EthAddr("02:00:00:00:%02x:%02x" % (dpid, p)))
+        for p in range(1, (SWITCHES + 1) * PORTS)]
+    self.batches = []
+    self.flood = {} # port_no -> flood state we've been told
+    self.fail = False # Fail the next send_batch()
+
+  def send_batch (self, messages, callback = None):
+    if self.fail:
+      self.fail = False
+      raise RuntimeError("Test failure")
+    self.batches.append(messages)
+    for m in messages:
+      assert m.mask == of.OFPPC_NO_FLOOD
+      self.flood[m.port_no] = not (m.config & of.OFPPC_NO_FLOOD)
+
+class MockOpenFlow (object):
+  def __init__ (self):
+    self.connections = {}
+
+  def getConnection (self, dpid):
+    return self.connections.get(dpid)
+
+class SpanningTreeTest (unittest.TestCase):
+  def setUp (self):
+    for d in (spanning_tree._adj, spanning_tree._tree, spanning_tree._prev,
+              spanning_tree._resync):
+      d.clear()
+    self.discovery = Discovery()
+    self.openflow = MockOpenFlow()
+    for dpid in range(1, SWITCHES + 1):
+      self.openflow.connections[dpid] = MockConnection(dpid)
+    self._old = dict((k, core.components.get(k))
+                     for k in ('openflow_discovery', 'openflow'))
+    core.components['openflow_discovery'] = self.discovery
+    core.components['openflow'] = self.openflow
+    spanning_tree.launch()
+
+  def tearDown (self):
+    self.discovery._expireTimer.cancel()
+    for k,v in self._old.iteritems():
+      if v is None:
+        del core.components[k]
+      else:
+        core.components[k] = v
+
+  def link (self, a, b, up = True, i = 0, both = True):
+    """
+    Brings a link between a and b up or down (one way only if not both)
+    """
+    links = [Link(a, b * PORTS + i, b, a * PORTS + i)]
+    if both:
+      links.append(Link(b, a * PORTS + i, a, b * PORTS + i))
+    for l in links:
+      if up:
+        self.discovery._addLink(l)
+        self.discovery.raiseEvent(LinkEvent, True, l)
+      else:
+        self.discovery._deleteLinks([l])
+
+  def batches (self):
+    r = sum((c.batches for c in self.openflow.connections.itervalues()), [])
+    for c in self.openflow.connections.itervalues():
+      del c.batches[:]
+    return r
+
+  def check (self):
+    """
+    Checks the tree spans each connected group of switches, and that the
+    switches have been told to flood on exactly the right ports
+    """
+    d = self.discovery
+    adj = {}
+    for l in d.adjacency:
+      if d.linksBetween(l.dpid1, l.dpid2, bidirectional = True):
+        adj.setdefault(l.dpid1, set()).add(l.dpid2)
+    tree = spanning_tree._calc_spanning_tree()
+    edges = set()
+    for sw, nbrs in tree.iteritems():
+      for w, port in nbrs:
+        self.assertTrue(w in adj[sw])
+        self.assertTrue(d.linksForPort(sw, port))
+        edges.add((min(sw, w), max(sw, w)))
+
+    seen = set()
+    for start in adj:
+      if start in seen: continue
+      # A connected group, and the tree edges in it
+      group = set([start])
+      todo = [start]
+      while todo:
+        v = todo.pop()
+        for w in adj[v]:
+          if w not in group:
+            group.add(w)
+            todo.append(w)
+      seen |= group
+      group_edges = [e for e in edges if e[0] in group]
+      self.assertEqual(len(group_edges), len(group) - 1)
+      reached = set([start])
+      todo = [start]
+      while todo:
+        v = todo.pop()
+        for w, port in tree.get(v, ()):
+          if w not in reached:
+            reached.add(w)
+            todo.append(w)
+      self.assertEqual(reached, group)
+
+    for sw, con in self.openflow.connections.iteritems():
+      tree_ports = set(port for w, port in tree.get(sw, ()))
+      for p in con.features.ports:
+        expected = (p.port_no in tree_ports or
+                    not d.isSwitchOnlyPort(sw, p.port_no))
+        self.assertEqual(con.flood.get(p.port_no, True), expected,
+                         "%s.%s" % (sw, p.port_no))
+
+  def test_ring (self):
+    for i in range(1, 5):
+      self.link(i, i % 4 + 1)
+      self.check()
+    # Closing the ring only turns off flooding on the new link
+    self.link(1, 4, False)
+    self.batches()
+    self.link(1, 4)
+    self.assertEqual(sorted((len(b), b[0].config) for b in self.batches()),
+                     [(1, of.OFPPC_NO_FLOOD)] * 2)
+    self.check()
+    # Cutting a tree link brings in the one which was left out
+    self.link(2, 3, False)
+    self.check()
+    self.assertTrue((4, 4 * PORTS) in spanning_tree._calc_spanning_tree()[1])
+
+  def test_parallel_links (self):
+    self.link(1, 2)
+    self.link(1, 2, i = 1)
+    self.check()
+    port = spanning_tree._adj[1][2]
+    self.link(1, 2, False, i = port - 2 * PORTS)
+    self.check()
+    self.assertNotEqual(spanning_tree._adj[1][2], port)
+
+  def test_one_way (self):
+    self.link(1, 2, both = False)
+    self.check()
+    self.assertEqual(spanning_tree._calc_spanning_tree(), {})
+    self.link(2, 1, both = False)
+    self.check()
+    self.assertEqual(len(spanning_tree._calc_spanning_tree()), 2)
+
+  def test_failed_push (self):
+    """ A push which fails is made good by the next one """
+    self.link(1, 2)
+    self.link(3, 4, both = False)
+    self.check()
+    self.openflow.connections[3].fail = True
+    # Makes 3-4 a tree edge, but switch 3 isn't told to flood on it
+    self.link(4, 3, both = False)
+    self.assertRaises(AssertionError, self.check)
+    self.link(5, 6)
+    self.check()
+
+  def test_random_changes (self):
+    rand = random.Random(1)
+    up = set()
+    for step in range(300):
+      if up and rand.random() < 0.4:
+        key = rand.choice(sorted(up))
+        up.remove(key)
+        a, b, i, both = key
+        self.link(a, b, False, i, both)
+      else:
+        a, b = rand.sample(range(1, SWITCHES + 1), 2)
+        i = rand.randint(0, PORTS - 1)
+        both = rand.random() < 0.9
+        if any(k[:3] in ((a, b, i), (b, a, i)) for k in up): continue
+        up.add((a, b, i, both))
+        self.link(a, b, True, i, both)
+      self.check()
+
+if __name__ == '__main__':
+  unittest.main()
@@ -127,6 +127,35 @@ class SwitchImplTest(unittest.TestCase):
     self.assertEqual(event.port.port_no,3)
     self.assertEqual(event.packet, self.packet)
     
+  def test_rewrite_actions(self):
+    s = self.switch
+    received = []
+    s.addListener(DpPacketOut, lambda(event): received.append(event))
+    for proto, tp in (
+        (ipv4.TCP_PROTOCOL, tcp(srcport=1234, dstport=80, off=5, payload="hi")),
+        (ipv4.UDP_PROTOCOL, udp(srcport=1234, dstport=5000, payload="hi"))):
+      e = ethernet(src=EthAddr("00:00:00:00:00:01"),
+                   dst=EthAddr("00:00:00:00:00:02"), type=ethernet.IP_TYPE,
+                   payload=ipv4(srcip=IPAddr("1.2.3.4"),
+                                dstip=IPAddr("1.2.3.5"), tos=4,
+                                protocol=proto, payload=tp))
+      # Parse it back so it has real checksums
+      packet = ethernet(e.pack())
+      actions = [ofp_action_nw_addr.set_src(IPAddr("10.0.0.1")),
+                 ofp_action_nw_addr.set_dst(IPAddr("10.0.0.2")),
+                 ofp_action_nw_tos(nw_tos=16),
+                 ofp_action_tp_port.set_src(4321),
+                 ofp_action_tp_port.set_dst(8080),
+                 ofp_action_output(port=2)]
+      s._process_actions_for_packet(actions, packet, 1)
+      # What goes out on the wire has the new fields and right checksums
+      ip = ethernet(received[-1].packet.pack()).next
+      self.assertEqual((ip.srcip, ip.dstip, ip.tos),
+                       (IPAddr("10.0.0.1"), IPAddr("10.0.0.2"), 16))
+      self.assertEqual((ip.next.srcport, ip.next.dstport), (4321, 8080))
+      self.assertEqual(ip.csum, ip.checksum())
+      self.assertEqual(ip.next.csum, ip.next.checksum(unparsed=True))
+
   def test_take_port_down(self):
     c = self.conn
     s = self.switch